@@ -0,0 +1,167 @@
+"""
+Shared JWT authentication for every agent API, with a cache of verified tokens
+- One AuthService per agent process verifies HS256 bearer tokens with python-jose: the same checks and the
+  same errors on every agent (401 for an expired token, 403 for anything else that does not verify)
+- Verified claims are cached by token digest (never the token itself) and each entry expires at the token's
+  `exp`, so the small set of long-lived service tokens that carries most traffic is verified once per
+  process instead of on every request. The cache is an LRU bounded by AGENT_AUTH_CACHE_SIZE
+- Key rotation: a service holds a current secret, used to issue tokens, plus previous secrets that are still
+  accepted. Tokens name their key in the `kid` header; tokens without one are tried against every key.
+  rotate() makes a new secret current, retire() stops accepting an old one and drops the cached tokens
+  verified with it
+- Time spent authenticating each request is exported per outcome (cached, verified, expired, invalid)
+
+Environment (<AGENT> is DEV, PM, TA, QA or UX; the per-agent variable wins over the shared one):
+- <AGENT>_AGENT_JWT_SECRET / AGENT_JWT_SECRET: current secret (default "dev-secret-key")
+- <AGENT>_AGENT_JWT_PREVIOUS_SECRETS / AGENT_JWT_PREVIOUS_SECRETS: comma-separated secrets still accepted
+- AGENT_AUTH_CACHE_SIZE: verified tokens kept per process (default 10000)
+- AGENT_AUTH_CACHE_TTL_SECONDS: how long a token without `exp` stays cached (default 300)
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from jose import ExpiredSignatureError, JWTError, jwt
+from prometheus_client import Histogram
+
+logger = logging.getLogger("auth_service")
+
+DEFAULT_SECRET = "dev-secret-key"
+ALGORITHM = "HS256"
+
+auth_seconds = Histogram(
+    "auth_validation_seconds", "Time spent authenticating a request", ["outcome"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using default {default}")
+        return default
+
+
+def key_id(secret: str) -> str:
+    """
+    Stable public identifier of a secret, carried in the `kid` header of the tokens it signs.
+    """
+    return hashlib.blake2b(secret.encode("utf-8"), digest_size=8, person=b"agent-kid").hexdigest()
+
+
+class AuthService:
+    """
+    JWT verification with a cache of verified claims and support for key rotation.
+    """
+    def __init__(
+        self,
+        secret: str = DEFAULT_SECRET,
+        previous_secrets: Iterable[str] = (),
+        algorithm: str = ALGORITHM,
+        cache_size: Optional[int] = None,
+        cache_ttl: Optional[float] = None,
+    ):
+        self.algorithm = algorithm
+        self.cache_size = cache_size if cache_size is not None else int(_env_float("AGENT_AUTH_CACHE_SIZE", 10000))
+        self.cache_ttl = cache_ttl if cache_ttl is not None else _env_float("AGENT_AUTH_CACHE_TTL_SECONDS", 300)
+        # kid -> secret, current key first
+        self.keys: Dict[str, str] = {}
+        for s in (secret, *previous_secrets):
+            self.keys.setdefault(key_id(s), s)
+        # token digest -> (claims, expires_at, kid)
+        self._cache: "OrderedDict[bytes, Tuple[dict, float, str]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls, agent: str) -> "AuthService":
+        secret = os.getenv(f"{agent}_AGENT_JWT_SECRET") or os.getenv("AGENT_JWT_SECRET") or DEFAULT_SECRET
+        previous = os.getenv(f"{agent}_AGENT_JWT_PREVIOUS_SECRETS") or os.getenv("AGENT_JWT_PREVIOUS_SECRETS", "")
+        return cls(secret, [s.strip() for s in previous.split(",") if s.strip()])
+
+    @property
+    def current_kid(self) -> str:
+        return next(iter(self.keys))
+
+    def issue(self, claims: dict) -> str:
+        """
+        Sign `claims` with the current key.
+        """
+        kid = self.current_kid
+        return jwt.encode(claims, self.keys[kid], algorithm=self.algorithm, headers={"kid": kid})
+
+    def rotate(self, secret: str) -> str:
+        """
+        Make `secret` the current key; the previous keys are still accepted until retired. Returns its kid.
+        """
+        kid = key_id(secret)
+        self.keys.pop(kid, None)
+        self.keys = {kid: secret, **self.keys}
+        return kid
+
+    def retire(self, kid: str) -> int:
+        """
+        Stop accepting the key `kid` and drop the cached tokens it verified. The current key cannot be retired.
+        Returns the number of cache entries dropped.
+        """
+        if kid == self.current_kid:
+            raise ValueError("Rotate to a new key before retiring the current one")
+        self.keys.pop(kid, None)
+        stale = [digest for digest, (_, _, entry_kid) in self._cache.items() if entry_kid == kid]
+        for digest in stale:
+            del self._cache[digest]
+        return len(stale)
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+    def _verify(self, token: str) -> Tuple[dict, str]:
+        kid = jwt.get_unverified_header(token).get("kid")
+        candidates = [(kid, self.keys[kid])] if kid in self.keys else list(self.keys.items())
+        for candidate_kid, secret in candidates:
+            try:
+                claims = jwt.decode(token, secret, algorithms=[self.algorithm], options={"verify_aud": False})
+                return claims, candidate_kid
+            except ExpiredSignatureError:
+                # The signature is checked before the claims: this key matched
+                raise
+            except JWTError:
+                continue
+        raise JWTError("Signature verification failed")
+
+    def validate_token(self, token: str) -> dict:
+        """
+        Validate and decode a JWT. Raises HTTPException for invalid/expired tokens.
+        """
+        started = time.perf_counter()
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+        now = time.time()
+        entry = self._cache.get(digest)
+        if entry is not None:
+            claims, expires_at, _ = entry
+            if now < expires_at:
+                self._cache.move_to_end(digest)
+                auth_seconds.labels("cached").observe(time.perf_counter() - started)
+                return dict(claims)
+            del self._cache[digest]
+            if "exp" in claims and claims["exp"] <= now:
+                auth_seconds.labels("expired").observe(time.perf_counter() - started)
+                raise HTTPException(status_code=401, detail="Token expired")
+        try:
+            claims, kid = self._verify(token)
+        except ExpiredSignatureError:
+            auth_seconds.labels("expired").observe(time.perf_counter() - started)
+            raise HTTPException(status_code=401, detail="Token expired")
+        except JWTError:
+            auth_seconds.labels("invalid").observe(time.perf_counter() - started)
+            raise HTTPException(status_code=403, detail="Invalid token")
+        expires_at = float(claims["exp"]) if "exp" in claims else now + self.cache_ttl
+        if self.cache_size > 0:
+            self._cache[digest] = (claims, expires_at, kid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        auth_seconds.labels("verified").observe(time.perf_counter() - started)
+        return dict(claims)
@@ -1,26 +1,30 @@
 """
 Circuit Breaker for Redis/Service Calls
-- Uses tenacity for retry
-- Uses circuitbreaker for open/close logic
+- Uses the shared async resilience policy (resilience.py): half-open probing, jittered retries within a
+  retry budget (the retries sleep on the event loop, they no longer block the thread) and an adaptive
+  concurrency limit
 - Exposes Prometheus metrics
 """
-from circuitbreaker import circuit
-from tenacity import Retrying, stop_after_attempt, wait_exponential
-import prometheus_client
+from typing import Any, Awaitable, Callable
+
 from prometheus_client import Gauge
+from resilience import CircuitBreaker, resilience_policy
 
 circuit_state = Gauge('windsrf_circuit_state', 'Circuit state for services', ['service'])
 
-@circuit(failure_threshold=5, recovery_timeout=30)
-def redis_operation(execute_redis_command):
-    service = 'redis'
-    try:
-        with Retrying(
-            stop=stop_after_attempt(3),
-            wait=wait_exponential(multiplier=1)
-        ) as retry:
-            retry(execute_redis_command)
-        circuit_state.labels(service=service).set(0)  # 0 = closed
-    except Exception:
-        circuit_state.labels(service=service).set(1)  # 1 = open
-        raise
+redis_policy = resilience_policy("redis", env_prefix="REDIS", fail_max=5, reset_timeout=30)
+
+
+def _track_state(breaker: CircuitBreaker, old: str, new: str) -> None:
+    circuit_state.labels(service='redis').set(1 if new == CircuitBreaker.OPEN else 0)  # 1 = open, 0 = closed
+
+
+redis_policy.breaker.listeners.append(_track_state)
+circuit_state.labels(service='redis').set(0)
+
+
+async def redis_operation(execute_redis_command: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Await `execute_redis_command()` through the breaker, retrying transient errors; it is called again for each attempt.
+    """
+    return await redis_policy.call(execute_redis_command, idempotent=True)
@@ -0,0 +1,132 @@
+"""
+Vectorized conflict resolution for batches of record pairs, shared by all agents
+- Each agent resolves a conflicting pair with the same rules and its own ConflictPolicy (weights,
+  similarity threshold, text fields), mirroring its single-pair resolve_conflict
+- resolve_pairs() scores a whole batch at once: the record fields become NumPy arrays, the semantic
+  similarity of every pair comes from one sparse product (SimilarityService.pair_similarities), and
+  each rule is a mask over the batch
+- Every result reports the winner and the decision path, so merges can be audited
+
+Rules, in order (the first that applies decides):
+1. "completed": exactly one record is completed (policies with prefer_completed)
+2. "similar_priority" / "similar_recency": the texts are at least `similar_threshold` similar
+   (the same work written twice); the higher priority wins, then the more recent timestamp
+3. "score": time, priority, dependency count and similarity differences, weighted; A wins ties
+
+Environment:
+- AGENT_MAX_CONFLICT_PAIRS: upper bound on pairs per batch request (default 5000)
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from similarity import SimilarityService, text_of
+
+logger = logging.getLogger("conflict_resolution")
+
+try:
+    MAX_CONFLICT_PAIRS = int(os.getenv("AGENT_MAX_CONFLICT_PAIRS", 5000))
+except ValueError:
+    logger.warning("Invalid AGENT_MAX_CONFLICT_PAIRS, using default 5000")
+    MAX_CONFLICT_PAIRS = 5000
+
+PATH_COMPLETED = "completed"
+PATH_SIMILAR_PRIORITY = "similar_priority"
+PATH_SIMILAR_RECENCY = "similar_recency"
+PATH_SCORE = "score"
+
+
+class ConflictPolicy:
+    """
+    How one agent resolves a conflicting pair. `similar_threshold=None` skips the similar-records
+    rule; `similarity_weight` adds the pair's similarity to the weighted score.
+    """
+    def __init__(
+        self,
+        fields: Sequence[str],
+        time_weight: float = 0.7,
+        priority_weight: float = 0.3,
+        dependency_weight: float = 0.0,
+        similarity_weight: float = 0.0,
+        similar_threshold: Optional[float] = 0.7,
+        prefer_completed: bool = False,
+    ):
+        self.fields = list(fields)
+        self.time_weight = time_weight
+        self.priority_weight = priority_weight
+        self.dependency_weight = dependency_weight
+        self.similarity_weight = similarity_weight
+        self.similar_threshold = similar_threshold
+        self.prefer_completed = prefer_completed
+
+    @property
+    def uses_similarity(self) -> bool:
+        return self.similar_threshold is not None or self.similarity_weight != 0
+
+
+def _column(records: Sequence[dict], field: str, default: float) -> np.ndarray:
+    return np.array([float(record.get(field, default) or 0) for record in records], dtype=np.float64)
+
+
+def resolve_pairs(
+    pairs: Sequence[Tuple[dict, dict]],
+    policy: ConflictPolicy,
+    similarity: Optional[SimilarityService] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Resolve every (a, b) pair. Returns one {"winner": "a"|"b", "resolved", "path", "similarity",
+    "score"} dict per pair, in order ("score" is None when an earlier rule decided).
+    Without a similarity service, similarity counts as 0.
+    """
+    if not pairs:
+        return []
+    records_a = [a for a, _ in pairs]
+    records_b = [b for _, b in pairs]
+    if similarity is not None and policy.uses_similarity:
+        similarities = similarity.pair_similarities(
+            [text_of(a, policy.fields) for a in records_a],
+            [text_of(b, policy.fields) for b in records_b],
+        )
+    else:
+        similarities = np.zeros(len(pairs))
+    time_a, time_b = _column(records_a, "timestamp", 0), _column(records_b, "timestamp", 0)
+    priority_a, priority_b = _column(records_a, "priority", 1), _column(records_b, "priority", 1)
+    deps_a = np.array([len(a.get("dependencies") or []) for a in records_a], dtype=np.float64)
+    deps_b = np.array([len(b.get("dependencies") or []) for b in records_b], dtype=np.float64)
+    scores = (
+        policy.time_weight * (time_a - time_b)
+        + policy.priority_weight * (priority_a - priority_b)
+        + policy.dependency_weight * (deps_a - deps_b)
+        + policy.similarity_weight * similarities
+    )
+    a_wins = scores >= 0
+    paths = np.full(len(pairs), PATH_SCORE, dtype=object)
+    decided = np.zeros(len(pairs), dtype=bool)
+    if policy.prefer_completed:
+        done_a = np.array([a.get("status") == "completed" for a in records_a])
+        done_b = np.array([b.get("status") == "completed" for b in records_b])
+        completed = done_a != done_b
+        a_wins = np.where(completed, done_a, a_wins)
+        paths[completed] = PATH_COMPLETED
+        decided |= completed
+    if policy.similar_threshold is not None:
+        similar = ~decided & (similarities >= policy.similar_threshold)
+        by_priority = similar & (priority_a != priority_b)
+        by_recency = similar & (priority_a == priority_b)
+        a_wins = np.where(by_priority, priority_a > priority_b, a_wins)
+        a_wins = np.where(by_recency, time_a >= time_b, a_wins)
+        paths[by_priority] = PATH_SIMILAR_PRIORITY
+        paths[by_recency] = PATH_SIMILAR_RECENCY
+        decided |= similar
+    return [
+        {
+            "winner": "a" if a_won else "b",
+            "resolved": a if a_won else b,
+            "path": path,
+            "similarity": float(score_similarity),
+            "score": None if was_decided else float(score),
+        }
+        for a, b, a_won, path, score_similarity, score, was_decided in zip(records_a, records_b, a_wins, paths, similarities, scores, decided)
+    ]
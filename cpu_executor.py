@@ -0,0 +1,168 @@
+"""
+Bounded executor for CPU-bound semantic work (TF-IDF, similarity, sklearn/numpy)
+- Keeps tokenisation, index rebuilds and similarity matrices off the event loop, so a burst of
+  hint requests does not stall unrelated endpoints on the same worker
+- Admission is bounded: at most `workers + max_queue` calls are queued or running; beyond that a
+  call fails fast with ExecutorBusy instead of piling up
+- Every call has a timeout (ExecutorTimeout); the caller stops waiting, the worker finishes the call
+- Queue depth, wait time and run time are exported to Prometheus
+
+Two kinds of calls:
+- `run(fn, ...)`: pure functions of their (picklable) arguments; they go to a process pool when
+  AGENT_EXECUTOR_KIND=process, else to the thread pool
+- `run_local(fn, ...)`: calls that read or update in-process state (the similarity index, the
+  similarity cache); always on the thread pool, which shares memory with the event loop
+
+Environment:
+- AGENT_EXECUTOR_KIND: "thread" (default) or "process"
+- AGENT_EXECUTOR_WORKERS: pool size (default: CPU count, at most 4)
+- AGENT_EXECUTOR_MAX_QUEUE: calls allowed to wait for a worker (default 64)
+- AGENT_EXECUTOR_TIMEOUT_SECONDS: default per-call timeout (default 10)
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("cpu_executor")
+
+executor_depth = Gauge("cpu_executor_queue_depth", "Calls queued or running in the executor", ["executor"])
+executor_wait = Histogram("cpu_executor_wait_seconds", "Time calls waited for a worker", ["executor"])
+executor_run = Histogram("cpu_executor_run_seconds", "Time calls spent running in a worker", ["executor"])
+executor_rejected = Counter("cpu_executor_rejected_total", "Calls rejected because the queue was full", ["executor"])
+executor_timeouts = Counter("cpu_executor_timeouts_total", "Calls whose caller timed out", ["executor"])
+
+
+class ExecutorUnavailable(RuntimeError):
+    """
+    The executor could not answer in time; callers should report a transient (503) failure.
+    """
+
+
+class ExecutorBusy(ExecutorUnavailable):
+    pass
+
+
+class ExecutorTimeout(ExecutorUnavailable):
+    pass
+
+
+def _timed(fn: Callable, submitted: float, *args, **kwargs) -> Any:
+    # Runs in the worker: measures the wait itself, so it is right for both pool kinds
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started - submitted, time.time() - started
+
+
+class CpuExecutor:
+    def __init__(self, name: str = "semantic", kind: str = "thread", workers: int = 4, max_queue: int = 64, timeout: float = 10.0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self) -> int:
+        return self._pending
+
+    def _pool(self, local: bool) -> Executor:
+        if self.kind == "process" and not local:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.workers)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-executor")
+        return self._threads
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                executor_rejected.labels(self.name).inc()
+                raise ExecutorBusy(f"{self.name} executor is saturated ({self._pending} calls queued or running)")
+            self._pending += 1
+        executor_depth.labels(self.name).set(self._pending)
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+        executor_depth.labels(self.name).set(self._pending)
+
+    async def _submit(self, local: bool, fn: Callable, args, kwargs, timeout: Optional[float]) -> Any:
+        self._admit()
+        try:
+            future = self._pool(local).submit(_timed, functools.partial(fn, **kwargs) if kwargs else fn, time.time(), *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the worker is done, not until the caller stops waiting
+        future.add_done_callback(self._release)
+        try:
+            result, waited, ran = await asyncio.wait_for(asyncio.wrap_future(future), timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            executor_timeouts.labels(self.name).inc()
+            raise ExecutorTimeout(f"{getattr(fn, '__qualname__', fn)} timed out in the {self.name} executor")
+        executor_wait.labels(self.name).observe(max(waited, 0.0))
+        executor_run.labels(self.name).observe(ran)
+        return result
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run a pure function in the configured pool (a process pool for kind="process").
+        """
+        return await self._submit(False, fn, args, kwargs, timeout)
+
+    async def run_local(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run a function that uses in-process state on the thread pool.
+        """
+        return await self._submit(True, fn, args, kwargs, timeout)
+
+    def shutdown(self, wait: bool = False) -> None:
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=True)
+        self._threads = self._processes = None
+
+
+_executor: Optional[CpuExecutor] = None
+
+
+def cpu_executor() -> CpuExecutor:
+    """
+    Process-wide executor for semantic work, configured from the environment.
+    """
+    global _executor
+    if _executor is None:
+        kind = os.getenv("AGENT_EXECUTOR_KIND", "thread").lower()
+        if kind not in ("thread", "process"):
+            logger.warning(f"Unknown AGENT_EXECUTOR_KIND={kind!r}, using a thread pool")
+            kind = "thread"
+        try:
+            workers = int(os.getenv("AGENT_EXECUTOR_WORKERS", min(4, os.cpu_count() or 1)))
+            max_queue = int(os.getenv("AGENT_EXECUTOR_MAX_QUEUE", 64))
+            timeout = float(os.getenv("AGENT_EXECUTOR_TIMEOUT_SECONDS", 10))
+        except ValueError:
+            logger.warning("Invalid AGENT_EXECUTOR_WORKERS/MAX_QUEUE/TIMEOUT_SECONDS, using defaults")
+            workers, max_queue, timeout = min(4, os.cpu_count() or 1), 64, 10.0
+        _executor = CpuExecutor("semantic", kind=kind, workers=workers, max_queue=max_queue, timeout=timeout)
+    return _executor
+
+
+def shutdown_cpu_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
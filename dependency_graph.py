@@ -0,0 +1,345 @@
+"""
+Incremental dependency-graph index over the `dependencies` lists of agent records, stored in Redis
+- Maintained on write: every create/update/delete of a record updates its node, so nothing is ever
+  recomputed from the whole registry
+- Forward edges (`<registry>:graph:deps:<id>`) and reverse edges (`<registry>:graph:dependents:<id>`)
+  are sets; `<registry>:graph:state` holds each node's state (pending, active or done) and
+  `<registry>:graph:blocking` its number of unfinished dependencies
+- `<registry>:graph:ready` is a sorted set of the pending nodes with no unfinished dependency, scored
+  by priority, so "what can run next" is a ZREVRANGE: proportional to the result, not the registry
+- When a node finishes (or is reopened) only its direct dependents' counters move by one
+- Every insert runs a cycle check (a DFS over the forward edges, inside the same script); a write
+  that would close a cycle is rejected with the offending path
+- Updates that change a record's dependencies claim the new edges with link() before the record is
+  written: the cycle check and the edge write are one script, so two concurrent updates cannot each
+  pass a check and then close a cycle together. Once the record is written, put_many(edges=False)
+  moves the node's state without touching the claimed edges; if the write does not apply, revert()
+  puts the node back in line with the stored record
+
+Dependencies on IDs the graph does not know (not created yet, deleted or archived) do not block.
+The reverse edges to such IDs are kept, so a dependency created later starts blocking its
+dependents as soon as it is written.
+
+Keys are derived inside the scripts, so they assume a standalone (non-cluster) Redis.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter
+from redis.exceptions import NoScriptError
+
+logger = logging.getLogger("dependency_graph")
+
+STATE_PENDING = "pending"
+STATE_ACTIVE = "active"
+STATE_DONE = "done"
+
+# Record statuses that count as finished for every agent
+DONE_STATUSES = ("completed", "archived")
+
+rejected_cycles = Counter("dependency_graph_cycles_rejected_total", "Writes rejected because they would close a dependency cycle", ["registry"])
+
+_GRAPH_HELPERS_LUA = r"""
+local prefix = KEYS[1]
+local state_key, blocking_key, priority_key, ready_key = prefix .. 'state', prefix .. 'blocking', prefix .. 'priority', prefix .. 'ready'
+
+local function is_open(state)
+    return (state and state ~= 'done') and true or false
+end
+
+local function refresh(id)
+    if redis.call('HGET', state_key, id) == 'pending' and (tonumber(redis.call('HGET', blocking_key, id)) or 0) <= 0 then
+        redis.call('ZADD', ready_key, tonumber(redis.call('HGET', priority_key, id)) or 1, id)
+    else
+        redis.call('ZREM', ready_key, id)
+    end
+end
+
+local function count_blocking(id)
+    local blocking = 0
+    for _, dep in ipairs(redis.call('SMEMBERS', prefix .. 'deps:' .. id)) do
+        if is_open(redis.call('HGET', state_key, dep)) then blocking = blocking + 1 end
+    end
+    return blocking
+end
+
+local function set_edges(id, deps)
+    local deps_key = prefix .. 'deps:' .. id
+    for _, dep in ipairs(redis.call('SMEMBERS', deps_key)) do
+        redis.call('SREM', prefix .. 'dependents:' .. dep, id)
+    end
+    redis.call('DEL', deps_key)
+    for _, dep in ipairs(deps) do
+        redis.call('SADD', deps_key, dep)
+        redis.call('SADD', prefix .. 'dependents:' .. dep, id)
+    end
+end
+
+local function propagate(id, delta)
+    for _, dependent in ipairs(redis.call('SMEMBERS', prefix .. 'dependents:' .. id)) do
+        if redis.call('HEXISTS', state_key, dependent) == 1 then
+            redis.call('HINCRBY', blocking_key, dependent, delta)
+            refresh(dependent)
+        end
+    end
+end
+"""
+
+# KEYS[1] = graph key prefix
+# ARGV    = mode, n_items, (id, state, priority, n_deps, dep*)*
+# Modes: "check" writes nothing; "link" replaces only the forward edges (state and priority are
+# ignored); "put" replaces the edges and the node; "state" moves the node and keeps its edges. "state"
+# runs no cycle check: it only adds edges to a node the graph did not know (a record written before the
+# index existed), and those are the record's stored dependencies.
+# Items are applied in order, so later items see the edges of earlier ones.
+# Returns one array per item: empty when accepted, otherwise the cycle (id, dep, ..., id) the item
+# would have closed; rejected items are not applied.
+UPDATE_GRAPH_LUA = _GRAPH_HELPERS_LUA + r"""
+local function find_cycle(id, deps)
+    local parent, stack = {}, {}
+    for _, dep in ipairs(deps) do
+        if dep == id then return {id, id} end
+        if parent[dep] == nil then
+            parent[dep] = id
+            stack[#stack + 1] = dep
+        end
+    end
+    while #stack > 0 do
+        local node = table.remove(stack)
+        for _, next_id in ipairs(redis.call('SMEMBERS', prefix .. 'deps:' .. node)) do
+            if next_id == id then
+                local reversed, current = {}, node
+                while current ~= id do
+                    reversed[#reversed + 1] = current
+                    current = parent[current]
+                end
+                local path = {id}
+                for i = #reversed, 1, -1 do path[#path + 1] = reversed[i] end
+                path[#path + 1] = id
+                return path
+            end
+            if parent[next_id] == nil then
+                parent[next_id] = node
+                stack[#stack + 1] = next_id
+            end
+        end
+    end
+    return nil
+end
+
+local mode = ARGV[1]
+local n_items = tonumber(ARGV[2])
+local pos = 3
+local result = {}
+for _ = 1, n_items do
+    local id, state, priority = ARGV[pos], ARGV[pos + 1], ARGV[pos + 2]
+    local n_deps = tonumber(ARGV[pos + 3])
+    local deps = {}
+    for i = 1, n_deps do deps[i] = ARGV[pos + 3 + i] end
+    pos = pos + 4 + n_deps
+    local cycle = nil
+    if mode ~= 'state' then cycle = find_cycle(id, deps) end
+    if cycle then
+        result[#result + 1] = cycle
+    else
+        result[#result + 1] = {}
+        if mode == 'link' then
+            set_edges(id, deps)
+            if redis.call('HEXISTS', state_key, id) == 1 then
+                redis.call('HSET', blocking_key, id, count_blocking(id))
+                refresh(id)
+            end
+        elseif mode == 'put' or mode == 'state' then
+            local previous = redis.call('HGET', state_key, id)
+            local was_open = is_open(previous)
+            if mode == 'put' or not previous then set_edges(id, deps) end
+            redis.call('HSET', state_key, id, state)
+            redis.call('HSET', blocking_key, id, count_blocking(id))
+            redis.call('HSET', priority_key, id, priority)
+            refresh(id)
+            local now_open = is_open(state)
+            if was_open ~= now_open then propagate(id, now_open and 1 or -1) end
+        end
+    end
+end
+return result
+"""
+
+UPDATE_GRAPH_SHA = hashlib.sha1(UPDATE_GRAPH_LUA.encode("utf-8")).hexdigest()
+
+# KEYS[1] = graph key prefix
+# ARGV    = ids to remove
+# Unfinished nodes stop blocking their dependents; edges claimed by link() for an ID without a node
+# are dropped too. Returns the number of nodes removed.
+REMOVE_NODES_LUA = _GRAPH_HELPERS_LUA + r"""
+local removed = 0
+for _, id in ipairs(ARGV) do
+    set_edges(id, {})
+    local state = redis.call('HGET', state_key, id)
+    if state then
+        redis.call('HDEL', state_key, id)
+        redis.call('HDEL', blocking_key, id)
+        redis.call('HDEL', priority_key, id)
+        redis.call('ZREM', ready_key, id)
+        if is_open(state) then propagate(id, -1) end
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+REMOVE_NODES_SHA = hashlib.sha1(REMOVE_NODES_LUA.encode("utf-8")).hexdigest()
+
+
+class DependencyCycle(Exception):
+    """
+    Raised when a write would make a record (transitively) depend on itself.
+    `path` lists the cycle from the record back to itself.
+    """
+    def __init__(self, record_id: str, path: Sequence[str]):
+        super().__init__(f"Dependency cycle for {record_id}: {' -> '.join(path)}")
+        self.record_id = record_id
+        self.path = list(path)
+
+
+def node_state(status: Optional[str]) -> str:
+    """
+    Graph state of a record status: pending records can become ready, finished ones stop blocking.
+    """
+    if status in DONE_STATUSES:
+        return STATE_DONE
+    if status == "pending":
+        return STATE_PENDING
+    return STATE_ACTIVE
+
+
+def _unique(dependencies: Optional[Iterable[str]]) -> List[str]:
+    return list(dict.fromkeys(dep for dep in (dependencies or []) if dep))
+
+
+class DependencyGraph:
+    """
+    Dependency-graph index of one registry (keys under `<registry>:graph:`).
+    Records are described by their `status`, `priority` and `dependencies` fields.
+    """
+    # Fields a write must touch to move its node
+    FIELDS = ("status", "priority", "dependencies")
+
+    def __init__(self, registry: str):
+        self.registry = registry
+        self.prefix = f"{registry}:graph:"
+        self.ready_key = f"{self.prefix}ready"
+        self.blocking_key = f"{self.prefix}blocking"
+
+    def affects(self, fields: Iterable[str]) -> bool:
+        """
+        Whether a write of `fields` changes the record's node.
+        """
+        return any(field in self.FIELDS for field in fields)
+
+    async def _evalsha(self, conn, source: str, sha: str, args: List[Any]):
+        try:
+            return await conn.evalsha(sha, 1, self.prefix, *args)
+        except NoScriptError:
+            await conn.script_load(source)
+            return await conn.evalsha(sha, 1, self.prefix, *args)
+
+    async def _update(self, conn, mode: str, items: List[Tuple[str, str, Any, List[str]]]) -> List[Optional[List[str]]]:
+        if not items:
+            return []
+        args: List[Any] = [mode, len(items)]
+        for record_id, state, priority, deps in items:
+            args.extend([record_id, state, priority, len(deps), *deps])
+        raw = await self._evalsha(conn, UPDATE_GRAPH_LUA, UPDATE_GRAPH_SHA, args)
+        cycles = [list(path) if path else None for path in raw]
+        rejected = sum(cycle is not None for cycle in cycles)
+        if rejected:
+            rejected_cycles.labels(self.registry).inc(rejected)
+        return cycles
+
+    async def check(self, conn, items: Sequence[Tuple[str, Optional[Iterable[str]]]]) -> List[Optional[List[str]]]:
+        """
+        Cycle check for (record_id, dependencies) pairs without writing anything.
+        Returns per item None, or the cycle the new dependencies would close.
+        """
+        return await self._update(conn, "check", [(record_id, "", 0, _unique(deps)) for record_id, deps in items])
+
+    async def link(self, conn, items: Sequence[Tuple[str, Optional[Iterable[str]]]]) -> List[Optional[List[str]]]:
+        """
+        Cycle check and claim the new edges of (record_id, dependencies) pairs in one script, before the
+        records are written. Returns per item None, or the cycle it would have closed (nothing written for it).
+        """
+        return await self._update(conn, "link", [(record_id, "", 0, _unique(deps)) for record_id, deps in items])
+
+    async def put_many(self, conn, items: Sequence[Tuple[str, Dict[str, Any]]], edges: bool = True) -> List[Optional[List[str]]]:
+        """
+        Insert or refresh the nodes of (record_id, record) pairs in one round trip.
+        Returns per item None, or the cycle it would have closed (that item is left unchanged).
+        With edges=False only the nodes' state and priority move; their edges stay as link() left them.
+        """
+        return await self._update(conn, "put" if edges else "state", [
+            (record_id, node_state(record.get("status")), record.get("priority") if record.get("priority") is not None else 1, _unique(record.get("dependencies")))
+            for record_id, record in items
+        ])
+
+    async def put(self, conn, record_id: str, record: Dict[str, Any], edges: bool = True) -> None:
+        """
+        Insert or refresh one record's node. Raises DependencyCycle.
+        """
+        [cycle] = await self.put_many(conn, [(record_id, record)], edges)
+        if cycle:
+            raise DependencyCycle(record_id, cycle)
+
+    async def revert(self, conn, items: Sequence[Tuple[str, Optional[Dict[str, Any]]]]) -> None:
+        """
+        Undo link() for writes that did not apply: put each node back in line with the stored record
+        (None when the record does not exist).
+        """
+        stored = [(record_id, record) for record_id, record in items if record is not None]
+        await self.remove(conn, [record_id for record_id, record in items if record is None])
+        if stored:
+            await self._put_logged(conn, stored)
+
+    async def remove(self, conn, record_ids: Sequence[str]) -> int:
+        """
+        Drop nodes (deleted or archived records). Returns the number of nodes removed.
+        """
+        if not record_ids:
+            return 0
+        return await self._evalsha(conn, REMOVE_NODES_LUA, REMOVE_NODES_SHA, list(record_ids))
+
+    async def ready(self, conn, limit: int = 100) -> List[str]:
+        """
+        IDs of up to `limit` pending records whose dependencies are all finished, highest priority first.
+        """
+        return await conn.zrevrange(self.ready_key, 0, limit - 1)
+
+    async def blocking(self, conn, record_id: str) -> Optional[int]:
+        """
+        Number of unfinished dependencies of a record (None when the graph does not know it).
+        """
+        count = await conn.hget(self.blocking_key, record_id)
+        return int(count) if count is not None else None
+
+    async def rebuild(self, conn, items, batch_size: int = 500) -> int:
+        """
+        (Re)insert the nodes of an async iterable of (record_id, record) pairs, e.g. for records written
+        before the index existed. Insertion order does not matter. Returns the number of records seen;
+        records that would close a cycle are logged and skipped.
+        """
+        count = 0
+        batch = []
+        async for record_id, record in items:
+            batch.append((record_id, record))
+            count += 1
+            if len(batch) >= batch_size:
+                await self._put_logged(conn, batch)
+                batch = []
+        await self._put_logged(conn, batch)
+        return count
+
+    async def _put_logged(self, conn, batch) -> None:
+        for (record_id, _), cycle in zip(batch, await self.put_many(conn, batch)):
+            if cycle:
+                logger.warning(f"Skipped {record_id} in {self.registry}: dependency cycle {' -> '.join(cycle)}")
@@ -1,7 +1,8 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from dev_agent.api import dev_router
 from dev_agent.security import validate_jwt
-from dev_agent.rate_limit import init_rate_limiter
+from dev_agent.rate_limit import init_rate_limiter, shutdown_rate_limiter
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 from dev_agent.metrics import update_redis_circuit_metric
@@ -10,32 +11,41 @@ from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExport
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry import trace
+from dev_agent.resources import dev_lifespan
+from cpu_executor import ExecutorUnavailable
+from resilience import DependencyUnavailable
+from contextlib import asynccontextmanager
+import asyncio
+import math
 import os
 
-app = FastAPI()
-
-@app.on_event("startup")
-async def startup_event():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     """
-    Initialize FastAPI Limiter, Prometheus metrics, and OpenTelemetry tracing on startup.
-    Tracing is exported via OTLP to the endpoint specified by OTEL_EXPORTER_OTLP_ENDPOINT (default: http://localhost:4318/v1/traces).
+    Start the rate limiter's Redis reconciliation and the circuit breaker metric on startup, and build and warm the shared
+    DEV resources (see dev_agent/resources.py). /health reports ready once warmup is done.
     """
-    import asyncio
     await init_rate_limiter(app)
-    Instrumentator().instrument(app).expose(app)
     # Schedule Redis circuit breaker metric update
     async def update_metric_periodically():
         while True:
             update_redis_circuit_metric()
             await asyncio.sleep(5)
-    asyncio.create_task(update_metric_periodically())
-    # OpenTelemetry tracing setup
-    otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
-    tracer_provider = TracerProvider()
-    span_processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint))
-    tracer_provider.add_span_processor(span_processor)
-    trace.set_tracer_provider(tracer_provider)
-    FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
+    metric_task = asyncio.create_task(update_metric_periodically())
+    async with dev_lifespan(app):
+        yield
+    metric_task.cancel()
+    await shutdown_rate_limiter(app)
+
+app = FastAPI(lifespan=lifespan)
+# Middleware and metrics routes must be in place before startup, so instrumentation happens at import time
+Instrumentator().instrument(app).expose(app)
+# OpenTelemetry tracing, exported via OTLP to OTEL_EXPORTER_OTLP_ENDPOINT (default: http://localhost:4318/v1/traces)
+otlp_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+tracer_provider = TracerProvider()
+tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint)))
+trace.set_tracer_provider(tracer_provider)
+FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
 
 app.include_router(dev_router)
 
@@ -48,6 +58,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ExecutorUnavailable)
+async def executor_unavailable(request, exc: ExecutorUnavailable):
+    """
+    Semantic work queue full or timed out (cpu_executor.py): transient, the client should retry.
+    """
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable(request, exc: DependencyUnavailable):
+    """
+    Redis circuit breaker open or no concurrency slot in time (resilience.py): transient, the client should retry.
+    """
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
 @app.get("/health")
 async def health():
+    """
+    Readiness: 200 once the shared resources are warm, 503 while warmup is still running.
+    """
+    resources = app.state.dev_resources
+    if not resources.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ok", "warmup_seconds": resources.warmup_seconds, "indexed_tasks": resources.indexed_tasks}
+
+@app.get("/live")
+async def live():
+    """
+    Liveness: the process is up, whether or not warmup has finished.
+    """
     return {"status": "ok"}
@@ -1,44 +1,100 @@
-import json
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Optional
+import os
+import time
+from typing import List, Dict, Optional, Tuple
 import redis.asyncio as redis
+from record_store import record_layout
+from semantic_index import semantic_index, related_ids
+from similarity import similarity_service
+
+# Other agents' records suggested alongside related DEV tasks
+RELATED_SOURCES = ("pm", "ta", "qa")
 
 class AIHintEngine:
-    def __init__(self, redis_conn):
+    def __init__(self, redis_conn, store=None, semantic=None):
         self.redis = redis_conn
-        self.vectorizer = TfidfVectorizer(stop_words='english')
         self.task_registry = "dev:tasks"
+        self.store = store or record_layout(self.task_registry, "dev:task:")
+        # Task descriptions are the "dev" source of the process-wide cross-agent index
+        # (semantic_index.py), kept up to date by DevStateManager's writes (index_task/unindex_tasks).
+        # Tasks written by another process are picked up from the cache invalidations they publish.
+        self.semantic = semantic or semantic_index(redis_conn)
+        # Tokenising, index refreshes and similarity queries run on the shared CPU executor, off the event loop
+        self.executor = self.semantic.executor
+        # Conflict-resolution similarity takes its IDF from the same index
+        self.similarity = similarity_service(self.task_registry, corpus=self.semantic.index)
+        # dev:module_maintainers snapshot, refreshed after DEV_AGENT_MAINTAINERS_TTL seconds
+        self.maintainers_ttl = float(os.getenv("DEV_AGENT_MAINTAINERS_TTL", 300))
+        self._maintainers: Optional[Dict[str, str]] = None
+        self._maintainers_loaded_at = 0.0
+
+    async def warm(self) -> int:
+        """
+        Load the semantic index (all sources) and the module maintainers map ahead of the first request.
+        Returns the number of indexed tasks.
+        """
+        await self.semantic.warm()
+        await self._load_maintainers()
+        return self.semantic.size("dev")
+
+    def invalidate(self) -> None:
+        """
+        Drop the indexed tasks so the next lookup reloads them from Redis.
+        """
+        self.semantic.invalidate("dev")
+
+    def index_task(self, task_id: str, description: Optional[str], created: bool = False) -> None:
+        """
+        Add or re-index one task after it was written. `created` marks a task new to the registry.
+        """
+        self.semantic.index_record("dev", task_id, description, created=created)
+
+    def unindex_tasks(self, task_ids: List[str]) -> None:
+        """
+        Remove tasks that left the registry (deleted or archived).
+        """
+        self.semantic.unindex_records("dev", task_ids)
+
+    async def _load_maintainers(self) -> None:
+        self._maintainers = await self.redis.hgetall("dev:module_maintainers")
+        self._maintainers_loaded_at = time.monotonic()
 
     async def suggest_task_fields(self, description: str, context: dict) -> dict:
-        existing_tasks = await self._get_similar_tasks(description)
-        assigned_to = await self._suggest_assignee(context.get('module'))
-        return {
-            "priority": self._suggest_priority(description),
-            "dependencies": self._suggest_dependencies(existing_tasks),
-            "assigned_to": assigned_to
-        }
-
-    async def _get_similar_tasks(self, query: str, threshold=0.4) -> List[dict]:
-        all_tasks_raw = await self.redis.hvals(self.task_registry)
-        all_tasks = [json.loads(t) for t in all_tasks_raw]
-        if not all_tasks:
+        [suggestions] = await self.suggest_task_fields_batch([(description, context)])
+        return suggestions
+
+    async def suggest_task_fields_batch(self, items: List[Tuple[str, dict]], threshold=0.4) -> List[dict]:
+        """
+        Suggestions for many (description, context) pairs at once: all descriptions are scored in one
+        query-by-index similarity matrix over every agent's records, and the matched tasks of the
+        whole batch are fetched in one round trip. Besides DEV dependencies, each suggestion lists
+        the related PM tasks, TA decisions and QA tests. Results are in input order.
+        """
+        if not items:
             return []
-        descriptions = [t['description'] for t in all_tasks] + [query]
-        matrix = self.vectorizer.fit_transform(descriptions)
-        similarities = cosine_similarity(matrix[-1], matrix[:-1]).flatten()
-        similar_idxs = np.where(similarities > threshold)[0]
-        return [all_tasks[i] for i in similar_idxs]
+        found = await self.semantic.search([description for description, _ in items], ("dev",) + RELATED_SOURCES, threshold=0.0)
+        matches = [[task_id for task_id, score in task_matches["dev"] if score > threshold] for task_matches in found]
+        matched_ids = sorted({task_id for ids in matches for task_id in ids})
+        # Matches are re-read so their status is current
+        tasks = await self.store.get_mapping(self.redis, matched_ids)
+        # Each distinct module's maintainer is resolved once for the whole batch
+        assignees = await self._suggest_assignees({(context or {}).get('module') for _, context in items})
+        suggestions = []
+        for (description, context), ids, task_matches in zip(items, matches, found):
+            suggestions.append({
+                "priority": self._suggest_priority(description),
+                "dependencies": self._suggest_dependencies([tasks[task_id] for task_id in ids if task_id in tasks]),
+                "assigned_to": assignees.get((context or {}).get('module')),
+                "related": related_ids(task_matches, RELATED_SOURCES)
+            })
+        return suggestions
 
     async def semantic_similarity(self, desc_a: str, desc_b: str) -> float:
         """
-        Compute semantic similarity between two task descriptions using TF-IDF and cosine similarity.
+        Compute semantic similarity between two task descriptions using TF-IDF and cosine similarity,
+        weighted by the task corpus's IDF; vectors are memoized per description.
         Returns a float between 0 (not similar) and 1 (identical).
         """
-        matrix = self.vectorizer.fit_transform([desc_a, desc_b])
-        sim = cosine_similarity(matrix[0], matrix[1])[0, 0]
-        return float(sim)
+        return await self.executor.run_local(self.similarity.similarity, desc_a, desc_b)
 
     def _suggest_priority(self, text: str) -> int:
         urgency_terms = {'critical': 4, 'urgent': 3, 'important': 2}
@@ -50,10 +106,17 @@ class AIHintEngine:
     def _suggest_dependencies(self, similar_tasks: List[dict]) -> List[str]:
         return list({t['id'] for t in similar_tasks if t.get('status') not in ['completed', 'archived']})
 
-    async def _suggest_assignee(self, module: Optional[str]) -> Optional[str]:
-        if not module:
-            return None
-        maintainers = await self.redis.hget("dev:module_maintainers", module)
-        if maintainers:
-            return maintainers.split(',')[0]
-        return None
+    async def _suggest_assignees(self, modules) -> Dict[str, Optional[str]]:
+        """
+        First maintainer of each module (None for modules without one).
+        """
+        modules = [module for module in modules if module]
+        if not modules:
+            return {}
+        if self._maintainers is None or time.monotonic() - self._maintainers_loaded_at > self.maintainers_ttl:
+            await self._load_maintainers()
+        assignees = {}
+        for module in modules:
+            maintainers = self._maintainers.get(module)
+            assignees[module] = maintainers.split(',')[0] if maintainers else None
+        return assignees
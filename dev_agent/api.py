@@ -1,14 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, List, Optional, Literal, Tuple
 from .core import DevStateManager, DevTask
 from .security import validate_jwt
 from .rate_limit import default_rate_limiter
+from redis_scripts import VersionConflict
+from dependency_graph import DependencyCycle
+from record_store import parse_fields
+from conflict_resolution import MAX_CONFLICT_PAIRS
 import uuid
+import json
+import os
 
-# Dependency injection for DevStateManager
-async def get_state_manager() -> DevStateManager:
+# Dependency injection for DevStateManager: the app-lifespan instance (see resources.py) when the
+# router is mounted in the DEV app, otherwise a fresh manager (e.g. router-only test apps)
+async def get_state_manager(request: Request) -> DevStateManager:
+    resources = getattr(request.app.state, "dev_resources", None)
+    if resources is not None:
+        return resources.state_manager
     return DevStateManager()
 
 dev_router = APIRouter(prefix="/dev", tags=["Developer"])
@@ -20,6 +30,30 @@ class DevTaskRequest(BaseModel):
     dependencies: List[str] = []
     priority: int = 1
 
+class DevBulkTaskRequest(BaseModel):
+    # Items are validated one by one so that a bad item is reported without failing the batch
+    tasks: List[Dict[str, Any]]
+
+# Upper bound on tasks per /dev/create_tasks call (and descriptions per /dev/suggest_task_fields/batch call)
+MAX_BULK_TASKS = int(os.getenv("DEV_AGENT_MAX_BULK_TASKS", 500))
+
+class DevSuggestItem(BaseModel):
+    description: str
+    context: Dict[str, Any] = {}
+
+class DevSuggestBatchRequest(BaseModel):
+    items: List[DevSuggestItem]
+
+class DevConflictBatchRequest(BaseModel):
+    pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+
+class DevClaimRequest(BaseModel):
+    worker: str
+    count: int = Field(1, ge=1, le=MAX_BULK_TASKS)
+
+class DevLeaseRequest(BaseModel):
+    worker: str
+
 class DevTaskUpdate(BaseModel):
     description: Optional[str] = None
     assigned_to: Optional[str] = None
@@ -27,6 +61,7 @@ class DevTaskUpdate(BaseModel):
     context: Optional[Dict[str, Any]] = None
     dependencies: Optional[List[str]] = None
     priority: Optional[int] = None
+    version: Optional[int] = None  # expected current version; the update is rejected with 409 if it is stale
 
 
 from fastapi import Query
@@ -36,13 +71,18 @@ async def create_task(
     req: DevTaskRequest,
     state_manager: DevStateManager = Depends(get_state_manager),
     enable_ai_hints: bool = Query(False, description="Enable AI hints for task field suggestions"),
-    preview: bool = Query(False, description="Preview suggested fields without creating task")
+    preview: bool = Query(False, description="Preview suggested fields without creating task"),
+    dedupe: Optional[Literal["warn", "reject"]] = Query(None, description="Check for near-duplicate tasks: warn lists them, reject returns 409")
 ):
     """
     Create a new developer task, optionally using AI hints for field suggestion. Supports preview mode for suggestions.
+    With ?dedupe= existing tasks with a near-identical description (MinHash/LSH) are reported or block creation.
     """
     task_data = req.dict()
     suggestions = {}
+    duplicates = await state_manager.find_duplicates(req.description) if dedupe else []
+    if dedupe == "reject" and duplicates:
+        raise HTTPException(status_code=409, detail={"message": "Near-duplicate tasks exist", "duplicates": duplicates})
     # AI hint logic
     if enable_ai_hints:
         suggestions = await state_manager.suggest_task_fields(req.description, req.context)
@@ -51,7 +91,10 @@ async def create_task(
             if k not in task_data or not task_data[k]:
                 task_data[k] = v
     if preview:
-        return {"proposed_task": task_data, "suggestions": suggestions}
+        response = {"proposed_task": task_data, "suggestions": suggestions}
+        if dedupe:
+            response["duplicates"] = duplicates
+        return response
     # Create and persist the task
     task = DevTask(
         id=f"devtask_{uuid.uuid4().hex}",
@@ -63,7 +106,64 @@ async def create_task(
         priority=task_data.get("priority", 1)
     )
     task_id = await state_manager.create_task(task.dict())
-    return {"task_id": task_id, "applied_suggestions": suggestions}
+    response = {"task_id": task_id, "applied_suggestions": suggestions}
+    if dedupe:
+        response["duplicates"] = duplicates
+    return response
+
+@dev_router.post("/create_tasks", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
+async def create_tasks(
+    req: DevBulkTaskRequest,
+    state_manager: DevStateManager = Depends(get_state_manager),
+    enable_ai_hints: bool = Query(False, description="Enable AI hints for task field suggestions"),
+    preview: bool = Query(False, description="Preview suggested fields without creating tasks")
+):
+    """
+    Create many developer tasks in one call. AI hints for the whole batch come from a single
+    similarity pass and all valid tasks are written in one Redis pipeline.
+    Returns one result per input item, in order: {"index", "task_id", "applied_suggestions"} or {"index", "error"}.
+    """
+    if len(req.tasks) > MAX_BULK_TASKS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_TASKS} tasks per request")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(req.tasks)
+    valid = []
+    for index, item in enumerate(req.tasks):
+        try:
+            valid.append((index, DevTaskRequest(**item).dict()))
+        except ValidationError as e:
+            results[index] = {"index": index, "error": str(e)}
+    suggestions = [{} for _ in valid]
+    if enable_ai_hints and valid:
+        suggestions = await state_manager.ai_hint_engine.suggest_task_fields_batch([(data["description"], data["context"]) for _, data in valid])
+        for (_, task_data), item_suggestions in zip(valid, suggestions):
+            for k, v in item_suggestions.items():
+                if k not in task_data or not task_data[k]:
+                    task_data[k] = v
+    if preview:
+        return {"proposed_tasks": [task_data for _, task_data in valid], "suggestions": suggestions}
+    tasks = []
+    for index, task_data in valid:
+        try:
+            task = DevTask(
+                id="",
+                description=task_data["description"],
+                assigned_to=task_data.get("assigned_to"),
+                status="pending",
+                context=task_data.get("context"),
+                dependencies=task_data.get("dependencies", []),
+                priority=task_data.get("priority", 1)
+            )
+            tasks.append((index, task.dict()))
+        except ValidationError as e:
+            results[index] = {"index": index, "error": str(e)}
+    created = await state_manager.create_tasks([task for _, task in tasks])
+    applied = dict(zip((index for index, _ in valid), suggestions))
+    for (index, _), outcome in zip(tasks, created):
+        if isinstance(outcome, Exception):
+            results[index] = {"index": index, "error": str(outcome)}
+        else:
+            results[index] = {"index": index, "task_id": outcome, "applied_suggestions": applied[index]}
+    return {"results": results, "created": sum(1 for r in results if "task_id" in r)}
 
 @dev_router.post("/suggest_task_fields", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
 async def suggest_task_fields(
@@ -76,24 +176,102 @@ async def suggest_task_fields(
     suggestions = await state_manager.suggest_task_fields(req.description, req.context)
     return {"suggestions": suggestions}
 
+@dev_router.post("/suggest_task_fields/batch", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
+async def suggest_task_fields_batch(
+    req: DevSuggestBatchRequest,
+    state_manager: DevStateManager = Depends(get_state_manager)
+):
+    """
+    Suggestions for many descriptions in one call: all of them are scored against the index in a
+    single sparse matrix product, and each distinct module's maintainer is looked up once.
+    Returns one suggestion per item, in order.
+    """
+    if len(req.items) > MAX_BULK_TASKS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_TASKS} items per request")
+    suggestions = await state_manager.ai_hint_engine.suggest_task_fields_batch([(item.description, item.context) for item in req.items])
+    return {"suggestions": suggestions}
+
 
 @dev_router.get("/status/{task_id}", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
-async def get_task_status(task_id: str, state_manager: DevStateManager = Depends(get_state_manager)):
+async def get_task_status(
+    task_id: str,
+    state_manager: DevStateManager = Depends(get_state_manager),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return (e.g. fields=status)")
+):
     """
     Get the status of a developer task by ID. Rate limited per user/IP.
+    With ?fields= only those fields are read from Redis (HMGET under the hash layout).
     """
-    task = await state_manager.get_task(task_id)
-    if not task:
+    task = await state_manager.get_task(task_id, fields=parse_fields(fields))
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"task": task}
 
 @dev_router.get("/list", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
-async def list_tasks(state_manager: DevStateManager = Depends(get_state_manager)):
+async def list_tasks(
+    state_manager: DevStateManager = Depends(get_state_manager),
+    status: Optional[str] = Query(None, description="Only return tasks with this status"),
+    assigned_to: Optional[str] = Query(None, description="Only return tasks assigned to this developer"),
+    min_priority: Optional[int] = Query(None, description="Only return tasks with at least this priority"),
+    cursor: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size hint"),
+    stream: bool = Query(False, description="Stream all matching tasks as NDJSON instead of returning a page"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return for each task")
+):
     """
-    List all developer tasks. Rate limited per user/IP.
+    List developer tasks, optionally filtered by status, assignee and minimum priority.
+    Filters are served from secondary indexes; unfiltered listings are cursor-paginated with HSCAN
+    (follow next_cursor until it is 0). With stream=true the response is NDJSON, one task per line.
+    ?fields= restricts each task to those fields. Rate limited per user/IP.
     """
-    tasks = await state_manager.list_tasks()
-    return {"tasks": tasks}
+    projection = parse_fields(fields)
+    if stream:
+        lines = (json.dumps(task) + "\n" async for task in state_manager.iter_tasks(status=status, assigned_to=assigned_to, min_priority=min_priority, fields=projection))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    if status is not None or assigned_to is not None or min_priority is not None:
+        tasks = await state_manager.list_tasks(status=status, assigned_to=assigned_to, min_priority=min_priority, fields=projection)
+        return {"tasks": tasks}
+    next_cursor, tasks = await state_manager.scan_tasks(cursor=cursor, limit=limit, fields=projection)
+    return {"tasks": tasks, "next_cursor": next_cursor}
+
+@dev_router.get("/ready", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
+async def ready_tasks(
+    state_manager: DevStateManager = Depends(get_state_manager),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of tasks to return"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return for each task")
+):
+    """
+    Pending developer tasks whose dependencies are all completed, highest priority first.
+    Served from the incremental dependency graph, so the cost is proportional to the result. Rate limited per user/IP.
+    """
+    return {"tasks": await state_manager.ready_tasks(limit=limit, fields=parse_fields(fields))}
+
+@dev_router.post("/claim", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
+async def claim_tasks(req: DevClaimRequest, state_manager: DevStateManager = Depends(get_state_manager)):
+    """
+    Lease up to `count` of the best pending tasks (priority boosted by age) to `worker`. No task is handed
+    to two workers: keep the lease with /heartbeat, finish by setting the task to completed, or /release it.
+    """
+    tasks = await state_manager.claim_tasks(req.worker, req.count)
+    return {"tasks": tasks, "lease_seconds": state_manager.queue.lease_seconds}
+
+@dev_router.post("/task/{task_id}/heartbeat", dependencies=[Depends(validate_jwt)])
+async def heartbeat_task(task_id: str, req: DevLeaseRequest, state_manager: DevStateManager = Depends(get_state_manager)):
+    """
+    Extend the worker's lease on a claimed task; 409 once the lease has expired or moved to another worker.
+    """
+    if not await state_manager.heartbeat_task(task_id, req.worker):
+        raise HTTPException(status_code=409, detail="Lease not held by this worker")
+    return {"lease_seconds": state_manager.queue.lease_seconds}
+
+@dev_router.post("/task/{task_id}/release", dependencies=[Depends(validate_jwt)])
+async def release_task(task_id: str, req: DevLeaseRequest, state_manager: DevStateManager = Depends(get_state_manager)):
+    """
+    Put a claimed task back in the queue without finishing it.
+    """
+    if not await state_manager.release_task(task_id, req.worker):
+        raise HTTPException(status_code=409, detail="Lease not held by this worker")
+    return {"status": "released"}
 
 @dev_router.put("/task/{task_id}", dependencies=[Depends(validate_jwt), Depends(default_rate_limiter())])
 async def update_task(task_id: str, updates: DevTaskUpdate, state_manager: DevStateManager = Depends(get_state_manager)):
@@ -103,6 +281,10 @@ async def update_task(task_id: str, updates: DevTaskUpdate, state_manager: DevSt
     try:
         updated_task = await state_manager.update_task(task_id, updates.dict(exclude_unset=True))
         return {"task": updated_task}
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except DependencyCycle as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "cycle": e.path})
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -115,3 +297,13 @@ async def delete_task(task_id: str, state_manager: DevStateManager = Depends(get
 async def resolve_conflict(task_a: Dict, task_b: Dict, state_manager: DevStateManager = Depends(get_state_manager)):
     resolved = await state_manager.resolve_conflict(task_a, task_b)
     return {"resolved_task": resolved}
+
+@dev_router.post("/resolve_conflict/batch", dependencies=[Depends(validate_jwt)])
+async def resolve_conflict_batch(req: DevConflictBatchRequest, state_manager: DevStateManager = Depends(get_state_manager)):
+    """
+    Resolve many task pairs at once (vectorized scoring, one batched similarity product).
+    Returns per pair, in order: {"winner": "a"|"b", "resolved", "path", "similarity", "score"}.
+    """
+    if len(req.pairs) > MAX_CONFLICT_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CONFLICT_PAIRS} pairs per request")
+    return {"results": await state_manager.resolve_conflicts(req.pairs)}
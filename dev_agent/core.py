@@ -1,10 +1,17 @@
+import logging
 import uuid
-import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Tuple, AsyncIterator, Sequence
 from pydantic import BaseModel, validator
-import redis.asyncio as redis
 from opentelemetry import trace
+from redis_pool import get_async_redis
+from record_store import record_layout
+from write_coalescer import coalescer_from_env, pipeline_flush
+from record_archive import RecordArchive, record_age
+from near_duplicates import DuplicateIndex
+from conflict_resolution import ConflictPolicy, resolve_pairs
+from dependency_graph import DependencyGraph, DependencyCycle
+from work_queue import WorkQueue
 
 class DevTask(BaseModel):
     id: str
@@ -36,76 +43,85 @@ class DevTask(BaseModel):
             raise ValueError(f"Status must be one of {valid_statuses}")
         return v
 
-from .circuit import redis_circuit_breaker
+from .circuit import redis_resilience
 
 from .ai_hints import AIHintEngine
+from redis_scripts import VersionConflict, MERGE_OK, MERGE_MISSING, MERGE_CONFLICT
+
+# The rules of DevStateManager.resolve_conflict, for batches of pairs
+CONFLICT_POLICY = ConflictPolicy(["description"], time_weight=0.5, priority_weight=0.3, dependency_weight=0.2, prefer_completed=True)
 
 class DevStateManager:
     """
-    State manager for developer agent tasks using async Redis with connection pooling, circuit breaker protection, batch pipelining, and context-aware AI hints for task creation.
+    State manager for developer agent tasks using async Redis with connection pooling, circuit breaker, retry and adaptive concurrency protection (resilience.py), batch pipelining, and context-aware AI hints for task creation.
     """
     def __init__(self, redis_url: str = None):
         """
-        Initialize DevStateManager with a robust, tuned Redis connection pool.
+        Initialize DevStateManager on the process-wide shared Redis pool (see redis_pool.py).
 
-        Pool parameters can be set via environment variables for flexibility:
+        Pool parameters can be set via environment variables for flexibility; they apply when
+        this manager is the first to open the pool for its URL and otherwise fall back to REDIS_POOL_*:
         - DEV_AGENT_REDIS_URL (default: 'redis://localhost:6379')
-        - DEV_AGENT_REDIS_MAX_CONNECTIONS (default: 100, int, min 1, recommended <= 1000)
-        - DEV_AGENT_REDIS_SOCKET_KEEPALIVE (default: True, bool)
-        - DEV_AGENT_REDIS_RETRY_ON_TIMEOUT (default: True, bool)
-        - DEV_AGENT_REDIS_SOCKET_CONNECT_TIMEOUT (default: 3, float, seconds)
-        - DEV_AGENT_REDIS_SOCKET_TIMEOUT (default: 5, float, seconds)
+        - DEV_AGENT_REDIS_MAX_CONNECTIONS (default: REDIS_POOL_MAX_CONNECTIONS, int, min 1, max 1000)
+        - DEV_AGENT_REDIS_SOCKET_KEEPALIVE (default: REDIS_SOCKET_KEEPALIVE, bool)
+        - DEV_AGENT_REDIS_RETRY_ON_TIMEOUT (default: REDIS_RETRY_ON_TIMEOUT, bool)
+        - DEV_AGENT_REDIS_SOCKET_CONNECT_TIMEOUT (default: REDIS_SOCKET_CONNECT_TIMEOUT, float, seconds)
+        - DEV_AGENT_REDIS_SOCKET_TIMEOUT (default: REDIS_SOCKET_TIMEOUT, float, seconds)
 
         Example:
-            export DEV_AGENT_REDIS_MAX_CONNECTIONS=200
+            export DEV_AGENT_REDIS_MAX_CONNECTIONS=30
             export DEV_AGENT_REDIS_SOCKET_KEEPALIVE=False
         """
         import os
         import logging
         logger = logging.getLogger("dev_agent.core")
         redis_url = redis_url or os.getenv("DEV_AGENT_REDIS_URL", "redis://localhost:6379")
-        # Validate and sanitize parameters
-        try:
-            max_connections = int(os.getenv("DEV_AGENT_REDIS_MAX_CONNECTIONS", 100))
-            if max_connections < 1:
-                logger.warning("DEV_AGENT_REDIS_MAX_CONNECTIONS < 1, resetting to 1")
-                max_connections = 1
-            if max_connections > 1000:
-                logger.warning("DEV_AGENT_REDIS_MAX_CONNECTIONS > 1000, capping at 1000")
-                max_connections = 1000
-        except Exception:
-            logger.warning("Invalid DEV_AGENT_REDIS_MAX_CONNECTIONS, using default 100")
-            max_connections = 100
-        socket_keepalive = os.getenv("DEV_AGENT_REDIS_SOCKET_KEEPALIVE", "True").lower() == "true"
-        retry_on_timeout = os.getenv("DEV_AGENT_REDIS_RETRY_ON_TIMEOUT", "True").lower() == "true"
-        try:
-            socket_connect_timeout = float(os.getenv("DEV_AGENT_REDIS_SOCKET_CONNECT_TIMEOUT", 3))
-            if socket_connect_timeout < 0:
-                logger.warning("DEV_AGENT_REDIS_SOCKET_CONNECT_TIMEOUT < 0, resetting to 0")
-                socket_connect_timeout = 0
-        except Exception:
-            logger.warning("Invalid DEV_AGENT_REDIS_SOCKET_CONNECT_TIMEOUT, using default 3")
-            socket_connect_timeout = 3
-        try:
-            socket_timeout = float(os.getenv("DEV_AGENT_REDIS_SOCKET_TIMEOUT", 5))
-            if socket_timeout < 0:
-                logger.warning("DEV_AGENT_REDIS_SOCKET_TIMEOUT < 0, resetting to 0")
-                socket_timeout = 0
-        except Exception:
-            logger.warning("Invalid DEV_AGENT_REDIS_SOCKET_TIMEOUT, using default 5")
-            socket_timeout = 5
+        # Agent-specific overrides of the shared REDIS_POOL_* settings, validated; unset means pool default
+        overrides = {}
+        max_connections = os.getenv("DEV_AGENT_REDIS_MAX_CONNECTIONS")
+        if max_connections is not None:
+            try:
+                overrides["max_connections"] = min(max(int(max_connections), 1), 1000)
+            except ValueError:
+                logger.warning("Invalid DEV_AGENT_REDIS_MAX_CONNECTIONS, using the shared pool default")
+        for name, key in (("DEV_AGENT_REDIS_SOCKET_KEEPALIVE", "socket_keepalive"), ("DEV_AGENT_REDIS_RETRY_ON_TIMEOUT", "retry_on_timeout")):
+            if os.getenv(name) is not None:
+                overrides[key] = os.getenv(name).lower() == "true"
+        for name, key in (("DEV_AGENT_REDIS_SOCKET_CONNECT_TIMEOUT", "socket_connect_timeout"), ("DEV_AGENT_REDIS_SOCKET_TIMEOUT", "socket_timeout")):
+            if os.getenv(name) is not None:
+                try:
+                    overrides[key] = max(float(os.getenv(name)), 0)
+                except ValueError:
+                    logger.warning(f"Invalid {name}, using the shared pool default")
         self.task_registry = "dev:tasks"
-        logger.info(f"[Redis Pool Settings] url={redis_url} max_connections={max_connections} keepalive={socket_keepalive} retry_on_timeout={retry_on_timeout} connect_timeout={socket_connect_timeout} timeout={socket_timeout}")
-        self.redis = redis.Redis.from_url(
-            redis_url,
-            decode_responses=True,
-            max_connections=max_connections,
-            socket_keepalive=socket_keepalive,
-            retry_on_timeout=retry_on_timeout,
-            socket_connect_timeout=socket_connect_timeout,
-            socket_timeout=socket_timeout
-        )
-        self.ai_hint_engine = AIHintEngine(self.redis)
+        # Blob (one hash of encoded records) or per-task hashes at dev:task:{id}, see record_store.py
+        self.store = record_layout(self.task_registry, "dev:task:")
+        # Cold tier for old completed tasks (dev:tasks:archive), see archive_tasks()
+        self.archive = RecordArchive(self.task_registry)
+        # MinHash/LSH buckets over descriptions for near-duplicate checks (dev:tasks:lsh:*)
+        self.duplicates = DuplicateIndex(self.task_registry)
+        # Dependency graph with unfinished-dependency counters, answers ready_tasks() (dev:tasks:graph:*)
+        self.graph = DependencyGraph(self.task_registry)
+        # Leased priority queue of pending tasks that workers claim from (queue:dev:*), follows status changes
+        self.queue = WorkQueue("dev")
+        # Secondary indexes: one set per status/assignee, one sorted set scored by priority
+        self.status_index_prefix = f"{self.task_registry}:idx:status:"
+        self.assignee_index_prefix = f"{self.task_registry}:idx:assigned_to:"
+        self.priority_index = f"{self.task_registry}:idx:priority"
+        logger.info(f"[Redis Pool Settings] url={redis_url} overrides={overrides}")
+        # Clients are cheap; connections come from the pool shared with every other manager for this URL
+        self.redis = get_async_redis(redis_url, **overrides)
+        self.ai_hint_engine = AIHintEngine(self.redis, store=self.store)
+        # Server-side merge (EVALSHA) that also keeps the secondary indexes in sync
+        self.merger = self.store.merger(index_specs=[
+            ("status", "set", self.status_index_prefix),
+            ("assigned_to", "set", self.assignee_index_prefix),
+            ("priority", "zset", self.priority_index),
+        ])
+        # Opt-in micro-batching (AGENT_WRITE_COALESCE): concurrent creates share one pipeline,
+        # concurrent updates one merge script call
+        self.create_coalescer = coalescer_from_env("dev_create_task", pipeline_flush(self.redis))
+        self.update_coalescer = coalescer_from_env("dev_update_task", lambda items: self.merger.merge(self.redis, items))
 
 
     async def suggest_task_fields(self, description: str, context: dict) -> dict:
@@ -116,58 +132,313 @@ class DevStateManager:
         return await self.ai_hint_engine.suggest_task_fields(description, context)
 
 
-    @redis_circuit_breaker
+    @redis_resilience
     async def create_task(self, task: dict) -> str:
         tracer = trace.get_tracer(__name__)
         with tracer.start_as_current_span("Redis Create Task"):
-            task = task.copy()
-            for k in ['created_at', 'updated_at']:
-                if k in task and hasattr(task[k], 'isoformat'):
-                    task[k] = task[k].isoformat()
             task_id = f"devtask_{uuid.uuid4().hex}"
-            await self.redis.hset(self.task_registry, task_id, json.dumps(task))
+            if self.create_coalescer is not None:
+                await self.create_coalescer.submit(lambda pipe: self._queue_create(pipe, task_id, task))
+            else:
+                pipe = self.redis.pipeline()
+                self._queue_create(pipe, task_id, task)
+                await pipe.execute()
+            self.store.invalidate([task_id])
+            # A fresh ID has no dependents yet, so a new task cannot close a cycle
+            await self.graph.put_many(self.redis, [(task_id, task)])
+            await self.queue.enqueue_pending(self.redis, [(task_id, task)])
+            self.ai_hint_engine.index_task(task_id, task.get("description"), created=True)
             return task_id
 
-    @redis_circuit_breaker
-    async def get_task(self, task_id: str) -> Optional[dict]:
+    def _queue_create(self, pipe, task_id: str, task: dict) -> str:
+        self.store.queue_write(pipe, task_id, task)
+        self._index_task(pipe, task_id, task)
+        self.duplicates.queue_add(pipe, task_id, task.get("description"))
+        return task_id
+
+    @redis_resilience.idempotent
+    async def find_duplicates(self, description: str) -> List[dict]:
+        """
+        Existing tasks whose description is a near-duplicate of `description` (MinHash/LSH estimate),
+        as [{"id", "similarity"}] best first.
+        """
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("Redis Find Duplicates"):
+            matches = await self.duplicates.find(self.redis, description)
+            return [{"id": task_id, "similarity": score} for task_id, score in matches]
+
+    @redis_resilience
+    async def create_tasks(self, tasks: List[dict]) -> List[Union[str, Exception]]:
+        """
+        Create many tasks in one pipelined round trip. Each task is stored under a new ID, which is
+        also written into its `id` field. Returns one entry per task, in order: the new task ID, or
+        the exception Redis raised for that task's writes.
+        """
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("Redis Create Tasks"):
+            if not tasks:
+                return []
+            queued = []
+            for task in tasks:
+                task_id = f"devtask_{uuid.uuid4().hex}"
+                record = dict(task, id=task_id)
+                queued.append(lambda pipe, task_id=task_id, record=record: self._queue_create(pipe, task_id, record))
+            results = await pipeline_flush(self.redis)(queued)
+            created = [(result, task) for task, result in zip(tasks, results) if not isinstance(result, Exception)]
+            await self.graph.put_many(self.redis, created)
+            await self.queue.enqueue_pending(self.redis, created)
+            for task, result in zip(tasks, results):
+                if not isinstance(result, Exception):
+                    self.ai_hint_engine.index_task(result, task.get("description"), created=True)
+            return results
+
+    @redis_resilience.idempotent
+    async def get_task(self, task_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Fetch a task, or only the requested `fields` of it (an HMGET under the hash layout).
+        Tasks moved to the cold tier by archive_tasks() are read from there.
+        """
         tracer = trace.get_tracer(__name__)
         with tracer.start_as_current_span("Redis Get Task"):
-            raw = await self.redis.hget(self.task_registry, task_id)
-            if not raw:
-                return None
-            return json.loads(raw)
+            task = await self.store.get(self.redis, task_id, fields)
+            if task is None:
+                task = await self.archive.get(self.redis, task_id, fields)
+            return task
 
-    @redis_circuit_breaker
-    async def list_tasks(self) -> List[dict]:
+    @redis_resilience.idempotent
+    async def list_tasks(self, status: Optional[str] = None, assigned_to: Optional[str] = None, min_priority: Optional[int] = None, fields: Optional[List[str]] = None) -> List[dict]:
+        """
+        List tasks, optionally filtered by status, assignee and minimum priority.
+        Filtered queries are answered from the secondary indexes and only fetch the matching records.
+        `fields` restricts each returned task to those fields.
+        """
         tracer = trace.get_tracer(__name__)
         with tracer.start_as_current_span("Redis List Tasks"):
-            keys = await self.redis.hkeys(self.task_registry)
-            if not keys:
-                return []
-            pipe = self.redis.pipeline()
-            for k in keys:
-                pipe.hget(self.task_registry, k)
-            raw_tasks = await pipe.execute()
-            return [json.loads(raw) for raw in raw_tasks if raw]
+            if status is not None or assigned_to is not None or min_priority is not None:
+                task_ids = await self._filter_task_ids(status, assigned_to, min_priority)
+                if not task_ids:
+                    return []
+                return await self.store.get_many(self.redis, task_ids, fields)
+            return [task async for task in self.iter_tasks(fields=fields)]
+
+    @redis_resilience.idempotent
+    async def scan_tasks(self, cursor: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> Tuple[int, List[dict]]:
+        """
+        Fetch one page of the task registry with HSCAN (SSCAN of the ID set under the hash layout).
+        Returns (next_cursor, tasks); a next_cursor of 0 means the scan is complete.
+        `limit` is passed to Redis as the COUNT hint, so a page may hold slightly more or fewer records.
+        """
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("Redis Scan Tasks"):
+            return await self.store.scan(self.redis, cursor, limit, fields)
 
-    @redis_circuit_breaker
+    async def iter_tasks(self, status: Optional[str] = None, assigned_to: Optional[str] = None, min_priority: Optional[int] = None, batch_size: int = 500, fields: Optional[List[str]] = None) -> AsyncIterator[dict]:
+        """
+        Yield tasks as they come off Redis, one HSCAN (or HMGET, when filtered) batch at a time,
+        so memory use stays bounded by `batch_size` regardless of registry size.
+        """
+        if status is not None or assigned_to is not None or min_priority is not None:
+            task_ids = await self._filter_task_ids(status, assigned_to, min_priority)
+            for i in range(0, len(task_ids), batch_size):
+                for task in await self.store.get_many(self.redis, task_ids[i:i+batch_size], fields):
+                    yield task
+            return
+        async for _, task in self.store.iter_items(self.redis, fields, batch_size):
+            yield task
+
+    @redis_resilience
     async def update_task(self, task_id: str, updates: dict) -> dict:
+        """
+        Atomically merge `updates` into a stored task in a single round trip.
+        If `updates` carries a `version`, the update only applies when it matches the stored
+        version (optimistic concurrency); otherwise VersionConflict is raised.
+        New `dependencies` that would close a cycle are rejected with DependencyCycle before anything is written:
+        the cycle check claims the new edges in the same script, ahead of the merge (see dependency_graph.py).
+        """
         tracer = trace.get_tracer(__name__)
         with tracer.start_as_current_span("Redis Update Task"):
-            raw = await self.redis.hget(self.task_registry, task_id)
-            if not raw:
+            updates = dict(updates)
+            expected_version = updates.pop("version", None)
+            linked = "dependencies" in updates
+            if linked:
+                await self._link(task_id, updates["dependencies"])
+            updates['updated_at'] = datetime.now().isoformat()
+            if self.update_coalescer is not None:
+                status, task = await self.update_coalescer.submit((task_id, updates, expected_version))
+            else:
+                [(status, task)] = await self.merger.merge(self.redis, [(task_id, updates, expected_version)])
+            if status == MERGE_MISSING and await self._restore_task(task_id):
+                # Updating an archived task brings it back to the live tier; restoring it reset its edges
+                if linked:
+                    await self._link(task_id, updates["dependencies"])
+                [(status, task)] = await self.merger.merge(self.redis, [(task_id, updates, expected_version)])
+            if status != MERGE_OK and linked:
+                await self.graph.revert(self.redis, [(task_id, task if isinstance(task, dict) else None)])
+            if status == MERGE_MISSING:
                 raise ValueError("Task not found")
-            task = json.loads(raw)
-            task.update(updates)
-            task['updated_at'] = datetime.now().isoformat()
-            await self.redis.hset(self.task_registry, task_id, json.dumps(task))
+            if status == MERGE_CONFLICT:
+                raise VersionConflict(task_id, task)
+            if status != MERGE_OK:
+                raise ValueError("Stored task is not a JSON object")
+            if self.graph.affects(updates):
+                # Completing a task only moves its direct dependents' counters; the edges were claimed above
+                await self.graph.put(self.redis, task_id, task, edges=False)
+            await self.queue.follow(self.redis, task_id, updates, task)
+            if "description" in updates:
+                self.ai_hint_engine.index_task(task_id, task.get("description"))
+                await self.duplicates.replace(self.redis, task_id, task.get("description"))
             return task
 
-    @redis_circuit_breaker
+    @redis_resilience
     async def delete_task(self, task_id: str) -> None:
         tracer = trace.get_tracer(__name__)
         with tracer.start_as_current_span("Redis Delete Task"):
-            await self.redis.hdel(self.task_registry, task_id)
+            task = await self.store.get(self.redis, task_id, ["status", "assigned_to"])
+            pipe = self.redis.pipeline()
+            self.store.queue_delete(pipe, task_id)
+            self.archive.queue_delete(pipe, task_id)
+            if task is not None:
+                self._unindex_task(pipe, task_id, task)
+            removed, *_ = await pipe.execute()
+            self.store.invalidate([task_id])
+            if removed:
+                self.ai_hint_engine.unindex_tasks([task_id])
+            await self.graph.remove(self.redis, [task_id])
+            await self.queue.remove(self.redis, [task_id])
+            await self.duplicates.remove(self.redis, task_id)
+
+    @redis_resilience.background
+    async def archive_tasks(self, older_than: float, statuses: Sequence[str] = ("completed", "archived"), batch_size: int = 100) -> int:
+        """
+        Move tasks in one of `statuses` that were last updated more than `older_than` seconds ago from
+        the live registry to the compressed cold tier (dev:tasks:archive), dropping them from the
+        secondary indexes. Candidates come from the status indexes, so live tasks are never scanned.
+        Returns the number of tasks archived.
+        """
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("Redis Archive Tasks"):
+            def is_cold(task: dict) -> bool:
+                age = record_age(task)
+                return task.get("status") in statuses and age is not None and age >= older_than
+            moved = []
+            for status in statuses:
+                batch = []
+                async for task_id in self.redis.sscan_iter(self._status_index(status), count=batch_size):
+                    batch.append(task_id)
+                    if len(batch) >= batch_size:
+                        moved += await self.archive.move(self.redis, self.store, batch, is_cold, self._unindex_task)
+                        batch = []
+                moved += await self.archive.move(self.redis, self.store, batch, is_cold, self._unindex_task)
+            self.ai_hint_engine.unindex_tasks(moved)
+            await self.duplicates.remove_many(self.redis, moved)
+            await self.graph.remove(self.redis, moved)
+            await self.queue.remove(self.redis, moved)
+            return len(moved)
+
+    async def _link(self, task_id: str, dependencies) -> None:
+        [cycle] = await self.graph.link(self.redis, [(task_id, dependencies)])
+        if cycle:
+            raise DependencyCycle(task_id, cycle)
+
+    async def _restore_task(self, task_id: str) -> bool:
+        """
+        Move an archived task back to the live registry and indexes. Returns False if it is not archived.
+        """
+        task = await self.archive.get(self.redis, task_id)
+        if task is None:
+            return False
+        pipe = self.redis.pipeline()
+        self._queue_create(pipe, task_id, task)
+        self.archive.queue_delete(pipe, task_id)
+        await pipe.execute()
+        self.store.invalidate([task_id])
+        await self.graph.put_many(self.redis, [(task_id, task)])
+        await self.queue.enqueue_pending(self.redis, [(task_id, task)])
+        self.ai_hint_engine.index_task(task_id, task.get("description"), created=True)
+        return True
+
+    def _status_index(self, status: str) -> str:
+        return f"{self.status_index_prefix}{status}"
+
+    def _assignee_index(self, assigned_to: str) -> str:
+        return f"{self.assignee_index_prefix}{assigned_to}"
+
+    def _index_task(self, pipe, task_id: str, task: dict) -> None:
+        """
+        Queue secondary index writes for a task on the given pipeline.
+        """
+        if task.get("status"):
+            pipe.sadd(self._status_index(task["status"]), task_id)
+        if task.get("assigned_to"):
+            pipe.sadd(self._assignee_index(task["assigned_to"]), task_id)
+        priority = task.get("priority")
+        pipe.zadd(self.priority_index, {task_id: priority if priority is not None else 1})
+
+    def _unindex_task(self, pipe, task_id: str, task: dict) -> None:
+        """
+        Queue removal of a task from the secondary indexes it was filed under.
+        """
+        if task.get("status"):
+            pipe.srem(self._status_index(task["status"]), task_id)
+        if task.get("assigned_to"):
+            pipe.srem(self._assignee_index(task["assigned_to"]), task_id)
+        pipe.zrem(self.priority_index, task_id)
+
+    async def _filter_task_ids(self, status: Optional[str], assigned_to: Optional[str], min_priority: Optional[int]) -> List[str]:
+        """
+        Resolve filters to task IDs using only the secondary indexes.
+        Set filters are intersected server-side; the priority bound is then checked with ZMSCORE
+        against the (already narrowed) candidates, so the cost is proportional to the result.
+        """
+        index_keys = []
+        if status is not None:
+            index_keys.append(self._status_index(status))
+        if assigned_to is not None:
+            index_keys.append(self._assignee_index(assigned_to))
+        if not index_keys:
+            return await self.redis.zrangebyscore(self.priority_index, min_priority, "+inf")
+        task_ids = list(await self.redis.sinter(index_keys))
+        if min_priority is None or not task_ids:
+            return task_ids
+        scores = await self.redis.zmscore(self.priority_index, task_ids)
+        return [tid for tid, score in zip(task_ids, scores) if score is not None and score >= min_priority]
+
+    @redis_resilience.background
+    async def rebuild_indexes(self, batch_size: int = 500) -> int:
+        """
+        Rebuild the secondary indexes and the dependency graph from the task registry, and queue the
+        pending tasks (e.g. for tasks written before indexing existed). Returns the number of tasks indexed.
+        """
+        count = 0
+        pipe = self.redis.pipeline()
+        nodes = []
+        async for task_id, task in self.store.iter_items(self.redis, ["status", "assigned_to", "priority", "dependencies"], batch_size):
+            self._index_task(pipe, task_id, task)
+            nodes.append((task_id, task))
+            count += 1
+            if count % batch_size == 0:
+                await pipe.execute()
+                await self.graph.put_many(self.redis, nodes)
+                await self.queue.enqueue_pending(self.redis, nodes)
+                pipe = self.redis.pipeline()
+                nodes = []
+        await pipe.execute()
+        await self.graph.put_many(self.redis, nodes)
+        await self.queue.enqueue_pending(self.redis, nodes)
+        return count
+
+    @redis_resilience.idempotent
+    async def ready_tasks(self, limit: int = 100, fields: Optional[List[str]] = None) -> List[dict]:
+        """
+        Up to `limit` pending tasks whose dependencies are all completed, highest priority first.
+        Answered from the dependency graph's ready set, so the cost is proportional to the result.
+        """
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("Redis Ready Tasks"):
+            task_ids = await self.graph.ready(self.redis, limit)
+            if not task_ids:
+                return []
+            return await self.store.get_many(self.redis, task_ids, fields)
 
     import logging
 
@@ -215,39 +486,88 @@ class DevStateManager:
         logger.info(f"Conflict resolved: rule-based scoring. Winner: {'A' if winner is task_a else 'B'} | Score: {total_score:.2f}")
         return winner
 
-    @redis_circuit_breaker
+    async def resolve_conflicts(self, pairs: List[Tuple[dict, dict]]) -> List[dict]:
+        """
+        Resolve many task pairs with the rules of resolve_conflict in one vectorized pass (one
+        batched similarity product for all descriptions), on the shared CPU executor.
+        Returns per pair the winner ("a"/"b"), the resolved task and the decision path, in order.
+        """
+        engine = self.ai_hint_engine
+        return await engine.executor.run_local(resolve_pairs, pairs, CONFLICT_POLICY, engine.similarity)
+
+    @redis_resilience
     async def batch_update_tasks(self, updates: List[dict], batch_size: int = 50) -> List[str]:
         """
-        Efficiently update multiple tasks in Redis using pipelining.
+        Efficiently update multiple tasks in Redis with one server-side merge script call per batch.
         Args:
-            updates: List of dicts, each with at least 'id' and update fields.
-            batch_size: Number of updates per pipeline execution.
+            updates: List of dicts, each with at least 'id' and update fields, plus an optional expected 'version'.
+            batch_size: Number of updates per script execution.
         Returns:
-            List of updated task IDs.
+            List of updated task IDs (missing tasks, version conflicts and dependency cycles are skipped).
         Raises:
             ValueError if any update lacks an 'id'.
         """
         updated_ids = []
         for i in range(0, len(updates), batch_size):
             batch = updates[i:i+batch_size]
-            pipe = self.redis.pipeline()
+            items = []
             for upd in batch:
                 task_id = upd.get('id')
                 if not task_id:
                     raise ValueError("Each update dict must include an 'id' key")
-                # Fetch, update, and re-serialize
-                pipe.hget(self.task_registry, task_id)
-            raws = await pipe.execute()
-            pipe = self.redis.pipeline()
-            for upd, raw in zip(batch, raws):
-                task_id = upd['id']
-                if raw:
-                    task = json.loads(raw)
-                    task.update(upd)
-                    for k in ['created_at', 'updated_at']:
-                        if k in task and hasattr(task[k], 'isoformat'):
-                            task[k] = task[k].isoformat()
-                    pipe.hset(self.task_registry, task_id, json.dumps(task))
-                    updated_ids.append(task_id)
-            await pipe.execute()
+                fields = dict(upd)
+                expected_version = fields.pop('version', None)
+                items.append((task_id, fields, expected_version))
+            items = await self._drop_cycles(items)
+            # One EVALSHA per batch: fetch, merge and re-index happen inside Redis
+            results = await self.merger.merge(self.redis, items)
+            merged = [(item, task) for item, (status, task) in zip(items, results) if status == MERGE_OK]
+            await self.graph.revert(self.redis, [
+                (item[0], task if isinstance(task, dict) else None)
+                for item, (status, task) in zip(items, results) if status != MERGE_OK and "dependencies" in item[1]
+            ])
+            await self.graph.put_many(self.redis, [(item[0], task) for item, task in merged if self.graph.affects(item[1])], edges=False)
+            for (task_id, fields, _), task in merged:
+                await self.queue.follow(self.redis, task_id, fields, task)
+                if "description" in fields:
+                    self.ai_hint_engine.index_task(task_id, task.get("description"))
+                    await self.duplicates.replace(self.redis, task_id, task.get("description"))
+            updated_ids.extend(item[0] for item, _ in merged)
         return updated_ids
+
+    @redis_resilience
+    async def claim_tasks(self, worker: str, count: int = 1) -> List[dict]:
+        """
+        Lease the `count` best pending tasks (priority, boosted by age) to `worker` with one ZPOPMAX.
+        The worker heartbeats to keep the lease and finishes it by setting the task to completed;
+        leases that expire go back to the queue. Tasks deleted since they were queued are skipped.
+        """
+        tracer = trace.get_tracer(__name__)
+        with tracer.start_as_current_span("Redis Claim Tasks"):
+            claimed = await self.queue.claim(self.redis, worker, count)
+            if not claimed:
+                return []
+            return await self.store.get_many(self.redis, [task_id for task_id, _ in claimed])
+
+    @redis_resilience.idempotent
+    async def heartbeat_task(self, task_id: str, worker: str) -> bool:
+        """
+        Extend `worker`'s lease on a claimed task. False if the lease expired or belongs to another worker.
+        """
+        return await self.queue.heartbeat(self.redis, task_id, worker)
+
+    @redis_resilience
+    async def release_task(self, task_id: str, worker: str) -> bool:
+        """
+        Give a claimed task back to the queue without finishing it.
+        """
+        return await self.queue.release(self.redis, task_id, worker)
+
+    async def _drop_cycles(self, items: List[Tuple[str, dict, Optional[int]]]) -> List[Tuple[str, dict, Optional[int]]]:
+        """
+        Leave out the updates whose new dependencies would close a cycle, and claim the edges of the others.
+        """
+        checked = [item for item in items if "dependencies" in item[1]]
+        cycles = await self.graph.link(self.redis, [(task_id, fields["dependencies"]) for task_id, fields, _ in checked])
+        rejected = {item[0] for item, cycle in zip(checked, cycles) if cycle}
+        return [item for item in items if item[0] not in rejected]
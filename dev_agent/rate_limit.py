@@ -1,14 +1,16 @@
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import redis.asyncio as redis
 import os
+from redis_pool import get_async_redis
+from rate_limiter import RateLimiter, start_rate_limiter, stop_rate_limiter
 
 REDIS_URL = os.getenv("DEV_AGENT_RATE_LIMIT_REDIS_URL", "redis://localhost:6379/1")
 
 async def init_rate_limiter(app):
-    redis_conn = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(redis_conn)
+    # Buckets live in process memory; this only starts their batched reconciliation with Redis (rate_limiter.py)
+    start_rate_limiter(get_async_redis(REDIS_URL))
 
-# Default rate limiter dependency: 10 requests per minute per user (adjust as needed)
+async def shutdown_rate_limiter(app):
+    await stop_rate_limiter()
+
+# Default rate limiter dependency: 10 requests per minute per user and route (adjust as needed)
 def default_rate_limiter():
     return RateLimiter(times=10, seconds=60)
@@ -0,0 +1,120 @@
+"""
+App-lifespan resources for the DEV agent
+- One DevStateManager (shared pool client, AIHintEngine, merge scripts) built at startup and reused by every request
+- Warmup before the agent reports ready: pre-open pool connections, load the Lua scripts,
+  build the similarity index and load dev:module_maintainers
+- Warmup retries in the background until Redis is reachable; /health reports 503 until it is done
+- The record cache invalidation listener (record_cache.py) runs for the lifetime of the app
+- A background archiver periodically moves old completed tasks to the cold tier (DevStateManager.archive_tasks)
+- A background reaper re-queues work-queue leases that expired (work_queue.py, AGENT_QUEUE_REAP_INTERVAL_SECONDS)
+- The CPU executor for semantic work (cpu_executor.py) is shut down with the app
+
+Environment:
+- DEV_AGENT_WARM_CONNECTIONS: pool connections to open during warmup (default 5)
+- DEV_AGENT_WARMUP_RETRY_SECONDS: delay between warmup attempts (default 5)
+- DEV_AGENT_ARCHIVE_INTERVAL_SECONDS: seconds between archiver runs (default 600, 0 disables)
+- DEV_AGENT_ARCHIVE_AFTER_SECONDS: archive tasks last updated longer ago than this (default 604800, 7 days)
+- DEV_AGENT_ARCHIVE_STATUSES: comma-separated terminal statuses to archive (default "completed,archived")
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI
+
+from redis_pool import close_pools
+from cpu_executor import shutdown_cpu_executor
+from record_cache import start_invalidation_listener, stop_invalidation_listener
+from .core import DevStateManager
+
+logger = logging.getLogger("dev_agent.resources")
+
+
+class DevResources:
+    def __init__(self, state_manager: Optional[DevStateManager] = None, warm_connections: Optional[int] = None):
+        self.state_manager = state_manager or DevStateManager()
+        self.warm_connections = warm_connections if warm_connections is not None else int(os.getenv("DEV_AGENT_WARM_CONNECTIONS", 5))
+        self.retry_seconds = float(os.getenv("DEV_AGENT_WARMUP_RETRY_SECONDS", 5))
+        self.ready = False
+        self.warmup_seconds: Optional[float] = None
+        self.indexed_tasks = 0
+        self._warmup_task: Optional[asyncio.Task] = None
+        self.archive_interval = float(os.getenv("DEV_AGENT_ARCHIVE_INTERVAL_SECONDS", 600))
+        self.archive_after = float(os.getenv("DEV_AGENT_ARCHIVE_AFTER_SECONDS", 7 * 24 * 3600))
+        self.archive_statuses = [s.strip() for s in os.getenv("DEV_AGENT_ARCHIVE_STATUSES", "completed,archived").split(",") if s.strip()]
+        self._archive_task: Optional[asyncio.Task] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+
+    async def _open_connections(self) -> None:
+        """
+        Check out (and so connect) warm_connections pool connections at once, then hand them back.
+        """
+        pool = self.state_manager.redis.connection_pool
+        connections = []
+        try:
+            for _ in range(min(self.warm_connections, pool.max_connections)):
+                connection = await pool.get_connection()
+                await connection.connect()
+                connections.append(connection)
+        finally:
+            for connection in connections:
+                await pool.release(connection)
+
+    async def warmup(self) -> None:
+        started = time.perf_counter()
+        await self._open_connections()
+        await self.state_manager.merger.load(self.state_manager.redis)
+        self.indexed_tasks = await self.state_manager.ai_hint_engine.warm()
+        self.warmup_seconds = time.perf_counter() - started
+        self.ready = True
+        logger.info(f"DEV agent warm in {self.warmup_seconds:.3f}s: {self.warm_connections} connections, {self.indexed_tasks} tasks indexed")
+
+    async def _warmup_until_ready(self) -> None:
+        while not self.ready:
+            try:
+                await self.warmup()
+            except Exception as e:
+                logger.warning(f"DEV agent warmup failed ({e}), retrying in {self.retry_seconds}s")
+                await asyncio.sleep(self.retry_seconds)
+
+    async def _archive_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.archive_interval)
+            try:
+                archived = await self.state_manager.archive_tasks(self.archive_after, self.archive_statuses)
+                if archived:
+                    logger.info(f"Archived {archived} tasks to the cold tier")
+            except Exception as e:
+                logger.warning(f"Task archiver run failed: {e}")
+
+    def start(self) -> None:
+        start_invalidation_listener(self.state_manager.redis)
+        self._warmup_task = asyncio.create_task(self._warmup_until_ready())
+        if self.archive_interval > 0:
+            self._archive_task = asyncio.create_task(self._archive_periodically())
+        self._reaper_task = asyncio.create_task(self.state_manager.queue.run_reaper(self.state_manager.redis))
+
+    async def stop(self) -> None:
+        for task in (self._warmup_task, self._archive_task, self._reaper_task):
+            if task is not None and not task.done():
+                task.cancel()
+        await stop_invalidation_listener()
+        shutdown_cpu_executor()
+        await close_pools()
+
+
+@asynccontextmanager
+async def dev_lifespan(app: FastAPI):
+    """
+    Build the DEV agent resources once for the application's lifetime and warm them in the background.
+    """
+    resources = DevResources()
+    app.state.dev_resources = resources
+    resources.start()
+    try:
+        yield
+    finally:
+        await resources.stop()
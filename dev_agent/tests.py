@@ -3,9 +3,13 @@ import pytest
 import jwt
 from httpx import AsyncClient, ASGITransport
 from fastapi import FastAPI
-from unittest.mock import AsyncMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
 from dev_agent.api import dev_router
-from dev_agent.core import DevTask
+from dev_agent.core import DevTask, DevStateManager
+from dev_agent.circuit import redis_resilience
+from redis_scripts import MERGE_CONFLICT, MERGE_MISSING, VersionConflict
+from semantic_index import SemanticIndex, Source
+from similarity import SimilarityService
 
 SECRET_KEY = os.getenv("DEV_AGENT_JWT_SECRET", "dev-secret-key")
 
@@ -25,12 +29,16 @@ async def jwt_token():
     return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
 @pytest.mark.asyncio
-@patch("dev_agent.core.redis.from_url", new_callable=AsyncMock)
+@patch("dev_agent.core.get_async_redis")
 async def test_dev_task_creation(mock_redis, async_client, jwt_token):
     redis_mock = AsyncMock()
-    redis_mock.hset.return_value = True
     redis_mock.hget.return_value = None
-    redis_mock.hkeys.return_value = []
+    # The graph and queue scripts: no cycle, one task queued
+    redis_mock.evalsha.side_effect = [[[]], 1]
+    # Writes are queued on a pipeline (sync) and sent with one execute (async)
+    pipe_mock = MagicMock()
+    pipe_mock.execute = AsyncMock(return_value=[1, 1, 1])
+    redis_mock.pipeline = MagicMock(return_value=pipe_mock)
     mock_redis.return_value = redis_mock
     response = await async_client.post(
         "/dev/create_task",
@@ -44,10 +52,13 @@ async def test_dev_task_creation(mock_redis, async_client, jwt_token):
         headers={"Authorization": f"Bearer {jwt_token}"}
     )
     assert response.status_code == 201
-    assert "task_id" in response.json()
+    task_id = response.json()["task_id"]
+    pipe_mock.execute.assert_awaited_once()
+    pipe_mock.hset.assert_any_call("dev:tasks", task_id, ANY)
+    redis_mock.hset.assert_not_called()
 
 @pytest.mark.asyncio
-@patch("dev_agent.core.redis.from_url", new_callable=AsyncMock)
+@patch("dev_agent.core.get_async_redis")
 async def test_dev_task_status_not_found(mock_redis, async_client, jwt_token):
     redis_mock = AsyncMock()
     redis_mock.hget.return_value = None
@@ -59,7 +70,7 @@ async def test_dev_task_status_not_found(mock_redis, async_client, jwt_token):
     assert response.status_code == 404
 
 @pytest.mark.asyncio
-@patch("dev_agent.core.redis.from_url", new_callable=AsyncMock)
+@patch("dev_agent.core.get_async_redis")
 async def test_conflict_resolution(mock_redis, async_client, jwt_token):
     redis_mock = AsyncMock()
     mock_redis.return_value = redis_mock
@@ -88,7 +99,7 @@ async def test_conflict_resolution(mock_redis, async_client, jwt_token):
     assert response.json()["resolved_task"]["id"] == "devtask_a"
 
 @pytest.mark.asyncio
-@patch("dev_agent.core.redis.from_url", new_callable=AsyncMock)
+@patch("dev_agent.core.get_async_redis")
 @pytest.mark.parametrize("task_a,task_b,expected", [
     ({"priority": 1, "timestamp": 100, "status": "pending", "dependencies": []}, {"priority": 2, "timestamp": 200, "status": "pending", "dependencies": []}, "task_b"),
     ({"priority": 2, "timestamp": 200, "status": "pending", "dependencies": []}, {"priority": 1, "timestamp": 100, "status": "pending", "dependencies": []}, "task_a"),
@@ -107,3 +118,255 @@ async def test_conflict_resolution_param(mock_redis, async_client, jwt_token, ta
     assert response.status_code == 200
     winner = response.json()["resolved_task"]["id"]
     assert (winner == "devtask_a" if expected == "task_a" else winner == "devtask_b")
+
+@pytest.mark.asyncio
+async def test_list_tasks_filters_read_only_indexed_ids():
+    state_manager = DevStateManager()
+    redis_mock = AsyncMock()
+    redis_mock.sinter.return_value = {"devtask_1"}
+    redis_mock.zmscore.return_value = [3.0]
+    redis_mock.hmget.return_value = ['{"description": "Fix login", "status": "blocked", "assigned_to": "developer1", "priority": 3}']
+    state_manager.redis = redis_mock
+    tasks = await state_manager.list_tasks(status="blocked", assigned_to="developer1", min_priority=2)
+    assert [t["description"] for t in tasks] == ["Fix login"]
+    redis_mock.sinter.assert_awaited_once_with(["dev:tasks:idx:status:blocked", "dev:tasks:idx:assigned_to:developer1"])
+    redis_mock.hmget.assert_awaited_once_with("dev:tasks", ["devtask_1"])
+    redis_mock.hkeys.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_scan_tasks_returns_page_and_cursor():
+    state_manager = DevStateManager()
+    redis_mock = AsyncMock()
+    redis_mock.hscan.return_value = (42, {"devtask_1": '{"description": "A"}', "devtask_2": '{"description": "B"}'})
+    state_manager.redis = redis_mock
+    next_cursor, tasks = await state_manager.scan_tasks(cursor=7, limit=2)
+    assert next_cursor == 42
+    assert [t["description"] for t in tasks] == ["A", "B"]
+    redis_mock.hscan.assert_awaited_once_with("dev:tasks", cursor=7, count=2)
+
+@pytest.mark.asyncio
+async def test_resources_warmup_marks_ready():
+    from dev_agent.resources import DevResources
+    state_manager = DevStateManager()
+    state_manager.merger = AsyncMock()
+    state_manager.ai_hint_engine = AsyncMock()
+    state_manager.ai_hint_engine.warm.return_value = 12
+    resources = DevResources(state_manager=state_manager, warm_connections=0)
+    assert not resources.ready
+    await resources.warmup()
+    assert resources.ready and resources.indexed_tasks == 12
+    state_manager.merger.load.assert_awaited_once_with(state_manager.redis)
+
+@pytest.mark.asyncio
+async def test_get_state_manager_reuses_app_resources():
+    from types import SimpleNamespace
+    from dev_agent.api import get_state_manager
+    state_manager = DevStateManager()
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(dev_resources=SimpleNamespace(state_manager=state_manager))))
+    assert await get_state_manager(request) is state_manager
+
+@pytest.mark.asyncio
+async def test_create_tasks_writes_batch_in_one_pipeline():
+    from unittest.mock import MagicMock
+    state_manager = DevStateManager()
+    pipe = MagicMock()
+    pipe.__len__.side_effect = lambda: len([c for c in pipe.method_calls if c[0] != "execute"])
+    pipe.execute = AsyncMock(side_effect=lambda raise_on_error: [1] * len(pipe))
+    state_manager.redis = MagicMock()
+    state_manager.redis.pipeline.return_value = pipe
+    state_manager.redis.evalsha = AsyncMock(return_value=[[], []])
+    results = await state_manager.create_tasks([{"description": "A", "status": "pending"}, {"description": "B", "status": "pending"}])
+    assert len(results) == 2 and all(r.startswith("devtask_") for r in results)
+    state_manager.redis.pipeline.assert_called_once()
+    pipe.execute.assert_awaited_once_with(raise_on_error=False)
+    # Both new tasks go into the dependency graph in one script call and into the work queue in another
+    assert state_manager.redis.evalsha.await_count == 2
+
+def loaded_semantic_index(**docs):
+    """
+    A cross-agent index with in-memory sources, loaded with `docs` ({source: [(id, text)]}).
+    """
+    index = SemanticIndex(MagicMock(), sources={name: Source(name, AsyncMock(), ["description"]) for name in ("pm", "dev", "ta", "qa")})
+    for name, source in index.sources.items():
+        source.store.count.return_value = len(docs.get(name, []))
+        index.load(name, docs.get(name, []))
+    return index
+
+@pytest.mark.asyncio
+async def test_suggest_task_fields_batch_scores_all_descriptions_at_once():
+    state_manager = DevStateManager()
+    engine = state_manager.ai_hint_engine
+    engine.semantic = loaded_semantic_index(
+        dev=[("devtask_1", "login page oauth"), ("devtask_2", "billing invoices export")],
+        ta=[("decision_1", "oauth provider for login")],
+    )
+    engine.store = AsyncMock()
+    engine.store.get_mapping.return_value = {"devtask_1": {"id": "devtask_1", "status": "pending"}}
+    engine._maintainers, engine._maintainers_loaded_at = {"auth": "alice,bob"}, float("inf")
+    suggestions = await engine.suggest_task_fields_batch([("urgent login oauth fix", {"module": "auth"}), ("unrelated", {})])
+    assert suggestions[0] == {"priority": 3, "dependencies": ["devtask_1"], "assigned_to": "alice", "related": {"pm": [], "ta": ["decision_1"], "qa": []}}
+    assert suggestions[1] == {"priority": 1, "dependencies": [], "assigned_to": None, "related": {"pm": [], "ta": [], "qa": []}}
+    engine.store.get_mapping.assert_awaited_once_with(engine.redis, ["devtask_1"])
+
+@pytest.mark.asyncio
+async def test_get_task_falls_back_to_archive():
+    state_manager = DevStateManager()
+    state_manager.store = AsyncMock()
+    state_manager.store.get.return_value = None
+    state_manager.archive = AsyncMock()
+    state_manager.archive.get.return_value = {"status": "completed"}
+    assert await state_manager.get_task("devtask_old", fields=["status"]) == {"status": "completed"}
+    state_manager.archive.get.assert_awaited_once_with(state_manager.redis, "devtask_old", ["status"])
+
+@pytest.mark.asyncio
+async def test_hint_index_follows_writes_without_refitting():
+    state_manager = DevStateManager()
+    engine = state_manager.ai_hint_engine
+    engine.semantic = loaded_semantic_index(dev=[("devtask_1", "login page oauth")])
+    dev_store = engine.semantic.sources["dev"].store
+    engine.store = AsyncMock()
+    engine.index_task("devtask_2", "export billing invoices", created=True)
+    dev_store.count.return_value = 2
+    engine.store.get_mapping.return_value = {"devtask_2": {"id": "devtask_2", "status": "pending"}}
+    assert (await engine.suggest_task_fields("billing export", {}))["dependencies"] == ["devtask_2"]
+    engine.store.get_mapping.assert_awaited_once_with(engine.redis, ["devtask_2"])
+    dev_store.iter_items.assert_not_called()
+    engine.unindex_tasks(["devtask_2"])
+    dev_store.count.return_value = 1
+    assert (await engine.suggest_task_fields("billing export", {}))["dependencies"] == []
+
+@pytest.mark.asyncio
+async def test_suggest_task_fields_batch_resolves_each_module_once():
+    state_manager = DevStateManager()
+    engine = state_manager.ai_hint_engine
+    engine.semantic = loaded_semantic_index(dev=[("devtask_1", "login page oauth")])
+    engine.store = AsyncMock()
+    engine.store.get_mapping.return_value = {}
+    engine.redis = AsyncMock()
+    engine.redis.hgetall.return_value = {"auth": "alice,bob", "billing": "carol"}
+    items = [("fix login", {"module": "auth"}), ("export", {"module": "billing"}), ("oauth", {"module": "auth"}), ("misc", {"module": "docs"})]
+    suggestions = await engine.suggest_task_fields_batch(items)
+    assert [s["assigned_to"] for s in suggestions] == ["alice", "carol", "alice", None]
+    engine.redis.hgetall.assert_awaited_once_with("dev:module_maintainers")
+
+@pytest.mark.asyncio
+async def test_resolve_conflicts_matches_single_pair_resolution():
+    state_manager = DevStateManager()
+    engine = state_manager.ai_hint_engine
+    engine.semantic = loaded_semantic_index(dev=[("devtask_1", "login page oauth"), ("devtask_2", "billing invoices export")])
+    # IDF comes from the loaded index, which knows the tasks' terms
+    engine.similarity = SimilarityService("dev:tasks:test", corpus=engine.semantic.index)
+    tasks = [
+        {"id": "a", "description": "login page oauth", "priority": 2, "timestamp": 1},
+        {"id": "b", "description": "login page oauth", "priority": 1, "timestamp": 9},
+        {"id": "c", "description": "billing invoices export", "status": "completed", "timestamp": 0},
+        {"id": "d", "description": "billing invoices", "dependencies": ["x"], "timestamp": 1},
+    ]
+    pairs = [(tasks[0], tasks[1]), (tasks[1], tasks[2]), (tasks[3], tasks[0]), (tasks[1], tasks[3])]
+    results = await state_manager.resolve_conflicts(pairs)
+    assert [r["resolved"] for r in results] == [await state_manager.resolve_conflict(a, b) for a, b in pairs]
+    assert [r["path"] for r in results] == ["similar_priority", "completed", "score", "score"]
+
+@pytest.mark.asyncio
+async def test_ready_tasks_reads_only_the_ready_set():
+    state_manager = DevStateManager()
+    redis_mock = AsyncMock()
+    redis_mock.zrevrange.return_value = ["devtask_2"]
+    redis_mock.hmget.return_value = ['{"description": "Deploy", "status": "pending", "priority": 3}']
+    state_manager.redis = redis_mock
+    tasks = await state_manager.ready_tasks(limit=5)
+    assert [t["description"] for t in tasks] == ["Deploy"]
+    redis_mock.zrevrange.assert_awaited_once_with("dev:tasks:graph:ready", 0, 4)
+    redis_mock.hmget.assert_awaited_once_with("dev:tasks", ["devtask_2"])
+    redis_mock.hscan.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_update_task_rejects_dependency_cycle_before_writing():
+    from dependency_graph import DependencyCycle
+    state_manager = DevStateManager()
+    state_manager.merger = AsyncMock()
+    state_manager.redis = AsyncMock()
+    state_manager.redis.evalsha.return_value = [["devtask_1", "devtask_2", "devtask_1"]]
+    with pytest.raises(DependencyCycle) as exc:
+        await state_manager.update_task("devtask_1", {"dependencies": ["devtask_2"]})
+    assert exc.value.path == ["devtask_1", "devtask_2", "devtask_1"]
+    state_manager.merger.merge.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_update_task_releases_claimed_edges_when_the_merge_does_not_apply():
+    state_manager = DevStateManager()
+    state_manager.merger = AsyncMock()
+    current = {"id": "devtask_1", "status": "pending", "version": 4, "dependencies": []}
+    state_manager.merger.merge.return_value = [(MERGE_CONFLICT, current)]
+    state_manager.graph = AsyncMock()
+    state_manager.graph.link.return_value = [None]
+    with pytest.raises(VersionConflict):
+        await state_manager.update_task("devtask_1", {"dependencies": ["devtask_2"], "version": 3})
+    # The edges are claimed before the merge and put back in line with the stored task after it
+    state_manager.graph.link.assert_awaited_once_with(state_manager.redis, [("devtask_1", ["devtask_2"])])
+    state_manager.graph.revert.assert_awaited_once_with(state_manager.redis, [("devtask_1", current)])
+    state_manager.graph.put.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_completing_a_task_refreshes_its_graph_node_and_queue():
+    state_manager = DevStateManager()
+    state_manager.merger = AsyncMock()
+    state_manager.merger.merge.return_value = [("ok", {"id": "devtask_1", "status": "completed", "priority": 2})]
+    state_manager.graph = AsyncMock()
+    state_manager.graph.affects = MagicMock(return_value=True)
+    state_manager.queue = AsyncMock()
+    await state_manager.update_task("devtask_1", {"status": "completed"})
+    state_manager.graph.put.assert_awaited_once_with(state_manager.redis, "devtask_1", {"id": "devtask_1", "status": "completed", "priority": 2}, edges=False)
+    state_manager.graph.link.assert_not_awaited()
+    # The status transition also acks the task's work-queue lease
+    state_manager.queue.follow.assert_awaited_once_with(state_manager.redis, "devtask_1", {"status": "completed", "updated_at": ANY}, {"id": "devtask_1", "status": "completed", "priority": 2})
+
+@pytest.mark.asyncio
+async def test_batch_description_edits_refresh_hints_and_duplicates():
+    state_manager = DevStateManager()
+    state_manager.merger = AsyncMock()
+    state_manager.merger.merge.return_value = [
+        ("ok", {"id": "devtask_1", "description": "Rotate the signing keys", "status": "pending"}),
+        ("ok", {"id": "devtask_2", "description": "Deploy", "status": "completed"}),
+    ]
+    state_manager.graph = AsyncMock()
+    state_manager.graph.affects = MagicMock(return_value=False)
+    state_manager.queue = AsyncMock()
+    state_manager.duplicates = AsyncMock()
+    state_manager.ai_hint_engine.index_task = MagicMock()
+    updated = await state_manager.batch_update_tasks([
+        {"id": "devtask_1", "description": "Rotate the signing keys"},
+        {"id": "devtask_2", "status": "completed"},
+    ])
+    assert updated == ["devtask_1", "devtask_2"]
+    # Only the task whose description changed is re-indexed
+    state_manager.ai_hint_engine.index_task.assert_called_once_with("devtask_1", "Rotate the signing keys")
+    state_manager.duplicates.replace.assert_awaited_once_with(state_manager.redis, "devtask_1", "Rotate the signing keys")
+
+@pytest.mark.asyncio
+async def test_unknown_task_updates_leave_the_breaker_closed():
+    state_manager = DevStateManager()
+    state_manager.merger = AsyncMock()
+    state_manager.merger.merge.return_value = [(MERGE_MISSING, None)]
+    state_manager._restore_task = AsyncMock(return_value=False)
+    limit = redis_resilience.limit.limit
+    for _ in range(redis_resilience.breaker.fail_max + 1):
+        with pytest.raises(ValueError):
+            await state_manager.update_task("devtask_missing", {"status": "completed"})
+    assert redis_resilience.breaker.current_state == "closed"
+    assert redis_resilience.limit.limit >= limit
+    with pytest.raises(ValueError):
+        await state_manager.batch_update_tasks([{"status": "completed"}] * 6)
+    assert redis_resilience.breaker.current_state == "closed"
+
+@pytest.mark.asyncio
+async def test_claim_tasks_leases_and_reads_only_claimed_tasks():
+    state_manager = DevStateManager()
+    redis_mock = AsyncMock()
+    redis_mock.evalsha.return_value = ["devtask_2", "2.5"]
+    redis_mock.hmget.return_value = ['{"description": "Deploy", "status": "pending", "priority": 3}']
+    state_manager.redis = redis_mock
+    tasks = await state_manager.claim_tasks("worker-1", count=2)
+    assert [t["description"] for t in tasks] == ["Deploy"]
+    assert redis_mock.evalsha.await_args.args[2:5] == ("queue:dev:", "worker-1", 2)
+    redis_mock.hmget.assert_awaited_once_with("dev:tasks", ["devtask_2"])
@@ -0,0 +1,7 @@
+"""
+Agent memory storage
+- vector_store: local dense-vector store (memory-mapped segments, batched top-k search)
+"""
+from memory.vector_store import VectorStore, memory_store
+
+__all__ = ["VectorStore", "memory_store"]
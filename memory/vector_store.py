@@ -0,0 +1,470 @@
+"""
+Local dense-vector memory store: memory-mapped embedding matrices with sidecar ID/metadata files
+- A store is a directory of append-only segments. Each segment is a raw row-major matrix
+  (`<segment>.vec`: float32, or int8 with per-row float32 scales in `<segment>.scale`) and a sidecar
+  (`<segment>.meta.jsonl`) holding one {"id", "seq", "metadata"} line per row
+- Sealed segments are memory-mapped read-only; the active segment is appended to on disk and mirrored
+  in memory until it reaches `segment_rows` rows, then sealed
+- Rows are L2-normalised on insert, so scores are cosine similarities. A search scores the whole batch
+  of queries against a chunk of rows with one matrix product and keeps a running top k (argpartition)
+- int8 quantization (symmetric, one scale per row) stores a quarter of the float32 bytes; each
+  component is rounded to 1/127 of the row's largest one
+- Writes never rewrite a segment: re-adding an ID appends a row that supersedes the old one, and a
+  delete appends to `tombstones.jsonl`. Dead rows are masked at search time and dropped by compact(),
+  which writes the live rows to fresh segments and then swaps the manifest; add() compacts by itself
+  once dead rows make up more than `compact_ratio` of the store
+- A crash mid-append leaves at most a partial row, which is truncated when the store is reopened
+
+One writer process per store directory. Searches and writes are thread-safe.
+
+Environment:
+- AGENT_MEMORY_DIR: directory holding one store per agent (default data/memory)
+- AGENT_MEMORY_QUANTIZE: "int8" to create new stores quantized (default: float32)
+- AGENT_MEMORY_SEGMENT_ROWS: rows per sealed segment (default 65536)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("memory.vector_store")
+
+memory_rows = Gauge("memory_store_rows", "Live memories in the store", ["store"])
+memory_search = Histogram("memory_store_search_seconds", "Time spent on a batched top-k search", ["store"])
+memory_compactions = Counter("memory_store_compactions_total", "Store compactions", ["store"])
+
+MANIFEST = "manifest.json"
+TOMBSTONES = "tombstones.jsonl"
+# Rows scored per matrix product; bounds the temporary float32 copy of an int8 chunk
+SEARCH_CHUNK_ROWS = 16384
+DTYPES = {"float32": np.float32, "int8": np.int8}
+
+
+class Segment:
+    """
+    One segment's rows: vectors (memory-mapped once sealed), int8 scales, IDs, sequence numbers,
+    metadata and the mask of rows that still hold the current version of their ID.
+    """
+    def __init__(self, name: str, dim: int, dtype):
+        self.name = name
+        self.sealed = False
+        self._vectors = np.zeros((0, dim), dtype=dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._live = np.zeros(0, dtype=bool)
+        self.ids: List[str] = []
+        self.seqs: List[int] = []
+        self.metadata: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.ids)]
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self._scales[:len(self.ids)]
+
+    @property
+    def live(self) -> np.ndarray:
+        return self._live[:len(self.ids)]
+
+    def extend(self, vectors: np.ndarray, scales: Optional[np.ndarray]) -> None:
+        # Amortised growth, so appending one row at a time stays linear
+        n, needed = len(self.ids), len(self.ids) + len(vectors)
+        if needed > len(self._vectors):
+            capacity = max(needed, 2 * len(self._vectors), 64)
+            grown = np.zeros((capacity, self._vectors.shape[1]), dtype=self._vectors.dtype)
+            grown[:n] = self._vectors[:n]
+            self._vectors = grown
+            self._scales = np.concatenate([self._scales[:n], np.zeros(capacity - n, dtype=np.float32)])
+            self._live = np.concatenate([self._live[:n], np.zeros(capacity - n, dtype=bool)])
+        self._vectors[n:needed] = vectors
+        if scales is not None:
+            self._scales[n:needed] = scales
+        self._live[n:needed] = True
+
+    def map(self, path: str, scales_path: Optional[str]) -> None:
+        """
+        Replace the in-memory rows with read-only maps of the segment's files.
+        """
+        n = len(self.ids)
+        live = self._live[:n].copy()
+        if n:
+            self._vectors = np.memmap(path, dtype=self._vectors.dtype, mode="r", shape=(n, self._vectors.shape[1]))
+            if scales_path:
+                self._scales = np.memmap(scales_path, dtype=np.float32, mode="r", shape=(n,))
+        self._live = live
+
+
+class VectorStore:
+    def __init__(
+        self,
+        path: str,
+        dim: Optional[int] = None,
+        quantize: Optional[str] = None,
+        segment_rows: int = 65536,
+        compact_ratio: float = 0.3,
+        name: Optional[str] = None,
+    ):
+        """
+        Open the store at `path`, creating it with `dim` and `quantize` (None or "int8") if it
+        does not exist. An existing store keeps the dimension and encoding it was created with.
+        """
+        self.path = path
+        self.name = name or os.path.basename(os.path.normpath(path))
+        self.segment_rows = max(1, segment_rows)
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._segments: List[Segment] = []
+        # id -> (segment, row) holding the current version of the id
+        self._rows: Dict[str, Tuple[Segment, int]] = {}
+        self._seq = 0
+        self._dead = 0
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if dim is not None and dim != manifest["dim"]:
+                raise ValueError(f"Store at {path} holds {manifest['dim']}-dimensional vectors, not {dim}")
+            self.dim = manifest["dim"]
+            self.encoding = manifest["dtype"]
+            self._next_segment = manifest["next_segment"]
+            self._load(manifest["segments"])
+        else:
+            if dim is None:
+                raise ValueError(f"No store at {path}; a dimension is needed to create one")
+            if quantize not in (None, "int8"):
+                raise ValueError(f"Unknown quantization: {quantize}")
+            self.dim = dim
+            self.encoding = quantize or "float32"
+            self._next_segment = 0
+            self._write_manifest()
+        memory_rows.labels(self.name).set(len(self._rows))
+
+    @property
+    def quantized(self) -> bool:
+        return self.encoding == "int8"
+
+    # --- files ---
+
+    def _file(self, segment: Segment, suffix: str) -> str:
+        return os.path.join(self.path, f"{segment.name}{suffix}")
+
+    def _suffixes(self) -> Tuple[str, ...]:
+        return (".vec", ".meta.jsonl", ".scale") if self.quantized else (".vec", ".meta.jsonl")
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "dim": self.dim,
+            "dtype": self.encoding,
+            "next_segment": self._next_segment,
+            "segments": [{"name": s.name, "sealed": s.sealed} for s in self._segments],
+        }
+        tmp = os.path.join(self.path, MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+
+    def _load(self, specs: List[dict]) -> None:
+        dtype = DTYPES[self.encoding]
+        row_bytes = self.dim * np.dtype(dtype).itemsize
+        for spec in specs:
+            segment = Segment(spec["name"], self.dim, dtype)
+            with open(self._file(segment, ".meta.jsonl")) as f:
+                entries = [json.loads(line) for line in f if line.endswith("\n")]
+            rows = min(len(entries), os.path.getsize(self._file(segment, ".vec")) // row_bytes)
+            if self.quantized:
+                rows = min(rows, os.path.getsize(self._file(segment, ".scale")) // 4)
+            entries = entries[:rows]
+            segment.ids = [entry["id"] for entry in entries]
+            segment.seqs = [entry["seq"] for entry in entries]
+            segment.metadata = [entry.get("metadata") for entry in entries]
+            segment._live = np.zeros(rows, dtype=bool)
+            if spec["sealed"]:
+                segment.sealed = True
+                segment.map(self._file(segment, ".vec"), self._file(segment, ".scale") if self.quantized else None)
+            else:
+                self._truncate(segment, rows * row_bytes)
+                segment._vectors = np.fromfile(self._file(segment, ".vec"), dtype=dtype).reshape(rows, self.dim)
+                if self.quantized:
+                    segment._scales = np.fromfile(self._file(segment, ".scale"), dtype=np.float32)
+            self._segments.append(segment)
+        # The newest row of each id is current, unless a later tombstone deleted it
+        deleted: Dict[str, int] = {}
+        tombstones = os.path.join(self.path, TOMBSTONES)
+        if os.path.exists(tombstones):
+            with open(tombstones) as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        entry = json.loads(line)
+                        deleted[entry["id"]] = max(entry["seq"], deleted.get(entry["id"], -1))
+                        self._seq = max(self._seq, entry["seq"] + 1)
+        latest: Dict[str, Tuple[Segment, int, int]] = {}
+        for segment in self._segments:
+            for row, (record_id, seq) in enumerate(zip(segment.ids, segment.seqs)):
+                self._seq = max(self._seq, seq + 1)
+                if record_id not in latest or latest[record_id][2] < seq:
+                    latest[record_id] = (segment, row, seq)
+        for record_id, (segment, row, seq) in latest.items():
+            if deleted.get(record_id, -1) < seq:
+                segment.live[row] = True
+                self._rows[record_id] = (segment, row)
+        self._dead = sum(len(s) for s in self._segments) - len(self._rows)
+
+    def _truncate(self, segment: Segment, vec_bytes: int) -> None:
+        # Drop a partial trailing row, and rows whose sidecar line never reached the disk
+        rows = len(segment)
+        with open(self._file(segment, ".vec"), "r+b") as f:
+            f.truncate(vec_bytes)
+        if self.quantized:
+            with open(self._file(segment, ".scale"), "r+b") as f:
+                f.truncate(rows * 4)
+        with open(self._file(segment, ".meta.jsonl"), "r+") as f:
+            lines = f.readlines()[:rows]
+            f.seek(0)
+            f.writelines(lines)
+            f.truncate()
+
+    def _new_segment(self, segments: List[Segment]) -> Segment:
+        segment = Segment(f"seg-{self._next_segment:06d}", self.dim, DTYPES[self.encoding])
+        self._next_segment += 1
+        for suffix in self._suffixes():
+            open(self._file(segment, suffix), "wb").close()
+        segments.append(segment)
+        return segment
+
+    def _seal(self, segment: Segment) -> None:
+        segment.sealed = True
+        segment.map(self._file(segment, ".vec"), self._file(segment, ".scale") if self.quantized else None)
+
+    # --- writes ---
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if not self.quantized:
+            return vectors.astype(np.float32), None
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _write_rows(self, segment: Segment, ids: Sequence[str], seqs: Sequence[int], vectors: np.ndarray, scales: Optional[np.ndarray], metadata: Sequence[Any]) -> None:
+        # Vectors first: rows without a sidecar line are truncated on open
+        with open(self._file(segment, ".vec"), "ab") as f:
+            f.write(np.ascontiguousarray(vectors).tobytes())
+        if scales is not None:
+            with open(self._file(segment, ".scale"), "ab") as f:
+                f.write(scales.tobytes())
+        with open(self._file(segment, ".meta.jsonl"), "a") as f:
+            f.writelines(json.dumps({"id": i, "seq": s, "metadata": m}) + "\n" for i, s, m in zip(ids, seqs, metadata))
+        first = len(segment)
+        segment.extend(vectors, scales)
+        segment.ids.extend(ids)
+        segment.seqs.extend(seqs)
+        segment.metadata.extend(metadata)
+        for row in range(first, len(segment)):
+            previous = self._rows.get(segment.ids[row])
+            if previous is not None:
+                previous[0].live[previous[1]] = False
+                self._dead += 1
+            self._rows[segment.ids[row]] = (segment, row)
+
+    def add(self, ids: Sequence[str], vectors, metadata: Optional[Sequence[Any]] = None) -> None:
+        """
+        Add memories, replacing any with the same ID. `vectors` is an (n, dim) array-like and
+        `metadata` one JSON-serialisable value per ID.
+        """
+        ids = [str(record_id) for record_id in ids]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if len(ids) != len(vectors):
+            raise ValueError(f"{len(ids)} ids for {len(vectors)} vectors")
+        metadata = list(metadata) if metadata is not None else [None] * len(ids)
+        if len(metadata) != len(ids):
+            raise ValueError(f"{len(ids)} ids for {len(metadata)} metadata values")
+        encoded, scales = self._encode(vectors)
+        with self._lock:
+            start = 0
+            while start < len(ids):
+                if self._segments and not self._segments[-1].sealed:
+                    segment = self._segments[-1]
+                else:
+                    segment = self._new_segment(self._segments)
+                    self._write_manifest()
+                end = min(len(ids), start + self.segment_rows - len(segment))
+                seqs = range(self._seq, self._seq + end - start)
+                self._seq += end - start
+                self._write_rows(segment, ids[start:end], seqs, encoded[start:end], None if scales is None else scales[start:end], metadata[start:end])
+                if len(segment) >= self.segment_rows:
+                    self._seal(segment)
+                    self._write_manifest()
+                start = end
+            memory_rows.labels(self.name).set(len(self._rows))
+            total = sum(len(s) for s in self._segments)
+            if self._dead > self.compact_ratio * total and self._dead >= min(self.segment_rows, 1024):
+                self.compact()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """
+        Delete memories by ID. Returns how many existed.
+        """
+        with self._lock:
+            found = [record_id for record_id in dict.fromkeys(ids) if record_id in self._rows]
+            if not found:
+                return 0
+            with open(os.path.join(self.path, TOMBSTONES), "a") as f:
+                for record_id in found:
+                    f.write(json.dumps({"id": record_id, "seq": self._seq}) + "\n")
+                    self._seq += 1
+            for record_id in found:
+                segment, row = self._rows.pop(record_id)
+                segment.live[row] = False
+                self._dead += 1
+            memory_rows.labels(self.name).set(len(self._rows))
+            return len(found)
+
+    def compact(self) -> None:
+        """
+        Rewrite the live rows into fresh segments, dropping superseded and deleted rows.
+        The manifest is only swapped once the new segments are on disk.
+        """
+        with self._lock:
+            started = time.time()
+            old, self._rows, self._dead = self._segments, {}, 0
+            segments: List[Segment] = []
+            segment = None
+            for source in old:
+                rows = np.nonzero(source.live)[0]
+                while len(rows):
+                    if segment is None or len(segment) >= self.segment_rows:
+                        if segment is not None:
+                            self._seal(segment)
+                        segment = self._new_segment(segments)
+                    room = self.segment_rows - len(segment)
+                    batch, rows = rows[:room], rows[room:]
+                    self._write_rows(
+                        segment,
+                        [source.ids[row] for row in batch],
+                        # Rows keep their sequence numbers; tombstones go with the rows they deleted
+                        [source.seqs[row] for row in batch],
+                        np.asarray(source.vectors[batch]),
+                        np.asarray(source.scales[batch]) if self.quantized else None,
+                        [source.metadata[row] for row in batch],
+                    )
+            if segment is not None and len(segment) >= self.segment_rows:
+                self._seal(segment)
+            self._segments = segments
+            self._write_manifest()
+            tombstones = os.path.join(self.path, TOMBSTONES)
+            if os.path.exists(tombstones):
+                os.remove(tombstones)
+            for segment in old:
+                for suffix in (".vec", ".meta.jsonl", ".scale"):
+                    if os.path.exists(self._file(segment, suffix)):
+                        os.remove(self._file(segment, suffix))
+            memory_compactions.labels(self.name).inc()
+            logger.info(f"Compacted memory store {self.name}: {len(self._rows)} memories in {len(segments)} segments ({time.time() - started:.2f}s)")
+
+    # --- reads ---
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._rows
+
+    @property
+    def segments(self) -> int:
+        return len(self._segments)
+
+    def get(self, record_id: str) -> Optional[Any]:
+        """
+        Metadata of a memory, or None if there is no such memory.
+        """
+        with self._lock:
+            found = self._rows.get(record_id)
+            return found[0].metadata[found[1]] if found else None
+
+    def search(self, queries, k: int = 10) -> List[List[Tuple[str, float, Any]]]:
+        """
+        For each query vector, the k most similar memories as (id, cosine score, metadata), best first.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+        started = time.time()
+        with self._lock:
+            # Snapshot: a concurrent write only appends rows and flips masks
+            snapshot = [(s, s.vectors, s.scales, s.live.copy()) for s in self._segments if len(s)]
+        # Running top k per query: scores, segment index and row of each kept candidate
+        best = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_segment = np.zeros((len(queries), 0), dtype=np.int64)
+        best_row = np.zeros((len(queries), 0), dtype=np.int64)
+        for index, (_, vectors, scales, live) in enumerate(snapshot):
+            for start in range(0, len(live), SEARCH_CHUNK_ROWS):
+                mask = live[start:start + SEARCH_CHUNK_ROWS]
+                if not mask.any():
+                    continue
+                scores = queries @ vectors[start:start + SEARCH_CHUNK_ROWS].astype(np.float32, copy=False).T
+                if self.quantized:
+                    scores *= scales[start:start + SEARCH_CHUNK_ROWS]
+                if not mask.all():
+                    scores[:, ~mask] = -np.inf
+                if scores.shape[1] > k:
+                    rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                    scores = np.take_along_axis(scores, rows, axis=1)
+                else:
+                    rows = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                best = np.hstack([best, scores])
+                best_segment = np.hstack([best_segment, np.full(scores.shape, index)])
+                best_row = np.hstack([best_row, rows + start])
+                if best.shape[1] > k:
+                    keep = np.argpartition(-best, k - 1, axis=1)[:, :k]
+                    best = np.take_along_axis(best, keep, axis=1)
+                    best_segment = np.take_along_axis(best_segment, keep, axis=1)
+                    best_row = np.take_along_axis(best_row, keep, axis=1)
+        results = []
+        for scores, segment_indexes, rows in zip(best, best_segment, best_row):
+            hits = []
+            for column in np.argsort(-scores, kind="stable")[:k]:
+                if not np.isfinite(scores[column]):
+                    break
+                segment, row = snapshot[segment_indexes[column]][0], int(rows[column])
+                hits.append((segment.ids[row], float(scores[column]), segment.metadata[row]))
+            results.append(hits)
+        memory_search.labels(self.name).observe(time.time() - started)
+        return results
+
+
+_stores: Dict[str, VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def memory_store(agent: str, dim: Optional[int] = None) -> VectorStore:
+    """
+    Process-wide memory store of an agent under AGENT_MEMORY_DIR. `dim` is needed the first time.
+    """
+    with _stores_lock:
+        store = _stores.get(agent)
+        if store is None:
+            quantize = os.getenv("AGENT_MEMORY_QUANTIZE") or None
+            if quantize not in (None, "int8"):
+                logger.warning(f"Unknown AGENT_MEMORY_QUANTIZE={quantize!r}, storing float32")
+                quantize = None
+            try:
+                segment_rows = int(os.getenv("AGENT_MEMORY_SEGMENT_ROWS", 65536))
+            except ValueError:
+                logger.warning("Invalid AGENT_MEMORY_SEGMENT_ROWS, using default 65536")
+                segment_rows = 65536
+            path = os.path.join(os.getenv("AGENT_MEMORY_DIR", os.path.join("data", "memory")), agent)
+            store = _stores[agent] = VectorStore(path, dim=dim, quantize=quantize, segment_rows=segment_rows, name=agent)
+        return store
@@ -0,0 +1,147 @@
+"""
+MinHash/LSH near-duplicate detection for agent records, stored in Redis
+- Each record's text is reduced to a MinHash signature over character 5-gram shingles (NUM_PERM
+  hash functions); the share of equal signature slots estimates the Jaccard similarity of two texts
+- The signature is cut into BANDS bands; every band is a bucket set (`<registry>:lsh:<band>:<digest>`)
+  holding the IDs that share it. Texts that are near-duplicates share at least one bucket with high
+  probability, so a lookup reads BANDS sets and only scores the IDs found there instead of the registry
+- Signatures are kept in `<registry>:minhash` (hex) so buckets can be cleaned up on update/delete
+
+With 64 permutations in 16 bands of 4 rows, pairs above ~0.5 Jaccard are candidates with high
+probability; candidates are then filtered by their estimated similarity against the threshold.
+
+Environment:
+- AGENT_DEDUPE_THRESHOLD: estimated Jaccard similarity from which a record counts as a duplicate (default 0.7)
+"""
+import hashlib
+import logging
+import os
+import re
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("near_duplicates")
+
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 5
+MAX_CANDIDATES = 500
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.RandomState(1)
+# Fixed seed: signatures are stored in Redis and must match across processes and restarts
+_A = _rng.randint(1, 2**31 - 1, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2**31 - 1, size=NUM_PERM).astype(np.uint64)
+
+
+def _shingles(text: str) -> List[str]:
+    text = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return [text] if text else []
+    return [text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)]
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """
+    MinHash signature (NUM_PERM uint32 values) of a text, or None for an empty text.
+    """
+    shingles = set(_shingles(text))
+    if not shingles:
+        return None
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of the texts behind two signatures.
+    """
+    return float(np.mean(sig_a == sig_b))
+
+
+class DuplicateIndex:
+    def __init__(self, registry: str, threshold: Optional[float] = None):
+        self.registry = registry
+        self.signatures_key = f"{registry}:minhash"
+        if threshold is None:
+            try:
+                threshold = float(os.getenv("AGENT_DEDUPE_THRESHOLD", 0.7))
+            except ValueError:
+                logger.warning("Invalid AGENT_DEDUPE_THRESHOLD, using default 0.7")
+                threshold = 0.7
+        self.threshold = threshold
+
+    def _bucket_keys(self, signature: np.ndarray) -> List[str]:
+        rows = NUM_PERM // BANDS
+        return [
+            f"{self.registry}:lsh:{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(BANDS)
+        ]
+
+    def queue_add(self, pipe, record_id: str, text: str) -> None:
+        """
+        Queue indexing of a new record's text on a pipeline.
+        """
+        signature = minhash(text)
+        if signature is None:
+            return
+        pipe.hset(self.signatures_key, record_id, signature.tobytes().hex())
+        for key in self._bucket_keys(signature):
+            pipe.sadd(key, record_id)
+
+    def _queue_remove(self, pipe, record_id: str, stored: Optional[str]) -> None:
+        if stored:
+            for key in self._bucket_keys(np.frombuffer(bytes.fromhex(stored), dtype=np.uint32)):
+                pipe.srem(key, record_id)
+        pipe.hdel(self.signatures_key, record_id)
+
+    async def replace(self, conn, record_id: str, text: Optional[str]) -> None:
+        """
+        Re-index a record whose text changed (None removes it).
+        """
+        stored = await conn.hget(self.signatures_key, record_id)
+        pipe = conn.pipeline(transaction=False)
+        self._queue_remove(pipe, record_id, stored)
+        if text:
+            self.queue_add(pipe, record_id, text)
+        await pipe.execute()
+
+    async def remove(self, conn, record_id: str) -> None:
+        await self.replace(conn, record_id, None)
+
+    async def remove_many(self, conn, record_ids: Sequence[str]) -> None:
+        """
+        Drop several records from the index with one signature read and one pipeline.
+        """
+        if not record_ids:
+            return
+        stored = await conn.hmget(self.signatures_key, list(record_ids))
+        pipe = conn.pipeline(transaction=False)
+        for record_id, raw in zip(record_ids, stored):
+            self._queue_remove(pipe, record_id, raw)
+        await pipe.execute()
+
+    async def find(self, conn, text: str, exclude: Sequence[str] = ()) -> List[Tuple[str, float]]:
+        """
+        Records whose text is estimated to be at least `threshold` similar to `text`, best first.
+        """
+        signature = minhash(text)
+        if signature is None:
+            return []
+        pipe = conn.pipeline(transaction=False)
+        for key in self._bucket_keys(signature):
+            pipe.smembers(key)
+        candidates = set().union(*await pipe.execute()) - set(exclude)
+        if not candidates:
+            return []
+        candidates = sorted(candidates)[:MAX_CANDIDATES]
+        stored = await conn.hmget(self.signatures_key, candidates)
+        matches = []
+        for record_id, raw in zip(candidates, stored):
+            if raw:
+                score = similarity(signature, np.frombuffer(bytes.fromhex(raw), dtype=np.uint32))
+                if score >= self.threshold:
+                    matches.append((record_id, score))
+        return sorted(matches, key=lambda match: -match[1])
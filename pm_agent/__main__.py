@@ -1,10 +1,16 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from redis_pool import close_pools
+from cpu_executor import ExecutorUnavailable, shutdown_cpu_executor
+from resilience import DependencyUnavailable
+from record_cache import start_invalidation_listener, stop_invalidation_listener
 from pm_agent.api import pm_router, prometheus_instrumentator, pm_state
-from pm_agent.rate_limit import init_rate_limiter
+from pm_agent.rate_limit import init_rate_limiter, shutdown_rate_limiter
 from pm_agent.security import validate_jwt
 from fastapi.middleware.cors import CORSMiddleware
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 import asyncio
+import math
 
 app = FastAPI()
 
@@ -27,11 +33,30 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event():
-    # Start background circuit breaker monitor
-    asyncio.create_task(pm_state.circuit_breaker_monitor())
-    # Initialize FastAPI-Limiter for rate limiting
+    # Re-queue work-queue leases that expired (AGENT_QUEUE_REAP_INTERVAL_SECONDS)
+    asyncio.create_task(pm_state.queue.run_reaper(pm_state.aredis))
+    # Start reconciling the in-process rate limit buckets with Redis
     await init_rate_limiter(app)
-
+    # Keep the record cache coherent with writes from other processes
+    start_invalidation_listener(pm_state.aredis)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the record cache listener and the semantic executor, then release the process-wide Redis pools (redis_pool.py)
+    await stop_invalidation_listener()
+    await shutdown_rate_limiter(app)
+    shutdown_cpu_executor()
+    await close_pools()
+
+@app.exception_handler(ExecutorUnavailable)
+async def executor_unavailable(request, exc: ExecutorUnavailable):
+    # Semantic work queue full or timed out: transient, the client should retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable(request, exc: DependencyUnavailable):
+    # Redis circuit breaker open or no concurrency slot in time (resilience.py): transient, the client should retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
 
 @app.get("/health")
 async def health():
@@ -1,21 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional, Literal, Tuple
 from .core import PMStateManager, Task
 from .batch_ai_semantic import PMBatchHelper, PMAIHintEngine, semantic_conflict_resolution
-from fastapi_limiter.depends import RateLimiter
+from rate_limiter import RateLimiter
 import uuid
 from prometheus_fastapi_instrumentator import Instrumentator
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer
 from .security import validate_jwt
+from conflict_resolution import MAX_CONFLICT_PAIRS
 import asyncio
+import json
+import os
 
 pm_router = APIRouter(prefix="/pm", tags=["Project Management"])
 pm_state = PMStateManager()
-batch_helper = PMBatchHelper(pm_state.aredis)
-ai_hint_engine = PMAIHintEngine(pm_state.aredis)
+batch_helper = PMBatchHelper(pm_state.aredis, graph=pm_state.graph, queue=pm_state.queue)
+ai_hint_engine = PMAIHintEngine(pm_state.aredis, resilience=pm_state.resilience)
 prometheus_instrumentator = Instrumentator()
 security = HTTPBearer()
 
@@ -31,8 +34,15 @@ class TaskRequest(BaseModel):
     assigned_to: Optional[str] = None
     priority: int = 1
 
-@pm_router.post("/assign_task", status_code=201, dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def assign_task(req: TaskRequest, token=Depends(validate_jwt)):
+@pm_router.post("/assign_task", status_code=201, dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=10, seconds=60))])
+async def assign_task(
+    req: TaskRequest,
+    token=Depends(validate_jwt),
+    dedupe: Optional[Literal["warn", "reject"]] = Query(None, description="Check for near-duplicate tasks: warn lists them, reject returns 409")
+):
+    duplicates = await pm_state.async_find_duplicates(req.objective) if dedupe else []
+    if dedupe == "reject" and duplicates:
+        raise HTTPException(status_code=409, detail={"message": "Near-duplicate tasks exist", "duplicates": duplicates})
     task = Task(
         id=f"task_{uuid.uuid4().hex}",
         objective=req.objective,
@@ -43,29 +53,123 @@ async def assign_task(req: TaskRequest, token=Depends(validate_jwt)):
         priority=req.priority
     )
     task_id = await pm_state.async_create_task(task.dict())
+    ai_hint_engine.index_task(task_id, task.objective, created=True)
+    if dedupe:
+        return {"task_id": task_id, "duplicates": duplicates}
     return {"task_id": task_id}
 
-@pm_router.get("/status/{task_id}", dependencies=[Depends(RateLimiter(times=30, seconds=60))])
+@pm_router.get("/status/{task_id}", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=30, seconds=60))])
 async def get_task_status(task_id: str, token=Depends(validate_jwt)):
     task = await pm_state.async_get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"task": task}
 
-@pm_router.post("/resolve_conflict", dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+@pm_router.get("/list_tasks", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=30, seconds=60))])
+async def list_tasks(
+    cursor: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size hint"),
+    stream: bool = Query(False, description="Stream all tasks as NDJSON instead of returning a page"),
+    token=Depends(validate_jwt)
+):
+    if stream:
+        lines = (json.dumps(task) + "\n" async for task in pm_state.async_iter_tasks())
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    next_cursor, tasks = await pm_state.async_scan_tasks(cursor=cursor, limit=limit)
+    return {"tasks": tasks, "next_cursor": next_cursor}
+
+@pm_router.get("/ready", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=30, seconds=60))])
+async def ready_tasks(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of tasks to return"),
+    token=Depends(validate_jwt)
+):
+    """
+    Pending tasks whose dependencies are all completed, highest priority first.
+    Served from the incremental dependency graph, so the cost is proportional to the result.
+    """
+    return {"tasks": await pm_state.async_ready_tasks(limit=limit)}
+
+class ClaimRequest(BaseModel):
+    worker: str
+    count: int = Field(1, ge=1, le=1000)
+
+class LeaseRequest(BaseModel):
+    worker: str
+
+@pm_router.post("/claim", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=30, seconds=60))])
+async def claim_tasks(req: ClaimRequest, token=Depends(validate_jwt)):
+    """
+    Lease up to `count` of the best pending tasks (priority boosted by age) to `worker`. No task is handed
+    to two workers: keep the lease with /heartbeat, finish by setting the task to completed, or /release it.
+    """
+    tasks = await pm_state.async_claim_tasks(req.worker, req.count)
+    return {"tasks": tasks, "lease_seconds": pm_state.queue.lease_seconds}
+
+@pm_router.post("/task/{task_id}/heartbeat")
+async def heartbeat_task(task_id: str, req: LeaseRequest, token=Depends(validate_jwt)):
+    if not await pm_state.async_heartbeat_task(task_id, req.worker):
+        raise HTTPException(status_code=409, detail="Lease not held by this worker")
+    return {"lease_seconds": pm_state.queue.lease_seconds}
+
+@pm_router.post("/task/{task_id}/release")
+async def release_task(task_id: str, req: LeaseRequest, token=Depends(validate_jwt)):
+    if not await pm_state.async_release_task(task_id, req.worker):
+        raise HTTPException(status_code=409, detail="Lease not held by this worker")
+    return {"status": "released"}
+
+@pm_router.post("/resolve_conflict", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=10, seconds=60))])
 async def resolve_conflict(task_a: Dict, task_b: Dict, token=Depends(validate_jwt)):
     # Use semantic conflict resolution
-    resolved = semantic_conflict_resolution(task_a, task_b)
+    resolved = await ai_hint_engine.executor.run_local(semantic_conflict_resolution, task_a, task_b)
     return {"resolved_task": resolved}
 
+class ConflictBatchRequest(BaseModel):
+    pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+
+@pm_router.post("/resolve_conflict/batch", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=10, seconds=60))])
+async def resolve_conflict_batch(req: ConflictBatchRequest, token=Depends(validate_jwt)):
+    """
+    Resolve many task pairs at once (vectorized scoring, one batched similarity product).
+    Returns per pair, in order: {"winner": "a"|"b", "resolved", "path", "similarity", "score"}.
+    """
+    if len(req.pairs) > MAX_CONFLICT_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CONFLICT_PAIRS} pairs per request")
+    return {"results": await ai_hint_engine.resolve_conflicts(req.pairs)}
+
 # --- Batch update endpoint ---
-@pm_router.post("/batch_update", dependencies=[Depends(RateLimiter(times=5, seconds=60))])
+@pm_router.post("/batch_update", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=5, seconds=60))])
 async def batch_update(updates: List[Dict], token=Depends(validate_jwt)):
     updated_ids = await batch_helper.batch_update_tasks(updates)
+    updated = set(updated_ids)
+    for upd in updates:
+        if upd.get('id') in updated and 'objective' in upd:
+            ai_hint_engine.index_task(upd['id'], upd['objective'])
+            await pm_state.duplicates.replace(pm_state.aredis, upd['id'], upd['objective'])
     return {"updated_ids": updated_ids}
 
 # --- AI/semantic task hint endpoint ---
-@pm_router.post("/ai_hint", dependencies=[Depends(RateLimiter(times=20, seconds=60))])
+@pm_router.post("/ai_hint", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=20, seconds=60))])
 async def ai_hint(objective: str, context: Dict, token=Depends(validate_jwt)):
     hints = await ai_hint_engine.suggest_task_fields(objective, context)
     return {"hints": hints}
+
+class HintItem(BaseModel):
+    objective: str
+    context: Dict[str, Any] = {}
+
+class HintBatchRequest(BaseModel):
+    items: List[HintItem]
+
+# Upper bound on objectives per /pm/ai_hint/batch call
+MAX_HINT_BATCH = int(os.getenv("PM_AGENT_MAX_HINT_BATCH", 500))
+
+@pm_router.post("/ai_hint/batch", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=5, seconds=60))])
+async def ai_hint_batch(req: HintBatchRequest, token=Depends(validate_jwt)):
+    """
+    Hints for many objectives in one call (one similarity pass, one maintainer lookup per module).
+    Returns one hint per item, in order.
+    """
+    if len(req.items) > MAX_HINT_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_HINT_BATCH} items per request")
+    hints = await ai_hint_engine.suggest_task_fields_batch([(item.objective, item.context) for item in req.items])
+    return {"hints": hints}
@@ -1,57 +1,118 @@
 # PM Agent: Batch Pipelining, AI Hints, Semantic Conflict Resolution
-import json
-from typing import List, Dict, Optional
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Optional, Tuple
 import redis.asyncio as aioredis
 import asyncio
+from redis_scripts import RecordMerger, MERGE_OK
+from record_codec import decode_record
+from record_cache import cache_for
+from semantic_index import semantic_index, related_ids
+from similarity import similarity_service
+from conflict_resolution import ConflictPolicy, resolve_pairs
+from dependency_graph import DependencyGraph
+from resilience import ResiliencePolicy, resilience_policy
+from work_queue import WorkQueue
+
+# Other agents' records suggested alongside related PM tasks
+RELATED_SOURCES = ("dev", "ta", "qa")
+# The rules of semantic_conflict_resolution, for batches of pairs
+CONFLICT_POLICY = ConflictPolicy(["objective"], time_weight=0.7, priority_weight=0.3, similarity_weight=0.5, similar_threshold=None)
 
 class PMBatchHelper:
-    def __init__(self, redis_conn):
+    def __init__(self, redis_conn, graph: Optional[DependencyGraph] = None, queue: Optional[WorkQueue] = None):
         self.redis = redis_conn
         self.task_registry = "pm:tasks"
+        self.merger = RecordMerger(self.task_registry, cache=cache_for(self.task_registry))
+        self.graph = graph or DependencyGraph(self.task_registry)
+        self.queue = queue or WorkQueue("pm")
 
     async def batch_update_tasks(self, updates: List[dict], batch_size: int = 50) -> List[str]:
+        # Each batch is merged server-side in a single EVALSHA; an optional 'version' makes the update conditional.
+        # Updates whose new dependencies would close a cycle are skipped; the others claim their edges before
+        # the merge (released again when the merge does not apply). Merged tasks refresh their graph nodes
+        # and follow their status changes in the work queue.
         updated_ids = []
         for i in range(0, len(updates), batch_size):
             batch = updates[i:i+batch_size]
-            pipe = self.redis.pipeline()
+            items = []
             for upd in batch:
-                task_id = upd['id']
-                raw = await self.redis.hget(self.task_registry, task_id)
-                if raw:
-                    task = json.loads(raw)
-                    task.update(upd)
-                    pipe.hset(self.task_registry, task_id, json.dumps(task))
-                    updated_ids.append(task_id)
-            await pipe.execute()
+                fields = dict(upd)
+                expected_version = fields.pop('version', None)
+                items.append((upd['id'], fields, expected_version))
+            checked = [item for item in items if 'dependencies' in item[1]]
+            cycles = await self.graph.link(self.redis, [(task_id, fields['dependencies']) for task_id, fields, _ in checked])
+            rejected = {item[0] for item, cycle in zip(checked, cycles) if cycle}
+            items = [item for item in items if item[0] not in rejected]
+            results = await self.merger.merge(self.redis, items)
+            merged = [(item, task) for item, (status, task) in zip(items, results) if status == MERGE_OK]
+            await self.graph.revert(self.redis, [
+                (item[0], task if isinstance(task, dict) else None)
+                for item, (status, task) in zip(items, results) if status != MERGE_OK and 'dependencies' in item[1]
+            ])
+            await self.graph.put_many(self.redis, [(item[0], task) for item, task in merged if self.graph.affects(item[1])], edges=False)
+            for (task_id, fields, _), task in merged:
+                await self.queue.follow(self.redis, task_id, fields, task)
+            updated_ids.extend(item[0] for item, _ in merged)
         return updated_ids
 
 class PMAIHintEngine:
-    def __init__(self, redis_conn):
+    def __init__(self, redis_conn, semantic=None, resilience: Optional[ResiliencePolicy] = None):
         self.redis = redis_conn
         self.task_registry = "pm:tasks"
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+        # Task and maintainer reads go through the PM manager's breaker and concurrency limit
+        # (PMStateManager.resilience; the process-wide "pm_redis" policy when not given)
+        self.resilience = resilience or resilience_policy("pm_redis", env_prefix="PM_AGENT_REDIS", fail_max=3, reset_timeout=10)
+        # Objectives are the "pm" source of the process-wide cross-agent index (semantic_index.py),
+        # kept current by index_task(); tasks written by another process arrive as cache invalidations
+        self.semantic = semantic or semantic_index(redis_conn)
+        # Index refreshes and similarity queries run on the shared CPU executor, off the event loop
+        self.executor = self.semantic.executor
+        # semantic_conflict_resolution takes its IDF from the same index
+        self.similarity = similarity_service(self.task_registry, corpus=self.semantic.index)
 
     async def suggest_task_fields(self, objective: str, context: dict) -> dict:
-        existing_tasks = await self._get_similar_tasks(objective)
-        assigned_to = await self._suggest_assignee(context.get('module'))
-        return {
-            "priority": self._suggest_priority(objective),
-            "dependencies": self._suggest_dependencies(existing_tasks),
-            "assigned_to": assigned_to
-        }
+        [hints] = await self.suggest_task_fields_batch([(objective, context)])
+        return hints
 
-    async def _get_similar_tasks(self, objective: str) -> List[dict]:
-        keys = await self.redis.hkeys(self.task_registry)
-        tasks = [json.loads(await self.redis.hget(self.task_registry, k)) for k in keys]
-        if not tasks:
+    async def suggest_task_fields_batch(self, items: List[Tuple[str, dict]]) -> List[dict]:
+        """
+        Hints for many (objective, context) pairs: one query-by-index similarity matrix finds each
+        objective's closest PM tasks and the related DEV tasks, TA decisions and QA tests; the matched
+        tasks and the distinct modules' maintainers are each read in one round trip. Results are in input order.
+        """
+        if not items:
             return []
-        corpus = [t['objective'] for t in tasks]
-        X = self.vectorizer.fit_transform(corpus + [objective])
-        sims = cosine_similarity(X[-1], X[:-1]).flatten()
-        similar = [tasks[i] for i in sims.argsort()[-3:][::-1]]
-        return similar
+        found = await self.semantic.search([objective for objective, _ in items], ("pm",) + RELATED_SOURCES)
+        matches = [[task_id for task_id, _ in task_matches["pm"][:3]] for task_matches in found]
+        tasks = await self._get_tasks(sorted({task_id for ids in matches for task_id in ids}))
+        assignees = await self._suggest_assignees({(context or {}).get('module') for _, context in items})
+        hints = []
+        for (objective, context), ids, task_matches in zip(items, matches, found):
+            hints.append({
+                "priority": self._suggest_priority(objective),
+                "dependencies": self._suggest_dependencies([tasks[task_id] for task_id in ids if task_id in tasks]),
+                "assigned_to": assignees.get((context or {}).get('module')),
+                "related": related_ids(task_matches, RELATED_SOURCES)
+            })
+        return hints
+
+    async def resolve_conflicts(self, pairs: List[Tuple[dict, dict]]) -> List[dict]:
+        """
+        semantic_conflict_resolution for many task pairs in one vectorized pass (one batched
+        similarity product for all objectives), on the shared CPU executor.
+        """
+        return await self.executor.run_local(resolve_pairs, pairs, CONFLICT_POLICY, self.similarity)
+
+    def index_task(self, task_id: str, objective: Optional[str], created: bool = False) -> None:
+        """
+        Add or re-index one task after it was written. `created` marks a task new to the registry.
+        """
+        self.semantic.index_record("pm", task_id, objective, created=created)
+
+    async def _get_tasks(self, task_ids: List[str]) -> Dict[str, dict]:
+        if not task_ids:
+            return {}
+        raw_tasks = await self.resilience.call(lambda: self.redis.hmget(self.task_registry, task_ids), idempotent=True)
+        return {task_id: decode_record(raw) for task_id, raw in zip(task_ids, raw_tasks) if raw}
 
     def _suggest_priority(self, text: str) -> int:
         urgency_terms = {"urgent": 3, "high": 2, "medium": 1, "low": 0}
@@ -63,21 +124,21 @@ class PMAIHintEngine:
     def _suggest_dependencies(self, similar_tasks: List[dict]) -> List[str]:
         return list({t['id'] for t in similar_tasks if t.get('status') not in ['completed', 'archived']})
 
-    async def _suggest_assignee(self, module: Optional[str]) -> Optional[str]:
-        if not module:
-            return None
-        maintainers = await self.redis.hget("pm:module_maintainers", module)
-        if maintainers:
-            return maintainers.split(',')[0]
-        return None
+    async def _suggest_assignees(self, modules) -> Dict[str, Optional[str]]:
+        """
+        First maintainer of each module (None for modules without one), in one HMGET.
+        """
+        modules = sorted(module for module in modules if module)
+        if not modules:
+            return {}
+        maintainers = await self.resilience.call(lambda: self.redis.hmget("pm:module_maintainers", modules), idempotent=True)
+        return {module: value.split(',')[0] if value else None for module, value in zip(modules, maintainers)}
 
 def semantic_conflict_resolution(task_a: dict, task_b: dict, alpha: float = 0.7, beta: float = 0.3, gamma: float = 0.5) -> dict:
     # Use both timestamp, priority, and semantic similarity
     time_score = alpha * (task_a.get('timestamp', 0) - task_b.get('timestamp', 0))
     priority_score = beta * (task_a.get('priority', 1) - task_b.get('priority', 1))
-    # Semantic similarity of objectives
-    vectorizer = TfidfVectorizer(stop_words='english')
-    X = vectorizer.fit_transform([task_a['objective'], task_b['objective']])
-    sim = cosine_similarity(X[0], X[1])[0][0]
+    # Semantic similarity of objectives (memoized vectors, corpus-level IDF)
+    sim = similarity_service("pm:tasks").similarity(task_a.get('objective', ''), task_b.get('objective', ''))
     semantic_score = gamma * sim
     return task_a if (time_score + priority_score + semantic_score) >= 0 else task_b
@@ -1,15 +1,26 @@
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, AsyncIterator
 from pydantic import BaseModel
 import uuid
-import json
-import redis.asyncio as aioredis
-from redis import Redis  # legacy, for migration
-import asyncio
 import logging
 from prometheus_client import Counter, Gauge
 from opentelemetry import trace
 from opentelemetry.instrumentation.redis import RedisInstrumentor
+from redis_scripts import RecordMerger, VersionConflict, MERGE_OK, MERGE_MISSING, MERGE_CONFLICT
+from record_codec import encode_record, decode_record
+from redis_pool import get_async_redis, get_bridge_redis, get_sync_redis
+from sync_bridge import bridge_twin, run_sync
+from record_cache import cache_for
+from write_coalescer import coalescer_from_env, pipeline_flush
+from near_duplicates import DuplicateIndex
+from dependency_graph import DependencyGraph, DependencyCycle
+from work_queue import WorkQueue
+from resilience import CircuitBreaker, resilience_policy
+
+redis_circuit_gauge = Gauge('pm_redis_circuit_open', 'PM Redis circuit breaker state')
+
+def _track_circuit(breaker: CircuitBreaker, old: str, new: str) -> None:
+    redis_circuit_gauge.set(1 if new == CircuitBreaker.OPEN else 0)
 
 class Task(BaseModel):
     id: str
@@ -25,95 +36,209 @@ class Task(BaseModel):
 
 class PMStateManager:
     def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379):
+        self._redis_url = f"redis://{redis_host}:{redis_port}"
         # Legacy sync Redis for migration
-        self.redis = Redis(host=redis_host, port=redis_port, decode_responses=True)
-        # Async Redis for new operations
-        self.aredis = aioredis.from_url(f"redis://{redis_host}:{redis_port}", decode_responses=True)
+        self.redis = get_sync_redis(self._redis_url)
+        # Async Redis for new operations; both draw from the process-wide pools in redis_pool.py
+        self.aredis = get_async_redis(self._redis_url)
         self.task_registry = "pm:tasks"
-        # Circuit breaker state
-        self.circuit_open = False
-        self.failure_count = 0
-        self.failure_threshold = 3
-        self.recovery_timeout = 10  # seconds
-        self.last_failure_time = None
+        # Read-through cache for async_get_task, invalidated by every update path
+        self.cache = cache_for(self.task_registry)
+        self.merger = RecordMerger(self.task_registry, cache=self.cache)
+        # MinHash/LSH buckets over objectives for near-duplicate checks (pm:tasks:lsh:*)
+        self.duplicates = DuplicateIndex(self.task_registry)
+        # Dependency graph with unfinished-dependency counters, answers async_ready_tasks (pm:tasks:graph:*)
+        self.graph = DependencyGraph(self.task_registry)
+        # Leased priority queue of pending tasks that agents claim from (queue:pm:*), follows status changes
+        self.queue = WorkQueue("pm")
+        # Opt-in micro-batching of concurrent async_create_task calls (AGENT_WRITE_COALESCE)
+        self.create_coalescer = coalescer_from_env("pm_create_task", pipeline_flush(self.aredis))
+        # Process-wide breaker (half-open probing), retry budget and adaptive concurrency limit for PM Redis calls (see resilience.py)
+        self.resilience = resilience_policy("pm_redis", env_prefix="PM_AGENT_REDIS", fail_max=3, reset_timeout=10,
+                                            exclude=[VersionConflict, DependencyCycle])
+        self._bridge: Optional["PMStateManager"] = None
+        if _track_circuit not in self.resilience.breaker.listeners:
+            self.resilience.breaker.listeners.append(_track_circuit)
         # Prometheus metrics
         self.task_create_counter = Counter('pm_task_create_total', 'Total PM tasks created')
         self.conflict_resolve_counter = Counter('pm_conflict_resolve_total', 'Total PM conflicts resolved')
-        self.redis_circuit_gauge = Gauge('pm_redis_circuit_open', 'PM Redis circuit breaker state')
+        self.redis_circuit_gauge = redis_circuit_gauge
         # OpenTelemetry tracer
         self.tracer = trace.get_tracer(__name__)
         RedisInstrumentor().instrument()
         # Logging
         self.logger = logging.getLogger("pm_agent.PMStateManager")
 
-    # --- Legacy sync methods below (to be migrated) ---
-
-    def create_task(self, task: dict) -> str:
-        # ... (existing sync code)
-        task = task.copy()
-        for k in ['created_at', 'updated_at']:
-            if k in task and hasattr(task[k], 'isoformat'):
-                task[k] = task[k].isoformat()
-        task_id = f"task_{uuid.uuid4().hex}"
-        self.redis.hset(self.task_registry, task_id, json.dumps(task))
-        return task_id
-
     # --- Modern async methods below ---
 
     async def async_create_task(self, task: dict) -> str:
         with self.tracer.start_as_current_span("pm_async_create_task"):
-            if self.circuit_open:
-                self.logger.warning("Circuit breaker open: rejecting create_task")
-                raise Exception("Redis circuit breaker open")
+            task_id = f"task_{uuid.uuid4().hex}"
             try:
-                task = task.copy()
-                for k in ['created_at', 'updated_at']:
-                    if k in task and hasattr(task[k], 'isoformat'):
-                        task[k] = task[k].isoformat()
-                task_id = f"task_{uuid.uuid4().hex}"
-                await self.aredis.hset(self.task_registry, task_id, json.dumps(task))
-                self.task_create_counter.inc()
-                self.logger.info(f"Task created: {task_id}")
-                self._reset_circuit()
-                return task_id
+                await self.resilience.call(lambda: self._create(task_id, task))
             except Exception as e:
-                self._record_failure()
                 self.logger.error(f"Create task failed: {e}")
                 raise
+            self.task_create_counter.inc()
+            self.logger.info(f"Task created: {task_id}")
+            return task_id
+
+    async def _create(self, task_id: str, task: dict) -> None:
+        if self.create_coalescer is not None:
+            await self.create_coalescer.submit(lambda pipe: self._queue_create(pipe, task_id, task))
+        else:
+            pipe = self.aredis.pipeline()
+            self._queue_create(pipe, task_id, task)
+            await pipe.execute()
+        # A fresh ID has no dependents yet, so a new task cannot close a cycle
+        await self.graph.put_many(self.aredis, [(task_id, task)])
+        await self.queue.enqueue_pending(self.aredis, [(task_id, task)])
+
+    def _queue_create(self, pipe, task_id: str, task: dict) -> None:
+        pipe.hset(self.task_registry, task_id, encode_record(task))
+        self.duplicates.queue_add(pipe, task_id, task.get("objective"))
+
+    async def async_find_duplicates(self, objective: str) -> List[dict]:
+        """
+        Existing tasks whose objective is a near-duplicate of `objective` (MinHash/LSH estimate),
+        as [{"id", "similarity"}] best first.
+        """
+        with self.tracer.start_as_current_span("pm_async_find_duplicates"):
+            try:
+                matches = await self.resilience.call(lambda: self.duplicates.find(self.aredis, objective), idempotent=True)
+            except Exception as e:
+                self.logger.error(f"Find duplicates failed: {e}")
+                raise
+            return [{"id": task_id, "similarity": score} for task_id, score in matches]
 
     async def async_get_task(self, task_id: str) -> dict:
         with self.tracer.start_as_current_span("pm_async_get_task"):
-            if self.circuit_open:
-                self.logger.warning("Circuit breaker open: rejecting get_task")
-                raise Exception("Redis circuit breaker open")
+            if self.cache is not None:
+                cached = self.cache.get(task_id)
+                if cached is not None:
+                    return cached
+                generation = self.cache.generation
             try:
-                raw = await self.aredis.hget(self.task_registry, task_id)
-                self._reset_circuit()
-                if not raw:
-                    return None
-                return json.loads(raw)
+                raw = await self.resilience.call(lambda: self.aredis.hget(self.task_registry, task_id), idempotent=True)
             except Exception as e:
-                self._record_failure()
                 self.logger.error(f"Get task failed: {e}")
                 raise
+            if not raw:
+                return None
+            task = decode_record(raw)
+            if self.cache is not None:
+                self.cache.put(task_id, task, generation)
+            return task
 
     async def async_update_task(self, task_id: str, updates: dict) -> None:
         with self.tracer.start_as_current_span("pm_async_update_task"):
-            if self.circuit_open:
-                self.logger.warning("Circuit breaker open: rejecting update_task")
-                raise Exception("Redis circuit breaker open")
+            updates = dict(updates)
+            expected_version = updates.pop("version", None)
             try:
-                task = await self.async_get_task(task_id)
-                if not task:
-                    raise ValueError("Task not found")
-                task.update(updates)
-                await self.aredis.hset(self.task_registry, task_id, json.dumps(task))
-                self._reset_circuit()
-                self.logger.info(f"Task updated: {task_id}")
+                cycle, merge_status, task = await self.resilience.call(lambda: self._merge_update(task_id, updates, expected_version))
             except Exception as e:
-                self._record_failure()
                 self.logger.error(f"Update task failed: {e}")
                 raise
+            if cycle:
+                raise DependencyCycle(task_id, cycle)
+            if merge_status == MERGE_MISSING:
+                raise ValueError("Task not found")
+            if merge_status == MERGE_CONFLICT:
+                raise VersionConflict(task_id, task)
+            if merge_status != MERGE_OK:
+                raise ValueError("Stored task is not a JSON object")
+            if "objective" in updates:
+                await self.duplicates.replace(self.aredis, task_id, task.get("objective"))
+            self.logger.info(f"Task updated: {task_id}")
+
+    async def _merge_update(self, task_id: str, updates: dict, expected_version) -> tuple:
+        # (cycle, merge_status, task); nothing is written when the new dependencies would close a cycle:
+        # the check claims the new edges in the same script, ahead of the merge (see dependency_graph.py)
+        linked = "dependencies" in updates
+        if linked:
+            [cycle] = await self.graph.link(self.aredis, [(task_id, updates["dependencies"])])
+            if cycle:
+                return cycle, None, None
+        [(merge_status, task)] = await self.merger.merge(self.aredis, [(task_id, updates, expected_version)])
+        if merge_status != MERGE_OK and linked:
+            await self.graph.revert(self.aredis, [(task_id, task if isinstance(task, dict) else None)])
+        if merge_status == MERGE_OK and self.graph.affects(updates):
+            # Completing a task only moves its direct dependents' counters; the edges were claimed above
+            await self.graph.put(self.aredis, task_id, task, edges=False)
+        if merge_status == MERGE_OK:
+            await self.queue.follow(self.aredis, task_id, updates, task)
+        return None, merge_status, task
+
+    async def async_ready_tasks(self, limit: int = 100) -> List[dict]:
+        """
+        Up to `limit` pending tasks whose dependencies are all completed, highest priority first,
+        from the dependency graph's ready set (cost proportional to the result).
+        """
+        with self.tracer.start_as_current_span("pm_async_ready_tasks"):
+            try:
+                raw_tasks = await self.resilience.call(lambda: self._ready(limit), idempotent=True)
+            except Exception as e:
+                self.logger.error(f"Ready tasks failed: {e}")
+                raise
+            return [decode_record(raw) for raw in raw_tasks if raw]
+
+    async def async_claim_tasks(self, worker: str, count: int = 1) -> List[dict]:
+        """
+        Lease the `count` best pending tasks (priority boosted by age) to `worker` with one ZPOPMAX;
+        expired leases go back to the queue. Tasks deleted since they were queued are skipped.
+        """
+        with self.tracer.start_as_current_span("pm_async_claim_tasks"):
+            try:
+                raw_tasks = await self.resilience.call(lambda: self._claim(worker, count))
+            except Exception as e:
+                self.logger.error(f"Claim tasks failed: {e}")
+                raise
+            return [decode_record(raw) for raw in raw_tasks if raw]
+
+    async def _ready(self, limit: int) -> list:
+        task_ids = await self.graph.ready(self.aredis, limit)
+        return await self.aredis.hmget(self.task_registry, task_ids) if task_ids else []
+
+    async def _claim(self, worker: str, count: int) -> list:
+        claimed = await self.queue.claim(self.aredis, worker, count)
+        task_ids = [task_id for task_id, _ in claimed]
+        return await self.aredis.hmget(self.task_registry, task_ids) if task_ids else []
+
+    async def async_heartbeat_task(self, task_id: str, worker: str) -> bool:
+        """
+        Extend `worker`'s lease on a claimed task. False if the lease expired or belongs to another worker.
+        """
+        return await self.resilience.call(lambda: self.queue.heartbeat(self.aredis, task_id, worker), idempotent=True)
+
+    async def async_release_task(self, task_id: str, worker: str) -> bool:
+        """
+        Give a claimed task back to the queue without finishing it.
+        """
+        return await self.resilience.call(lambda: self.queue.release(self.aredis, task_id, worker))
+
+    async def async_scan_tasks(self, cursor: int = 0, limit: int = 100) -> Tuple[int, List[dict]]:
+        """
+        Fetch one HSCAN page of tasks. Returns (next_cursor, tasks); 0 means the scan is complete.
+        """
+        with self.tracer.start_as_current_span("pm_async_scan_tasks"):
+            try:
+                next_cursor, page = await self.resilience.call(lambda: self.aredis.hscan(self.task_registry, cursor=cursor, count=limit), idempotent=True)
+            except Exception as e:
+                self.logger.error(f"Scan tasks failed: {e}")
+                raise
+            return next_cursor, [decode_record(raw) for raw in page.values()]
+
+    async def async_iter_tasks(self, batch_size: int = 500) -> AsyncIterator[dict]:
+        """
+        Yield tasks page by page without materialising the whole registry.
+        """
+        cursor = 0
+        while True:
+            cursor, tasks = await self.async_scan_tasks(cursor, batch_size)
+            for task in tasks:
+                yield task
+            if cursor == 0:
+                break
 
     async def async_resolve_conflict(self, task_a: dict, task_b: dict, alpha: float = 0.7, beta: float = 0.3) -> dict:
         with self.tracer.start_as_current_span("pm_async_resolve_conflict"):
@@ -126,56 +251,40 @@ class PMStateManager:
             self.logger.info(f"Conflict resolved: {resolved['id']}")
             return resolved
 
-    # --- Circuit breaker helpers ---
-    def _record_failure(self):
-        self.failure_count += 1
-        self.last_failure_time = asyncio.get_event_loop().time()
-        if self.failure_count >= self.failure_threshold:
-            self.circuit_open = True
-            self.redis_circuit_gauge.set(1)
-            self.logger.error("Redis circuit breaker opened!")
-
-    def _reset_circuit(self):
-        self.failure_count = 0
-        self.circuit_open = False
-        self.redis_circuit_gauge.set(0)
-
-    async def circuit_breaker_monitor(self):
-        while True:
-            if self.circuit_open and self.last_failure_time:
-                now = asyncio.get_event_loop().time()
-                if now - self.last_failure_time > self.recovery_timeout:
-                    self._reset_circuit()
-                    self.logger.info("Redis circuit breaker reset.")
-            await asyncio.sleep(1)
+    # --- Synchronous compatibility wrappers (not for use inside async handlers) ---
+
+    def _bridged(self) -> "PMStateManager":
+        """
+        Twin of this manager for the sync write wrappers, with a client and resilience policy used only on
+        the bridge loop (see sync_bridge.py). Writes are not coalesced there.
+        """
+        if self._bridge is None:
+            self._bridge = bridge_twin(
+                self,
+                aredis=get_bridge_redis(self._redis_url),
+                create_coalescer=None,
+                resilience=resilience_policy("pm_redis_sync", env_prefix="PM_AGENT_REDIS", fail_max=3, reset_timeout=10,
+                                             exclude=[VersionConflict, DependencyCycle]),
+            )
+        return self._bridge
 
     def create_task(self, task: dict) -> str:
-        # Ensure all fields are JSON serializable
-        task = task.copy()
-        for k in ['created_at', 'updated_at']:
-            if k in task and hasattr(task[k], 'isoformat'):
-                task[k] = task[k].isoformat()
-        task_id = f"task_{uuid.uuid4().hex}"
-        self.redis.hset(self.task_registry, task_id, json.dumps(task))
-        return task_id
+        # The async path also files the task in the dependency graph, work queue and duplicate index
+        return run_sync(self._bridged().async_create_task(task))
 
     def get_task(self, task_id: str) -> dict:
         raw = self.redis.hget(self.task_registry, task_id)
         if not raw:
             return None
-        return json.loads(raw)
+        return decode_record(raw)
 
     def list_tasks(self) -> list:
-        # This is a simplified scan; in production, use SCAN for large sets
-        keys = self.redis.keys(f"{self.task_registry}:*")
-        return [self.redis.json().get(k) for k in keys]
+        # Tasks live in the pm:tasks hash; HSCAN walks it incrementally instead of the blocking KEYS
+        return [decode_record(raw) for _, raw in self.redis.hscan_iter(self.task_registry, count=500)]
 
     def update_task(self, task_id: str, updates: dict) -> None:
-        task = self.get_task(task_id)
-        if not task:
-            raise ValueError("Task not found")
-        task.update(updates)
-        self.redis.json().set(f"{self.task_registry}:{task_id}", Path.root_path(), task)
+        # Server-side merge with the cycle check, graph, work queue and duplicate index upkeep of async_update_task
+        run_sync(self._bridged().async_update_task(task_id, updates))
 
     def resolve_conflict(self, task_a: dict, task_b: dict, alpha: float = 0.7, beta: float = 0.3) -> dict:
         time_score = alpha * (task_a.get('timestamp', 0) - task_b.get('timestamp', 0))
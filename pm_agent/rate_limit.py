@@ -1,16 +1,16 @@
-# PM Agent: API Rate Limiting (FastAPI-Limiter integration)
+# PM Agent: API Rate Limiting (in-process token buckets reconciled with Redis, see rate_limiter.py)
 import os
-from fastapi import Request, HTTPException
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import redis.asyncio as aioredis
+from redis_pool import get_async_redis
+from rate_limiter import RateLimiter, rate_limiter, start_rate_limiter, stop_rate_limiter
 
 REDIS_URL = os.getenv("PM_AGENT_REDIS_URL", "redis://localhost:6379/0")
 
 async def init_rate_limiter(app):
-    redis = await aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(redis)
-    app.state.rate_limiter = FastAPILimiter
+    start_rate_limiter(get_async_redis(REDIS_URL))
+    app.state.rate_limiter = rate_limiter()
+
+async def shutdown_rate_limiter(app):
+    await stop_rate_limiter()
 
 # Usage in FastAPI endpoint:
 # from fastapi import Depends
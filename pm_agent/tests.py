@@ -4,11 +4,12 @@ from httpx import AsyncClient
 from fastapi import FastAPI
 from pm_agent.api import pm_router
 from pm_agent.core import PMStateManager
+from pm_agent.security import auth_service
 import asyncio
 import os
 
-# --- JWT token stub for tests ---
-TEST_JWT = "Bearer test.jwt.token"
+# --- JWT for tests, signed with the PM agent's current key (see auth_service.py) ---
+TEST_JWT = f"Bearer {auth_service.issue({'sub': 'pm-test'})}"
 
 def auth_headers():
     return {"Authorization": TEST_JWT}
@@ -94,3 +95,62 @@ async def test_tracing_headers_propagation(async_client):
 # def test_task_assignment(): ...
 # def test_task_status_not_found(): ...
 # def test_conflict_resolution(): ...
+
+@pytest.mark.asyncio
+async def test_ai_hint_batch_reads_tasks_and_maintainers_once():
+    from unittest.mock import AsyncMock, MagicMock
+    from record_codec import encode_record
+    from semantic_index import SemanticIndex, Source
+    from pm_agent.batch_ai_semantic import PMAIHintEngine
+    index = SemanticIndex(MagicMock(), sources={name: Source(name, AsyncMock(), ["objective"]) for name in ("pm", "dev", "ta", "qa")})
+    for name, source in index.sources.items():
+        docs = [("pmtask_1", "launch billing dashboard"), ("pmtask_2", "migrate login to oauth")] if name == "pm" else []
+        source.store.count.return_value = len(docs)
+        index.load(name, docs)
+    redis_mock = AsyncMock()
+    tasks = {"pmtask_1": encode_record({"id": "pmtask_1", "status": "pending"}), "pmtask_2": encode_record({"id": "pmtask_2", "status": "completed"})}
+    maintainers = {"billing": "alice,bob"}
+    redis_mock.hmget.side_effect = lambda key, fields: [(tasks if key == "pm:tasks" else maintainers).get(f) for f in fields]
+    async def call(fn, idempotent=False):
+        return await fn()
+    resilience = MagicMock()
+    resilience.call = AsyncMock(side_effect=call)
+    engine = PMAIHintEngine(redis_mock, semantic=index, resilience=resilience)
+    hints = await engine.suggest_task_fields_batch([("urgent billing dashboard", {"module": "billing"}), ("oauth login", {"module": "auth"}), ("billing", {"module": "billing"})])
+    assert [h["priority"] for h in hints] == [3, 1, 1]
+    assert [h["assigned_to"] for h in hints] == ["alice", None, "alice"]
+    assert hints[0]["dependencies"] == ["pmtask_1"] and hints[1]["dependencies"] == []
+    assert redis_mock.hmget.await_count == 2
+    # Both reads are retried under the PM policy
+    assert [call.kwargs for call in resilience.call.await_args_list] == [{"idempotent": True}] * 2
+
+@pytest.mark.asyncio
+async def test_batch_update_skips_cycles_and_refreshes_graph():
+    from unittest.mock import AsyncMock
+    from pm_agent.batch_ai_semantic import PMBatchHelper
+    helper = PMBatchHelper(AsyncMock())
+    helper.graph.link = AsyncMock(return_value=[["pmtask_1", "pmtask_2", "pmtask_1"], None])
+    helper.graph.put_many = AsyncMock()
+    helper.merger.merge = AsyncMock(return_value=[("ok", {"status": "pending", "dependencies": ["pmtask_9"]}), ("ok", {"objective": "x"})])
+    updates = [
+        {"id": "pmtask_1", "dependencies": ["pmtask_2"]},
+        {"id": "pmtask_3", "dependencies": ["pmtask_9"]},
+        {"id": "pmtask_4", "objective": "x"},
+    ]
+    assert await helper.batch_update_tasks(updates) == ["pmtask_3", "pmtask_4"]
+    assert [item[0] for item in helper.merger.merge.await_args.args[1]] == ["pmtask_3", "pmtask_4"]
+    helper.graph.put_many.assert_awaited_once_with(helper.redis, [("pmtask_3", {"status": "pending", "dependencies": ["pmtask_9"]})], edges=False)
+
+def test_legacy_sync_writes_go_through_the_async_paths():
+    from unittest.mock import AsyncMock, patch
+    from pm_agent.core import PMStateManager
+    from pm_agent.api import pm_state as state
+    with patch.object(PMStateManager, "async_create_task", AsyncMock(return_value="task_1")) as create, \
+            patch.object(PMStateManager, "async_update_task", AsyncMock()) as update:
+        assert state.create_task({"objective": "x"}) == "task_1"
+        state.update_task("task_1", {"status": "completed"})
+    create.assert_awaited_once_with({"objective": "x"})
+    update.assert_awaited_once_with("task_1", {"status": "completed"})
+    # They run on the bridge loop with its own client and policy, without the loop-bound coalescer
+    assert state._bridge.aredis is not state.aredis and state._bridge.create_coalescer is None
+    assert state._bridge.resilience is not state.resilience
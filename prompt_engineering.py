@@ -21,16 +21,23 @@ Role: {self.role}\n"""
         return prompt
 
 class ContextInjector:
-    def __init__(self, agent):
+    def __init__(self, agent, recall_k: int = 5):
         self.agent = agent
+        self.recall_k = recall_k
 
-    def get_context(self):
+    def get_context(self, query_vector=None):
         # Gather dynamic memory and status for the agent
+        memory = getattr(self.agent, "memory", {})
+        # Agents with a vector store (memory.VectorStore) also get the memories closest to the query
+        store = getattr(self.agent, "memory_store", None)
+        if store is not None and query_vector is not None:
+            recalled = [metadata for _, _, metadata in store.search([query_vector], k=self.recall_k)[0]]
+            memory = {**memory, "recalled": recalled}
         return {
-            "memory": getattr(self.agent, "memory", {}),
+            "memory": memory,
             "status": getattr(self.agent, "status", {})
         }
 
-    def inject(self, prompt_template: PromptTemplate) -> str:
-        context = self.get_context()
+    def inject(self, prompt_template: PromptTemplate, query_vector=None) -> str:
+        context = self.get_context(query_vector)
         return prompt_template.render(memory=context["memory"], status=context["status"])
@@ -1,14 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from .core import QAStateManager, QATestCase
+from .batch_ai_semantic import QAAIHintEngine
 import uuid
-from fastapi import Depends
+from fastapi import Depends, Query
+from fastapi.responses import StreamingResponse
+import json
 from .security import validate_jwt
-from fastapi_limiter.depends import RateLimiter
+from record_store import parse_fields
+from conflict_resolution import MAX_CONFLICT_PAIRS
+from rate_limiter import RateLimiter
+from redis_scripts import VersionConflict
 
 qa_router = APIRouter(prefix="/qa", tags=["Quality Assurance"])
 qa_state = QAStateManager()
+ai_hint_engine = QAAIHintEngine(qa_state.redis)
 
 # Dependency injection for async QAStateManager (for testability)
 def get_async_qa_state():
@@ -33,12 +40,17 @@ async def create_test(req: QATestCaseRequest, state: QAStateManager = Depends(ge
         priority=req.priority
     )
     test_id = await state.async_create_test(test.dict())
+    ai_hint_engine.index_test(test_id, test.description, created=True)
     return {"test_id": test_id}
 
 @qa_router.get("/status/{test_id}")
-async def get_test_status(test_id: str, state: QAStateManager = Depends(get_async_qa_state), token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))):
-    test = await state.async_get_test(test_id)
-    if not test:
+async def get_test_status(
+    test_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return (e.g. fields=status)"),
+    state: QAStateManager = Depends(get_async_qa_state), token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))
+):
+    test = await state.async_get_test(test_id, fields=parse_fields(fields))
+    if test is None:
         raise HTTPException(status_code=404, detail="Test not found")
     return {"test": test}
 
@@ -47,14 +59,44 @@ async def resolve_conflict(test_a: Dict, test_b: Dict, state: QAStateManager = D
     resolved = await state.async_resolve_conflict(test_a, test_b)
     return {"resolved_test": resolved}
 
+class ConflictBatchRequest(BaseModel):
+    pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+
+@qa_router.post("/resolve_conflict/batch")
+async def resolve_conflict_batch(req: ConflictBatchRequest, state: QAStateManager = Depends(get_async_qa_state), token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))):
+    """
+    Resolve many test pairs at once (vectorized scoring, one batched similarity product).
+    Returns per pair, in order: {"winner": "a"|"b", "resolved", "path", "similarity", "score"}.
+    """
+    if len(req.pairs) > MAX_CONFLICT_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CONFLICT_PAIRS} pairs per request")
+    return {"results": await ai_hint_engine.executor.run_local(state.resolve_conflicts, req.pairs)}
+
 @qa_router.get("/list_tests")
-async def list_tests(state: QAStateManager = Depends(get_async_qa_state), token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))):
-    tests = await state.async_list_tests()
-    return {"tests": tests}
+async def list_tests(
+    cursor: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size hint"),
+    stream: bool = Query(False, description="Stream all tests as NDJSON instead of returning a page"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return for each test"),
+    state: QAStateManager = Depends(get_async_qa_state), token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))
+):
+    projection = parse_fields(fields)
+    if stream:
+        lines = (json.dumps(test) + "\n" async for test in state.async_iter_tests(fields=projection))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    next_cursor, tests = await state.async_scan_tests(cursor=cursor, limit=limit, fields=projection)
+    return {"tests": tests, "next_cursor": next_cursor}
 
 @qa_router.post("/update_test/{test_id}")
 async def update_test(test_id: str, updates: Dict, state: QAStateManager = Depends(get_async_qa_state), token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))):
-    await state.async_update_test(test_id, updates)
+    try:
+        test = await state.async_update_test(test_id, updates)
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if "description" in updates:
+        ai_hint_engine.index_test(test_id, test.get("description"))
     return {"status": "updated"}
 
 @qa_router.post("/batch_update_tests")
@@ -64,5 +106,6 @@ async def batch_update_tests(batch: List[Dict], state: QAStateManager = Depends(
 
 @qa_router.post("/ai_hint")
 async def ai_hint_endpoint(payload: Dict, token=Depends(validate_jwt), rl=Depends(RateLimiter(times=10, seconds=60))):
-    # TODO: Implement AI/semantic hint logic
-    return {"hint": "AI/semantic endpoint placeholder"}
+    # Related tests plus cross-agent matches (PM/DEV/TA) from the shared semantic index
+    description = payload.get("description") or payload.get("objective") or ""
+    return {"hint": await ai_hint_engine.suggest_test_fields(description)}
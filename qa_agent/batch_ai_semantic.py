@@ -0,0 +1,26 @@
+# QA Agent: AI/semantic hints over the cross-agent semantic index (semantic_index.py)
+from typing import Optional
+from semantic_index import semantic_index, related_ids
+
+# Other agents' records suggested alongside related QA tests
+RELATED_SOURCES = ("pm", "dev", "ta")
+
+class QAAIHintEngine:
+    def __init__(self, redis_conn, semantic=None):
+        # Test descriptions are the "qa" source of the process-wide index, kept current by index_test()
+        # and by the cache invalidations of tests written by another process
+        self.semantic = semantic or semantic_index(redis_conn)
+
+    async def suggest_test_fields(self, description: str) -> dict:
+        # One query finds the closest tests and the related PM tasks, DEV tasks and TA decisions
+        [matches] = await self.semantic.search([description], ("qa",) + RELATED_SOURCES)
+        return {
+            "dependencies": related_ids(matches, ["qa"])["qa"],
+            "related": related_ids(matches, RELATED_SOURCES)
+        }
+
+    def index_test(self, test_id: str, description: Optional[str], created: bool = False) -> None:
+        """
+        Add or re-index one test after it was written. `created` marks a test new to the registry.
+        """
+        self.semantic.index_record("qa", test_id, description, created=created)
@@ -1,10 +1,17 @@
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, AsyncIterator
 from pydantic import BaseModel
 import uuid
-import json
-import redis.asyncio as aioredis
-import asyncio
+from redis_scripts import VersionConflict, MERGE_OK, MERGE_MISSING, MERGE_CONFLICT
+from redis_pool import get_async_redis, get_bridge_redis
+from sync_bridge import bridge_twin, run_sync
+from record_store import record_layout
+from resilience import resilience_policy
+from similarity import similarity_service, similar_winner, text_of
+from conflict_resolution import ConflictPolicy, resolve_pairs
+
+# The rules of resolve_conflict, for batches of pairs
+CONFLICT_POLICY = ConflictPolicy(["description"])
 
 class QATestCase(BaseModel):
     id: str
@@ -20,96 +27,112 @@ class QATestCase(BaseModel):
 
 class QAStateManager:
     def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379, max_concurrent: int = 10):
-        self.redis = aioredis.from_url(f"redis://{redis_host}:{redis_port}/0", decode_responses=True)
+        self.redis = get_async_redis(f"redis://{redis_host}:{redis_port}/0")
         self.test_registry = "qa:tests"
-        self.bulkhead = asyncio.Semaphore(max_concurrent)
-        self.circuit_open = False
-        self.fail_count = 0
-        self.max_failures = 3
-        self.reset_timeout = 5  # seconds
-
-    async def _circuit_breaker(self, coro):
-        if self.circuit_open:
-            raise Exception("Redis circuit breaker is open")
-        try:
-            async with self.bulkhead:
-                result = await coro
-            self.fail_count = 0
-            return result
-        except Exception as e:
-            self.fail_count += 1
-            if self.fail_count >= self.max_failures:
-                self.circuit_open = True
-                asyncio.create_task(self._reset_circuit())
-            raise e
-
-    async def _reset_circuit(self):
-        await asyncio.sleep(self.reset_timeout)
-        self.circuit_open = False
-        self.fail_count = 0
-
-    def create_test(self, test: dict) -> str:
-        test = test.copy()
-        for k in ['created_at', 'updated_at']:
-            if k in test and hasattr(test[k], 'isoformat'):
-                test[k] = test[k].isoformat()
-        test_id = f"qatest_{uuid.uuid4().hex}"
-        self.redis.hset(self.test_registry, test_id, json.dumps(test))
-        return test_id
+        self.store = record_layout(self.test_registry, "qa:test:")
+        self.merger = self.store.merger()
+        self.similarity = similarity_service(self.test_registry)
+        # Process-wide breaker, retry budget and adaptive concurrency limit for QA Redis calls (see resilience.py);
+        # max_concurrent is the limit's starting point
+        self.resilience = resilience_policy("qa_redis", env_prefix="QA_AGENT_REDIS", fail_max=3, reset_timeout=5, initial_limit=max_concurrent)
+        self._redis_url = f"redis://{redis_host}:{redis_port}/0"
+        self._max_concurrent = max_concurrent
+        self._bridge: Optional["QAStateManager"] = None
 
     async def async_create_test(self, test: dict) -> str:
-        test = test.copy()
-        for k in ['created_at', 'updated_at']:
-            if k in test and hasattr(test[k], 'isoformat'):
-                test[k] = test[k].isoformat()
         test_id = f"qatest_{uuid.uuid4().hex}"
-        await self._circuit_breaker(self.redis.hset(self.test_registry, test_id, json.dumps(test)))
+        await self.resilience.call(lambda: self._write_test(test_id, test))
         return test_id
 
-    def get_test(self, test_id: str) -> dict:
-        raw = self.redis.hget(self.test_registry, test_id)
-        if not raw:
-            return None
-        return json.loads(raw)
-
-    async def async_get_test(self, test_id: str) -> dict:
-        raw = await self._circuit_breaker(self.redis.hget(self.test_registry, test_id))
-        if not raw:
-            return None
-        return json.loads(raw)
+    async def _write_test(self, test_id: str, test: dict) -> None:
+        pipe = self.redis.pipeline()
+        self.store.queue_write(pipe, test_id, test)
+        await pipe.execute()
+        self.store.invalidate([test_id])
 
-    def list_tests(self) -> list:
-        keys = self.redis.hkeys(self.test_registry)
-        return [json.loads(self.redis.hget(self.test_registry, k)) for k in keys]
+    async def async_get_test(self, test_id: str, fields: Optional[List[str]] = None) -> dict:
+        return await self.resilience.call(lambda: self.store.get(self.redis, test_id, fields), idempotent=True)
 
     async def async_list_tests(self) -> list:
-        keys = await self._circuit_breaker(self.redis.hkeys(self.test_registry))
-        return [json.loads(await self._circuit_breaker(self.redis.hget(self.test_registry, k))) for k in keys]
+        return [test async for test in self.async_iter_tests()]
 
-    def update_test(self, test_id: str, updates: dict) -> None:
-        test = self.get_test(test_id)
-        if not test:
-            raise ValueError("Test not found")
-        test.update(updates)
-        for k in ['created_at', 'updated_at']:
-            if k in test and hasattr(test[k], 'isoformat'):
-                test[k] = test[k].isoformat()
-        self.redis.hset(self.test_registry, test_id, json.dumps(test))
-
-    async def async_update_test(self, test_id: str, updates: dict) -> None:
-        test = await self.async_get_test(test_id)
-        if not test:
+    async def async_scan_tests(self, cursor: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> Tuple[int, list]:
+        """
+        Fetch one HSCAN page of test cases. Returns (next_cursor, tests); 0 means the scan is complete.
+        """
+        return await self.resilience.call(lambda: self.store.scan(self.redis, cursor, limit, fields), idempotent=True)
+
+    async def async_iter_tests(self, batch_size: int = 500, fields: Optional[List[str]] = None) -> AsyncIterator[dict]:
+        """
+        Yield test cases page by page without materialising the whole registry.
+        """
+        cursor = 0
+        while True:
+            cursor, tests = await self.async_scan_tests(cursor, batch_size, fields)
+            for test in tests:
+                yield test
+            if cursor == 0:
+                break
+
+    async def async_update_test(self, test_id: str, updates: dict) -> dict:
+        """
+        Merge `updates` into the stored test case server-side in one round trip. A `version` in
+        `updates` makes the update conditional (VersionConflict when stale).
+        """
+        updates = dict(updates)
+        expected_version = updates.pop("version", None)
+        [(status, test)] = await self.resilience.call(lambda: self.merger.merge(self.redis, [(test_id, updates, expected_version)]))
+        if status == MERGE_MISSING:
             raise ValueError("Test not found")
-        test.update(updates)
-        for k in ['created_at', 'updated_at']:
-            if k in test and hasattr(test[k], 'isoformat'):
-                test[k] = test[k].isoformat()
-        await self._circuit_breaker(self.redis.hset(self.test_registry, test_id, json.dumps(test)))
+        if status == MERGE_CONFLICT:
+            raise VersionConflict(test_id, test)
+        if status != MERGE_OK:
+            raise ValueError("Stored test is not a JSON object")
+        return test
 
     def resolve_conflict(self, test_a: dict, test_b: dict, alpha: float = 0.7, beta: float = 0.3) -> dict:
+        # Near-identical tests (the same thing written twice): higher priority, then recency, wins
+        score = self.similarity.similarity(text_of(test_a, ["description"]), text_of(test_b, ["description"]))
+        winner = similar_winner(test_a, test_b, score)
+        if winner is not None:
+            return winner
         time_score = alpha * (test_a.get('timestamp', 0) - test_b.get('timestamp', 0))
         priority_score = beta * (test_a.get('priority', 1) - test_b.get('priority', 1))
         return test_a if (time_score + priority_score) >= 0 else test_b
 
+    def resolve_conflicts(self, pairs: List[Tuple[dict, dict]]) -> List[dict]:
+        """
+        Resolve many test pairs with the rules of resolve_conflict in one vectorized pass (one
+        batched similarity product). Returns per pair the winner ("a"/"b"), the resolved test and the decision path.
+        """
+        return resolve_pairs(pairs, CONFLICT_POLICY, self.similarity)
+
     async def async_resolve_conflict(self, test_a: dict, test_b: dict, alpha: float = 0.7, beta: float = 0.3) -> dict:
         return self.resolve_conflict(test_a, test_b, alpha, beta)
+
+    # --- Synchronous compatibility wrappers (not for use inside async handlers) ---
+
+    def _bridged(self) -> "QAStateManager":
+        """
+        Twin of this manager for the sync wrappers, with a client and resilience policy used only on the
+        bridge loop (see sync_bridge.py).
+        """
+        if self._bridge is None:
+            self._bridge = bridge_twin(
+                self,
+                redis=get_bridge_redis(self._redis_url),
+                resilience=resilience_policy("qa_redis_sync", env_prefix="QA_AGENT_REDIS", fail_max=3, reset_timeout=5, initial_limit=self._max_concurrent),
+            )
+        return self._bridge
+
+    def create_test(self, test: dict) -> str:
+        return run_sync(self._bridged().async_create_test(test))
+
+    def get_test(self, test_id: str) -> dict:
+        return run_sync(self._bridged().async_get_test(test_id))
+
+    def list_tests(self) -> list:
+        return run_sync(self._bridged().async_list_tests())
+
+    def update_test(self, test_id: str, updates: dict) -> None:
+        run_sync(self._bridged().async_update_test(test_id, updates))
@@ -1,8 +1,9 @@
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import redis.asyncio as aioredis
+from redis_pool import get_async_redis
+from rate_limiter import start_rate_limiter, stop_rate_limiter
 
 async def setup_rate_limiter(app):
-    redis = aioredis.from_url("redis://localhost:6379/0", encoding="utf8", decode_responses=True)
-    await FastAPILimiter.init(redis)
-    app.dependency_overrides[RateLimiter] = lambda: RateLimiter(times=10, seconds=60)  # Default: 10 req/min
+    # Buckets live in process memory; this only starts their batched reconciliation with Redis (rate_limiter.py)
+    start_rate_limiter(get_async_redis("redis://localhost:6379/0"))
+
+async def shutdown_rate_limiter(app):
+    await stop_rate_limiter()
@@ -2,13 +2,16 @@ import pytest
 import pytest_asyncio
 import httpx
 from qa_agent.__main__ import app
+from qa_agent.security import auth_service
 from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock
+from redis_scripts import MERGE_CONFLICT, MERGE_MISSING, VersionConflict
 
 client = TestClient(app)
 
-# Utility for test JWT (must match logic in qa_agent/security.py)
+# Utility for test JWT, signed with the QA agent's current key (see auth_service.py)
 def get_jwt():
-    return "valid_jwt_testtoken"
+    return auth_service.issue({"sub": "qa-test"})
 
 @pytest_asyncio.fixture(scope="module")
 async def async_client():
@@ -76,3 +79,25 @@ def test_conflict_resolution():
     response = client.post("/qa/resolve_conflict", json={"test_a": test_a, "test_b": test_b}, headers={"Authorization": f"Bearer {get_jwt()}"})
     assert response.status_code == 200
     assert response.json()["resolved_test"]["id"] == "qatest_a"
+
+def test_sync_wrappers_round_trip_through_the_bridge():
+    from qa_agent.api import qa_state
+    test_id = qa_state.create_test({"description": "Sync wrapper round trip", "status": "pending", "priority": 1})
+    assert qa_state.get_test(test_id)["description"] == "Sync wrapper round trip"
+    qa_state.update_test(test_id, {"status": "passed"})
+    assert qa_state.get_test(test_id)["status"] == "passed"
+
+@pytest.mark.asyncio
+async def test_update_test_merges_server_side(monkeypatch):
+    from qa_agent.api import qa_state
+    merger = AsyncMock()
+    monkeypatch.setattr(qa_state, "merger", merger)
+    merger.merge.return_value = [("ok", {"id": "qatest_1", "status": "passed", "version": 3})]
+    assert (await qa_state.async_update_test("qatest_1", {"status": "passed", "version": 2}))["version"] == 3
+    merger.merge.assert_awaited_once_with(qa_state.redis, [("qatest_1", {"status": "passed"}, 2)])
+    merger.merge.return_value = [(MERGE_MISSING, None)]
+    with pytest.raises(ValueError):
+        await qa_state.async_update_test("qatest_missing", {"status": "passed"})
+    merger.merge.return_value = [(MERGE_CONFLICT, {"id": "qatest_1", "version": 4})]
+    with pytest.raises(VersionConflict):
+        await qa_state.async_update_test("qatest_1", {"status": "failed", "version": 3})
@@ -0,0 +1,297 @@
+"""
+Hybrid rate limiter for the agent APIs: in-process token buckets reconciled with Redis in batches
+- Every (user, route) pair has one token bucket per limit, kept in process memory: deciding whether a
+  request may run costs no Redis round trip
+- A route can carry several limits (e.g. a burst of 5 per second and a sustained 60 per minute);
+  a request must find a token in every one of them
+- A background task reconciles the buckets touched since the previous run with a shared bucket per
+  key in Redis, in one EVALSHA for all of them: it pushes the tokens this process consumed and pulls
+  back what is left globally, so all workers converge on one budget. Between runs a worker can only
+  overshoot by what it admits in one AGENT_RATE_LIMIT_SYNC_SECONDS interval
+- Without Redis (not started, or unreachable) the buckets keep working per process
+- Decisions, reconciliation latency and errors are exported to Prometheus
+
+The user is the subject of the verified bearer token, which the agents' validate_jwt keeps on the
+request (so routes list it before the limiter), or otherwise the client address. A raw Authorization
+header is never used: anyone can send a different one with each request. The route is the method and
+path template, so /task/{task_id} is one route whatever the ID.
+
+Environment:
+- AGENT_RATE_LIMIT_SYNC_SECONDS: seconds between reconciliations (default 0.5)
+- AGENT_RATE_LIMIT_MAX_KEYS: buckets kept per process, least recently used dropped first (default 100000)
+- AGENT_RATE_LIMIT_ENABLED: "true" (default) or "false" to admit every request
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response
+from prometheus_client import Counter, Histogram
+from redis.exceptions import NoScriptError
+
+logger = logging.getLogger("rate_limiter")
+
+KEY_PREFIX = "ratelimit:"
+
+limiter_decisions = Counter("rate_limiter_decisions_total", "Rate limiter decisions", ["route", "decision"])
+limiter_sync_seconds = Histogram("rate_limiter_sync_seconds", "Time spent reconciling buckets with Redis")
+limiter_sync_errors = Counter("rate_limiter_sync_errors_total", "Failed reconciliations with Redis")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using default {default}")
+        return default
+
+
+# KEYS[1] = key prefix
+# ARGV    = now, n_items, (key, capacity, rate, consumed)*
+# Each shared bucket is a hash {tokens, ts}: refilled to `now`, charged `consumed` (it may go negative,
+# which delays the refill for everyone) and kept until it would be full again.
+# Returns the tokens left in each bucket, as strings, in order.
+SYNC_BUCKETS_LUA = r"""
+local prefix = KEYS[1]
+local now = tonumber(ARGV[1])
+local result = {}
+local pos = 3
+for i = 1, tonumber(ARGV[2]) do
+    local key, capacity, rate, consumed = prefix .. ARGV[pos], tonumber(ARGV[pos + 1]), tonumber(ARGV[pos + 2]), tonumber(ARGV[pos + 3])
+    pos = pos + 4
+    local stored = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens, ts = tonumber(stored[1]), tonumber(stored[2])
+    if not tokens then
+        tokens, ts = capacity, now
+    end
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - consumed
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil((capacity - tokens + 1) / rate * 1000))
+    result[i] = tostring(tokens)
+end
+return result
+"""
+
+SYNC_BUCKETS_SHA = hashlib.sha1(SYNC_BUCKETS_LUA.encode("utf-8")).hexdigest()
+
+
+class Limit:
+    """
+    `times` requests per `seconds`: a bucket of `times` tokens refilled at times/seconds per second.
+    """
+    __slots__ = ("times", "seconds", "rate")
+
+    def __init__(self, times: int, seconds: float):
+        if times <= 0 or seconds <= 0:
+            raise ValueError("A limit needs positive times and seconds")
+        self.times = times
+        self.seconds = seconds
+        self.rate = times / seconds
+
+    @property
+    def name(self) -> str:
+        return f"{self.times}/{self.seconds:g}s"
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "consumed", "touched")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+        # Tokens taken since the last reconciliation, and whether the bucket was used at all
+        self.consumed = 0
+        self.touched = False
+
+    def refill(self, limit: Limit, now: float) -> None:
+        self.tokens = min(limit.times, self.tokens + (now - self.updated) * limit.rate)
+        self.updated = now
+
+
+class HybridRateLimiter:
+    """
+    Process-wide token buckets keyed by (identity, route, limit), with optional Redis reconciliation.
+    """
+    def __init__(self, max_keys: Optional[int] = None, sync_interval: Optional[float] = None, key_prefix: str = KEY_PREFIX):
+        self.max_keys = max_keys if max_keys is not None else int(_env_float("AGENT_RATE_LIMIT_MAX_KEYS", 100000))
+        self.sync_interval = sync_interval if sync_interval is not None else _env_float("AGENT_RATE_LIMIT_SYNC_SECONDS", 0.5)
+        self.key_prefix = key_prefix
+        self.enabled = os.getenv("AGENT_RATE_LIMIT_ENABLED", "true").lower() == "true"
+        self._buckets: "OrderedDict[str, Tuple[_Bucket, Limit]]" = OrderedDict()
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _bucket(self, key: str, limit: Limit, now: float) -> _Bucket:
+        entry = self._buckets.get(key)
+        if entry is None:
+            entry = (_Bucket(limit.times, now), limit)
+            self._buckets[key] = entry
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return entry[0]
+
+    def acquire(self, identity: str, route: str, limits: Sequence[Limit], now: Optional[float] = None) -> float:
+        """
+        Take one token from every limit's bucket for (identity, route). Returns 0 when the request is
+        admitted, otherwise the seconds until the most constrained bucket has a token again (nothing is taken).
+        """
+        now = time.monotonic() if now is None else now
+        buckets = []
+        retry_after = 0.0
+        for limit in limits:
+            bucket = self._bucket(f"{route}:{identity}:{limit.name}", limit, now)
+            bucket.refill(limit, now)
+            bucket.touched = True
+            if bucket.tokens < 1:
+                retry_after = max(retry_after, (1 - bucket.tokens) / limit.rate)
+            buckets.append(bucket)
+        if retry_after:
+            return retry_after
+        for bucket in buckets:
+            bucket.tokens -= 1
+            bucket.consumed += 1
+        return 0.0
+
+    async def sync(self, conn) -> int:
+        """
+        Reconcile every bucket used since the last call with its shared bucket in Redis, in one round
+        trip. Returns the number of buckets reconciled.
+        """
+        started = time.monotonic()
+        batch: List[Tuple[_Bucket, Limit, int]] = []
+        args: List[Any] = [time.time(), 0]
+        for key, (bucket, limit) in self._buckets.items():
+            if bucket.touched:
+                batch.append((bucket, limit, bucket.consumed))
+                args.extend([key, limit.times, limit.rate, bucket.consumed])
+                bucket.touched = False
+                bucket.consumed = 0
+        if not batch:
+            return 0
+        args[1] = len(batch)
+        try:
+            try:
+                remaining = await conn.evalsha(SYNC_BUCKETS_SHA, 1, self.key_prefix, *args)
+            except NoScriptError:
+                await conn.script_load(SYNC_BUCKETS_LUA)
+                remaining = await conn.evalsha(SYNC_BUCKETS_SHA, 1, self.key_prefix, *args)
+        except Exception:
+            # Keep the consumption for the next attempt
+            for bucket, _, consumed in batch:
+                bucket.consumed += consumed
+                bucket.touched = True
+            raise
+        now = time.monotonic()
+        for (bucket, limit, _), tokens in zip(batch, remaining):
+            # The shared bucket already counts this process's tokens up to the snapshot; requests
+            # admitted while the call was in flight are still to be pushed
+            bucket.refill(limit, now)
+            bucket.tokens = min(bucket.tokens, float(tokens) - bucket.consumed)
+        limiter_sync_seconds.observe(time.monotonic() - started)
+        return len(batch)
+
+    async def run_sync(self, conn) -> None:
+        """
+        Reconcile every sync_interval seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                limiter_sync_errors.inc()
+                logger.warning(f"Rate limit reconciliation failed: {e}")
+
+    def start(self, conn) -> asyncio.Task:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self.run_sync(conn))
+        return self._sync_task
+
+    async def stop(self) -> None:
+        if self._sync_task is not None and not self._sync_task.done():
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+        self._sync_task = None
+
+
+_limiter: Optional[HybridRateLimiter] = None
+
+
+def rate_limiter() -> HybridRateLimiter:
+    """
+    The process-wide limiter shared by every route and agent router in the process.
+    """
+    global _limiter
+    if _limiter is None:
+        _limiter = HybridRateLimiter()
+    return _limiter
+
+
+def start_rate_limiter(conn) -> asyncio.Task:
+    """
+    Start reconciling the process-wide buckets with Redis over `conn`.
+    """
+    return rate_limiter().start(conn)
+
+
+async def stop_rate_limiter() -> None:
+    await rate_limiter().stop()
+
+
+def default_identifier(request: Request) -> str:
+    """
+    The `sub` of the claims verified for this request (request.state.auth_claims) or the client address.
+    Behind a proxy the address comes from the server's trusted proxy headers (uvicorn --proxy-headers),
+    never from a client-supplied X-Forwarded-For.
+    """
+    claims = getattr(request.state, "auth_claims", None)
+    if claims and claims.get("sub"):
+        return f"sub:{claims['sub']}"
+    return request.client.host if request.client else "anonymous"
+
+
+class RateLimiter:
+    """
+    FastAPI dependency admitting `times` requests per period per (user, route), plus any extra `limits`
+    (e.g. a burst limit on top of the sustained one). Rejected requests get 429 with Retry-After.
+
+    Same arguments as fastapi_limiter's RateLimiter: Depends(RateLimiter(times=10, seconds=60)).
+    """
+    def __init__(
+        self,
+        times: int = 1,
+        milliseconds: int = 0,
+        seconds: int = 0,
+        minutes: int = 0,
+        hours: int = 0,
+        limits: Sequence[Limit] = (),
+        identifier: Optional[Callable[[Request], str]] = None,
+    ):
+        period = milliseconds / 1000 + seconds + 60 * minutes + 3600 * hours
+        self.limits = ([Limit(times, period)] if period else []) + list(limits)
+        if not self.limits:
+            raise ValueError("RateLimiter needs a period or at least one limit")
+        self.identifier = identifier or default_identifier
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        limiter = rate_limiter()
+        if not limiter.enabled:
+            return
+        route = request.scope.get("route")
+        route_name = f"{request.method} {getattr(route, 'path', request.url.path)}"
+        retry_after = limiter.acquire(self.identifier(request), route_name, self.limits)
+        if retry_after:
+            limiter_decisions.labels(route_name, "limited").inc()
+            raise HTTPException(status_code=429, detail="Too Many Requests", headers={"Retry-After": str(math.ceil(retry_after))})
+        limiter_decisions.labels(route_name, "allowed").inc()
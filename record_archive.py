@@ -0,0 +1,197 @@
+"""
+Cold tier for agent records that reached a terminal state
+- Archived records live in a separate hash (`<registry>:archive`), zstd-compressed through the
+  record codec, so the live registry (and everything that scans it) only holds live work
+- `<registry>:archive:at` is a sorted set of archive times, for retention and inspection
+- A move is a compare-and-set per record: under the blob layout one script call per batch archives
+  each record and removes it from the live registry and its indexes only if its stored bytes are
+  still the ones that were read and checked, so a concurrent write skips just that record (left for
+  the next run) instead of the batch. The hash layout WATCHes the candidates' own keys and moves the
+  batch in one MULTI/EXEC
+
+Environment:
+- AGENT_ARCHIVE_COMPRESS_THRESHOLD: compress archived records larger than this many bytes (default 64)
+"""
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from prometheus_client import Counter
+from redis.exceptions import NoScriptError, WatchError
+
+from record_codec import RecordCodec, decode_record, to_bytes
+from record_store import project
+
+logger = logging.getLogger("record_archive")
+
+archived_records = Counter("record_archive_moved_total", "Records moved to the cold tier", ["registry"])
+archive_conflicts = Counter("record_archive_conflicts_total", "Records (hash layout: batches) left live because they changed while being archived", ["registry"])
+archive_reads = Counter("record_archive_reads_total", "Reads answered from the cold tier", ["registry"])
+
+
+# KEYS[1] = live registry hash, KEYS[2] = archive hash, KEYS[3] = archive times
+# ARGV    = now, n_items, (id, expected_raw, archived_raw, n_ops, (command, key)*)*
+# Each item moves only if the live record still holds expected_raw; its index removals
+# (SREM/ZREM of the ID) happen with it. Returns the IDs moved.
+ARCHIVE_RECORDS_LUA = r"""
+local moved = {}
+local pos = 3
+for _ = 1, tonumber(ARGV[2]) do
+    local id, expected, archived = ARGV[pos], ARGV[pos + 1], ARGV[pos + 2]
+    local n_ops = tonumber(ARGV[pos + 3])
+    if redis.call('HGET', KEYS[1], id) == expected then
+        redis.call('HSET', KEYS[2], id, archived)
+        redis.call('ZADD', KEYS[3], ARGV[1], id)
+        redis.call('HDEL', KEYS[1], id)
+        for i = 0, n_ops - 1 do
+            redis.call(ARGV[pos + 4 + 2 * i], ARGV[pos + 5 + 2 * i], id)
+        end
+        moved[#moved + 1] = id
+    end
+    pos = pos + 4 + 2 * n_ops
+end
+return moved
+"""
+
+ARCHIVE_RECORDS_SHA = hashlib.sha1(ARCHIVE_RECORDS_LUA.encode("utf-8")).hexdigest()
+
+
+class _IndexRemovals:
+    """
+    Stands in for a pipeline to collect the index removals a `queue_unindex` callback queues, as
+    (command, key) pairs for the archive script. The member removed is always the record ID.
+    """
+    def __init__(self):
+        self.ops: List[str] = []
+
+    def srem(self, key: str, member: str) -> None:
+        self.ops.extend(["SREM", key])
+
+    def zrem(self, key: str, member: str) -> None:
+        self.ops.extend(["ZREM", key])
+
+
+def record_age(record: dict, now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds since the record was last updated (`updated_at`, else `timestamp`), or None if unknown.
+    """
+    now = now if now is not None else time.time()
+    updated_at = record.get("updated_at")
+    if isinstance(updated_at, str):
+        try:
+            return now - datetime.fromisoformat(updated_at).timestamp()
+        except ValueError:
+            pass
+    if isinstance(record.get("timestamp"), (int, float)):
+        return now - record["timestamp"]
+    return None
+
+
+class RecordArchive:
+    """
+    Compressed cold store for one registry.
+    """
+    def __init__(self, registry: str, codec: Optional[RecordCodec] = None):
+        self.registry = registry
+        self.key = f"{registry}:archive"
+        self.times_key = f"{registry}:archive:at"
+        if codec is None:
+            try:
+                threshold = int(os.getenv("AGENT_ARCHIVE_COMPRESS_THRESHOLD", 64))
+            except ValueError:
+                logger.warning("Invalid AGENT_ARCHIVE_COMPRESS_THRESHOLD, using default 64")
+                threshold = 64
+            codec = RecordCodec(compress_threshold=threshold)
+        self.codec = codec
+
+    def queue_put(self, pipe, record_id: str, record: dict) -> None:
+        pipe.hset(self.key, record_id, self.codec.encode(record))
+        pipe.zadd(self.times_key, {record_id: time.time()})
+
+    def queue_delete(self, pipe, record_id: str) -> None:
+        pipe.hdel(self.key, record_id)
+        pipe.zrem(self.times_key, record_id)
+
+    async def count(self, conn) -> int:
+        return await conn.hlen(self.key)
+
+    async def get(self, conn, record_id: str, fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        raw = await conn.hget(self.key, record_id)
+        if not raw:
+            return None
+        archive_reads.labels(self.registry).inc()
+        return project(self.codec.decode(raw), fields)
+
+    async def move(
+        self,
+        conn,
+        store,
+        candidate_ids: Iterable[str],
+        is_cold: Callable[[dict], bool],
+        queue_unindex: Optional[Callable[[Any, str, dict], None]] = None,
+    ) -> List[str]:
+        """
+        Move the candidates that are still cold from the live `store` (a record_store layout) into the
+        archive. Returns the IDs moved; records written concurrently stay live.
+        """
+        candidate_ids = list(candidate_ids)
+        if not candidate_ids:
+            return []
+        if store.name == "blob":
+            return await self._move_blobs(conn, store, candidate_ids, is_cold, queue_unindex)
+        async with conn.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(*store.watch_keys(candidate_ids))
+                records = await store.get_mapping(conn, candidate_ids)
+                cold = {record_id: record for record_id, record in records.items() if is_cold(record)}
+                if not cold:
+                    await pipe.reset()
+                    return []
+                pipe.multi()
+                for record_id, record in cold.items():
+                    self.queue_put(pipe, record_id, record)
+                    store.queue_delete(pipe, record_id)
+                    if queue_unindex is not None:
+                        queue_unindex(pipe, record_id, record)
+                await pipe.execute()
+                store.invalidate(list(cold))
+            except WatchError:
+                archive_conflicts.labels(self.registry).inc()
+                logger.info(f"[{self.registry}] archive batch of {len(candidate_ids)} changed concurrently, retrying next run")
+                return []
+        archived_records.labels(self.registry).inc(len(cold))
+        return list(cold)
+
+    async def _move_blobs(self, conn, store, candidate_ids: List[str], is_cold, queue_unindex) -> List[str]:
+        raw_records = await conn.hmget(store.registry, candidate_ids)
+        args: List[Any] = [time.time(), 0]
+        cold: Dict[str, dict] = {}
+        for record_id, raw in zip(candidate_ids, raw_records):
+            record = decode_record(raw) if raw else None
+            if record is None or not is_cold(record):
+                continue
+            removals = _IndexRemovals()
+            if queue_unindex is not None:
+                queue_unindex(removals, record_id, record)
+            args.extend([record_id, to_bytes(raw), self.codec.encode(record), len(removals.ops) // 2, *removals.ops])
+            cold[record_id] = record
+        if not cold:
+            return []
+        args[1] = len(cold)
+        keys = [store.registry, self.key, self.times_key]
+        try:
+            moved = await conn.evalsha(ARCHIVE_RECORDS_SHA, len(keys), *keys, *args)
+        except NoScriptError:
+            await conn.script_load(ARCHIVE_RECORDS_LUA)
+            moved = await conn.evalsha(ARCHIVE_RECORDS_SHA, len(keys), *keys, *args)
+        moved = [record_id.decode() if isinstance(record_id, bytes) else record_id for record_id in moved]
+        if len(moved) < len(cold):
+            archive_conflicts.labels(self.registry).inc(len(cold) - len(moved))
+            logger.info(f"[{self.registry}] {len(cold) - len(moved)} of {len(cold)} records changed while being archived, retrying next run")
+        if moved and store.cache is not None:
+            await store.cache.publish_invalidation(conn, moved)
+        archived_records.labels(self.registry).inc(len(moved))
+        return moved
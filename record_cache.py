@@ -0,0 +1,276 @@
+"""
+In-process read-through cache for agent records, kept coherent across processes over Redis pub/sub
+- One LRU + TTL cache per registry (dev:tasks, pm:tasks, ta:decisions, qa:tests, ...)
+- Entries may be partial: a `?fields=` read caches just those fields, a full read caches the record
+- Every write path invalidates the local entry when it queues the write and again once the write
+  executed, and publishes the record IDs on INVALIDATION_CHANNEL; each process runs one listener
+  that drops the published IDs
+- A generation counter keeps a read that raced with an invalidation from re-filling the cache
+  with the value it fetched before the write
+- Other in-process state derived from the registries (the semantic index) can follow the same
+  messages with on_invalidation instead of polling Redis
+- Hit/miss/eviction/invalidation counters and entry gauges exported to Prometheus
+- Caches are thread-safe: the sync bridge (sync_bridge.py) reads and writes them from its own thread
+
+Environment:
+- RECORD_CACHE_ENABLED: "true" (default) or "false"
+- RECORD_CACHE_MAX_ENTRIES: default entries per registry (default 10000)
+- RECORD_CACHE_LIMITS: per-registry overrides, e.g. "dev:tasks=5000,qa:tests=1000"
+- RECORD_CACHE_TTL: seconds an entry may be served without revalidation (default 30)
+
+The TTL bounds staleness if an invalidation message is lost (listener reconnecting, writer in
+another process crashing between its write and its publish); when the listener (re)subscribes,
+every cache is cleared.
+"""
+import asyncio
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("record_cache")
+
+INVALIDATION_CHANNEL = "agent:cache:invalidate"
+
+cache_requests = Counter("record_cache_requests_total", "Record cache lookups", ["registry", "result"])
+cache_evictions = Counter("record_cache_evictions_total", "Record cache evictions", ["registry", "reason"])
+cache_invalidations = Counter("record_cache_invalidations_total", "Record cache invalidations", ["registry", "source"])
+cache_entries = Gauge("record_cache_entries", "Entries in the record cache", ["registry"])
+
+
+def _env_limits() -> Dict[str, int]:
+    limits = {}
+    for item in os.getenv("RECORD_CACHE_LIMITS", "").split(","):
+        registry, _, value = item.strip().rpartition("=")
+        if registry and value.isdigit():
+            limits[registry] = int(value)
+    return limits
+
+
+class RecordCache:
+    """
+    LRU + TTL cache of (possibly partial) records for one registry.
+    """
+    def __init__(self, registry: str, max_entries: int = 10000, ttl: float = 30.0):
+        self.registry = registry
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # record_id -> (fields, complete, expires_at)
+        self._entries: "OrderedDict[str, Tuple[dict, bool, float]]" = OrderedDict()
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, record_id: str, fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        """
+        Cached copy of the record (or of the requested fields), or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(record_id)
+            if entry is not None:
+                record, complete, expires_at = entry
+                if expires_at <= time.monotonic():
+                    del self._entries[record_id]
+                    cache_evictions.labels(self.registry, "ttl").inc()
+                    cache_entries.labels(self.registry).set(len(self._entries))
+                elif fields and all(f in record for f in fields):
+                    self._entries.move_to_end(record_id)
+                    cache_requests.labels(self.registry, "hit").inc()
+                    return copy.deepcopy({f: record[f] for f in fields})
+                elif complete:
+                    self._entries.move_to_end(record_id)
+                    cache_requests.labels(self.registry, "hit").inc()
+                    record = {f: record[f] for f in fields if f in record} if fields else record
+                    return copy.deepcopy(record)
+        cache_requests.labels(self.registry, "miss").inc()
+        return None
+
+    def put(self, record_id: str, record: dict, generation: int, fields: Optional[Sequence[str]] = None) -> None:
+        """
+        Store a record (or the `fields` read of it) fetched when the cache was at `generation`.
+        Dropped if anything was invalidated since, as the fetched value may predate that write.
+        """
+        if self.max_entries <= 0:
+            return
+        complete = not fields
+        record = copy.deepcopy(record)
+        with self._lock:
+            if generation != self.generation:
+                return
+            entry = self._entries.get(record_id)
+            if entry is not None and not complete:
+                cached, cached_complete, _ = entry
+                record = {**cached, **record}
+                complete = cached_complete
+            self._entries[record_id] = (record, complete, time.monotonic() + self.ttl)
+            self._entries.move_to_end(record_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                cache_evictions.labels(self.registry, "size").inc()
+            cache_entries.labels(self.registry).set(len(self._entries))
+
+    def invalidate(self, record_ids: Iterable[str], source: str = "local") -> None:
+        with self._lock:
+            self.generation += 1
+            for record_id in record_ids:
+                if self._entries.pop(record_id, None) is not None:
+                    cache_invalidations.labels(self.registry, source).inc()
+            cache_entries.labels(self.registry).set(len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            cache_entries.labels(self.registry).set(0)
+
+    def message(self, record_ids: Iterable[str]) -> str:
+        return json.dumps({"registry": self.registry, "ids": list(record_ids)})
+
+    def queue_invalidation(self, pipe, record_ids: Sequence[str]) -> None:
+        """
+        Invalidate locally and queue the cross-process invalidation on the write's pipeline.
+        A read between this call and the pipeline's execution can re-fill the entry with the old
+        value, so the caller invalidates again after executing it.
+        """
+        self.invalidate(record_ids)
+        pipe.publish(INVALIDATION_CHANNEL, self.message(record_ids))
+
+    async def publish_invalidation(self, conn, record_ids: Sequence[str]) -> None:
+        """
+        Invalidate locally and tell the other processes (for writes that are not pipelined, e.g. scripts).
+        """
+        self.invalidate(record_ids)
+        await conn.publish(INVALIDATION_CHANNEL, self.message(record_ids))
+
+
+_caches: Dict[str, RecordCache] = {}
+
+
+def cache_for(registry: str) -> Optional[RecordCache]:
+    """
+    Process-wide cache for a registry, sized from the environment. None when caching is disabled.
+    """
+    if os.getenv("RECORD_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    cache = _caches.get(registry)
+    if cache is None:
+        try:
+            default = int(os.getenv("RECORD_CACHE_MAX_ENTRIES", 10000))
+            ttl = float(os.getenv("RECORD_CACHE_TTL", 30))
+        except ValueError:
+            logger.warning("Invalid RECORD_CACHE_MAX_ENTRIES/RECORD_CACHE_TTL, using defaults")
+            default, ttl = 10000, 30.0
+        cache = _caches[registry] = RecordCache(registry, _env_limits().get(registry, default), ttl)
+    return cache
+
+
+_handlers: List[Callable[[Optional[str], Optional[List[str]]], None]] = []
+_subscribed = False
+
+
+def on_invalidation(handler: Callable[[Optional[str], Optional[List[str]]], None]) -> None:
+    """
+    Call handler(registry, ids) for every invalidation this process receives (its own writes
+    included), and handler(None, None) whenever messages may have been missed: when the listener
+    (re)subscribes or loses its subscription.
+    """
+    _handlers.append(handler)
+
+
+def invalidations_live() -> bool:
+    """
+    Whether the listener is subscribed, i.e. on_invalidation handlers currently see every write.
+    """
+    return _subscribed
+
+
+def _notify(registry: Optional[str], ids: Optional[List[str]]) -> None:
+    for handler in _handlers:
+        try:
+            handler(registry, ids)
+        except Exception:
+            logger.exception("Cache invalidation handler failed")
+
+
+def _set_subscribed(subscribed: bool) -> None:
+    global _subscribed
+    _subscribed = subscribed
+    for cache in _caches.values():
+        cache.clear()
+    _notify(None, None)
+
+
+def apply_invalidation(message: str) -> None:
+    try:
+        payload = json.loads(message)
+        cache = _caches.get(payload["registry"])
+        ids = payload["ids"]
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f"Ignoring malformed cache invalidation: {message!r}")
+        return
+    if cache is not None:
+        cache.invalidate(ids, source="remote")
+    _notify(payload["registry"], ids)
+
+
+async def listen_for_invalidations(conn, retry_seconds: float = 1.0) -> None:
+    """
+    Apply invalidations published by any process until cancelled. Caches are cleared on every
+    (re)subscribe since messages sent while disconnected are lost.
+    """
+    while True:
+        pubsub = conn.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            _set_subscribed(True)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    apply_invalidation(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener lost its subscription ({e}), retrying in {retry_seconds}s")
+            _set_subscribed(False)
+            await asyncio.sleep(retry_seconds)
+        finally:
+            if _subscribed:
+                _set_subscribed(False)
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+
+_listener: Optional[asyncio.Task] = None
+
+
+def start_invalidation_listener(conn) -> asyncio.Task:
+    """
+    Start this process's invalidation listener (once) on the running event loop.
+    """
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(listen_for_invalidations(conn))
+    return _listener
+
+
+async def stop_invalidation_listener() -> None:
+    """
+    Cancel the listener (application shutdown, before the pools are closed).
+    """
+    global _listener
+    if _listener is not None and not _listener.done():
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+    _listener = None
@@ -0,0 +1,162 @@
+"""
+Compact codec for agent records stored in Redis
+- One format-version prefix byte per stored value
+- Fast JSON encoding (orjson when installed) or msgpack, selected by environment
+- zstd compression for large records (big `context`/`rationale` payloads) above a threshold
+- Transparent decoding of legacy plain-JSON records written before the codec existed
+
+Environment:
+- AGENT_RECORD_FORMAT: "json" (default) or "msgpack"
+- AGENT_RECORD_COMPRESS_THRESHOLD: encoded size in bytes above which records are zstd-compressed (default 4096, 0 disables)
+- AGENT_RECORD_ZSTD_LEVEL: zstd compression level (default 3)
+
+JSON is the default because the server-side merge script in redis_scripts.py can patch
+prefixed JSON records in place; msgpack and compressed records are merged client-side.
+Redis clients reading these values should be created with encoding_errors="surrogateescape"
+so binary payloads survive decode_responses=True (see `to_bytes`).
+"""
+import json
+import logging
+import os
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional compression
+    zstandard = None
+
+logger = logging.getLogger("record_codec")
+
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FORMAT_ZSTD = 0x03
+
+REDIS_ENCODING_ERRORS = "surrogateescape"
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps_json(value: Any) -> bytes:
+    """
+    Serialize a value to JSON bytes, datetimes as ISO 8601.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_json_default).encode("utf-8")
+
+
+def loads_json(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_bytes(raw: Union[bytes, str]) -> bytes:
+    """
+    Recover the exact stored bytes from a value read by a decode_responses=True client.
+    """
+    if isinstance(raw, str):
+        return raw.encode("utf-8", REDIS_ENCODING_ERRORS)
+    return raw
+
+
+class RecordCodec:
+    def __init__(self, fmt: Optional[str] = None, compress_threshold: Optional[int] = None, zstd_level: Optional[int] = None):
+        fmt = (fmt or os.getenv("AGENT_RECORD_FORMAT", "json")).lower()
+        if fmt == "msgpack" and msgpack is None:
+            logger.warning("AGENT_RECORD_FORMAT=msgpack but msgpack is not installed, using json")
+            fmt = "json"
+        if fmt not in ("json", "msgpack"):
+            logger.warning(f"Unknown AGENT_RECORD_FORMAT={fmt}, using json")
+            fmt = "json"
+        self.format = fmt
+        if compress_threshold is None:
+            try:
+                compress_threshold = int(os.getenv("AGENT_RECORD_COMPRESS_THRESHOLD", 4096))
+            except ValueError:
+                logger.warning("Invalid AGENT_RECORD_COMPRESS_THRESHOLD, using default 4096")
+                compress_threshold = 4096
+        if compress_threshold and zstandard is None:
+            compress_threshold = 0
+        self.compress_threshold = max(0, compress_threshold)
+        self.zstd_level = zstd_level if zstd_level is not None else int(os.getenv("AGENT_RECORD_ZSTD_LEVEL", 3))
+        self._compressor = zstandard.ZstdCompressor(level=self.zstd_level) if self.compress_threshold else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def encode(self, record: dict) -> bytes:
+        """
+        Encode a record into its stored form: prefix byte + body, compressed when large.
+        """
+        if self.format == "msgpack":
+            payload = bytes([FORMAT_MSGPACK]) + msgpack.packb(record, default=_json_default, use_bin_type=True)
+        else:
+            payload = bytes([FORMAT_JSON]) + dumps_json(record)
+        if self.compress_threshold and len(payload) > self.compress_threshold:
+            return bytes([FORMAT_ZSTD]) + self._compressor.compress(payload)
+        return payload
+
+    def decode(self, raw: Union[bytes, str, None]) -> Optional[dict]:
+        """
+        Decode a stored value of any known format, including legacy plain JSON.
+        """
+        if raw is None:
+            return None
+        data = to_bytes(raw)
+        if not data:
+            return None
+        tag = data[0]
+        if tag == FORMAT_JSON:
+            return loads_json(data[1:])
+        if tag == FORMAT_MSGPACK:
+            if msgpack is None:
+                raise RuntimeError("Record is msgpack-encoded but msgpack is not installed")
+            return msgpack.unpackb(data[1:], raw=False)
+        if tag == FORMAT_ZSTD:
+            if self._decompressor is None:
+                raise RuntimeError("Record is zstd-compressed but zstandard is not installed")
+            return self.decode(self._decompressor.decompress(data[1:]))
+        # Legacy records are plain JSON text
+        return loads_json(data)
+
+
+def encode_fields(record: dict) -> dict:
+    """
+    Encode a record as a field -> JSON value mapping, for layouts that store one Redis hash per record.
+    """
+    return {field: dumps_json(value) for field, value in record.items()}
+
+
+def decode_fields(mapping: Union[dict, list]) -> dict:
+    """
+    Decode a field -> JSON value mapping (or a flat [field, value, ...] reply) back into a record.
+    Fields whose value is None (absent in an HMGET reply) are left out.
+    """
+    if isinstance(mapping, list):
+        mapping = dict(zip(mapping[::2], mapping[1::2]))
+    return {to_bytes(field).decode("utf-8"): loads_json(value) for field, value in mapping.items() if value is not None}
+
+
+# Process-wide codec configured from the environment
+default_codec = RecordCodec()
+
+
+def encode_record(record: dict) -> bytes:
+    return default_codec.encode(record)
+
+
+def decode_record(raw: Union[bytes, str, None]) -> Optional[dict]:
+    return default_codec.decode(raw)
@@ -0,0 +1,267 @@
+"""
+Storage layouts for agent records in Redis
+- "blob" (default): one registry hash per agent, one encoded record per hash field (see record_codec.py)
+- "hash": one Redis hash per record at `<key_prefix><id>` with one JSON value per record field,
+  plus an ID set (`<registry>:ids`) for listing
+
+The hash layout lets `?fields=` projections run as HMGET of just the requested fields, so polling
+a task's status moves a few bytes instead of the whole record (context included). The blob layout
+answers the same projections by decoding the full record and dropping the other fields.
+
+Both layouts read through the registry's record cache (record_cache.py) when one is given, and
+invalidate it from their write and delete paths; callers invalidate again (`invalidate`) after
+executing the pipeline the writes were queued on.
+
+Environment:
+- AGENT_RECORD_LAYOUT: "blob" (default) or "hash"
+
+Switching an existing deployment to the hash layout needs a one-off `FieldHashLayout.migrate_from_blob()`.
+"""
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from record_cache import RecordCache, cache_for
+from record_codec import decode_fields, decode_record, encode_fields, encode_record
+from redis_scripts import RecordMerger
+
+logger = logging.getLogger("record_store")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated `?fields=` query parameter. Returns None when no projection was requested.
+    """
+    if not fields:
+        return None
+    parsed = [f.strip() for f in fields.split(",") if f.strip()]
+    return parsed or None
+
+
+def project(record: Optional[dict], fields: Optional[Sequence[str]]) -> Optional[dict]:
+    if record is None or not fields:
+        return record
+    return {f: record[f] for f in fields if f in record}
+
+
+async def _read_through(cache: Optional[RecordCache], record_id: str, fields: Optional[Sequence[str]], load) -> Optional[dict]:
+    """
+    Serve a read from the cache, or run `load(fields)` and cache what it returns.
+    """
+    if cache is None:
+        return await load(fields)
+    record = cache.get(record_id, fields)
+    if record is not None:
+        return record
+    generation = cache.generation
+    record = await load(fields)
+    if record is not None:
+        cache.put(record_id, record, generation, fields)
+    return record
+
+
+class BlobLayout:
+    """
+    One registry hash, one encoded record per field.
+    """
+    name = "blob"
+
+    def __init__(self, registry: str, cache: Optional[RecordCache] = None):
+        self.registry = registry
+        self.cache = cache
+
+    def merger(self, index_specs=()) -> RecordMerger:
+        return RecordMerger(self.registry, index_specs=index_specs, cache=self.cache)
+
+    def watch_keys(self, record_ids: Sequence[str]) -> List[str]:
+        return [self.registry]
+
+    def queue_write(self, pipe, record_id: str, record: dict) -> None:
+        pipe.hset(self.registry, record_id, encode_record(record))
+        if self.cache is not None:
+            self.cache.queue_invalidation(pipe, [record_id])
+
+    def queue_delete(self, pipe, record_id: str) -> None:
+        pipe.hdel(self.registry, record_id)
+        if self.cache is not None:
+            self.cache.queue_invalidation(pipe, [record_id])
+
+    def invalidate(self, record_ids: Sequence[str]) -> None:
+        """
+        Drop the records from the local cache once the pipeline holding their queued writes has
+        executed (see RecordCache.queue_invalidation).
+        """
+        if self.cache is not None:
+            self.cache.invalidate(record_ids)
+
+    async def count(self, conn) -> int:
+        return await conn.hlen(self.registry)
+
+    async def get(self, conn, record_id: str, fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        async def load(_):
+            # The whole record is decoded either way, so cache all of it
+            raw = await conn.hget(self.registry, record_id)
+            return decode_record(raw) if raw else None
+        return project(await _read_through(self.cache, record_id, None, load), fields)
+
+    async def get_many(self, conn, record_ids: Sequence[str], fields: Optional[Sequence[str]] = None) -> List[dict]:
+        if not record_ids:
+            return []
+        raw_records = await conn.hmget(self.registry, record_ids)
+        return [project(decode_record(raw), fields) for raw in raw_records if raw]
+
+    async def get_mapping(self, conn, record_ids: Sequence[str], fields: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+        """
+        Records by ID in one round trip; missing IDs are left out.
+        """
+        if not record_ids:
+            return {}
+        raw_records = await conn.hmget(self.registry, record_ids)
+        return {record_id: project(decode_record(raw), fields) for record_id, raw in zip(record_ids, raw_records) if raw}
+
+    async def scan(self, conn, cursor: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> Tuple[int, List[dict]]:
+        next_cursor, page = await conn.hscan(self.registry, cursor=cursor, count=limit)
+        return next_cursor, [project(decode_record(raw), fields) for raw in page.values()]
+
+    async def iter_items(self, conn, fields: Optional[Sequence[str]] = None, batch_size: int = 500) -> AsyncIterator[Tuple[str, dict]]:
+        async for record_id, raw in conn.hscan_iter(self.registry, count=batch_size):
+            yield record_id, project(decode_record(raw), fields)
+
+
+class FieldHashLayout:
+    """
+    One Redis hash per record plus an ID set for listing.
+    """
+    name = "hash"
+
+    def __init__(self, registry: str, key_prefix: str, cache: Optional[RecordCache] = None):
+        self.registry = registry
+        self.key_prefix = key_prefix
+        self.ids_key = f"{registry}:ids"
+        self.cache = cache
+
+    def key(self, record_id: str) -> str:
+        return f"{self.key_prefix}{record_id}"
+
+    def merger(self, index_specs=()) -> RecordMerger:
+        return RecordMerger(self.registry, index_specs=index_specs, key_prefix=self.key_prefix, cache=self.cache)
+
+    def watch_keys(self, record_ids: Sequence[str]) -> List[str]:
+        return [self.key(record_id) for record_id in record_ids]
+
+    def queue_write(self, pipe, record_id: str, record: dict) -> None:
+        key = self.key(record_id)
+        pipe.delete(key)
+        if record:
+            pipe.hset(key, mapping=encode_fields(record))
+        pipe.sadd(self.ids_key, record_id)
+        if self.cache is not None:
+            self.cache.queue_invalidation(pipe, [record_id])
+
+    def queue_delete(self, pipe, record_id: str) -> None:
+        pipe.delete(self.key(record_id))
+        pipe.srem(self.ids_key, record_id)
+        if self.cache is not None:
+            self.cache.queue_invalidation(pipe, [record_id])
+
+    def invalidate(self, record_ids: Sequence[str]) -> None:
+        """
+        Drop the records from the local cache once the pipeline holding their queued writes has
+        executed (see RecordCache.queue_invalidation).
+        """
+        if self.cache is not None:
+            self.cache.invalidate(record_ids)
+
+    def _queue_read(self, pipe, record_id: str, fields: Optional[Sequence[str]]) -> None:
+        key = self.key(record_id)
+        if fields:
+            # EXISTS tells a missing record apart from a record lacking the requested fields
+            pipe.exists(key)
+            pipe.hmget(key, list(fields))
+        else:
+            pipe.hgetall(key)
+
+    def _decode_reads(self, replies: List[Any], fields: Optional[Sequence[str]]) -> List[Optional[dict]]:
+        if not fields:
+            return [decode_fields(reply) if reply else None for reply in replies]
+        records = []
+        for exists, values in zip(replies[::2], replies[1::2]):
+            records.append(decode_fields(dict(zip(fields, values))) if exists else None)
+        return records
+
+    async def count(self, conn) -> int:
+        return await conn.scard(self.ids_key)
+
+    async def get(self, conn, record_id: str, fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        async def load(fields):
+            [record] = await self._read(conn, [record_id], fields)
+            return record
+        return await _read_through(self.cache, record_id, fields, load)
+
+    async def _read(self, conn, record_ids: Sequence[str], fields: Optional[Sequence[str]]) -> List[Optional[dict]]:
+        pipe = conn.pipeline(transaction=False)
+        for record_id in record_ids:
+            self._queue_read(pipe, record_id, fields)
+        return self._decode_reads(await pipe.execute(), fields)
+
+    async def get_many(self, conn, record_ids: Sequence[str], fields: Optional[Sequence[str]] = None) -> List[dict]:
+        if not record_ids:
+            return []
+        return [record for record in await self._read(conn, record_ids, fields) if record is not None]
+
+    async def get_mapping(self, conn, record_ids: Sequence[str], fields: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+        """
+        Records by ID in one pipelined round trip; missing IDs are left out.
+        """
+        if not record_ids:
+            return {}
+        records = await self._read(conn, record_ids, fields)
+        return {record_id: record for record_id, record in zip(record_ids, records) if record is not None}
+
+    async def scan(self, conn, cursor: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> Tuple[int, List[dict]]:
+        next_cursor, record_ids = await conn.sscan(self.ids_key, cursor=cursor, count=limit)
+        return next_cursor, await self.get_many(conn, record_ids, fields)
+
+    async def iter_items(self, conn, fields: Optional[Sequence[str]] = None, batch_size: int = 500) -> AsyncIterator[Tuple[str, dict]]:
+        cursor = 0
+        while True:
+            cursor, record_ids = await conn.sscan(self.ids_key, cursor=cursor, count=batch_size)
+            if record_ids:
+                for record_id, record in zip(record_ids, await self._read(conn, record_ids, fields)):
+                    if record is not None:
+                        yield record_id, record
+            if cursor == 0:
+                break
+
+    async def migrate_from_blob(self, conn, batch_size: int = 500) -> int:
+        """
+        Copy records from the blob registry into per-record hashes. The registry hash is left in place.
+        Returns the number of records copied.
+        """
+        count = 0
+        pipe, batch = conn.pipeline(), []
+        async for record_id, raw in conn.hscan_iter(self.registry, count=batch_size):
+            self.queue_write(pipe, record_id, decode_record(raw))
+            batch.append(record_id)
+            count += 1
+            if count % batch_size == 0:
+                await pipe.execute()
+                self.invalidate(batch)
+                pipe, batch = conn.pipeline(), []
+        await pipe.execute()
+        self.invalidate(batch)
+        return count
+
+
+def record_layout(registry: str, key_prefix: str, layout: Optional[str] = None):
+    """
+    Build the storage layout for an agent registry, selected by AGENT_RECORD_LAYOUT unless given,
+    reading through the registry's process-wide record cache.
+    """
+    layout = (layout or os.getenv("AGENT_RECORD_LAYOUT", "blob")).lower()
+    cache = cache_for(registry)
+    if layout == "hash":
+        return FieldHashLayout(registry, key_prefix, cache=cache)
+    if layout != "blob":
+        logger.warning(f"Unknown AGENT_RECORD_LAYOUT={layout}, using blob")
+    return BlobLayout(registry, cache=cache)
@@ -0,0 +1,207 @@
+"""
+Process-wide Redis connection pool registry shared by every agent in the process
+- One pool per (URL, DB, sync/async); state managers and rate limiters draw clients from it
+  instead of opening their own connections
+- The sync bridge (sync_bridge.py) runs coroutines on its own event loop; asyncio connections cannot
+  move between loops, so it gets separate "bridge" pools used only on that loop
+- Pools are blocking: once max_connections are checked out, callers wait up to
+  REDIS_POOL_TIMEOUT seconds for a free connection instead of opening more
+- Pool usage is exported as Prometheus gauges, read at scrape time
+
+Environment (applied when a pool is first created):
+- REDIS_POOL_MAX_CONNECTIONS: connections per pool (default 20, 1-1000)
+- REDIS_POOL_TIMEOUT: seconds to wait for a free connection (default 5)
+- REDIS_SOCKET_CONNECT_TIMEOUT: socket connect timeout in seconds (default 3)
+- REDIS_SOCKET_TIMEOUT: socket operation timeout in seconds (default 5)
+- REDIS_SOCKET_KEEPALIVE: enable TCP keepalive (default True)
+- REDIS_RETRY_ON_TIMEOUT: retry a command once on timeout (default True)
+
+docker-compose caps Redis at --maxclients 100, so the sum of max_connections over all pools of
+all agent processes has to stay below that.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import redis
+import redis.asyncio as aioredis
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+from record_codec import REDIS_ENCODING_ERRORS
+from sync_bridge import on_bridge_loop
+
+logger = logging.getLogger("redis_pool")
+
+DEFAULT_REDIS_URL = "redis://localhost:6379"
+
+_pools: Dict[Tuple[str, int, str], Any] = {}
+_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int, low: int, high: int) -> int:
+    try:
+        value = int(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using default {default}")
+        return default
+    if value < low or value > high:
+        logger.warning(f"{name}={value} out of range [{low}, {high}], clamping")
+        value = min(max(value, low), high)
+    return value
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        value = float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using default {default}")
+        return default
+    if value < 0:
+        logger.warning(f"{name} < 0, resetting to 0")
+        value = 0
+    return value
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() == "true"
+
+
+def pool_settings() -> Dict[str, Any]:
+    """
+    Pool settings from the environment, validated.
+    """
+    return {
+        "max_connections": _env_int("REDIS_POOL_MAX_CONNECTIONS", 20, 1, 1000),
+        "timeout": _env_float("REDIS_POOL_TIMEOUT", 5),
+        "socket_connect_timeout": _env_float("REDIS_SOCKET_CONNECT_TIMEOUT", 3),
+        "socket_timeout": _env_float("REDIS_SOCKET_TIMEOUT", 5),
+        "socket_keepalive": _env_bool("REDIS_SOCKET_KEEPALIVE", True),
+        "retry_on_timeout": _env_bool("REDIS_RETRY_ON_TIMEOUT", True),
+    }
+
+
+def _split_url(url: Optional[str], db: Optional[int]) -> Tuple[str, int]:
+    """
+    Normalise a Redis URL into (URL without DB path, DB number). An explicit db wins over the URL path.
+    """
+    parsed = urlparse(url or os.getenv("REDIS_URL", DEFAULT_REDIS_URL))
+    path_db = parsed.path.strip("/")
+    if db is None:
+        db = int(path_db) if path_db.isdigit() else 0
+    return urlunparse(parsed._replace(path="")), int(db)
+
+
+def _redact(base_url: str) -> str:
+    """
+    URL without credentials, for logs and metric labels.
+    """
+    parsed = urlparse(base_url)
+    return urlunparse(parsed._replace(netloc=parsed.netloc.rpartition("@")[2]))
+
+
+def _get_pool(url: Optional[str], db: Optional[int], flavour: str, overrides: Dict[str, Any]):
+    base_url, db = _split_url(url, db)
+    key = (base_url, db, flavour)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            settings = pool_settings()
+            settings.update({k: v for k, v in overrides.items() if v is not None})
+            pool_class = redis.BlockingConnectionPool if flavour == "sync" else aioredis.BlockingConnectionPool
+            pool = pool_class.from_url(
+                base_url,
+                db=db,
+                decode_responses=True,
+                encoding_errors=REDIS_ENCODING_ERRORS,
+                **settings
+            )
+            _pools[key] = pool
+            logger.info(f"[Redis Pool] created {flavour} pool url={_redact(base_url)} db={db} {settings}")
+    return pool
+
+
+def get_async_redis(url: Optional[str] = None, db: Optional[int] = None, **overrides) -> aioredis.Redis:
+    """
+    Async client backed by the shared pool for (url, db). Clients are cheap; the pool is shared.
+    `overrides` (e.g. max_connections) only take effect if this call creates the pool.
+    """
+    return aioredis.Redis(connection_pool=_get_pool(url, db, "async", overrides))
+
+
+def get_bridge_redis(url: Optional[str] = None, db: Optional[int] = None, **overrides) -> aioredis.Redis:
+    """
+    Async client for the sync bridge loop only, backed by a pool separate from get_async_redis's.
+    """
+    return aioredis.Redis(connection_pool=_get_pool(url, db, "bridge", overrides))
+
+
+def get_sync_redis(url: Optional[str] = None, db: Optional[int] = None, **overrides) -> redis.Redis:
+    """
+    Sync client backed by the shared pool for (url, db).
+    """
+    return redis.Redis(connection_pool=_get_pool(url, db, "sync", overrides))
+
+
+def _usage(pool) -> Tuple[int, int, int]:
+    """
+    (in_use, idle, max) connection counts for a pool of either flavour.
+    """
+    if hasattr(pool, "_in_use_connections"):
+        in_use = len(pool._in_use_connections)
+        idle = len(getattr(pool, "_available_connections", []))
+    else:
+        idle = sum(1 for conn in list(getattr(pool.pool, "queue", [])) if conn is not None)
+        in_use = len(getattr(pool, "_connections", [])) - idle
+    return in_use, idle, pool.max_connections
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Current usage of every shared pool, keyed by "<flavour> <url>/<db>".
+    """
+    stats = {}
+    for (base_url, db, flavour), pool in list(_pools.items()):
+        in_use, idle, max_connections = _usage(pool)
+        stats[f"{flavour} {_redact(base_url)}/{db}"] = {"in_use": in_use, "idle": idle, "max": max_connections}
+    return stats
+
+
+async def close_pools() -> None:
+    """
+    Disconnect and forget every shared pool (application shutdown, tests).
+    """
+    with _lock:
+        pools = list(_pools.items())
+        _pools.clear()
+    for (_, _, flavour), pool in pools:
+        if flavour == "async":
+            await pool.disconnect()
+        elif flavour == "bridge":
+            await on_bridge_loop(pool.disconnect())
+        else:
+            pool.disconnect()
+
+
+class RedisPoolCollector:
+    """
+    Prometheus collector reporting shared pool usage at scrape time.
+    """
+    def collect(self):
+        connections = GaugeMetricFamily("redis_pool_connections", "Connections in the shared Redis pools", labels=["url", "db", "flavour", "state"])
+        max_connections = GaugeMetricFamily("redis_pool_max_connections", "Configured size of the shared Redis pools", labels=["url", "db", "flavour"])
+        for (base_url, db, flavour), pool in list(_pools.items()):
+            in_use, idle, limit = _usage(pool)
+            url = _redact(base_url)
+            connections.add_metric([url, str(db), flavour, "in_use"], in_use)
+            connections.add_metric([url, str(db), flavour, "idle"], idle)
+            max_connections.add_metric([url, str(db), flavour], limit)
+        yield connections
+        yield max_connections
+
+
+REGISTRY.register(RedisPoolCollector())
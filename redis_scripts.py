@@ -0,0 +1,395 @@
+"""
+Server-side Redis scripts shared by the agent state managers
+- Atomic partial updates (merge) of JSON records stored in a registry hash
+- Whole batches merged in a single EVALSHA round trip
+- Optional optimistic concurrency through a per-record `version` field
+- Optional maintenance of set/sorted-set secondary indexes inside the same script
+- Compare-and-set fallback for records the script cannot patch (msgpack or compressed, see record_codec.py)
+- Field-level merge for records stored as one Redis hash each (see record_store.py)
+"""
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import NoScriptError
+
+from record_codec import RecordCodec, default_codec, dumps_json, decode_fields, to_bytes
+
+MERGE_OK = "ok"
+MERGE_MISSING = "missing"
+MERGE_CONFLICT = "conflict"
+MERGE_INVALID = "invalid"
+
+# The script never fully decodes a record: it splits the top-level JSON object into raw
+# key/value tokens, swaps in the new (already JSON-encoded) values and reassembles it.
+# That keeps untouched fields byte-for-byte identical (cjson would turn [] into {}).
+# Legacy plain-JSON and FORMAT_JSON-prefixed records are patched in place; anything else
+# is reported as 'invalid' and merged client-side by RecordMerger.
+#
+# KEYS[1] = registry hash
+# ARGV    = n_index_specs, (field, "set"|"zset", key_or_prefix)*, n_items,
+#           (id, expected_version or "", n_fields, (escaped_field, json_value)*)*
+# Index keys are derived inside the script, so it assumes a standalone (non-cluster) Redis.
+# Returns a flat array of (status, record) pairs, one per item.
+MERGE_RECORDS_LUA = r"""
+local function skip_string(s, i)
+    local j = i + 1
+    while true do
+        local p = string.find(s, '["\\]', j)
+        if not p then return nil end
+        if string.sub(s, p, p) == '\\' then
+            j = p + 2
+        else
+            return p + 1
+        end
+    end
+end
+
+local function skip_value(s, i)
+    local c = string.sub(s, i, i)
+    if c == '"' then return skip_string(s, i) end
+    if c == '{' or c == '[' then
+        local depth, j = 1, i + 1
+        while true do
+            local p = string.find(s, '[%[%]{}"]', j)
+            if not p then return nil end
+            local d = string.sub(s, p, p)
+            if d == '"' then
+                j = skip_string(s, p)
+                if not j then return nil end
+            else
+                if d == '{' or d == '[' then depth = depth + 1 else depth = depth - 1 end
+                j = p + 1
+                if depth == 0 then return j end
+            end
+        end
+    end
+    local p = string.find(s, '[,}%s]', i)
+    return p
+end
+
+local function split_object(s)
+    local keys, vals = {}, {}
+    local i = string.find(s, '[^%s]')
+    if not i or string.sub(s, i, i) ~= '{' then return nil end
+    i = i + 1
+    while true do
+        i = string.find(s, '[^%s,]', i)
+        if not i then return nil end
+        local c = string.sub(s, i, i)
+        if c == '}' then return keys, vals end
+        if c ~= '"' then return nil end
+        local kend = skip_string(s, i)
+        if not kend then return nil end
+        local key = string.sub(s, i + 1, kend - 2)
+        local colon = string.find(s, ':', kend, true)
+        if not colon then return nil end
+        local vstart = string.find(s, '[^%s]', colon + 1)
+        if not vstart then return nil end
+        local vend = skip_value(s, vstart)
+        if not vend then return nil end
+        if vals[key] == nil then keys[#keys + 1] = key end
+        vals[key] = string.sub(s, vstart, vend - 1)
+        i = vend
+    end
+end
+
+local function unquote(raw)
+    if raw == nil or raw == 'null' then return nil end
+    local inner = string.match(raw, '^"(.*)"$')
+    if inner then return inner end
+    return raw
+end
+
+local registry = KEYS[1]
+local pos = 1
+local n_specs = tonumber(ARGV[pos]); pos = pos + 1
+local specs = {}
+for s = 1, n_specs do
+    specs[s] = {ARGV[pos], ARGV[pos + 1], ARGV[pos + 2]}
+    pos = pos + 3
+end
+
+local result = {}
+local n_items = tonumber(ARGV[pos]); pos = pos + 1
+for _ = 1, n_items do
+    local id = ARGV[pos]
+    local expected = ARGV[pos + 1]
+    local n_fields = tonumber(ARGV[pos + 2])
+    pos = pos + 3
+    local raw = redis.call('HGET', registry, id)
+    if not raw then
+        result[#result + 1] = 'missing'
+        result[#result + 1] = false
+    else
+        local prefix, body = '', raw
+        if string.byte(raw, 1) == 1 then
+            prefix, body = string.sub(raw, 1, 1), string.sub(raw, 2)
+        end
+        local keys, vals = split_object(body)
+        if not keys then
+            result[#result + 1] = 'invalid'
+            result[#result + 1] = raw
+        else
+            local current = tonumber(vals['version'] or '0') or 0
+            if expected ~= '' and tonumber(expected) ~= current then
+                result[#result + 1] = 'conflict'
+                result[#result + 1] = raw
+            else
+                local old = {}
+                for s = 1, n_specs do old[s] = vals[specs[s][1]] end
+                for f = 0, n_fields - 1 do
+                    local key, value = ARGV[pos + 2 * f], ARGV[pos + 2 * f + 1]
+                    if vals[key] == nil then keys[#keys + 1] = key end
+                    vals[key] = value
+                end
+                if vals['version'] == nil then keys[#keys + 1] = 'version' end
+                vals['version'] = tostring(current + 1)
+                local parts = {}
+                for k = 1, #keys do
+                    parts[k] = '"' .. keys[k] .. '": ' .. vals[keys[k]]
+                end
+                local merged = prefix .. '{' .. table.concat(parts, ', ') .. '}'
+                redis.call('HSET', registry, id, merged)
+                for s = 1, n_specs do
+                    local field, kind, target = specs[s][1], specs[s][2], specs[s][3]
+                    local before, after = unquote(old[s]), unquote(vals[field])
+                    if kind == 'set' then
+                        if before ~= after then
+                            if before then redis.call('SREM', target .. before, id) end
+                            if after then redis.call('SADD', target .. after, id) end
+                        end
+                    else
+                        redis.call('ZADD', target, tonumber(after) or 1, id)
+                    end
+                end
+                result[#result + 1] = 'ok'
+                result[#result + 1] = merged
+            end
+        end
+    end
+    pos = pos + 2 * n_fields
+end
+return result
+"""
+
+MERGE_RECORDS_SHA = hashlib.sha1(MERGE_RECORDS_LUA.encode("utf-8")).hexdigest()
+
+# Same contract as MERGE_RECORDS_LUA for the per-record hash layout: each record lives at
+# KEYS[1] .. id with one JSON value per field, so a merge is a plain HSET of the changed fields.
+# KEYS[1] = record key prefix
+# ARGV    = as above, with unescaped field names
+# Returns a flat array of (status, HGETALL reply) pairs, one per item.
+MERGE_FIELDS_LUA = r"""
+local function unquote(raw)
+    if not raw or raw == 'null' then return nil end
+    local inner = string.match(raw, '^"(.*)"$')
+    if inner then return inner end
+    return raw
+end
+
+local key_prefix = KEYS[1]
+local pos = 1
+local n_specs = tonumber(ARGV[pos]); pos = pos + 1
+local specs = {}
+for s = 1, n_specs do
+    specs[s] = {ARGV[pos], ARGV[pos + 1], ARGV[pos + 2]}
+    pos = pos + 3
+end
+
+local result = {}
+local n_items = tonumber(ARGV[pos]); pos = pos + 1
+for _ = 1, n_items do
+    local id = ARGV[pos]
+    local expected = ARGV[pos + 1]
+    local n_fields = tonumber(ARGV[pos + 2])
+    pos = pos + 3
+    local key = key_prefix .. id
+    if redis.call('EXISTS', key) == 0 then
+        result[#result + 1] = 'missing'
+        result[#result + 1] = false
+    else
+        local current = tonumber(redis.call('HGET', key, 'version') or '0') or 0
+        if expected ~= '' and tonumber(expected) ~= current then
+            result[#result + 1] = 'conflict'
+            result[#result + 1] = redis.call('HGETALL', key)
+        else
+            local old = {}
+            for s = 1, n_specs do old[s] = redis.call('HGET', key, specs[s][1]) end
+            for f = 0, n_fields - 1 do
+                redis.call('HSET', key, ARGV[pos + 2 * f], ARGV[pos + 2 * f + 1])
+            end
+            redis.call('HSET', key, 'version', tostring(current + 1))
+            for s = 1, n_specs do
+                local field, kind, target = specs[s][1], specs[s][2], specs[s][3]
+                local before, after = unquote(old[s]), unquote(redis.call('HGET', key, field))
+                if kind == 'set' then
+                    if before ~= after then
+                        if before then redis.call('SREM', target .. before, id) end
+                        if after then redis.call('SADD', target .. after, id) end
+                    end
+                else
+                    redis.call('ZADD', target, tonumber(after) or 1, id)
+                end
+            end
+            result[#result + 1] = 'ok'
+            result[#result + 1] = redis.call('HGETALL', key)
+        end
+    end
+    pos = pos + 2 * n_fields
+end
+return result
+"""
+
+MERGE_FIELDS_SHA = hashlib.sha1(MERGE_FIELDS_LUA.encode("utf-8")).hexdigest()
+
+# Compare-and-set of a single record plus index operations.
+# KEYS[1] = registry hash
+# ARGV    = id, expected_raw, new_raw, (op, key, score_or_empty)*
+CAS_RECORD_LUA = r"""
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+for i = 4, #ARGV, 3 do
+    local op, key = ARGV[i], ARGV[i + 1]
+    if op == 'ZADD' then
+        redis.call('ZADD', key, ARGV[i + 2], ARGV[1])
+    else
+        redis.call(op, key, ARGV[1])
+    end
+end
+return 1
+"""
+
+CAS_RECORD_SHA = hashlib.sha1(CAS_RECORD_LUA.encode("utf-8")).hexdigest()
+
+
+class VersionConflict(Exception):
+    """
+    Raised when an update carries a `version` that no longer matches the stored record.
+    """
+    def __init__(self, record_id: str, current: Optional[dict] = None):
+        super().__init__(f"Version conflict for {record_id}")
+        self.record_id = record_id
+        self.current = current
+
+
+class RecordMerger:
+    """
+    Atomic partial updates for records kept in a Redis hash (one field per record).
+
+    index_specs is an optional list of (field, kind, target) tuples describing secondary
+    indexes to keep in sync: kind "set" moves the record ID between `target + value` sets,
+    kind "zset" re-scores the ID in the `target` sorted set.
+
+    With key_prefix set, records are instead stored one Redis hash per record at
+    `key_prefix + id` (the "hash" layout in record_store.py) and merged field by field.
+
+    With a cache (record_cache.RecordCache) set, merged records are invalidated locally and
+    on the other processes after every merge.
+    """
+    def __init__(self, registry: str, index_specs: Iterable[Tuple[str, str, str]] = (), codec: Optional[RecordCodec] = None, cas_attempts: int = 5, key_prefix: Optional[str] = None, cache=None):
+        self.registry = registry
+        self.key_prefix = key_prefix
+        self.cache = cache
+        self.index_specs = list(index_specs)
+        self.codec = codec or default_codec
+        self.cas_attempts = cas_attempts
+
+    async def load(self, redis_conn) -> str:
+        """
+        Preload the scripts so that the first update is a plain EVALSHA.
+        """
+        if self.key_prefix is not None:
+            return await redis_conn.script_load(MERGE_FIELDS_LUA)
+        await redis_conn.script_load(CAS_RECORD_LUA)
+        return await redis_conn.script_load(MERGE_RECORDS_LUA)
+
+    async def _evalsha(self, redis_conn, source: str, sha: str, args: List[Any], key: Optional[str] = None):
+        key = key or self.registry
+        try:
+            return await redis_conn.evalsha(sha, 1, key, *args)
+        except NoScriptError:
+            await redis_conn.script_load(source)
+            return await redis_conn.evalsha(sha, 1, key, *args)
+
+    def build_args(self, updates: List[Tuple[str, Dict[str, Any], Optional[int]]]) -> List[Any]:
+        args: List[Any] = [len(self.index_specs)]
+        for field, kind, target in self.index_specs:
+            args.extend([field, kind, target])
+        args.append(len(updates))
+        for record_id, fields, expected_version in updates:
+            args.extend([record_id, "" if expected_version is None else int(expected_version), len(fields)])
+            for key, value in fields.items():
+                # Blob records are patched as raw JSON text, so keys go in already escaped
+                args.extend([key if self.key_prefix is not None else json.dumps(key)[1:-1], dumps_json(value)])
+        return args
+
+    async def merge(self, redis_conn, updates: List[Tuple[str, Dict[str, Any], Optional[int]]]) -> List[Tuple[str, Optional[dict]]]:
+        """
+        Merge a batch of (record_id, fields, expected_version) updates in one round trip.
+        Returns one (status, record) pair per update, where status is one of
+        MERGE_OK, MERGE_MISSING or MERGE_CONFLICT and record is the stored record after
+        the call (None when missing).
+        """
+        if not updates:
+            return []
+        if self.key_prefix is not None:
+            raw = await self._evalsha(redis_conn, MERGE_FIELDS_LUA, MERGE_FIELDS_SHA, self.build_args(updates), key=self.key_prefix)
+            results = [
+                (status.decode() if isinstance(status, bytes) else status, decode_fields(reply) if reply else None)
+                for status, reply in zip(raw[::2], raw[1::2])
+            ]
+            await self._invalidate(redis_conn, updates, results)
+            return results
+        raw = await self._evalsha(redis_conn, MERGE_RECORDS_LUA, MERGE_RECORDS_SHA, self.build_args(updates))
+        results = []
+        for n, i in enumerate(range(0, len(raw), 2)):
+            status = raw[i].decode() if isinstance(raw[i], bytes) else raw[i]
+            if status == MERGE_INVALID:
+                record_id, fields, expected_version = updates[n]
+                results.append(await self._merge_client_side(redis_conn, record_id, fields, expected_version))
+            else:
+                results.append((status, self.codec.decode(raw[i + 1]) if raw[i + 1] else None))
+        await self._invalidate(redis_conn, updates, results)
+        return results
+
+    async def _invalidate(self, redis_conn, updates, results) -> None:
+        if self.cache is None:
+            return
+        merged = [record_id for (record_id, _, _), (status, _) in zip(updates, results) if status == MERGE_OK]
+        if merged:
+            await self.cache.publish_invalidation(redis_conn, merged)
+
+    def _index_ops(self, before: dict, after: dict) -> List[Any]:
+        ops: List[Any] = []
+        for field, kind, target in self.index_specs:
+            old, new = before.get(field), after.get(field)
+            if kind == "zset":
+                ops.extend(["ZADD", target, new if new is not None else 1])
+            elif old != new:
+                if old is not None:
+                    ops.extend(["SREM", f"{target}{old}", ""])
+                if new is not None:
+                    ops.extend(["SADD", f"{target}{new}", ""])
+        return ops
+
+    async def _merge_client_side(self, redis_conn, record_id: str, fields: Dict[str, Any], expected_version: Optional[int]) -> Tuple[str, Optional[dict]]:
+        """
+        Read-merge-CAS for records the merge script cannot patch (binary or compressed formats).
+        """
+        for _ in range(self.cas_attempts):
+            raw = await redis_conn.hget(self.registry, record_id)
+            if raw is None:
+                return MERGE_MISSING, None
+            record = self.codec.decode(raw)
+            current = record.get("version") or 0
+            if expected_version is not None and int(expected_version) != current:
+                return MERGE_CONFLICT, record
+            merged = dict(record)
+            merged.update(fields)
+            merged["version"] = current + 1
+            encoded = self.codec.encode(merged)
+            args = [record_id, to_bytes(raw), encoded] + self._index_ops(record, merged)
+            if await self._evalsha(redis_conn, CAS_RECORD_LUA, CAS_RECORD_SHA, args):
+                return MERGE_OK, self.codec.decode(encoded)
+        raise RuntimeError(f"Gave up merging {record_id} after {self.cas_attempts} concurrent modifications")
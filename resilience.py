@@ -0,0 +1,412 @@
+"""
+Async resilience for calls to a dependency (Redis): circuit breaker, budgeted retries and an adaptive concurrency limit
+- CircuitBreaker: opens after `fail_max` consecutive failures and rejects calls with CircuitOpen for
+  `reset_timeout` seconds, then goes half-open and lets `half_open_probes` calls through. A successful
+  probe closes it, a failed one opens it again. Exceptions in `exclude` (version conflicts, rejected
+  cycles) are answers from the dependency, not failures
+- Retries: calls marked idempotent are retried on transient errors (connection errors, timeouts) with
+  full-jitter exponential backoff, never blocking the event loop. Every call earns `ratio` of a retry in
+  a RetryBudget (plus a small floor per second) and every retry spends one, so during an outage retries
+  add at most ~ratio extra load instead of multiplying it
+- AdaptiveLimit: an AIMD concurrency limit that replaces the fixed bulkheads. Each completed call is a
+  latency sample feeding a short and a long moving average; the limit grows by about one per round trip
+  while it is in use and the short average stays near the long one, and is cut by `backoff` (at most
+  once per round trip) when the short average rises past `tolerance` times the long one (requests are
+  queueing in the dependency) or a call fails. Comparing averages rather than single samples keeps a
+  steady mix of cheap and expensive calls from reading as congestion. Calls beyond the limit wait up
+  to `max_wait` seconds, then fail with LimitExceeded
+- ResiliencePolicy puts the three together for one dependency; `resilience_policy(name)` returns the
+  process-wide policy, so every state manager instance for that dependency shares one breaker, budget
+  and limit. Breaker state, limit, in-flight calls, retries and rejections are exported to Prometheus
+
+CircuitOpen and LimitExceeded are DependencyUnavailable: the agents answer them with 503 and Retry-After.
+
+Environment (PREFIX is the policy's env prefix, e.g. DEV_AGENT_REDIS; AGENT_RESILIENCE_<SETTING> applies
+to every policy without its own value):
+- <PREFIX>_CIRCUIT_FAIL_MAX: consecutive failures that open the breaker
+- <PREFIX>_CIRCUIT_TIMEOUT: seconds the breaker stays open before probing
+- <PREFIX>_RETRY_ATTEMPTS: attempts per idempotent call, including the first (default 3)
+- <PREFIX>_RETRY_BUDGET_RATIO: retries earned per call (default 0.1)
+- <PREFIX>_CONCURRENCY_INITIAL / _CONCURRENCY_MIN / _CONCURRENCY_MAX: concurrency limit bounds (default 10 / 1 / 200)
+- <PREFIX>_CONCURRENCY_WAIT_SECONDS: how long a call waits for a slot (default 5)
+"""
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Type
+
+from prometheus_client import Counter, Gauge
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+logger = logging.getLogger("resilience")
+
+circuit_state = Gauge("resilience_circuit_state", "Circuit breaker state (0=closed, 1=half-open, 2=open)", ["dependency"])
+concurrency_limit = Gauge("resilience_concurrency_limit", "Adaptive concurrency limit", ["dependency"])
+inflight_calls = Gauge("resilience_inflight_calls", "Calls holding a concurrency slot", ["dependency"])
+retries_total = Counter("resilience_retries_total", "Retries of idempotent calls", ["dependency", "outcome"])
+rejected_total = Counter("resilience_rejected_total", "Calls rejected without reaching the dependency", ["dependency", "reason"])
+
+# Errors after which the same call may succeed
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    RedisConnectionError, RedisTimeoutError, ConnectionError, TimeoutError, asyncio.TimeoutError,
+)
+
+
+def _setting(prefix: Optional[str], name: str, default: float) -> float:
+    for var in ([f"{prefix}_{name}"] if prefix else []) + [f"AGENT_RESILIENCE_{name}"]:
+        raw = os.getenv(var)
+        if raw is None:
+            continue
+        try:
+            return float(raw)
+        except ValueError:
+            logger.warning(f"Invalid {var}, using default {default}")
+            return default
+    return default
+
+
+class DependencyUnavailable(RuntimeError):
+    """
+    The call was not attempted; callers should report a transient (503) failure.
+    """
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyUnavailable):
+    pass
+
+
+class LimitExceeded(DependencyUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half-open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 30, half_open_probes: int = 1,
+                 exclude: Sequence[Type[BaseException]] = ()):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.exclude = tuple(exclude)
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        # Called with (breaker, old_state, new_state)
+        self.listeners: List[Callable[["CircuitBreaker", str, str], None]] = []
+        circuit_state.labels(name).set(0)
+
+    def _set_state(self, state: str) -> None:
+        old, self._state = self._state, state
+        if old == state:
+            return
+        circuit_state.labels(self.name).set(self.STATE_VALUES[state])
+        log = logger.warning if state == self.OPEN else logger.info
+        log(f"Circuit breaker {self.name}: {old} -> {state}")
+        for listener in self.listeners:
+            listener(self, old, state)
+
+    @property
+    def current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._probes = 0
+            self._set_state(self.HALF_OPEN)
+        return self._state
+
+    def admit(self) -> bool:
+        """
+        Raise CircuitOpen unless a call may go through. Returns True when the call is a half-open probe.
+        """
+        state = self.current_state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        rejected_total.labels(self.name, "circuit_open").inc()
+        retry_after = max(1.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpen(f"Circuit breaker {self.name} is open", retry_after)
+
+    def record_success(self, probe: bool) -> None:
+        self.failures = 0
+        if probe:
+            self._probes = max(0, self._probes - 1)
+            self._set_state(self.CLOSED)
+
+    def record_failure(self, probe: bool) -> None:
+        if probe:
+            self._probes = max(0, self._probes - 1)
+            self._open()
+            return
+        self.failures += 1
+        if self._state == self.CLOSED and self.failures >= self.fail_max:
+            self._open()
+
+    def cancel(self, probe: bool) -> None:
+        # The call ended without an answer either way (cancelled, or no concurrency slot)
+        if probe:
+            self._probes = max(0, self._probes - 1)
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self.failures = 0
+        self._set_state(self.OPEN)
+
+
+class RetryBudget:
+    """
+    Retries allowed across all calls: `ratio` per call plus `min_per_second`, at most `cap` banked.
+    """
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, cap: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.cap = cap
+        self.balance = cap
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(self.cap, self.balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0,
+                 budget: Optional[RetryBudget] = None, retry_on: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.retry_on = retry_on
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: concurrent callers that failed together do not retry together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class AdaptiveLimit:
+    def __init__(self, name: str, initial: int = 10, min_limit: int = 1, max_limit: int = 200,
+                 backoff: float = 0.9, tolerance: float = 2.0, slack: float = 0.002, short_alpha: float = 0.2,
+                 long_alpha: float = 0.005, max_wait: float = 5.0):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        # Absolute allowance on top of the long average, so sub-millisecond jitter is not read as queueing
+        self.slack = slack
+        self.short_alpha = short_alpha
+        self.long_alpha = long_alpha
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.short_rtt: Optional[float] = None
+        self.long_rtt: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        concurrency_limit.labels(name).set(self.limit)
+
+    async def acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self._take()
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            rejected_total.labels(self.name, "concurrency_limit").inc()
+            raise LimitExceeded(f"No {self.name} concurrency slot within {self.max_wait:g}s")
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over as the wait ended: give it back
+            self.inflight -= 1
+            self._wake()
+
+    def _take(self) -> None:
+        self.inflight += 1
+        inflight_calls.labels(self.name).set(self.inflight)
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._take()
+                waiter.set_result(None)
+        inflight_calls.labels(self.name).set(self.inflight)
+
+    def release(self, rtt: float, dropped: bool = False) -> None:
+        """
+        Give back a slot with the call's latency; `dropped` when the call failed.
+        """
+        concurrency = self.inflight
+        self.inflight -= 1
+        self._update(rtt, dropped, concurrency)
+        self._wake()
+
+    def _update(self, rtt: float, dropped: bool, concurrency: int) -> None:
+        if not dropped:
+            if self.long_rtt is None:
+                self.short_rtt = self.long_rtt = rtt
+            else:
+                self.short_rtt += self.short_alpha * (rtt - self.short_rtt)
+                # The long average follows slowly, so a host that got slower for good does not pin the limit down
+                self.long_rtt += self.long_alpha * (rtt - self.long_rtt)
+        if dropped or self.short_rtt > self.long_rtt * self.tolerance + self.slack:
+            now = time.monotonic()
+            if now - self._last_decrease >= rtt:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif concurrency >= self.limit / 2:
+            # Only grow a limit that is in use
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        concurrency_limit.labels(self.name).set(self.limit)
+
+
+class ResiliencePolicy:
+    """
+    Breaker, retries and concurrency limit for one dependency. Use `await policy.call(fn)` or decorate
+    async functions with `@policy` (no retries), `@policy.idempotent` (retried on transient errors)
+    or `@policy.background`.
+    """
+    def __init__(self, name: str, breaker: CircuitBreaker, limit: AdaptiveLimit, retry: RetryPolicy):
+        self.name = name
+        self.breaker = breaker
+        self.limit = limit
+        self.retry = retry
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], idempotent: bool = False, limited: bool = True) -> Any:
+        """
+        Run `fn()` through the breaker and, if `limited`, the concurrency limit. `fn` is called again for
+        each retry, so it must build a fresh awaitable every time.
+        """
+        limit = self.limit if limited else None
+        self.retry.budget.deposit()
+        attempt = 1
+        while True:
+            probe = self.breaker.admit()
+            if limit is not None:
+                try:
+                    await limit.acquire()
+                except BaseException:
+                    self.breaker.cancel(probe)
+                    raise
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                excluded = isinstance(e, self.breaker.exclude)
+                if limit is not None:
+                    limit.release(time.monotonic() - started, dropped=not excluded)
+                if excluded:
+                    self.breaker.record_success(probe)
+                    raise
+                self.breaker.record_failure(probe)
+                if not (idempotent and attempt < self.retry.attempts and isinstance(e, self.retry.retry_on)):
+                    raise
+                if not self.retry.budget.withdraw():
+                    retries_total.labels(self.name, "budget_exhausted").inc()
+                    raise
+                retries_total.labels(self.name, "retried").inc()
+                await asyncio.sleep(self.retry.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled: says nothing about the dependency
+                if limit is not None:
+                    limit.release(time.monotonic() - started)
+                self.breaker.cancel(probe)
+                raise
+            if limit is not None:
+                limit.release(time.monotonic() - started)
+            self.breaker.record_success(probe)
+            return result
+
+    def __call__(self, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.call(lambda: func(*args, **kwargs))
+        return wrapper
+
+    def idempotent(self, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.call(lambda: func(*args, **kwargs), idempotent=True)
+        return wrapper
+
+    def background(self, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """
+        For long-running jobs (archiving, rebuilds): breaker only. They hold no concurrency slot and
+        their run time is not a latency sample.
+        """
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.call(lambda: func(*args, **kwargs), limited=False)
+        return wrapper
+
+
+_policies: Dict[str, ResiliencePolicy] = {}
+
+
+def resilience_policy(
+    name: str,
+    env_prefix: Optional[str] = None,
+    fail_max: int = 5,
+    reset_timeout: float = 30,
+    initial_limit: int = 10,
+    exclude: Sequence[Type[BaseException]] = (),
+) -> ResiliencePolicy:
+    """
+    The process-wide policy for dependency `name`, built on first use from the environment (see the
+    module docstring) with the given defaults.
+    """
+    policy = _policies.get(name)
+    if policy is None:
+        breaker = CircuitBreaker(
+            name,
+            fail_max=int(_setting(env_prefix, "CIRCUIT_FAIL_MAX", fail_max)),
+            reset_timeout=_setting(env_prefix, "CIRCUIT_TIMEOUT", reset_timeout),
+            exclude=exclude,
+        )
+        limit = AdaptiveLimit(
+            name,
+            initial=int(_setting(env_prefix, "CONCURRENCY_INITIAL", initial_limit)),
+            min_limit=int(_setting(env_prefix, "CONCURRENCY_MIN", 1)),
+            max_limit=int(_setting(env_prefix, "CONCURRENCY_MAX", 200)),
+            max_wait=_setting(env_prefix, "CONCURRENCY_WAIT_SECONDS", 5),
+        )
+        retry = RetryPolicy(
+            attempts=int(_setting(env_prefix, "RETRY_ATTEMPTS", 3)),
+            budget=RetryBudget(ratio=_setting(env_prefix, "RETRY_BUDGET_RATIO", 0.1)),
+        )
+        policy = _policies[name] = ResiliencePolicy(name, breaker, limit, retry)
+    return policy
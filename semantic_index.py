@@ -0,0 +1,317 @@
+"""
+Cross-agent semantic index over the PM, DEV, TA and QA registries
+- One IncrementalTfidfIndex per process holds the text of every source's records, keyed by
+  (source, record id) and weighted with one IDF over all of them
+- A query is scored against every source in one sparse product; `sources` (the source-type facet)
+  picks which sources' matches are returned, so a DEV hint can list the TA decisions, QA tests and
+  PM objectives relevant to a new task from the same query that finds related DEV tasks
+- Each source is kept current separately: writes made in this process are indexed as they happen
+  (index_record/unindex_records), and records written by another agent arrive as IDs on the record
+  cache invalidation channel (record_cache.on_invalidation); the next query re-reads just those
+  records. Without a live subscription (listener not running, caching disabled), a source whose
+  registry size no longer matches what the index accounts for is refreshed from Redis instead.
+  A refresh re-tokenises only records whose text changed, and replays the writes that landed while
+  it was scanning
+- Tokenising and scoring run on the shared CPU executor (cpu_executor.py)
+
+Sources and their text fields: pm:tasks (objective), dev:tasks (description),
+ta:decisions (summary, rationale), qa:tests (description).
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cpu_executor import CpuExecutor, cpu_executor
+from record_cache import cache_for, invalidations_live, on_invalidation
+from record_store import BlobLayout, record_layout
+from tfidf_index import IncrementalTfidfIndex, analyze_texts, top_matches
+
+logger = logging.getLogger("semantic_index")
+
+# Refreshes scan and tokenise a whole registry, so they get more time than the executor's per-call default
+REFRESH_TIMEOUT = 300.0
+# Cross-agent suggestions: matches scoring above RELATED_THRESHOLD, at most RELATED_PER_SOURCE per source
+RELATED_THRESHOLD = 0.4
+RELATED_PER_SOURCE = 3
+
+
+class Source:
+    """
+    One indexed registry: its storage layout and the record fields whose text is indexed.
+    """
+    def __init__(self, name: str, store, fields: Sequence[str]):
+        self.name = name
+        self.store = store
+        self.fields = list(fields)
+
+    def text(self, record: dict) -> str:
+        return " ".join(str(record[field]) for field in self.fields if record.get(field))
+
+
+def default_sources() -> Dict[str, Source]:
+    return {
+        # PM writes its registry as a hash of encoded records regardless of AGENT_RECORD_LAYOUT
+        "pm": Source("pm", BlobLayout("pm:tasks", cache=cache_for("pm:tasks")), ["objective"]),
+        "dev": Source("dev", record_layout("dev:tasks", "dev:task:"), ["description"]),
+        "ta": Source("ta", record_layout("ta:decisions", "ta:decision:"), ["summary", "rationale"]),
+        "qa": Source("qa", record_layout("qa:tests", "qa:test:"), ["description"]),
+    }
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogateescape"), digest_size=8).digest()
+
+
+class SemanticIndex:
+    def __init__(self, redis_conn, sources: Optional[Dict[str, Source]] = None, executor: Optional[CpuExecutor] = None):
+        self.redis = redis_conn
+        self.sources = sources if sources is not None else default_sources()
+        self.executor = executor or cpu_executor()
+        self.index = IncrementalTfidfIndex()
+        # Per source: registry size the index accounts for, and whether it was loaded at all
+        self._sizes: Dict[str, int] = {}
+        self._built: Dict[str, bool] = {}
+        # (source, id) -> digest of the indexed text, so a refresh only re-tokenises changed records
+        self._digests: Dict[Tuple[str, str], bytes] = {}
+        # Writes made while a source is being refreshed, replayed onto the refreshed state
+        self._journals: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+        # Per source: IDs of records changed (possibly by another process) since they were last read
+        self._dirty: Dict[str, set] = {name: set() for name in self.sources}
+        self._registries = {getattr(spec.store, "registry", None): name for name, spec in self.sources.items()}
+        self._refresh_locks = {name: asyncio.Lock() for name in self.sources}
+        self._lock = threading.Lock()
+
+    def size(self, source: str) -> int:
+        with self._lock:
+            return sum(1 for doc_source, _ in self._digests if doc_source == source)
+
+    def invalidate(self, source: str) -> None:
+        """
+        Reload `source` from Redis on its next query.
+        """
+        self._built[source] = False
+
+    def note_invalidation(self, registry: Optional[str], record_ids: Optional[Sequence[str]]) -> None:
+        """
+        record_cache.on_invalidation handler: mark the records re-read on the next query, or reload
+        every source when invalidations may have been missed (registry None).
+        """
+        if registry is None:
+            for name in self.sources:
+                self.invalidate(name)
+            return
+        source = self._registries.get(registry)
+        if source is None or not self._built.get(source):
+            return
+        with self._lock:
+            self._dirty[source].update(record_ids)
+
+    def _follows_invalidations(self, source: str) -> bool:
+        return invalidations_live() and getattr(self.sources[source].store, "cache", None) is not None
+
+    def _put(self, source: str, record_id: str, text: Optional[str], terms: Optional[Dict[str, int]] = None) -> None:
+        key = (source, record_id)
+        if text:
+            self.index.add(key, text, terms)
+            self._digests[key] = _digest(text)
+        else:
+            self.index.remove(key)
+            self._digests.pop(key, None)
+
+    def index_record(self, source: str, record_id: str, text: Optional[str], created: bool = False) -> None:
+        """
+        Add or re-index one record after it was written in this process.
+        `created` marks a record new to the registry.
+        """
+        if not self._built.get(source):
+            return
+        with self._lock:
+            if source in self._journals:
+                self._journals[source].append((record_id, text))
+            self._put(source, record_id, text)
+        if created:
+            self._sizes[source] += 1
+
+    def unindex_records(self, source: str, record_ids: Sequence[str]) -> None:
+        """
+        Remove records that left the registry (deleted or archived).
+        """
+        if not self._built.get(source):
+            return
+        with self._lock:
+            for record_id in record_ids:
+                if source in self._journals:
+                    self._journals[source].append((record_id, None))
+                self._put(source, record_id, None)
+        self._sizes[source] -= len(record_ids)
+
+    def load(self, source: str, docs: Iterable[Tuple[str, str]], size: Optional[int] = None) -> None:
+        """
+        Replace a source's records with `docs` ((record id, text) pairs) synchronously (tests, tools).
+        """
+        docs = list(docs)
+        self._journals[source] = []
+        self._apply_refresh(source, docs, analyze_texts([text for _, text in docs]))
+        self._sizes[source] = len(docs) if size is None else size
+        self._built[source] = True
+
+    def _changed(self, source: str, docs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        with self._lock:
+            return [(record_id, text) for record_id, text in docs if self._digests.get((source, record_id)) != _digest(text)]
+
+    def _apply_refresh(self, source: str, changed: List[Tuple[str, str]], analyzed: List[Dict[str, int]], live: Optional[set] = None) -> None:
+        with self._lock:
+            journal = self._journals.pop(source, [])
+            if live is None:
+                live = {record_id for record_id, _ in changed}
+            for doc_source, record_id in [key for key in self._digests if key[0] == source and key[1] not in live]:
+                self._put(doc_source, record_id, None)
+            for (record_id, text), terms in zip(changed, analyzed):
+                self._put(source, record_id, text, terms)
+            for record_id, text in journal:
+                self._put(source, record_id, text)
+
+    async def refresh(self, source: str) -> None:
+        """
+        Bring one source in line with its registry in Redis.
+        """
+        spec = self.sources[source]
+        with self._lock:
+            self._journals[source] = []
+            # The scan reads every record; changes noted from here on are re-read afterwards
+            self._dirty[source] = set()
+        try:
+            size = await spec.store.count(self.redis)
+            docs = []
+            async for record_id, record in spec.store.iter_items(self.redis, spec.fields):
+                text = spec.text(record)
+                if text:
+                    docs.append((record_id, text))
+            changed = self._changed(source, docs)
+            analyzed = await self.executor.run(analyze_texts, [text for _, text in changed], timeout=REFRESH_TIMEOUT)
+            live = {record_id for record_id, _ in docs}
+            await self.executor.run_local(self._apply_refresh, source, changed, analyzed, live, timeout=REFRESH_TIMEOUT)
+        except BaseException:
+            with self._lock:
+                self._journals.pop(source, None)
+            raise
+        self._sizes[source] = size
+        self._built[source] = True
+        logger.info(f"Semantic index refreshed {source}: {len(docs)} records, {len(changed)} re-tokenised")
+
+    async def refresh_records(self, source: str) -> int:
+        """
+        Re-read the records of `source` noted as changed and re-index those whose text changed.
+        Returns the number of records read.
+        """
+        spec = self.sources[source]
+        with self._lock:
+            record_ids, self._dirty[source] = sorted(self._dirty[source]), set()
+        if not record_ids:
+            return 0
+        records = await spec.store.get_mapping(self.redis, record_ids, spec.fields)
+        await self.executor.run_local(self._apply_records, source, record_ids, records)
+        return len(record_ids)
+
+    def _apply_records(self, source: str, record_ids: Sequence[str], records: Dict[str, dict]) -> None:
+        spec = self.sources[source]
+        with self._lock:
+            for record_id in record_ids:
+                record = records.get(record_id)
+                text = spec.text(record) if record else None
+                if text and self._digests.get((source, record_id)) == _digest(text):
+                    continue
+                self._put(source, record_id, text)
+
+    async def ensure(self, sources: Optional[Sequence[str]] = None) -> None:
+        """
+        Load the sources that were never loaded and re-read the records changed since the last
+        query. Sources not followed through invalidations are refreshed when their registry size changed.
+        """
+        names = list(sources or self.sources)
+        followed = [name for name in names if self._built.get(name) and self._follows_invalidations(name)]
+        polled = [name for name in names if name not in followed]
+        sizes = await asyncio.gather(*(self.sources[name].store.count(self.redis) for name in polled))
+        for name, size in zip(polled, sizes):
+            if self._built.get(name) and size == self._sizes.get(name):
+                continue
+            # Concurrent requests share one refresh
+            async with self._refresh_locks[name]:
+                if not self._built.get(name) or await self.sources[name].store.count(self.redis) != self._sizes.get(name):
+                    await self.refresh(name)
+        for name in followed:
+            if self._dirty[name]:
+                async with self._refresh_locks[name]:
+                    await self.refresh_records(name)
+
+    async def warm(self) -> int:
+        """
+        Load every source ahead of the first query. Returns the number of indexed records.
+        """
+        await self.ensure()
+        return len(self.index)
+
+    def _search(self, texts: Sequence[str], sources: Sequence[str], threshold: float, top_k: Optional[int]) -> List[Dict[str, List[Tuple[str, float]]]]:
+        results = [{source: [] for source in sources} for _ in texts]
+        if not len(self.index):
+            return results
+        doc_ids, scores = self.index.similarities(texts)
+        for row, result in enumerate(results):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data, columns = scores.data[start:end], scores.indices[start:end]
+            # Only the row's stored entries (records sharing a term with the query) are ranked
+            row_sources = np.array([doc_ids[column][0] for column in columns], dtype=object)
+            for source in sources:
+                picked = np.nonzero(row_sources == source)[0]
+                result[source] = [
+                    (doc_ids[columns[picked[i]]][1], float(data[picked[i]]))
+                    for i in top_matches(data[picked], threshold, top_k)
+                ]
+        return results
+
+    async def search(
+        self,
+        texts: Sequence[str],
+        sources: Optional[Sequence[str]] = None,
+        threshold: float = 0.0,
+        top_k: Optional[int] = None,
+    ) -> List[Dict[str, List[Tuple[str, float]]]]:
+        """
+        For each query text, a {source: [(record id, score), ...]} map of the records scoring above
+        `threshold` in each requested source, best first, at most `top_k` per source.
+        """
+        if not texts:
+            return []
+        sources = list(sources or self.sources)
+        await self.ensure(sources)
+        return await self.executor.run_local(self._search, list(texts), sources, threshold, top_k)
+
+
+def related_ids(
+    matches: Dict[str, List[Tuple[str, float]]],
+    sources: Sequence[str],
+    threshold: float = RELATED_THRESHOLD,
+    per_source: int = RELATED_PER_SOURCE,
+) -> Dict[str, List[str]]:
+    """
+    The best-matching record IDs per source from one query's search result.
+    """
+    return {source: [record_id for record_id, score in matches.get(source, []) if score > threshold][:per_source] for source in sources}
+
+
+_index: Optional[SemanticIndex] = None
+
+
+def semantic_index(redis_conn) -> SemanticIndex:
+    """
+    Process-wide semantic index (all agents in a process share the one index).
+    """
+    global _index
+    if _index is None:
+        _index = SemanticIndex(redis_conn)
+        on_invalidation(_index.note_invalidation)
+    return _index
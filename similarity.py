@@ -0,0 +1,198 @@
+"""
+Memoized text similarity for conflict resolution, shared by all agents
+- One service per record family (dev:tasks, pm:tasks, ta:decisions, qa:tests, ux:feedbacks)
+- Texts are tokenised once: an LRU keyed by content hash keeps each text's term counts and its
+  L2-normalised TF-IDF vector, so resolving a conflict is a sparse dot product instead of a fit
+- IDF is corpus-level, not fitted on the two texts being compared: a service attached to an
+  IncrementalTfidfIndex (the agent's hint index) reads that index's document frequencies and, like
+  the index's own transform(), ignores terms the index has never seen; otherwise the corpus is the
+  set of distinct texts currently in the LRU
+- Cached vectors are re-weighted lazily when the corpus size drifted by more than `reweight_drift`
+  since the last weighting, so scores are stable from one call to the next in between
+
+Tokenisation and IDF smoothing match sklearn's TfidfVectorizer(stop_words='english').
+
+Environment:
+- AGENT_SIMILARITY_CACHE_SIZE: texts kept per service (default 4096)
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import Counter as TermCounter, OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from prometheus_client import Counter
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger("similarity")
+
+similarity_requests = Counter("similarity_cache_requests_total", "Similarity vector lookups", ["service", "result"])
+similarity_evictions = Counter("similarity_cache_evictions_total", "Similarity vectors evicted", ["service"])
+
+
+class SimilarityService:
+    """
+    Cosine similarity of texts over TF-IDF vectors memoized by content hash.
+    Thread-safe: the sync compatibility wrappers may call it outside the event loop.
+    """
+    def __init__(self, name: str, corpus=None, max_entries: int = 4096, reweight_drift: float = 0.2):
+        self.name = name
+        self.corpus = corpus
+        self.max_entries = max(1, max_entries)
+        self.reweight_drift = reweight_drift
+        self.analyzer = TfidfVectorizer(stop_words='english').build_analyzer()
+        # digest -> [term counts, epoch the vector was weighted at, vector]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        # Document frequencies of the cached texts, used when no corpus is attached
+        self._df: Dict[str, int] = TermCounter()
+        self._epoch = 0
+        self._weighted_at = 0
+        self._lock = threading.Lock()
+
+    def attach(self, corpus) -> None:
+        """
+        Take IDF from `corpus` (an IncrementalTfidfIndex) from now on.
+        """
+        with self._lock:
+            self.corpus = corpus
+            self._epoch += 1
+            self._weighted_at = self._corpus_size()
+
+    def _corpus_size(self) -> int:
+        return len(self.corpus) if self.corpus is not None else len(self._entries)
+
+    def _current_epoch(self) -> int:
+        n = self._corpus_size()
+        if abs(n - self._weighted_at) > self.reweight_drift * max(self._weighted_at, 1):
+            self._epoch += 1
+            self._weighted_at = n
+        return self._epoch
+
+    def _weigh(self, counts: Dict[str, int]) -> Dict[str, float]:
+        n = self._weighted_at
+        # Every term of a cached text is in _df; an attached corpus only knows the terms it has indexed
+        df = self._df if self.corpus is None else self.corpus.document_frequencies(counts)
+        weights = {term: count * (math.log((1 + n) / (1 + df[term])) + 1) for term, count in counts.items() if term in df}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {term: w / norm for term, w in weights.items()} if norm else weights
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            _, (counts, _, _) = self._entries.popitem(last=False)
+            for term in counts:
+                self._df[term] -= 1
+                if not self._df[term]:
+                    del self._df[term]
+            similarity_evictions.labels(self.name).inc()
+
+    def vector(self, text: str) -> Dict[str, float]:
+        """
+        L2-normalised TF-IDF vector of a text (term -> weight; empty if it has only stop words).
+        """
+        text = text or ""
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogateescape"), digest_size=16).hexdigest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                similarity_requests.labels(self.name, "miss").inc()
+                counts = dict(TermCounter(self.analyzer(text)))
+                for term in counts:
+                    self._df[term] += 1
+                entry = self._entries[digest] = [counts, -1, None]
+                self._evict()
+            else:
+                similarity_requests.labels(self.name, "hit").inc()
+                self._entries.move_to_end(digest)
+            epoch = self._current_epoch()
+            if entry[1] != epoch:
+                entry[2], entry[1] = self._weigh(entry[0]), epoch
+            return entry[2]
+
+    def similarity(self, text_a: str, text_b: str) -> float:
+        """
+        Cosine similarity between 0 (nothing in common) and 1 (same terms in the same proportions).
+        """
+        vector_a, vector_b = self.vector(text_a), self.vector(text_b)
+        if len(vector_a) > len(vector_b):
+            vector_a, vector_b = vector_b, vector_a
+        return min(1.0, sum(weight * vector_b.get(term, 0.0) for term, weight in vector_a.items()))
+
+    def pair_similarities(self, texts_a: Sequence[str], texts_b: Sequence[str]) -> np.ndarray:
+        """
+        Cosine similarity of each (texts_a[i], texts_b[i]) pair: the memoized vectors are stacked
+        into two sparse matrices over the batch's terms and multiplied row by row in one product.
+        """
+        # Register every text first, so adding the batch's texts to the corpus cannot re-weight
+        # one side of the batch and not the other
+        for text in set(texts_a) | set(texts_b):
+            self.vector(text)
+        columns: Dict[str, int] = {}
+
+        def stack(texts: Sequence[str]) -> tuple:
+            indptr, indices, data = [0], [], []
+            for text in texts:
+                for term, weight in self.vector(text).items():
+                    indices.append(columns.setdefault(term, len(columns)))
+                    data.append(weight)
+                indptr.append(len(indices))
+            return data, indices, indptr
+
+        # Both sides are stacked before either matrix is built, so they share the column numbering
+        parts_a, parts_b = stack(texts_a), stack(texts_b)
+        shape = (len(texts_a), max(len(columns), 1))
+        matrix_a, matrix_b = csr_matrix(parts_a, shape=shape), csr_matrix(parts_b, shape=shape)
+        return np.minimum(1.0, np.asarray(matrix_a.multiply(matrix_b).sum(axis=1)).ravel())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._df.clear()
+            self._epoch += 1
+            self._weighted_at = self._corpus_size()
+
+
+_services: Dict[str, SimilarityService] = {}
+_services_lock = threading.Lock()
+
+
+def similarity_service(name: str, corpus=None) -> SimilarityService:
+    """
+    Process-wide similarity service for a record family, sized from the environment.
+    Passing `corpus` attaches it (an agent's hint index) to the service.
+    """
+    with _services_lock:
+        service = _services.get(name)
+        if service is None:
+            try:
+                max_entries = int(os.getenv("AGENT_SIMILARITY_CACHE_SIZE", 4096))
+            except ValueError:
+                logger.warning("Invalid AGENT_SIMILARITY_CACHE_SIZE, using default 4096")
+                max_entries = 4096
+            service = _services[name] = SimilarityService(name, max_entries=max_entries)
+    if corpus is not None and service.corpus is not corpus:
+        service.attach(corpus)
+    return service
+
+
+def text_of(record: dict, fields: List[str]) -> str:
+    """
+    The record's text for similarity: the given fields that are set, joined.
+    """
+    return " ".join(str(record[field]) for field in fields if record.get(field))
+
+
+def similar_winner(record_a: dict, record_b: dict, score: float, threshold: float = 0.7) -> Optional[dict]:
+    """
+    For records at least `threshold` similar (the same work written twice), the one to keep:
+    higher priority first, then the more recent timestamp. None when they are not that similar.
+    """
+    if score < threshold:
+        return None
+    priority_a, priority_b = record_a.get('priority', 1), record_b.get('priority', 1)
+    if priority_a != priority_b:
+        return record_a if priority_a > priority_b else record_b
+    return record_a if record_a.get('timestamp', 0) >= record_b.get('timestamp', 0) else record_b
@@ -0,0 +1,66 @@
+"""
+Bridge for the synchronous compatibility wrappers of the async state managers
+- Coroutines run on one private event loop in a daemon thread, so async Redis clients and their
+  pooled connections always live on the same loop across calls
+- Nothing loop-bound may be shared between the bridge loop and the application loop: asyncio Redis
+  connections and the waiters of a resilience concurrency limit belong to the loop that created them.
+  The wrappers therefore run on a twin of their state manager (bridge_twin) holding a client from the
+  bridge's own pool (redis_pool.get_bridge_redis) and its own resilience policy. What the twin does share
+  with the application (record caches, similarity services) is plain thread-safe state
+- The sync wrappers are for scripts and tools. Do not mix them with the async API in one process: the
+  twin's pool and policy are separate from the application's, so the application's concurrency limit
+  and circuit breaker neither see nor protect the wrapper calls
+- Calling a wrapper from inside a running event loop is an error: async code must await the
+  async_* method instead of blocking the loop
+"""
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def _bridge_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="sync-bridge", daemon=True).start()
+    return _loop
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """
+    Run a coroutine to completion from synchronous code and return its result.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run_coroutine_threadsafe(coro, _bridge_loop()).result()
+    coro.close()
+    raise RuntimeError("Synchronous state manager method called from a running event loop; await its async_ variant instead")
+
+
+async def on_bridge_loop(coro: Awaitable[Any]) -> Any:
+    """
+    Await a coroutine that must run on the bridge loop (e.g. closing bridge connections) from any loop.
+    """
+    loop = _bridge_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def bridge_twin(manager: T, **attrs: Any) -> T:
+    """
+    Shallow copy of `manager` with `attrs` replaced: the loop-bound parts (Redis clients, resilience
+    policy) are swapped for bridge-only ones while stores, scripts and settings are shared.
+    """
+    twin = copy.copy(manager)
+    for name, value in attrs.items():
+        setattr(twin, name, value)
+    return twin
@@ -1,8 +1,14 @@
+import math
 from fastapi import FastAPI
-from ta_agent.api import ta_router
+from redis_pool import close_pools
+from cpu_executor import ExecutorUnavailable, shutdown_cpu_executor
+from resilience import DependencyUnavailable
+from record_cache import start_invalidation_listener, stop_invalidation_listener
+from ta_agent.api import ta_router, ta_state
 from ta_agent.security import validate_jwt
 from fastapi.middleware.cors import CORSMiddleware
-from ta_agent.rate_limit import setup_rate_limiter
+from fastapi.responses import JSONResponse
+from ta_agent.rate_limit import setup_rate_limiter, shutdown_rate_limiter
 from prometheus_client import Counter, generate_latest, CONTENT_TYPE_LATEST
 from fastapi import Response
 
@@ -11,6 +17,8 @@ app = FastAPI()
 @app.on_event("startup")
 async def on_startup():
     await setup_rate_limiter(app)
+    # Keep the record cache coherent with writes from other processes
+    start_invalidation_listener(ta_state.redis)
 
 app.include_router(ta_router)
 
@@ -36,6 +44,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the record cache listener and the semantic executor, then release the process-wide Redis pools (redis_pool.py)
+    await stop_invalidation_listener()
+    await shutdown_rate_limiter(app)
+    shutdown_cpu_executor()
+    await close_pools()
+
+@app.exception_handler(ExecutorUnavailable)
+async def executor_unavailable(request, exc: ExecutorUnavailable):
+    # Semantic work queue full or timed out: transient, the client should retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable(request, exc: DependencyUnavailable):
+    # Redis circuit breaker open or no concurrency slot in time (resilience.py): transient, the client should retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -1,14 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_limiter.depends import RateLimiter
+from rate_limiter import RateLimiter
 from .security import validate_jwt
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from .core import TAStateManager, ArchitectureDecision
-from fastapi import BackgroundTasks
+from .batch_ai_semantic import TAAIHintEngine
+from redis_scripts import VersionConflict
+from record_store import parse_fields
+from conflict_resolution import MAX_CONFLICT_PAIRS
+from fastapi import BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 import uuid
+import json
 
 ta_router = APIRouter(prefix="/ta", tags=["Technical Architect"])
 ta_state = TAStateManager()
+ai_hint_engine = TAAIHintEngine(ta_state.aredis)
 
 class DecisionRequest(BaseModel):
     summary: str
@@ -28,7 +35,8 @@ async def propose_decision(req: DecisionRequest):
         dependencies=req.dependencies,
         priority=req.priority
     )
-    decision_id = ta_state.create_decision(decision.dict())
+    decision_id = await ta_state.async_create_decision(decision.dict())
+    ai_hint_engine.index_decision(decision_id, decision.dict(), created=True)
     return {"decision_id": decision_id}
 
 @ta_router.post("/async_propose_decision", status_code=201, dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=5, seconds=60))])
@@ -43,39 +51,62 @@ async def async_propose_decision(req: DecisionRequest):
         priority=req.priority
     )
     decision_id = await ta_state.async_create_decision(decision.dict())
+    ai_hint_engine.index_decision(decision_id, decision.dict(), created=True)
     return {"decision_id": decision_id}
 
 @ta_router.get("/async_status/{decision_id}", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=10, seconds=60))])
-async def async_get_decision_status(decision_id: str):
-    decision = await ta_state.async_get_decision(decision_id)
-    if not decision:
+async def async_get_decision_status(
+    decision_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return (e.g. fields=status)")
+):
+    decision = await ta_state.async_get_decision(decision_id, fields=parse_fields(fields))
+    if decision is None:
         raise HTTPException(status_code=404, detail="Decision not found")
     return {"decision": decision}
 
 @ta_router.get("/async_list_decisions", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=10, seconds=60))])
-async def async_list_decisions():
-    decisions = await ta_state.async_list_decisions()
-    return {"decisions": decisions}
+async def async_list_decisions(
+    cursor: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size hint"),
+    stream: bool = Query(False, description="Stream all decisions as NDJSON instead of returning a page"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return for each decision")
+):
+    projection = parse_fields(fields)
+    if stream:
+        lines = (json.dumps(decision) + "\n" async for decision in ta_state.async_iter_decisions(fields=projection))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    next_cursor, decisions = await ta_state.async_scan_decisions(cursor=cursor, limit=limit, fields=projection)
+    return {"decisions": decisions, "next_cursor": next_cursor}
 
 @ta_router.post("/async_update_decision/{decision_id}", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=5, seconds=60))])
 async def async_update_decision(decision_id: str, updates: Dict):
-    await ta_state.async_update_decision(decision_id, updates)
+    try:
+        await ta_state.async_update_decision(decision_id, updates)
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if "summary" in updates or "rationale" in updates:
+        ai_hint_engine.index_decision(decision_id, await ta_state.async_get_decision(decision_id, fields=["summary", "rationale"]))
     return {"status": "updated"}
 
 @ta_router.post("/async_batch_update_decisions", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=2, seconds=60))])
 async def async_batch_update_decisions(updates: List[Dict]):
     updated_ids = await ta_state.async_batch_update_decisions(updates)
+    if any("summary" in upd or "rationale" in upd for upd in updates):
+        # Reloaded on the next hint query; only decisions whose text changed are re-tokenised
+        ai_hint_engine.semantic.invalidate("ta")
     return {"updated_ids": updated_ids}
 
 @ta_router.post("/ai_hint", dependencies=[Depends(validate_jwt), Depends(RateLimiter(times=5, seconds=60))])
 async def ai_hint(objective: str, context: Dict):
-    # Placeholder for AI/semantic hint logic
-    return {"suggested_fields": {"priority": 1, "dependencies": []}}
+    # Related decisions plus cross-agent matches (PM/DEV/QA) from the shared semantic index
+    return {"suggested_fields": await ai_hint_engine.suggest_decision_fields(objective)}
 
 
 @ta_router.get("/status/{decision_id}")
 async def get_decision_status(decision_id: str):
-    decision = ta_state.get_decision(decision_id)
+    decision = await ta_state.async_get_decision(decision_id)
     if not decision:
         raise HTTPException(status_code=404, detail="Decision not found")
     return {"decision": decision}
@@ -84,3 +115,16 @@ async def get_decision_status(decision_id: str):
 async def resolve_conflict(dec_a: Dict, dec_b: Dict):
     resolved = ta_state.resolve_conflict(dec_a, dec_b)
     return {"resolved_decision": resolved}
+
+class ConflictBatchRequest(BaseModel):
+    pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+
+@ta_router.post("/resolve_conflict/batch")
+async def resolve_conflict_batch(req: ConflictBatchRequest):
+    """
+    Resolve many decision pairs at once (vectorized scoring, one batched similarity product).
+    Returns per pair, in order: {"winner": "a"|"b", "resolved", "path", "similarity", "score"}.
+    """
+    if len(req.pairs) > MAX_CONFLICT_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CONFLICT_PAIRS} pairs per request")
+    return {"results": await ai_hint_engine.executor.run_local(ta_state.resolve_conflicts, req.pairs)}
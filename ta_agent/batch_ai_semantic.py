@@ -1,2 +1,28 @@
-# Placeholder for batch update and AI/semantic hint logic for TA agent
-# To be implemented: TF-IDF, semantic similarity, batch ops
+# TA Agent: AI/semantic hints over the cross-agent semantic index (semantic_index.py)
+from typing import Optional
+from semantic_index import semantic_index, related_ids
+
+# Other agents' records suggested alongside related TA decisions
+RELATED_SOURCES = ("pm", "dev", "qa")
+
+class TAAIHintEngine:
+    def __init__(self, redis_conn, semantic=None):
+        # Decisions are the "ta" source of the process-wide index, kept current by index_decision()
+        # and by the cache invalidations of decisions written by another process
+        self.semantic = semantic or semantic_index(redis_conn)
+
+    async def suggest_decision_fields(self, objective: str) -> dict:
+        # One query finds the closest decisions and the related PM tasks, DEV tasks and QA tests
+        [matches] = await self.semantic.search([objective], ("ta",) + RELATED_SOURCES)
+        return {
+            "priority": 1,
+            "dependencies": related_ids(matches, ["ta"])["ta"],
+            "related": related_ids(matches, RELATED_SOURCES)
+        }
+
+    def index_decision(self, decision_id: str, decision: Optional[dict], created: bool = False) -> None:
+        """
+        Add or re-index one decision after it was written. `created` marks a decision new to the registry.
+        """
+        text = self.semantic.sources["ta"].text(decision) if decision else None
+        self.semantic.index_record("ta", decision_id, text, created=created)
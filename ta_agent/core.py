@@ -1,10 +1,17 @@
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, AsyncIterator
 from pydantic import BaseModel
 import uuid
-import json
-from redis.asyncio import Redis
-import asyncio
+from redis_scripts import VersionConflict, MERGE_OK, MERGE_MISSING, MERGE_CONFLICT
+from redis_pool import get_async_redis, get_bridge_redis
+from sync_bridge import bridge_twin, run_sync
+from record_store import record_layout
+from resilience import resilience_policy
+from similarity import similarity_service, similar_winner, text_of
+from conflict_resolution import ConflictPolicy, resolve_pairs
+
+# The rules of resolve_conflict, for batches of pairs
+CONFLICT_POLICY = ConflictPolicy(["summary", "rationale"])
 
 class ArchitectureDecision(BaseModel):
     id: str
@@ -19,132 +26,121 @@ class ArchitectureDecision(BaseModel):
     timestamp: float = datetime.now().timestamp()
 
 class TAStateManager:
-    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379):
-        self.redis = Redis(host=redis_host, port=redis_port, decode_responses=True)
-        self.aredis = Redis(host=redis_host, port=redis_port, decode_responses=True)
+    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379, max_concurrent: int = 10):
+        # One client on the process-wide shared pool; `aredis` is kept as an alias for the async methods
+        self.redis = get_async_redis(f"redis://{redis_host}:{redis_port}")
+        self.aredis = self.redis
         self.decision_registry = "ta:decisions"
-        # Circuit breaker state
-        self.circuit_open = False
-        self.failure_count = 0
-        self.failure_threshold = 5
-        self.bulkhead_semaphore = asyncio.Semaphore(10)
+        self.store = record_layout(self.decision_registry, "ta:decision:")
+        self.merger = self.store.merger()
+        self.similarity = similarity_service(self.decision_registry)
+        # Process-wide breaker, retry budget and adaptive concurrency limit for TA Redis calls (see resilience.py);
+        # max_concurrent is the limit's starting point
+        self.resilience = resilience_policy("ta_redis", env_prefix="TA_AGENT_REDIS", fail_max=5, reset_timeout=5, initial_limit=max_concurrent)
+        self._redis_url = f"redis://{redis_host}:{redis_port}"
+        self._max_concurrent = max_concurrent
+        self._bridge: Optional["TAStateManager"] = None
 
-    def create_decision(self, decision: dict) -> str:
-        decision = decision.copy()
-        for k in ['created_at', 'updated_at']:
-            if k in decision and hasattr(decision[k], 'isoformat'):
-                decision[k] = decision[k].isoformat()
-        decision_id = f"decision_{uuid.uuid4().hex}"
-        self.redis.hset(self.decision_registry, decision_id, json.dumps(decision))
-        return decision_id
+    async def _write_decision(self, decision_id: str, decision: dict) -> None:
+        pipe = self.aredis.pipeline()
+        self.store.queue_write(pipe, decision_id, decision)
+        await pipe.execute()
+        self.store.invalidate([decision_id])
 
     async def async_create_decision(self, decision: dict) -> str:
-        if self.circuit_open:
-            raise Exception("Redis circuit breaker open")
-        async with self.bulkhead_semaphore:
-            try:
-                decision = decision.copy()
-                for k in ['created_at', 'updated_at']:
-                    if k in decision and hasattr(decision[k], 'isoformat'):
-                        decision[k] = decision[k].isoformat()
-                decision_id = f"decision_{uuid.uuid4().hex}"
-                await self.aredis.hset(self.decision_registry, decision_id, json.dumps(decision))
-                self.failure_count = 0
-                return decision_id
-            except Exception as e:
-                self.failure_count += 1
-                if self.failure_count >= self.failure_threshold:
-                    self.circuit_open = True
-                raise e
-
-    def get_decision(self, decision_id: str) -> dict:
-        raw = self.redis.hget(self.decision_registry, decision_id)
-        if not raw:
-            return None
-        return json.loads(raw)
-
-    async def async_get_decision(self, decision_id: str) -> dict:
-        if self.circuit_open:
-            raise Exception("Redis circuit breaker open")
-        async with self.bulkhead_semaphore:
-            try:
-                raw = await self.aredis.hget(self.decision_registry, decision_id)
-                self.failure_count = 0
-                return json.loads(raw) if raw else None
-            except Exception as e:
-                self.failure_count += 1
-                if self.failure_count >= self.failure_threshold:
-                    self.circuit_open = True
-                raise e
+        decision_id = f"decision_{uuid.uuid4().hex}"
+        await self.resilience.call(lambda: self._write_decision(decision_id, decision))
+        return decision_id
 
-    def list_decisions(self) -> list:
-        keys = self.redis.hkeys(self.decision_registry)
-        return [json.loads(self.redis.hget(self.decision_registry, k)) for k in keys]
+    async def async_get_decision(self, decision_id: str, fields: Optional[List[str]] = None) -> dict:
+        return await self.resilience.call(lambda: self.store.get(self.aredis, decision_id, fields), idempotent=True)
 
     async def async_list_decisions(self) -> list:
-        if self.circuit_open:
-            raise Exception("Redis circuit breaker open")
-        async with self.bulkhead_semaphore:
-            try:
-                keys = await self.aredis.hkeys(self.decision_registry)
-                self.failure_count = 0
-                return [json.loads(await self.aredis.hget(self.decision_registry, k)) for k in keys]
-            except Exception as e:
-                self.failure_count += 1
-                if self.failure_count >= self.failure_threshold:
-                    self.circuit_open = True
-                raise e
+        return [decision async for decision in self.async_iter_decisions()]
 
-    def update_decision(self, decision_id: str, updates: dict) -> None:
-        decision = self.get_decision(decision_id)
-        if not decision:
-            raise ValueError("Decision not found")
-        decision.update(updates)
-        for k in ['created_at', 'updated_at']:
-            if k in decision and hasattr(decision[k], 'isoformat'):
-                decision[k] = decision[k].isoformat()
-        self.redis.hset(self.decision_registry, decision_id, json.dumps(decision))
+    async def async_scan_decisions(self, cursor: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> Tuple[int, list]:
+        """
+        Fetch one HSCAN page of decisions. Returns (next_cursor, decisions); 0 means the scan is complete.
+        """
+        return await self.resilience.call(lambda: self.store.scan(self.aredis, cursor, limit, fields), idempotent=True)
+
+    async def async_iter_decisions(self, batch_size: int = 500, fields: Optional[List[str]] = None) -> AsyncIterator[dict]:
+        """
+        Yield decisions page by page without materialising the whole registry.
+        """
+        cursor = 0
+        while True:
+            cursor, decisions = await self.async_scan_decisions(cursor, batch_size, fields)
+            for decision in decisions:
+                yield decision
+            if cursor == 0:
+                break
 
     async def async_update_decision(self, decision_id: str, updates: dict) -> None:
-        if self.circuit_open:
-            raise Exception("Redis circuit breaker open")
-        async with self.bulkhead_semaphore:
-            try:
-                decision = await self.async_get_decision(decision_id)
-                if not decision:
-                    raise ValueError("Decision not found")
-                decision.update(updates)
-                for k in ['created_at', 'updated_at']:
-                    if k in decision and hasattr(decision[k], 'isoformat'):
-                        decision[k] = decision[k].isoformat()
-                await self.aredis.hset(self.decision_registry, decision_id, json.dumps(decision))
-                self.failure_count = 0
-            except Exception as e:
-                self.failure_count += 1
-                if self.failure_count >= self.failure_threshold:
-                    self.circuit_open = True
-                raise e
+        updates = dict(updates)
+        expected_version = updates.pop("version", None)
+        [(status, decision)] = await self.resilience.call(lambda: self.merger.merge(self.aredis, [(decision_id, updates, expected_version)]))
+        if status == MERGE_MISSING:
+            raise ValueError("Decision not found")
+        if status == MERGE_CONFLICT:
+            raise VersionConflict(decision_id, decision)
+        if status != MERGE_OK:
+            raise ValueError("Stored decision is not a JSON object")
 
     def resolve_conflict(self, dec_a: dict, dec_b: dict, alpha: float = 0.7, beta: float = 0.3) -> dict:
+        # Near-identical decisions (the same thing written twice): higher priority, then recency, wins
+        score = self.similarity.similarity(text_of(dec_a, ["summary", "rationale"]), text_of(dec_b, ["summary", "rationale"]))
+        winner = similar_winner(dec_a, dec_b, score)
+        if winner is not None:
+            return winner
         time_score = alpha * (dec_a.get('timestamp', 0) - dec_b.get('timestamp', 0))
         priority_score = beta * (dec_a.get('priority', 1) - dec_b.get('priority', 1))
         return dec_a if (time_score + priority_score) >= 0 else dec_b
 
+    def resolve_conflicts(self, pairs: List[Tuple[dict, dict]]) -> List[dict]:
+        """
+        Resolve many decision pairs with the rules of resolve_conflict in one vectorized pass (one
+        batched similarity product). Returns per pair the winner ("a"/"b"), the resolved decision and the decision path.
+        """
+        return resolve_pairs(pairs, CONFLICT_POLICY, self.similarity)
+
     async def async_batch_update_decisions(self, updates: list, batch_size: int = 50) -> list:
-        if self.circuit_open:
-            raise Exception("Redis circuit breaker open")
+        # One server-side merge (EVALSHA) per batch instead of an awaited HGET per item
         updated_ids = []
         for i in range(0, len(updates), batch_size):
-            batch = updates[i:i+batch_size]
-            pipe = self.aredis.pipeline()
-            for upd in batch:
-                decision_id = upd['id']
-                raw = await self.aredis.hget(self.decision_registry, decision_id)
-                if raw:
-                    decision = json.loads(raw)
-                    decision.update(upd)
-                    pipe.hset(self.decision_registry, decision_id, json.dumps(decision))
-                    updated_ids.append(decision_id)
-            await pipe.execute()
-        self.failure_count = 0
+            items = []
+            for upd in updates[i:i+batch_size]:
+                fields = dict(upd)
+                expected_version = fields.pop('version', None)
+                items.append((upd['id'], fields, expected_version))
+            results = await self.resilience.call(lambda: self.merger.merge(self.aredis, items))
+            updated_ids.extend(item[0] for item, (status, _) in zip(items, results) if status == MERGE_OK)
         return updated_ids
+
+    # --- Synchronous compatibility wrappers (not for use inside async handlers) ---
+
+    def _bridged(self) -> "TAStateManager":
+        """
+        Twin of this manager for the sync wrappers, with a client and resilience policy used only on the
+        bridge loop (see sync_bridge.py).
+        """
+        if self._bridge is None:
+            client = get_bridge_redis(self._redis_url)
+            self._bridge = bridge_twin(
+                self,
+                redis=client, aredis=client,
+                resilience=resilience_policy("ta_redis_sync", env_prefix="TA_AGENT_REDIS", fail_max=5, reset_timeout=5, initial_limit=self._max_concurrent),
+            )
+        return self._bridge
+
+    def create_decision(self, decision: dict) -> str:
+        return run_sync(self._bridged().async_create_decision(decision))
+
+    def get_decision(self, decision_id: str) -> dict:
+        return run_sync(self._bridged().async_get_decision(decision_id))
+
+    def list_decisions(self) -> list:
+        return run_sync(self._bridged().async_list_decisions())
+
+    def update_decision(self, decision_id: str, updates: dict) -> None:
+        run_sync(self._bridged().async_update_decision(decision_id, updates))
@@ -1,11 +1,14 @@
-from fastapi_limiter import FastAPILimiter
 from fastapi import FastAPI
-import redis.asyncio as redis
 import os
+from redis_pool import get_async_redis
+from rate_limiter import rate_limiter, start_rate_limiter, stop_rate_limiter
 
 REDIS_URL = os.getenv("TA_AGENT_REDIS_URL", "redis://localhost:6379/0")
 
 async def setup_rate_limiter(app: FastAPI):
-    redis_conn = await redis.from_url(REDIS_URL, encoding="utf8", decode_responses=True)
-    await FastAPILimiter.init(redis_conn)
-    app.state.rate_limiter = FastAPILimiter
+    # Buckets live in process memory; this only starts their batched reconciliation with Redis (rate_limiter.py)
+    start_rate_limiter(get_async_redis(REDIS_URL))
+    app.state.rate_limiter = rate_limiter()
+
+async def shutdown_rate_limiter(app: FastAPI):
+    await stop_rate_limiter()
@@ -1,9 +1,16 @@
-from fastapi import Depends, HTTPException
+from fastapi import Depends, Request
 from fastapi.security import HTTPBearer
+from auth_service import AuthService
 
 security = HTTPBearer()
+# Shared JWT verification with a cache of verified tokens and key rotation (see auth_service.py)
+auth_service = AuthService.from_env("TA")
 
-async def validate_jwt(token = Depends(security)):
-    # Simplified validation logic
-    if not token.credentials.startswith("valid_jwt"):
-        raise HTTPException(status_code=403, detail="Invalid credentials")
+async def validate_jwt(request: Request, token = Depends(security)):
+    """
+    FastAPI dependency for JWT validation using AuthService.
+    The verified claims are kept on the request: rate limits key on their subject.
+    """
+    claims = auth_service.validate_token(token.credentials)
+    request.state.auth_claims = claims
+    return claims
@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from fastapi import FastAPI
 from ta_agent.api import ta_router
+from ta_agent.security import auth_service
 import pytest
 import asyncio
 import httpx
@@ -19,8 +20,8 @@ async def async_client():
         yield ac
 
 def get_jwt():
-    # Dummy JWT for testing; replace with real signing if needed
-    return "Bearer test.jwt.token"
+    # Signed with the TA agent's current key (see auth_service.py)
+    return f"Bearer {auth_service.issue({'sub': 'ta-test'})}"
 
 def test_decision_proposal():
     response = client.post("/ta/propose_decision", json={
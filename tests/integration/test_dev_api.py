@@ -8,7 +8,7 @@ import pytest
 def patch_rate_limiter(monkeypatch):
     from dev_agent import rate_limit
     def test_rate_limiter():
-        from fastapi_limiter.depends import RateLimiter
+        from rate_limiter import RateLimiter
         return RateLimiter(times=1000, seconds=60)
     monkeypatch.setattr(rate_limit, "default_rate_limiter", test_rate_limiter)
 
@@ -18,7 +18,7 @@ from fastapi.testclient import TestClient
 from fastapi import FastAPI
 from dev_agent.api import dev_router
 from tests.integration.jwt_test_util import make_test_jwt
-from fastapi_limiter import FastAPILimiter
+from rate_limiter import start_rate_limiter
 from tests.integration.redis_test_util import get_redis
 import asyncio
 
@@ -39,7 +39,7 @@ def client(event_loop):
     redis = get_redis()
     @app.on_event("startup")
     async def startup():
-        await FastAPILimiter.init(redis)
+        start_rate_limiter(redis)
     with TestClient(app) as c:
         yield c
 
@@ -47,7 +47,7 @@ def client(event_loop):
 def patch_rate_limiter(monkeypatch):
     from dev_agent import rate_limit
     def test_rate_limiter():
-        from fastapi_limiter.depends import RateLimiter
+        from rate_limiter import RateLimiter
         return RateLimiter(times=1000, seconds=60)
     monkeypatch.setattr(rate_limit, "default_rate_limiter", test_rate_limiter)
 
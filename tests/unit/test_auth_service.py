@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from fastapi import HTTPException
+from jose import jwt
+from auth_service import AuthService, key_id
+
+
+def test_verified_claims_are_cached_until_exp():
+    service = AuthService("secret-a", cache_size=10)
+    token = service.issue({"sub": "svc", "exp": int(time.time()) + 60})
+    with patch("auth_service.jwt.decode", wraps=jwt.decode) as decode:
+        assert service.validate_token(token)["sub"] == "svc"
+        assert service.validate_token(token)["sub"] == "svc"
+        assert decode.call_count == 1
+    with patch("auth_service.time.time", return_value=time.time() + 120):
+        with pytest.raises(HTTPException) as exc:
+            service.validate_token(token)
+    assert exc.value.status_code == 401
+
+
+def test_invalid_and_expired_tokens():
+    service = AuthService("secret-a")
+    with pytest.raises(HTTPException) as exc:
+        service.validate_token("not.a.jwt")
+    assert exc.value.status_code == 403
+    with pytest.raises(HTTPException) as exc:
+        service.validate_token(AuthService("other").issue({"sub": "x"}))
+    assert exc.value.status_code == 403
+    with pytest.raises(HTTPException) as exc:
+        service.validate_token(service.issue({"sub": "x", "exp": int(time.time()) - 10}))
+    assert exc.value.status_code == 401
+
+
+def test_cache_is_bounded():
+    service = AuthService("secret-a", cache_size=2)
+    tokens = [service.issue({"sub": str(n)}) for n in range(3)]
+    for token in tokens:
+        service.validate_token(token)
+    assert len(service._cache) == 2
+
+
+def test_rotation_accepts_previous_keys_until_retired():
+    service = AuthService("old", previous_secrets=["older"])
+    legacy = jwt.encode({"sub": "legacy"}, "older", algorithm="HS256")
+    old = service.issue({"sub": "old"})
+    assert service.validate_token(legacy)["sub"] == "legacy"
+    new_kid = service.rotate("new")
+    assert service.current_kid == new_kid
+    assert jwt.get_unverified_header(service.issue({"sub": "n"}))["kid"] == new_kid
+    assert service.validate_token(old)["sub"] == "old"
+    assert service.retire(key_id("old")) == 1
+    with pytest.raises(HTTPException):
+        service.validate_token(old)
+    assert service.validate_token(legacy)["sub"] == "legacy"
+    with pytest.raises(ValueError):
+        service.retire(new_kid)
+
+
+def test_from_env_prefers_the_agent_secret(monkeypatch):
+    monkeypatch.setenv("AGENT_JWT_SECRET", "shared")
+    monkeypatch.setenv("QA_AGENT_JWT_SECRET", "qa")
+    monkeypatch.setenv("AGENT_JWT_PREVIOUS_SECRETS", "a, b")
+    assert list(AuthService.from_env("QA").keys.values()) == ["qa", "a", "b"]
+    assert list(AuthService.from_env("PM").keys.values()) == ["shared", "a", "b"]
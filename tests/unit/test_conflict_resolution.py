@@ -0,0 +1,49 @@
+import sys
+import os
+import random
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from conflict_resolution import ConflictPolicy, resolve_pairs
+from similarity import SimilarityService, similar_winner, text_of
+
+TEXTS = ["fix login page oauth redirect", "oauth login redirect fix", "export billing invoices", "billing dashboard", ""]
+
+
+def _single(a, b, service, alpha=0.7, beta=0.3):
+    # The per-pair rules of the TA/QA/UX resolve_conflict
+    winner = similar_winner(a, b, service.similarity(text_of(a, ["description"]), text_of(b, ["description"])))
+    if winner is not None:
+        return winner
+    return a if alpha * (a.get('timestamp', 0) - b.get('timestamp', 0)) + beta * (a.get('priority', 1) - b.get('priority', 1)) >= 0 else b
+
+
+def test_pair_similarities_match_pairwise_similarity():
+    service = SimilarityService("test")
+    texts_a, texts_b = TEXTS, list(reversed(TEXTS))
+    batch = service.pair_similarities(texts_a, texts_b)
+    assert list(batch) == pytest.approx([service.similarity(a, b) for a, b in zip(texts_a, texts_b)])
+    assert service.pair_similarities([], []).shape == (0,)
+
+
+def test_batch_matches_single_pair_resolution():
+    service = SimilarityService("test")
+    rng = random.Random(3)
+    records = [{"id": str(i), "description": rng.choice(TEXTS), "priority": rng.randint(1, 3), "timestamp": rng.randint(0, 5)} for i in range(60)]
+    pairs = [(records[i], records[i + 30]) for i in range(30)]
+    results = resolve_pairs(pairs, ConflictPolicy(["description"]), service)
+    assert [r["resolved"] for r in results] == [_single(a, b, service) for a, b in pairs]
+    assert {r["path"] for r in results} <= {"similar_priority", "similar_recency", "score"}
+
+
+def test_decision_paths():
+    service = SimilarityService("test")
+    policy = ConflictPolicy(["description"], time_weight=0.5, priority_weight=0.3, dependency_weight=0.2, prefer_completed=True)
+    done = {"description": "billing dashboard", "status": "completed", "timestamp": 1}
+    same_a = {"description": "fix login page oauth redirect", "priority": 1, "timestamp": 5}
+    same_b = {"description": "fix login page oauth redirect", "priority": 2, "timestamp": 1}
+    other = {"description": "export billing invoices", "timestamp": 1, "dependencies": ["x", "y"]}
+    results = resolve_pairs([(same_a, done), (same_a, same_b), (same_a, dict(same_b, priority=1)), (same_a, other)], policy, service)
+    assert [(r["winner"], r["path"]) for r in results] == [("b", "completed"), ("b", "similar_priority"), ("a", "similar_recency"), ("a", "score")]
+    assert results[0]["score"] is None and results[3]["score"] == pytest.approx(0.5 * 4 - 0.2 * 2)
+    assert resolve_pairs([], policy, service) == []
@@ -0,0 +1,50 @@
+import sys
+import os
+import asyncio
+import threading
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from cpu_executor import CpuExecutor, ExecutorBusy, ExecutorTimeout
+from tfidf_index import analyze_texts
+
+
+@pytest.mark.asyncio
+async def test_calls_run_off_the_event_loop():
+    executor = CpuExecutor("test", workers=2)
+    try:
+        assert await executor.run_local(threading.get_ident) != threading.get_ident()
+        assert await executor.run(sorted, [3, 1, 2], reverse=True) == [3, 2, 1]
+        assert executor.depth == 0
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_and_timeouts_release_on_completion():
+    executor = CpuExecutor("test", workers=1, max_queue=0, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(ExecutorTimeout):
+            await executor.run_local(release.wait, 5)
+        # The timed-out call still occupies the only worker slot
+        with pytest.raises(ExecutorBusy):
+            await executor.run_local(len, [])
+        release.set()
+        for _ in range(100):
+            if executor.depth == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert await executor.run_local(len, [1]) == 1
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_process_pool_runs_pure_functions():
+    executor = CpuExecutor("test", kind="process", workers=1, timeout=30)
+    try:
+        assert await executor.run(analyze_texts, ["fix the login bug"]) == [{"fix": 1, "login": 1, "bug": 1}]
+    finally:
+        executor.shutdown()
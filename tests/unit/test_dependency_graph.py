@@ -0,0 +1,76 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from redis.exceptions import NoScriptError
+from dependency_graph import DependencyGraph, DependencyCycle, UPDATE_GRAPH_SHA, REMOVE_NODES_SHA, node_state
+
+
+def test_node_state():
+    assert node_state("pending") == "pending"
+    assert node_state("completed") == node_state("archived") == "done"
+    assert node_state("in_progress") == node_state("blocked") == node_state(None) == "active"
+
+
+@pytest.mark.asyncio
+async def test_put_many_args_and_cycles():
+    conn = AsyncMock()
+    conn.evalsha.return_value = [[], ["b", "a", "b"]]
+    graph = DependencyGraph("dev:tasks")
+    cycles = await graph.put_many(conn, [
+        ("a", {"status": "completed", "priority": 3, "dependencies": ["x", "y", "x"]}),
+        ("b", {"status": "pending", "priority": None, "dependencies": ["a"]}),
+    ])
+    assert cycles == [None, ["b", "a", "b"]]
+    assert conn.evalsha.await_args.args == (
+        UPDATE_GRAPH_SHA, 1, "dev:tasks:graph:",
+        "put", 2,
+        "a", "done", 3, 2, "x", "y",
+        "b", "pending", 1, 1, "a",
+    )
+
+
+@pytest.mark.asyncio
+async def test_put_raises_on_cycle_and_check_writes_nothing():
+    conn = AsyncMock()
+    conn.evalsha.return_value = [["a", "a"]]
+    graph = DependencyGraph("pm:tasks")
+    with pytest.raises(DependencyCycle) as exc:
+        await graph.put(conn, "a", {"status": "pending", "dependencies": ["a"]})
+    assert exc.value.path == ["a", "a"]
+    conn.evalsha.return_value = [[]]
+    assert await graph.check(conn, [("a", ["b"])]) == [None]
+    assert conn.evalsha.await_args.args[3:] == ("check", 1, "a", "", 0, 1, "b")
+
+
+@pytest.mark.asyncio
+async def test_script_loaded_on_noscript_and_ready_query():
+    conn = AsyncMock()
+    conn.evalsha.side_effect = [NoScriptError("NOSCRIPT"), 1]
+    graph = DependencyGraph("dev:tasks")
+    assert await graph.remove(conn, ["a"]) == 1
+    conn.script_load.assert_awaited_once()
+    assert conn.evalsha.await_args.args[:4] == (REMOVE_NODES_SHA, 1, "dev:tasks:graph:", "a")
+    conn.zrevrange.return_value = ["c", "b"]
+    assert await graph.ready(conn, limit=2) == ["c", "b"]
+    conn.zrevrange.assert_awaited_once_with("dev:tasks:graph:ready", 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_link_claims_edges_and_revert_follows_the_stored_record():
+    conn = AsyncMock()
+    conn.evalsha.return_value = [[]]
+    graph = DependencyGraph("dev:tasks")
+    assert await graph.link(conn, [("a", ["b", "b"])]) == [None]
+    assert conn.evalsha.await_args.args[3:] == ("link", 1, "a", "", 0, 1, "b")
+    await graph.put(conn, "a", {"status": "completed", "dependencies": ["b"]}, edges=False)
+    assert conn.evalsha.await_args.args[3:5] == ("state", 1)
+    conn.evalsha.reset_mock()
+    conn.evalsha.side_effect = [1, [[]]]
+    await graph.revert(conn, [("a", None), ("c", {"status": "pending", "dependencies": []})])
+    assert [call.args[3:] for call in conn.evalsha.await_args_list] == [
+        ("a",),
+        ("put", 1, "c", "pending", 1, 0),
+    ]
@@ -0,0 +1,51 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from near_duplicates import BANDS, DuplicateIndex, minhash, similarity
+
+
+def test_signatures_are_stable_and_estimate_similarity():
+    a = minhash("Implement OAuth login flow for the admin dashboard")
+    assert (a == minhash("implement  oauth LOGIN flow for the admin dashboard")).all()
+    assert similarity(a, minhash("Implement OAuth login flow for the admin dashboard!")) > 0.9
+    assert similarity(a, minhash("Export monthly billing invoices as CSV")) < 0.2
+    assert minhash("   ") is None
+
+
+@pytest.mark.asyncio
+async def test_find_scores_only_bucket_candidates():
+    index = DuplicateIndex("dev:tasks", threshold=0.7)
+    text = "Implement OAuth login flow for the admin dashboard"
+    queued = MagicMock()
+    index.queue_add(queued, "devtask_1", text)
+    stored = queued.hset.call_args[0][2]
+    assert queued.sadd.call_count == BANDS
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[{"devtask_1"}] + [set()] * (BANDS - 1))
+    conn = MagicMock()
+    conn.pipeline.return_value = pipe
+    conn.hmget = AsyncMock(return_value=[stored])
+    assert await index.find(conn, text + "!") == [("devtask_1", pytest.approx(1.0, abs=0.1))]
+    conn.hmget.assert_awaited_once_with("dev:tasks:minhash", ["devtask_1"])
+    assert await index.find(conn, text, exclude=["devtask_1"]) == []
+
+
+@pytest.mark.asyncio
+async def test_remove_many_clears_buckets_in_one_pipeline():
+    index = DuplicateIndex("dev:tasks")
+    queued = MagicMock()
+    index.queue_add(queued, "devtask_1", "Implement OAuth login flow for the admin dashboard")
+    stored = queued.hset.call_args[0][2]
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    conn = MagicMock()
+    conn.pipeline.return_value = pipe
+    conn.hmget = AsyncMock(return_value=[stored, None])
+    await index.remove_many(conn, ["devtask_1", "devtask_2"])
+    conn.hmget.assert_awaited_once_with("dev:tasks:minhash", ["devtask_1", "devtask_2"])
+    assert pipe.srem.call_count == BANDS
+    assert pipe.hdel.call_count == 2
+    pipe.execute.assert_awaited_once()
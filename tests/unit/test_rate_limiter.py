@@ -0,0 +1,98 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+from rate_limiter import HybridRateLimiter, Limit, RateLimiter, SYNC_BUCKETS_SHA
+
+
+def test_burst_and_sustained_limits_both_apply():
+    limiter = HybridRateLimiter(max_keys=100)
+    limits = [Limit(5, 60), Limit(3, 1)]
+    assert [limiter.acquire("alice", "GET /x", limits, now=0) for _ in range(3)] == [0, 0, 0]
+    # The burst limit refuses the fourth request for a third of a second
+    assert limiter.acquire("alice", "GET /x", limits, now=0) == pytest.approx(1 / 3)
+    assert limiter.acquire("bob", "GET /x", limits, now=0) == 0
+    assert limiter.acquire("alice", "GET /y", limits, now=0) == 0
+    # A second later the burst bucket is full again but the sustained one only has two tokens
+    assert [limiter.acquire("alice", "GET /x", limits, now=1) for _ in range(2)] == [0, 0]
+    assert limiter.acquire("alice", "GET /x", limits, now=1) == pytest.approx((1 - 1 / 12) * 12)
+
+
+def test_bucket_count_is_bounded():
+    limiter = HybridRateLimiter(max_keys=2)
+    for user in ("a", "b", "c"):
+        limiter.acquire(user, "GET /x", [Limit(1, 60)], now=0)
+    assert limiter.acquire("a", "GET /x", [Limit(1, 60)], now=0) == 0
+
+
+@pytest.mark.asyncio
+async def test_sync_pushes_consumption_and_pulls_global_budget():
+    limiter = HybridRateLimiter()
+    limit = Limit(10, 60)
+    for _ in range(2):
+        limiter.acquire("alice", "GET /x", [limit])
+    conn = AsyncMock()
+    conn.evalsha.return_value = ["1.5"]
+    assert await limiter.sync(conn) == 1
+    args = conn.evalsha.await_args.args
+    assert args[:3] == (SYNC_BUCKETS_SHA, 1, "ratelimit:")
+    assert args[4:] == (1, "GET /x:alice:10/60s", 10, limit.rate, 2)
+    # Other workers used most of the shared budget: one token left here
+    assert limiter.acquire("alice", "GET /x", [limit]) == 0
+    assert limiter.acquire("alice", "GET /x", [limit]) > 0
+    conn.evalsha.reset_mock()
+    assert await limiter.sync(conn) == 1
+    assert conn.evalsha.await_args.args[-1] == 1
+    assert await limiter.sync(conn) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_sync_keeps_consumption():
+    limiter = HybridRateLimiter()
+    limiter.acquire("alice", "GET /x", [Limit(10, 60)])
+    conn = AsyncMock()
+    conn.evalsha.side_effect = ConnectionError("down")
+    with pytest.raises(ConnectionError):
+        await limiter.sync(conn)
+    conn.evalsha.side_effect = None
+    conn.evalsha.return_value = ["9"]
+    await limiter.sync(conn)
+    assert conn.evalsha.await_args.args[-1] == 1
+
+
+def test_dependency_returns_429_with_retry_after():
+    app = FastAPI()
+
+    async def verified(request: Request):
+        # Stands in for an agent's validate_jwt
+        request.state.auth_claims = {"sub": request.headers["X-Test-Subject"]}
+
+    @app.get("/items/{item_id}", dependencies=[Depends(verified), Depends(RateLimiter(times=2, seconds=60))])
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    headers = {"X-Test-Subject": "rate-limit-test"}
+    assert [client.get(f"/items/{n}", headers=headers).status_code for n in range(3)] == [200, 200, 429]
+    response = client.get("/items/9", headers=headers)
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+    assert client.get("/items/1", headers={"X-Test-Subject": "someone-else"}).status_code == 200
+
+
+def test_unverified_requests_are_limited_by_address_whatever_their_headers():
+    app = FastAPI()
+
+    @app.get("/open", dependencies=[Depends(RateLimiter(times=2, seconds=60))])
+    async def open_route():
+        return {}
+
+    client = TestClient(app)
+    statuses = [
+        client.get("/open", headers={"Authorization": f"Bearer forged-{n}", "X-Forwarded-For": f"10.0.0.{n}"}).status_code
+        for n in range(3)
+    ]
+    assert statuses == [200, 200, 429]
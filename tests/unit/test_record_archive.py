@@ -0,0 +1,60 @@
+import sys
+import os
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from record_archive import RecordArchive, record_age
+from record_codec import FORMAT_ZSTD, RecordCodec, to_bytes
+
+
+def test_record_age_prefers_updated_at():
+    now = time.time()
+    assert record_age({"updated_at": "2020-01-01T00:00:00", "timestamp": now}, now) > 3600
+    assert record_age({"timestamp": now - 60}, now) == pytest.approx(60)
+    assert record_age({"updated_at": "not a date"}) is None
+
+
+@pytest.mark.asyncio
+async def test_archive_round_trip_is_compressed():
+    archive = RecordArchive("dev:tasks", codec=RecordCodec(compress_threshold=1))
+    pipe = MagicMock()
+    archive.queue_put(pipe, "devtask_1", {"status": "completed", "description": "x" * 200})
+    key, record_id, raw = pipe.hset.call_args[0]
+    assert (key, record_id) == ("dev:tasks:archive", "devtask_1")
+    assert to_bytes(raw)[0] == FORMAT_ZSTD
+    conn = AsyncMock()
+    conn.hget.return_value = raw
+    assert await archive.get(conn, "devtask_1", ["status"]) == {"status": "completed"}
+    conn.hget.return_value = None
+    assert await archive.get(conn, "devtask_2") is None
+
+
+@pytest.mark.asyncio
+async def test_blob_move_sends_each_record_with_its_bytes_for_compare_and_set():
+    from record_codec import encode_record
+    from record_store import BlobLayout
+    from record_archive import ARCHIVE_RECORDS_SHA
+    archive = RecordArchive("dev:tasks", codec=RecordCodec(compress_threshold=10 ** 6))
+    store = BlobLayout("dev:tasks", cache=AsyncMock())
+    old = {"status": "completed", "timestamp": 0}
+    conn = AsyncMock()
+    conn.hmget.return_value = [encode_record(old).decode(), encode_record({"status": "pending"}).decode(), None]
+    # devtask_1 is cold, devtask_2 is not, devtask_3 is gone; the script reports what it moved
+    conn.evalsha.return_value = ["devtask_1"]
+
+    def unindex(pipe, record_id, record):
+        pipe.srem(f"dev:tasks:status:{record['status']}", record_id)
+        pipe.zrem("dev:tasks:priority", record_id)
+
+    moved = await archive.move(conn, store, ["devtask_1", "devtask_2", "devtask_3"], lambda r: r["status"] == "completed", unindex)
+    assert moved == ["devtask_1"]
+    args = conn.evalsha.await_args.args
+    assert args[:5] == (ARCHIVE_RECORDS_SHA, 3, "dev:tasks", "dev:tasks:archive", "dev:tasks:archive:at")
+    assert args[6:] == (
+        1, "devtask_1", to_bytes(encode_record(old)), archive.codec.encode(old),
+        2, "SREM", "dev:tasks:status:completed", "ZREM", "dev:tasks:priority",
+    )
+    conn.watch.assert_not_called()
+    store.cache.publish_invalidation.assert_awaited_once_with(conn, ["devtask_1"])
@@ -0,0 +1,96 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from record_cache import INVALIDATION_CHANNEL, RecordCache, _handlers, apply_invalidation, cache_for, on_invalidation
+from record_codec import encode_record
+from record_store import BlobLayout
+
+
+def test_cache_serves_projections_of_complete_records():
+    cache = RecordCache("test:records", max_entries=10, ttl=60)
+    cache.put("r1", {"status": "pending", "priority": 2}, cache.generation)
+    assert cache.get("r1") == {"status": "pending", "priority": 2}
+    assert cache.get("r1", ["status"]) == {"status": "pending"}
+    # Hits are copies
+    cache.get("r1")["status"] = "changed"
+    assert cache.get("r1", ["status"]) == {"status": "pending"}
+
+
+def test_partial_entries_only_answer_their_fields():
+    cache = RecordCache("test:records", max_entries=10, ttl=60)
+    cache.put("r1", {"status": "pending"}, cache.generation, ["status"])
+    assert cache.get("r1", ["status"]) == {"status": "pending"}
+    assert cache.get("r1", ["status", "priority"]) is None
+    assert cache.get("r1") is None
+
+
+def test_lru_eviction_and_ttl():
+    cache = RecordCache("test:records", max_entries=2, ttl=60)
+    for record_id in ("r1", "r2"):
+        cache.put(record_id, {"id": record_id}, cache.generation)
+    cache.get("r1")
+    cache.put("r3", {"id": "r3"}, cache.generation)
+    assert cache.get("r2") is None
+    assert cache.get("r1") == {"id": "r1"}
+    cache.ttl = 0
+    cache.put("r4", {"id": "r4"}, cache.generation)
+    assert cache.get("r4") is None
+
+
+def test_stale_read_is_not_cached_after_invalidation():
+    cache = RecordCache("test:records", max_entries=10, ttl=60)
+    generation = cache.generation
+    cache.invalidate(["r1"])
+    cache.put("r1", {"status": "old"}, generation)
+    assert cache.get("r1") is None
+
+
+def test_remote_invalidation_message():
+    cache = cache_for("test:remote")
+    cache.put("r1", {"status": "pending"}, cache.generation)
+    apply_invalidation(cache.message(["r1"]))
+    assert cache.get("r1") is None
+    apply_invalidation("not json")
+
+
+def test_invalidation_handlers_see_every_message():
+    seen = []
+    on_invalidation(lambda registry, ids: seen.append((registry, ids)))
+    try:
+        apply_invalidation(RecordCache("test:handled").message(["r1", "r2"]))
+        apply_invalidation("not json")
+    finally:
+        _handlers.pop()
+    assert seen == [("test:handled", ["r1", "r2"])]
+
+
+@pytest.mark.asyncio
+async def test_layout_reads_through_and_writes_invalidate():
+    conn = AsyncMock()
+    conn.hget.return_value = encode_record({"status": "pending", "priority": 1})
+    layout = BlobLayout("test:layout", cache=RecordCache("test:layout", ttl=60))
+    assert await layout.get(conn, "r1", ["status"]) == {"status": "pending"}
+    assert await layout.get(conn, "r1") == {"status": "pending", "priority": 1}
+    assert conn.hget.await_count == 1
+    pipe = MagicMock()
+    layout.queue_write(pipe, "r1", {"status": "done"})
+    pipe.publish.assert_called_once_with(INVALIDATION_CHANNEL, layout.cache.message(["r1"]))
+    conn.hget.return_value = encode_record({"status": "done"})
+    assert await layout.get(conn, "r1") == {"status": "done"}
+
+
+@pytest.mark.asyncio
+async def test_read_racing_a_queued_write_is_dropped_after_execute():
+    conn = AsyncMock()
+    conn.hget.return_value = encode_record({"status": "pending"})
+    layout = BlobLayout("test:race", cache=RecordCache("test:race", ttl=60))
+    layout.queue_write(MagicMock(), "r1", {"status": "done"})
+    # A read between queueing the write and executing it caches the old value...
+    assert await layout.get(conn, "r1") == {"status": "pending"}
+    # ...until the caller invalidates again once the pipeline executed
+    layout.invalidate(["r1"])
+    conn.hget.return_value = encode_record({"status": "done"})
+    assert await layout.get(conn, "r1") == {"status": "done"}
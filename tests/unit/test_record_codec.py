@@ -0,0 +1,42 @@
+import sys
+import os
+import json
+from datetime import datetime
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from record_codec import RecordCodec, FORMAT_JSON, FORMAT_MSGPACK, FORMAT_ZSTD, msgpack, zstandard
+
+
+def test_json_roundtrip_with_prefix_and_datetimes():
+    codec = RecordCodec("json", compress_threshold=0)
+    encoded = codec.encode({"title": "t", "tags": [], "created_at": datetime(2024, 1, 1)})
+    assert encoded[0] == FORMAT_JSON
+    assert codec.decode(encoded) == {"title": "t", "tags": [], "created_at": "2024-01-01T00:00:00"}
+
+
+def test_decodes_legacy_json_and_surrogate_escaped_strings():
+    codec = RecordCodec("json", compress_threshold=0)
+    assert codec.decode(json.dumps({"status": "todo"})) == {"status": "todo"}
+    assert codec.decode(None) is None
+    raw = codec.encode({"status": "todo"}).decode("utf-8", "surrogateescape")
+    assert codec.decode(raw) == {"status": "todo"}
+
+
+@pytest.mark.skipif(msgpack is None, reason="msgpack not installed")
+def test_msgpack_roundtrip():
+    codec = RecordCodec("msgpack", compress_threshold=0)
+    encoded = codec.encode({"status": "todo", "priority": 2})
+    assert encoded[0] == FORMAT_MSGPACK
+    assert codec.decode(encoded) == {"status": "todo", "priority": 2}
+
+
+@pytest.mark.skipif(zstandard is None, reason="zstandard not installed")
+def test_large_records_are_compressed():
+    codec = RecordCodec("json", compress_threshold=64)
+    record = {"context": "x" * 1000}
+    encoded = codec.encode(record)
+    assert encoded[0] == FORMAT_ZSTD
+    assert len(encoded) < 1000
+    assert codec.decode(encoded.decode("utf-8", "surrogateescape")) == record
+    assert codec.encode({"a": 1})[0] == FORMAT_JSON
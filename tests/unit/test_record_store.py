@@ -0,0 +1,47 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from record_codec import encode_record
+from record_store import BlobLayout, FieldHashLayout, parse_fields, record_layout
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields(" , ") is None
+    assert parse_fields("status, priority") == ["status", "priority"]
+
+
+def test_record_layout_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_RECORD_LAYOUT", "hash")
+    layout = record_layout("dev:tasks", "dev:task:")
+    assert isinstance(layout, FieldHashLayout)
+    assert layout.key("devtask_1") == "dev:task:devtask_1"
+    assert layout.merger().key_prefix == "dev:task:"
+    monkeypatch.setenv("AGENT_RECORD_LAYOUT", "blob")
+    assert isinstance(record_layout("dev:tasks", "dev:task:"), BlobLayout)
+
+
+@pytest.mark.asyncio
+async def test_hash_layout_projection_is_an_hmget():
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[1, ['"blocked"', None], 0, [None, None]])
+    conn = MagicMock()
+    conn.pipeline.return_value = pipe
+    layout = FieldHashLayout("dev:tasks", "dev:task:")
+    records = await layout._read(conn, ["devtask_1", "devtask_2"], ["status", "priority"])
+    assert records == [{"status": "blocked"}, None]
+    pipe.hmget.assert_any_call("dev:task:devtask_1", ["status", "priority"])
+    pipe.hgetall.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_blob_layout_projects_after_decoding():
+    conn = AsyncMock()
+    conn.hget.return_value = encode_record({"status": "pending", "context": {"big": "x" * 100}})
+    layout = BlobLayout("dev:tasks")
+    assert await layout.get(conn, "devtask_1", ["status"]) == {"status": "pending"}
+    conn.hget.return_value = None
+    assert await layout.get(conn, "devtask_2", ["status"]) is None
@@ -0,0 +1,49 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from redis.exceptions import NoScriptError
+from redis_scripts import RecordMerger, MERGE_RECORDS_SHA, MERGE_FIELDS_SHA, MERGE_OK, MERGE_MISSING, MERGE_CONFLICT
+
+
+def test_build_args_layout():
+    merger = RecordMerger("dev:tasks", index_specs=[("status", "set", "dev:tasks:idx:status:")])
+    args = merger.build_args([("devtask_1", {"status": "blocked", "priority": 2}, 3), ("devtask_2", {}, None)])
+    assert args == [
+        1, "status", "set", "dev:tasks:idx:status:",
+        2,
+        "devtask_1", 3, 2, "status", b'"blocked"', "priority", b"2",
+        "devtask_2", "", 0,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_merge_decodes_results_in_order():
+    redis_mock = AsyncMock()
+    redis_mock.evalsha.return_value = ["ok", '{"status": "blocked", "version": 1}', "missing", None, "conflict", '{"version": 4}']
+    merger = RecordMerger("dev:tasks")
+    results = await merger.merge(redis_mock, [("a", {"status": "blocked"}, None), ("b", {}, None), ("c", {}, 2)])
+    assert results == [(MERGE_OK, {"status": "blocked", "version": 1}), (MERGE_MISSING, None), (MERGE_CONFLICT, {"version": 4})]
+    assert redis_mock.evalsha.await_args.args[:3] == (MERGE_RECORDS_SHA, 1, "dev:tasks")
+
+
+@pytest.mark.asyncio
+async def test_merge_loads_script_on_noscript():
+    redis_mock = AsyncMock()
+    redis_mock.evalsha.side_effect = [NoScriptError("NOSCRIPT"), ["ok", "{}"]]
+    merger = RecordMerger("pm:tasks")
+    results = await merger.merge(redis_mock, [("t", {"x": 1}, None)])
+    assert results == [(MERGE_OK, {})]
+    redis_mock.script_load.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_hash_layout_merge_uses_field_script():
+    redis_mock = AsyncMock()
+    redis_mock.evalsha.return_value = ["ok", ["status", '"blocked"', "version", "2"], "missing", None]
+    merger = RecordMerger("dev:tasks", key_prefix="dev:task:")
+    results = await merger.merge(redis_mock, [("a", {"status": "blocked"}, 1), ("b", {}, None)])
+    assert results == [(MERGE_OK, {"status": "blocked", "version": 2}), (MERGE_MISSING, None)]
+    assert redis_mock.evalsha.await_args.args[:3] == (MERGE_FIELDS_SHA, 1, "dev:task:")
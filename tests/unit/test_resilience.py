@@ -0,0 +1,122 @@
+import sys
+import os
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from redis.exceptions import ConnectionError as RedisConnectionError
+from resilience import (
+    AdaptiveLimit, CircuitBreaker, CircuitOpen, LimitExceeded, ResiliencePolicy, RetryBudget, RetryPolicy,
+)
+
+
+class Conflict(Exception):
+    pass
+
+
+def make_policy(name, fail_max=2, reset_timeout=30, attempts=3, budget=None, limit=None):
+    return ResiliencePolicy(
+        name,
+        CircuitBreaker(name, fail_max=fail_max, reset_timeout=reset_timeout, exclude=[Conflict]),
+        limit or AdaptiveLimit(name, initial=4),
+        RetryPolicy(attempts=attempts, base_delay=0, budget=budget or RetryBudget()),
+    )
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_then_half_open_probe_closes_it():
+    policy = make_policy("t_breaker")
+    failing = AsyncMock(side_effect=RuntimeError("down"))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await policy.call(failing)
+    with pytest.raises(CircuitOpen):
+        await policy.call(failing)
+    assert failing.await_count == 2
+    with patch("resilience.time.monotonic", return_value=10 ** 9):
+        assert policy.breaker.current_state == CircuitBreaker.HALF_OPEN
+        release = asyncio.Event()
+
+        async def probe():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.create_task(policy.call(probe))
+        await asyncio.sleep(0)
+        # Only one probe at a time while half-open
+        with pytest.raises(CircuitOpen):
+            await policy.call(probe)
+        release.set()
+        assert await first == "ok"
+    assert policy.breaker.current_state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_excluded_errors_do_not_count():
+    policy = make_policy("t_exclude", fail_max=1)
+    with pytest.raises(Conflict):
+        await policy.call(AsyncMock(side_effect=Conflict()))
+    assert policy.breaker.current_state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_only_idempotent_transient_failures_are_retried_within_budget():
+    policy = make_policy("t_retry", fail_max=100)
+    flaky = AsyncMock(side_effect=[RedisConnectionError("reset"), "value"])
+    assert await policy.call(flaky, idempotent=True) == "value"
+    assert flaky.await_count == 2
+    write = AsyncMock(side_effect=RedisConnectionError("reset"))
+    with pytest.raises(RedisConnectionError):
+        await policy.call(write)
+    assert write.await_count == 1
+    bad = AsyncMock(side_effect=ValueError("bad"))
+    with pytest.raises(ValueError):
+        await policy.call(bad, idempotent=True)
+    assert bad.await_count == 1
+
+    broke = make_policy("t_budget", fail_max=100, budget=RetryBudget(ratio=0, min_per_second=0, cap=1))
+    down = AsyncMock(side_effect=RedisConnectionError("down"))
+    with pytest.raises(RedisConnectionError):
+        await broke.call(down, idempotent=True)
+    with pytest.raises(RedisConnectionError):
+        await broke.call(down, idempotent=True)
+    # One retry in the budget: 2 attempts, then 1
+    assert down.await_count == 3
+
+
+def test_limit_grows_while_used_and_backs_off_on_latency_and_drops():
+    limit = AdaptiveLimit("t_aimd", initial=4, max_limit=8, slack=0)
+    for _ in range(20):
+        limit.inflight = 4
+        limit.release(0.01)
+    assert limit.limit > 5
+    grown = limit.limit
+    limit._last_decrease = -10 ** 9
+    limit.inflight = 1
+    limit.release(1.0)
+    assert limit.limit == pytest.approx(grown * 0.9)
+    limit._last_decrease = -10 ** 9
+    limit.inflight = 1
+    limit.release(0.01, dropped=True)
+    assert limit.limit < grown * 0.9
+    # An idle limit does not grow
+    idle = AdaptiveLimit("t_idle", initial=10)
+    for _ in range(20):
+        idle.inflight = 1
+        idle.release(0.01)
+    assert idle.limit == 10
+
+
+@pytest.mark.asyncio
+async def test_calls_beyond_the_limit_wait_then_fail():
+    limit = AdaptiveLimit("t_wait", initial=1, max_limit=1, max_wait=0.05)
+    await limit.acquire()
+    waiter = asyncio.create_task(limit.acquire())
+    await asyncio.sleep(0)
+    limit.release(0.001)
+    await waiter
+    assert limit.inflight == 1
+    with pytest.raises(LimitExceeded):
+        await limit.acquire()
+    assert limit.inflight == 1 and not limit._waiters
@@ -0,0 +1,101 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from cpu_executor import CpuExecutor
+from semantic_index import SemanticIndex, Source, related_ids
+
+
+class FakeStore:
+    def __init__(self, registry, records):
+        self.registry = registry
+        self.cache = None
+        self.records = records
+        self.scans = 0
+        self.counts = 0
+
+    async def count(self, conn):
+        self.counts += 1
+        return len(self.records)
+
+    async def get_mapping(self, conn, record_ids, fields=None):
+        return {record_id: self.records[record_id] for record_id in record_ids if record_id in self.records}
+
+    async def iter_items(self, conn, fields=None):
+        self.scans += 1
+        for record_id, record in list(self.records.items()):
+            yield record_id, record
+
+
+def make_index(**records):
+    sources = {name: Source(name, FakeStore(f"{name}:records", records.get(name, {})), ["description"]) for name in ("pm", "dev", "ta", "qa")}
+    return SemanticIndex(MagicMock(), sources=sources, executor=CpuExecutor("test", workers=1))
+
+
+@pytest.mark.asyncio
+async def test_one_query_returns_matches_per_source():
+    index = make_index(
+        dev={"devtask_1": {"description": "oauth login redirect"}},
+        ta={"decision_1": {"description": "use oauth for login"}, "decision_2": {"description": "billing database schema"}},
+        qa={"qatest_1": {"description": "billing export csv"}},
+    )
+    [matches] = await index.search(["login with oauth"], ["dev", "ta", "qa"])
+    assert [record_id for record_id, _ in matches["dev"]] == ["devtask_1"]
+    assert [record_id for record_id, _ in matches["ta"]] == ["decision_1"]
+    assert matches["qa"] == []
+    [only_ta] = await index.search(["login with oauth"], ["ta"])
+    assert list(only_ta) == ["ta"]
+    assert related_ids(matches, ["ta", "qa"], threshold=0.0) == {"ta": ["decision_1"], "qa": []}
+
+
+@pytest.mark.asyncio
+async def test_refresh_only_retokenises_changed_records():
+    index = make_index(ta={"decision_1": {"description": "use oauth for login"}})
+    await index.ensure()
+    index.executor.run = AsyncMock(side_effect=lambda fn, texts, **kwargs: fn(texts))
+    store = index.sources["ta"].store
+    store.records["decision_2"] = {"description": "billing database schema"}
+    [matches] = await index.search(["billing schema"], ["ta"])
+    assert [record_id for record_id, _ in matches["ta"]] == ["decision_2"]
+    assert index.executor.run.await_args.args[1] == ["billing database schema"]
+    del store.records["decision_1"]
+    [matches] = await index.search(["oauth login"], ["ta"])
+    assert matches["ta"] == [] and index.size("ta") == 1
+
+
+@pytest.mark.asyncio
+async def test_local_writes_are_indexed_without_a_refresh():
+    index = make_index(qa={"qatest_1": {"description": "billing export csv"}})
+    await index.ensure()
+    store = index.sources["qa"].store
+    store.records["qatest_2"] = {"description": "oauth login flow"}
+    index.index_record("qa", "qatest_2", "oauth login flow", created=True)
+    scans = store.scans
+    [matches] = await index.search(["oauth login"], ["qa"])
+    assert [record_id for record_id, _ in matches["qa"]] == ["qatest_2"]
+    assert store.scans == scans
+
+
+@pytest.mark.asyncio
+async def test_invalidated_records_are_reread_without_a_scan():
+    index = make_index(ta={"decision_1": {"description": "use oauth for login"}, "decision_2": {"description": "billing schema"}})
+    await index.ensure()
+    store = index.sources["ta"].store
+    store.cache = MagicMock()
+    scans, counts = store.scans, store.counts
+    with patch("semantic_index.invalidations_live", return_value=True):
+        # Another agent edits a record in place (the registry size does not change) and deletes one
+        store.records["decision_1"] = {"description": "kubernetes deployment rollout"}
+        del store.records["decision_2"]
+        index.note_invalidation("ta:records", ["decision_1", "decision_2"])
+        index.note_invalidation("other:records", ["decision_9"])
+        [matches] = await index.search(["kubernetes rollout"], ["ta"])
+        assert [record_id for record_id, _ in matches["ta"]] == ["decision_1"]
+        assert index.size("ta") == 1
+        assert (store.scans, store.counts) == (scans, counts)
+        # Missed messages: every source is reloaded on its next query
+        index.note_invalidation(None, None)
+        await index.search(["kubernetes rollout"], ["ta"])
+        assert store.scans == scans + 1
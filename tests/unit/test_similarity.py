@@ -0,0 +1,66 @@
+import sys
+import os
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from similarity import SimilarityService, similar_winner, text_of
+from tfidf_index import IncrementalTfidfIndex
+
+DOCS = [
+    "fix login page oauth redirect",
+    "export billing invoices to csv",
+    "oauth token refresh for login",
+    "dashboard for billing reports",
+]
+
+
+def test_scores_use_the_attached_corpus_idf():
+    index = IncrementalTfidfIndex()
+    index.rebuild(enumerate(DOCS))
+    service = SimilarityService("test", corpus=index)
+    vectorizer = TfidfVectorizer(stop_words="english").fit(DOCS)
+    a, b = "login oauth redirect", "oauth login refresh"
+    expected = cosine_similarity(vectorizer.transform([a]), vectorizer.transform([b]))[0, 0]
+    assert service.similarity(a, b) == pytest.approx(expected)
+
+
+
+def test_terms_unknown_to_the_corpus_are_ignored_like_transform():
+    index = IncrementalTfidfIndex()
+    index.rebuild(enumerate(DOCS))
+    service = SimilarityService("test", corpus=index)
+    a, b = "login oauth kubernetes", "oauth login helm"
+    assert set(service.vector(a)) == {"login", "oauth"}
+    expected = cosine_similarity(index.transform([a]), index.transform([b]))[0, 0]
+    assert service.similarity(a, b) == pytest.approx(expected) == pytest.approx(1.0)
+
+
+def test_vectors_are_memoized_by_content():
+    service = SimilarityService("test")
+    calls = []
+    analyzer = service.analyzer
+    service.analyzer = lambda text: calls.append(text) or analyzer(text)
+    first = service.similarity("fix the login page", "login page fix")
+    assert service.similarity("fix the login page", "login page fix") == first
+    assert calls == ["fix the login page", "login page fix"]
+    assert service.similarity("same words", "same words") == pytest.approx(1.0)
+    assert service.similarity("", "only stop words here") == 0.0
+
+
+def test_lru_is_bounded_and_evicted_texts_leave_the_corpus():
+    service = SimilarityService("test", max_entries=2)
+    for text in DOCS:
+        service.vector(text)
+    assert len(service._entries) == 2
+    assert service._df["redirect"] == 0 and service._df["billing"] == 1
+
+
+def test_similar_records_prefer_priority_then_recency():
+    a = {"id": "a", "priority": 1, "timestamp": 200}
+    b = {"id": "b", "priority": 2, "timestamp": 100}
+    assert similar_winner(a, b, 0.9) is b
+    assert similar_winner(a, dict(b, priority=1), 0.9) is a
+    assert similar_winner(a, b, 0.1) is None
+    assert text_of({"summary": "s", "rationale": None}, ["summary", "rationale"]) == "s"
@@ -0,0 +1,36 @@
+import sys
+import os
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from sync_bridge import bridge_twin, run_sync
+
+
+async def _loop_id():
+    await asyncio.sleep(0)
+    return id(asyncio.get_running_loop())
+
+
+def test_run_sync_reuses_one_loop():
+    assert run_sync(_loop_id()) == run_sync(_loop_id())
+
+
+@pytest.mark.asyncio
+async def test_run_sync_refuses_to_block_a_running_loop():
+    with pytest.raises(RuntimeError):
+        run_sync(_loop_id())
+
+
+class _Manager:
+    def __init__(self):
+        self.redis = object()
+        self.store = object()
+
+
+def test_bridge_twin_replaces_only_the_given_attributes():
+    manager = _Manager()
+    client = object()
+    twin = bridge_twin(manager, redis=client)
+    assert twin.redis is client and manager.redis is not client
+    assert twin.store is manager.store
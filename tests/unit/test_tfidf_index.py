@@ -0,0 +1,88 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from tfidf_index import IncrementalTfidfIndex, top_matches
+
+DOCS = {
+    "t1": "fix login page oauth redirect",
+    "t2": "export billing invoices to csv",
+    "t3": "oauth token refresh for login",
+    "t4": "dashboard for billing reports",
+}
+
+
+def reference(docs, query):
+    vectorizer = TfidfVectorizer(stop_words="english")
+    matrix = vectorizer.fit_transform(list(docs.values()))
+    return dict(zip(docs, cosine_similarity(vectorizer.transform([query]), matrix)[0]))
+
+
+@pytest.mark.parametrize("compact_threshold", [0, 100])
+def test_incremental_updates_match_a_full_refit(compact_threshold):
+    index = IncrementalTfidfIndex(compact_threshold=compact_threshold)
+    index.rebuild(list(DOCS.items())[:2])
+    docs = dict(DOCS)
+    for doc_id in ("t3", "t4"):
+        index.add(doc_id, docs[doc_id])
+    index.remove("t2")
+    del docs["t2"]
+    docs["t1"] = "login page styling"
+    index.add("t1", docs["t1"])
+    doc_ids, scores = index.similarities(["oauth login"])
+    expected = reference(docs, "oauth login")
+    assert sorted(doc_id for doc_id in doc_ids if doc_id is not None) == sorted(docs)
+    for doc_id, score in zip(doc_ids, scores.toarray()[0]):
+        if doc_id is None:
+            assert score == 0
+        else:
+            assert score == pytest.approx(expected[doc_id])
+
+
+def test_search_ranks_and_thresholds():
+    index = IncrementalTfidfIndex()
+    index.rebuild(DOCS.items())
+    [matches] = index.search(["oauth login"], threshold=0.1, top_k=2)
+    assert [doc_id for doc_id, _ in matches] == ["t3", "t1"] or [doc_id for doc_id, _ in matches] == ["t1", "t3"]
+    assert matches[0][1] >= matches[1][1]
+    assert index.search(["the and of"], threshold=0.1) == [[]]
+    index.add("t5", "the and of")
+    assert "t5" not in index
+
+
+def test_writes_during_a_rebuild_are_replayed():
+    index = IncrementalTfidfIndex()
+    docs = list(DOCS.items())[:2]
+
+    def write_while_rebuilding():
+        # Stands in for the event loop indexing a task while the rebuild runs in a worker
+        index.add("t3", DOCS["t3"])
+        index.remove("t1")
+        yield from docs
+
+    index.rebuild(write_while_rebuilding())
+    assert "t3" in index and "t1" not in index and "t2" in index
+    [matches] = index.search(["oauth login"])
+    assert [doc_id for doc_id, _ in matches] == ["t3"]
+
+
+def test_document_frequencies_leave_out_unknown_terms():
+    index = IncrementalTfidfIndex()
+    index.rebuild(enumerate(["oauth login", "oauth token", "billing"]))
+    assert index.document_frequencies(["oauth", "billing", "kubernetes"]) == {"oauth": 2, "billing": 1}
+
+
+def test_top_matches_partitions_sparse_rows():
+    scores = np.array([0.2, 0.9, 0.05, 0.7, 0.4])
+    assert list(top_matches(scores, 0.1, 2)) == [1, 3]
+    assert list(top_matches(scores, 0.1, None)) == [1, 3, 4, 0]
+    index = IncrementalTfidfIndex(compact_threshold=100)
+    index.rebuild(DOCS.items())
+    index.remove("t3")
+    doc_ids, scores = index.similarities(["oauth login"])
+    # The deleted row keeps its column but stores no score
+    assert [doc_ids[column] for column in scores.indices] == ["t1"]
@@ -0,0 +1,97 @@
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from memory.vector_store import VectorStore
+from prompt_engineering import ContextInjector
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.RandomState(seed).randn(n, dim).astype(np.float32)
+
+
+def _brute_force(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return [list(np.argsort(-row)[:k]) for row in queries @ vectors.T]
+
+
+def test_batched_search_matches_brute_force_across_segments(tmp_path):
+    vectors, queries = _vectors(500), _vectors(7, seed=1)
+    store = VectorStore(str(tmp_path / "dev"), dim=16, segment_rows=128)
+    store.add([f"m{i}" for i in range(500)], vectors, [{"n": i} for i in range(500)])
+    assert store.segments == 4 and len(store) == 500
+    results = store.search(queries, k=5)
+    for hits, expected in zip(results, _brute_force(vectors, queries, 5)):
+        assert [hit[0] for hit in hits] == [f"m{i}" for i in expected]
+        assert [hit[2]["n"] for hit in hits] == [int(i) for i in expected]
+        assert hits[0][1] >= hits[-1][1]
+
+
+def test_replacements_and_deletes_survive_reopen(tmp_path):
+    path = str(tmp_path / "qa")
+    vectors = _vectors(3)
+    store = VectorStore(path, dim=16, segment_rows=2)
+    store.add(["a", "b", "c"], vectors, ["a1", "b1", "c1"])
+    store.add(["a"], vectors[2], ["a2"])
+    assert store.delete(["b", "missing"]) == 1
+    store.add(["b"], vectors[1], ["b2"])
+    reopened = VectorStore(path)
+    assert len(reopened) == 3
+    assert reopened.get("a") == "a2" and reopened.get("b") == "b2"
+    top = reopened.search(vectors[2], k=3)[0]
+    assert {hit[0] for hit in top[:2]} == {"a", "c"}
+    assert len([hit for hit in top if hit[0] == "a"]) == 1
+    reopened.delete(["b"])
+    assert "b" not in VectorStore(path)
+
+
+def test_compaction_drops_dead_rows(tmp_path):
+    path = str(tmp_path / "pm")
+    store = VectorStore(path, dim=16, segment_rows=4, compact_ratio=10)
+    vectors = _vectors(10)
+    store.add([str(i) for i in range(10)], vectors)
+    store.delete([str(i) for i in range(0, 10, 2)])
+    store.add(["1"], vectors[0], ["moved"])
+    store.compact()
+    assert store.segments == 2 and len(store) == 5
+    assert sorted(os.listdir(path)) == sorted(["manifest.json"] + [f"seg-00000{n}{s}" for n in (3, 4) for s in (".vec", ".meta.jsonl")])
+    reopened = VectorStore(path)
+    assert reopened.get("1") == "moved" and "0" not in reopened
+    assert reopened.search(vectors[0], k=1)[0][0][0] == "1"
+
+
+def test_int8_quantization_keeps_the_ranking(tmp_path):
+    vectors, queries = _vectors(300, dim=64), _vectors(5, dim=64, seed=2)
+    store = VectorStore(str(tmp_path / "ta"), dim=64, quantize="int8", segment_rows=100)
+    store.add([str(i) for i in range(300)], vectors)
+    assert os.path.getsize(str(tmp_path / "ta" / "seg-000000.vec")) == 100 * 64
+    reopened = VectorStore(str(tmp_path / "ta"))
+    for hits, expected in zip(reopened.search(queries, k=3), _brute_force(vectors, queries, 3)):
+        assert hits[0][0] == str(expected[0])
+
+
+def test_partial_append_is_truncated_on_open(tmp_path):
+    path = str(tmp_path / "ux")
+    store = VectorStore(path, dim=16)
+    store.add(["a", "b"], _vectors(2))
+    with open(os.path.join(path, "seg-000000.vec"), "ab") as f:
+        f.write(b"\x00" * 30)
+    reopened = VectorStore(path)
+    assert len(reopened) == 2
+    reopened.add(["c"], _vectors(1, seed=3))
+    assert len(VectorStore(path)) == 3
+
+
+def test_context_injector_recalls_nearest_memories(tmp_path):
+    class Agent:
+        memory = {"risks": []}
+        status = {}
+    agent = Agent()
+    agent.memory_store = VectorStore(str(tmp_path / "agent"), dim=16)
+    vectors = _vectors(3)
+    agent.memory_store.add(["x", "y", "z"], vectors, ["first", "second", "third"])
+    context = ContextInjector(agent, recall_k=1).get_context(vectors[1])
+    assert context["memory"] == {"risks": [], "recalled": ["second"]}
+    assert ContextInjector(agent).get_context()["memory"] == {"risks": []}
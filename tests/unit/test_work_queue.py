@@ -0,0 +1,53 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from work_queue import WorkQueue, ENQUEUE_SHA, CLAIM_SHA, LEASE_SHA
+
+
+@pytest.mark.asyncio
+async def test_enqueue_args_and_claim_decoding():
+    conn = AsyncMock()
+    conn.evalsha.return_value = 2
+    queue = WorkQueue("dev", lease_seconds=30, aging_seconds=600)
+    assert await queue.enqueue(conn, [("a", 3), ("b", None)]) == 2
+    args = conn.evalsha.await_args.args
+    assert args[:4] == (ENQUEUE_SHA, 1, "queue:dev:", "add")
+    assert args[5:] == (600, "a", 3, "b", 1)
+    conn.evalsha.return_value = ["a", "2.5", "b", "-1"]
+    assert await queue.claim(conn, "worker-1", 2) == [("a", 2.5), ("b", -1.0)]
+    assert conn.evalsha.await_args.args[:7] == (CLAIM_SHA, 1, "queue:dev:", "worker-1", 2, 30000, conn.evalsha.await_args.args[6])
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_is_scoped_to_the_lease_holder():
+    conn = AsyncMock()
+    conn.evalsha.return_value = 0
+    queue = WorkQueue("pm", lease_seconds=10)
+    assert not await queue.heartbeat(conn, "a", "worker-2")
+    args = conn.evalsha.await_args.args
+    assert args[:6] == (LEASE_SHA, 1, "queue:pm:", "heartbeat", "worker-2", 10000)
+    assert args[7:] == ("a",)
+
+
+@pytest.mark.asyncio
+async def test_status_transitions_move_items():
+    queue = WorkQueue("dev")
+    queue.enqueue = AsyncMock()
+    queue.ack = AsyncMock(return_value=False)
+    queue.remove = AsyncMock()
+    queue.rescore = AsyncMock()
+    conn = AsyncMock()
+    await queue.follow(conn, "a", {"status": "pending"}, {"status": "pending", "priority": 2})
+    queue.enqueue.assert_awaited_once_with(conn, [("a", 2)])
+    await queue.follow(conn, "a", {"status": "completed"}, {"status": "completed"})
+    queue.ack.assert_awaited_once_with(conn, "a")
+    queue.remove.assert_awaited_once_with(conn, ["a"])
+    await queue.follow(conn, "a", {"status": "in_progress"}, {"status": "in_progress"})
+    conn.zrem.assert_awaited_once_with("queue:dev:pending", "a")
+    await queue.follow(conn, "a", {"priority": 5}, {"status": "pending", "priority": 5})
+    queue.rescore.assert_awaited_once_with(conn, "a", 5)
+    await queue.follow(conn, "a", {"description": "x"}, {"status": "pending"})
+    assert queue.enqueue.await_count == 1
@@ -0,0 +1,58 @@
+import sys
+import os
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from write_coalescer import WriteCoalescer, coalescer_from_env, pipeline_flush
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_share_one_flush():
+    batches = []
+
+    async def flush(items):
+        batches.append(list(items))
+        return [ValueError("bad") if item == "bad" else item.upper() for item in items]
+
+    coalescer = WriteCoalescer("test", flush, window=0.01, max_batch=10)
+    results = await asyncio.gather(*(coalescer.submit(item) for item in ["a", "bad", "c"]), return_exceptions=True)
+    assert results[0] == "A" and results[2] == "C"
+    assert isinstance(results[1], ValueError)
+    assert batches == [["a", "bad", "c"]]
+
+
+@pytest.mark.asyncio
+async def test_max_batch_flushes_without_waiting_for_the_window():
+    flush = AsyncMock(side_effect=lambda items: list(items))
+    coalescer = WriteCoalescer("test", flush, window=60, max_batch=2)
+    assert await asyncio.wait_for(asyncio.gather(coalescer.submit(1), coalescer.submit(2)), 1) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_reaches_every_caller():
+    coalescer = WriteCoalescer("test", AsyncMock(side_effect=ConnectionError("down")), window=0.001)
+    results = await asyncio.gather(coalescer.submit(1), coalescer.submit(2), return_exceptions=True)
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_flush_maps_errors_to_their_item():
+    pipe = MagicMock()
+    pipe.__len__.side_effect = lambda: len([c for c in pipe.method_calls if c[0] == "hset"])
+    pipe.execute = AsyncMock(return_value=[1, RuntimeError("WRONGTYPE")])
+    conn = MagicMock()
+    conn.pipeline.return_value = pipe
+    results = await pipeline_flush(conn)([lambda p: p.hset("k", "a", 1) and "a", lambda p: p.hset("k", "b", 1) and "b"])
+    assert results[0] == "a"
+    assert isinstance(results[1], RuntimeError)
+    conn.pipeline.assert_called_once_with(transaction=True)
+
+
+def test_coalescing_is_opt_in(monkeypatch):
+    monkeypatch.delenv("AGENT_WRITE_COALESCE", raising=False)
+    assert coalescer_from_env("test", AsyncMock()) is None
+    monkeypatch.setenv("AGENT_WRITE_COALESCE", "true")
+    monkeypatch.setenv("AGENT_WRITE_COALESCE_MAX_BATCH", "7")
+    assert coalescer_from_env("test", AsyncMock()).max_batch == 7
@@ -0,0 +1,290 @@
+"""
+Incrementally maintained TF-IDF similarity index
+- Vocabulary, document frequencies and one L2-normalised sparse TF-IDF row per document, kept in
+  memory and updated per document on create/update/delete instead of refitting the whole corpus
+- A query is one transform plus one sparse matrix-vector (or matrix-matrix, for batches) product;
+  scores stay sparse and the best matches are picked from each row's stored entries only
+- Rows written since the last compaction live in a small delta set and deleted rows are masked;
+  the matrix is compacted (and every row re-weighted with the current IDF) lazily at query time
+  once the delta or the tombstones grow past `compact_threshold`, or the corpus size drifted by
+  more than `reweight_drift` since rows were last weighted
+
+Tokenisation and IDF smoothing match sklearn's TfidfVectorizer(stop_words='english'), so scores
+are comparable to the previous fit_transform-per-request implementation.
+
+The index is safe to use from executor threads (cpu_executor.py) while the event loop applies
+single-document writes: every operation holds the index lock, and a rebuild runs outside it, then
+swaps the new state in and replays the writes that arrived meanwhile.
+"""
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+@lru_cache(maxsize=None)
+def _analyzer(stop_words: Optional[str]):
+    return TfidfVectorizer(stop_words=stop_words).build_analyzer()
+
+
+def analyze_texts(texts: Sequence[str], stop_words: Optional[str] = 'english') -> List[Dict[str, int]]:
+    """
+    Term counts of each text. A pure function, so corpus tokenisation can run in a worker process.
+    """
+    analyzer = _analyzer(stop_words)
+    return [dict(Counter(analyzer(text or ""))) for text in texts]
+
+
+def top_matches(scores: np.ndarray, threshold: float, top_k: Optional[int]) -> np.ndarray:
+    """
+    Positions of the entries of `scores` above `threshold`, best first, at most `top_k` of them.
+    """
+    matches = np.nonzero(scores > threshold)[0]
+    if top_k is not None and top_k < len(matches):
+        matches = matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]]
+    return matches[np.argsort(-scores[matches], kind="stable")]
+
+
+class IncrementalTfidfIndex:
+    def __init__(self, stop_words: Optional[str] = 'english', compact_threshold: int = 256, reweight_drift: float = 0.2):
+        self.stop_words = stop_words
+        self.analyzer = _analyzer(stop_words)
+        self.compact_threshold = compact_threshold
+        self.reweight_drift = reweight_drift
+        self.vocabulary: Dict[str, int] = {}
+        self.df: List[int] = []
+        # doc id -> term counts by column; the source of truth for re-weighting
+        self._counts: Dict[str, Dict[int, int]] = {}
+        # Compacted rows: CSR matrix plus its row -> doc id map (None marks a deleted row)
+        self._matrix: Optional[csr_matrix] = None
+        self._row_ids: List[Optional[str]] = []
+        self._row_of: Dict[str, int] = {}
+        # False for deleted rows; reset to all-live by compaction
+        self._live = np.zeros(0, dtype=bool)
+        self._tombstones = 0
+        # Rows written since the last compaction: doc id -> (columns, weights)
+        self._delta: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._weighted_at = 0
+        self._lock = threading.RLock()
+        # Writes applied while a rebuild is running, replayed onto the rebuilt state
+        self._journal: Optional[List[Tuple[str, Optional[str]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._counts
+
+    def _idf(self, columns: Sequence[int]) -> np.ndarray:
+        n = len(self._counts)
+        df = np.asarray([self.df[c] for c in columns], dtype=np.float64)
+        return np.log((1 + n) / (1 + df)) + 1
+
+    def _term_counts(self, text: str, grow: bool, terms: Optional[Dict[str, int]] = None) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        if terms is None:
+            terms = Counter(self.analyzer(text or ""))
+        for term, count in terms.items():
+            column = self.vocabulary.get(term)
+            if column is None:
+                if not grow:
+                    continue
+                column = self.vocabulary[term] = len(self.df)
+                self.df.append(0)
+            counts[column] = count
+        return counts
+
+    def _weights(self, counts: Dict[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        columns = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) * self._idf(columns)
+        norm = np.linalg.norm(weights)
+        return columns, (weights / norm if norm else weights)
+
+    def _drop_row(self, doc_id: str) -> None:
+        if self._delta.pop(doc_id, None) is not None:
+            return
+        row = self._row_of.pop(doc_id, None)
+        if row is not None:
+            self._row_ids[row] = None
+            self._live[row] = False
+            self._tombstones += 1
+
+    def add(self, doc_id: str, text: str, terms: Optional[Dict[str, int]] = None) -> None:
+        """
+        Index a document, replacing its previous text if it was already indexed.
+        `terms` optionally holds the text's term counts, already computed by analyze_texts.
+        """
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((doc_id, text))
+            self._add(doc_id, text, terms)
+
+    def _add(self, doc_id: str, text: str, terms: Optional[Dict[str, int]] = None) -> None:
+        self._remove(doc_id)
+        counts = self._term_counts(text, grow=True, terms=terms)
+        if not counts:
+            # Only stop words: nothing to match on
+            return
+        for column in counts:
+            self.df[column] += 1
+        self._counts[doc_id] = counts
+        self._delta[doc_id] = self._weights(counts)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((doc_id, None))
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        counts = self._counts.pop(doc_id, None)
+        if counts is None:
+            return
+        for column in counts:
+            self.df[column] -= 1
+        self._drop_row(doc_id)
+
+    def rebuild(self, docs: Iterable[Tuple[str, str]], analyzed: Optional[Sequence[Dict[str, int]]] = None) -> None:
+        """
+        Replace the whole index with `docs` ((doc id, text) pairs). `analyzed` optionally holds the
+        docs' term counts, already computed by analyze_texts (e.g. in a worker process).
+        """
+        with self._lock:
+            self._journal = []
+        try:
+            fresh = IncrementalTfidfIndex(self.stop_words, self.compact_threshold, self.reweight_drift)
+            for i, (doc_id, text) in enumerate(docs):
+                counts = fresh._term_counts(text, grow=True, terms=analyzed[i] if analyzed is not None else None)
+                if counts:
+                    for column in counts:
+                        fresh.df[column] += 1
+                    fresh._counts[doc_id] = counts
+            fresh._compact()
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            journal, self._journal = self._journal, None
+            for name in ("vocabulary", "df", "_counts", "_matrix", "_row_ids", "_row_of", "_live", "_tombstones", "_delta", "_weighted_at"):
+                setattr(self, name, getattr(fresh, name))
+            for doc_id, text in journal:
+                if text is None:
+                    self._remove(doc_id)
+                else:
+                    self._add(doc_id, text)
+
+    def compact(self) -> None:
+        """
+        Re-weight every row with the current IDF and fold the delta into one CSR matrix.
+        """
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        doc_ids = list(self._counts)
+        indptr, indices, data = [0], [], []
+        for doc_id in doc_ids:
+            columns, weights = self._weights(self._counts[doc_id])
+            indices.append(columns)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(columns))
+        self._matrix = csr_matrix(
+            (np.concatenate(data) if data else np.zeros(0), np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64), indptr),
+            shape=(len(doc_ids), len(self.df)),
+        )
+        self._row_ids = doc_ids
+        self._row_of = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+        self._live = np.ones(len(doc_ids), dtype=bool)
+        self._delta, self._tombstones = {}, 0
+        self._weighted_at = len(doc_ids)
+
+    def _needs_compaction(self) -> bool:
+        if self._matrix is None:
+            return True
+        if len(self._delta) > self.compact_threshold or self._tombstones > self.compact_threshold:
+            return True
+        n = len(self._counts)
+        return abs(n - self._weighted_at) > self.reweight_drift * max(self._weighted_at, 1)
+
+    def document_frequencies(self, terms: Iterable[str]) -> Dict[str, int]:
+        """
+        Number of indexed documents containing each of `terms`, read under the index lock so it is
+        consistent with a concurrent rebuild. Terms not in the vocabulary are left out.
+        """
+        with self._lock:
+            return {term: self.df[self.vocabulary[term]] for term in terms if term in self.vocabulary}
+
+    def transform(self, texts: Sequence[str]) -> csr_matrix:
+        """
+        L2-normalised TF-IDF rows for query texts over the current vocabulary (unknown terms are ignored).
+        """
+        with self._lock:
+            return self._transform(texts)
+
+    def _transform(self, texts: Sequence[str]) -> csr_matrix:
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            counts = self._term_counts(text, grow=False)
+            columns, weights = self._weights(counts) if counts else (np.zeros(0, dtype=np.int64), np.zeros(0))
+            indices.append(columns)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(columns))
+        return csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=(len(texts), len(self.df)))
+
+    def similarities(self, texts: Sequence[str]) -> Tuple[List[Optional[str]], csr_matrix]:
+        """
+        Cosine similarity of each query text against every indexed document.
+        Returns (doc ids, sparse len(texts) x len(doc ids) matrix). Only documents sharing a term with
+        a query have an entry in its row; deleted rows have a None doc id and no entries.
+        """
+        with self._lock:
+            return self._similarities(texts)
+
+    def _similarities(self, texts: Sequence[str]) -> Tuple[List[Optional[str]], csr_matrix]:
+        if self._needs_compaction():
+            self._compact()
+        queries = self._transform(texts)
+        width = self._matrix.shape[1]
+        # Compacted rows never use columns added after compaction, so those query terms can be dropped
+        scores = (queries[:, :width] @ self._matrix.T).tocsr()
+        doc_ids = list(self._row_ids)
+        live = self._live
+        if self._delta:
+            delta_ids = list(self._delta)
+            indptr, indices, data = [0], [], []
+            for doc_id in delta_ids:
+                columns, weights = self._delta[doc_id]
+                indices.append(columns)
+                data.append(weights)
+                indptr.append(indptr[-1] + len(columns))
+            delta = csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=(len(delta_ids), len(self.df)))
+            scores = hstack([scores, queries @ delta.T], format="csr")
+            doc_ids += delta_ids
+            live = np.concatenate([live, np.ones(len(delta_ids), dtype=bool)])
+        if self._tombstones:
+            scores.data[~live[scores.indices]] = 0
+            scores.eliminate_zeros()
+        return doc_ids, scores
+
+    def search(self, texts: Sequence[str], threshold: float = 0.0, top_k: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """
+        For each query text, the (doc id, score) pairs scoring above `threshold`, best first,
+        at most `top_k` of them. Only documents sharing a term with the query can match.
+        """
+        if not texts:
+            return []
+        with self._lock:
+            if not self._counts:
+                return [[] for _ in texts]
+            doc_ids, scores = self._similarities(texts)
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data, columns = scores.data[start:end], scores.indices[start:end]
+            results.append([(doc_ids[columns[i]], float(data[i])) for i in top_matches(data, threshold, top_k)])
+        return results
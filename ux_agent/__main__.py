@@ -1,5 +1,11 @@
+import math
 from fastapi import FastAPI
-from ux_agent.api import ux_router
+from fastapi.responses import JSONResponse
+from cpu_executor import ExecutorUnavailable, shutdown_cpu_executor
+from resilience import DependencyUnavailable
+from redis_pool import close_pools
+from record_cache import start_invalidation_listener, stop_invalidation_listener
+from ux_agent.api import ux_router, ux_state
 from ux_agent.security import validate_jwt
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -7,6 +13,11 @@ app = FastAPI()
 
 app.include_router(ux_router)
 
+@app.on_event("startup")
+async def on_startup():
+    # Keep the record cache coherent with writes from other processes
+    start_invalidation_listener(ux_state.redis)
+
 origins = ["*"]
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +27,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the record cache listener and the CPU executor, then release the process-wide Redis pools (redis_pool.py)
+    await stop_invalidation_listener()
+    shutdown_cpu_executor()
+    await close_pools()
+
+@app.exception_handler(ExecutorUnavailable)
+async def executor_unavailable(request, exc: ExecutorUnavailable):
+    # CPU work queue full or timed out: transient, the client should retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable(request, exc: DependencyUnavailable):
+    # Redis circuit breaker open or no concurrency slot in time (resilience.py): transient, the client should retry
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from .core import UXStateManager, UXFeedback
+from conflict_resolution import MAX_CONFLICT_PAIRS
+from cpu_executor import cpu_executor
 import uuid
+import json
 
 ux_router = APIRouter(prefix="/ux", tags=["User Experience"])
 ux_state = UXStateManager()
@@ -25,17 +29,42 @@ async def create_feedback(req: UXFeedbackRequest):
         dependencies=req.dependencies,
         priority=req.priority
     )
-    feedback_id = ux_state.create_feedback(feedback.dict())
+    feedback_id = await ux_state.async_create_feedback(feedback.dict())
     return {"feedback_id": feedback_id}
 
 @ux_router.get("/status/{feedback_id}")
 async def get_feedback_status(feedback_id: str):
-    feedback = ux_state.get_feedback(feedback_id)
+    feedback = await ux_state.async_get_feedback(feedback_id)
     if not feedback:
         raise HTTPException(status_code=404, detail="Feedback not found")
     return {"feedback": feedback}
 
+@ux_router.get("/list_feedbacks")
+async def list_feedbacks(
+    cursor: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size hint"),
+    stream: bool = Query(False, description="Stream all feedback as NDJSON instead of returning a page")
+):
+    if stream:
+        lines = (json.dumps(feedback) + "\n" async for feedback in ux_state.async_iter_feedbacks())
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    next_cursor, feedbacks = await ux_state.async_scan_feedbacks(cursor=cursor, limit=limit)
+    return {"feedbacks": feedbacks, "next_cursor": next_cursor}
+
 @ux_router.post("/resolve_conflict")
 async def resolve_conflict(feedback_a: Dict, feedback_b: Dict):
     resolved = ux_state.resolve_conflict(feedback_a, feedback_b)
     return {"resolved_feedback": resolved}
+
+class ConflictBatchRequest(BaseModel):
+    pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+
+@ux_router.post("/resolve_conflict/batch")
+async def resolve_conflict_batch(req: ConflictBatchRequest):
+    """
+    Resolve many feedback pairs at once (vectorized scoring, one batched similarity product),
+    on the shared CPU executor. Returns per pair, in order: {"winner": "a"|"b", "resolved", "path", "similarity", "score"}.
+    """
+    if len(req.pairs) > MAX_CONFLICT_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CONFLICT_PAIRS} pairs per request")
+    return {"results": await cpu_executor().run_local(ux_state.resolve_conflicts, req.pairs)}
@@ -1,9 +1,17 @@
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Iterator, AsyncIterator
 from pydantic import BaseModel
 import uuid
-import json
-from redis import Redis
+from redis_pool import get_async_redis, get_bridge_redis
+from record_store import record_layout
+from resilience import resilience_policy
+from similarity import similarity_service, similar_winner, text_of
+from conflict_resolution import ConflictPolicy, resolve_pairs
+from redis_scripts import VersionConflict, MERGE_OK, MERGE_MISSING, MERGE_CONFLICT
+from sync_bridge import bridge_twin, run_sync
+
+# The rules of resolve_conflict, for batches of pairs
+CONFLICT_POLICY = ConflictPolicy(["description"])
 
 class UXFeedback(BaseModel):
     id: str
@@ -18,40 +26,122 @@ class UXFeedback(BaseModel):
     timestamp: float = datetime.now().timestamp()
 
 class UXStateManager:
-    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379):
-        self.redis = Redis(host=redis_host, port=redis_port, decode_responses=True)
+    def __init__(self, redis_host: str = 'localhost', redis_port: int = 6379, max_concurrent: int = 10):
+        self.redis = get_async_redis(f"redis://{redis_host}:{redis_port}")
         self.feedback_registry = "ux:feedbacks"
+        self.store = record_layout(self.feedback_registry, "ux:feedback:")
+        self.merger = self.store.merger()
+        self.similarity = similarity_service(self.feedback_registry)
+        # Process-wide breaker, retry budget and adaptive concurrency limit for UX Redis calls (see resilience.py);
+        # max_concurrent is the limit's starting point
+        self.resilience = resilience_policy("ux_redis", env_prefix="UX_AGENT_REDIS", fail_max=3, reset_timeout=5, initial_limit=max_concurrent)
+        self._redis_url = f"redis://{redis_host}:{redis_port}"
+        self._max_concurrent = max_concurrent
+        self._bridge: Optional["UXStateManager"] = None
 
-    def create_feedback(self, feedback: dict) -> str:
-        feedback = feedback.copy()
-        for k in ['created_at', 'updated_at']:
-            if k in feedback and hasattr(feedback[k], 'isoformat'):
-                feedback[k] = feedback[k].isoformat()
+    async def _write_feedback(self, feedback_id: str, feedback: dict) -> None:
+        pipe = self.redis.pipeline()
+        self.store.queue_write(pipe, feedback_id, feedback)
+        await pipe.execute()
+        self.store.invalidate([feedback_id])
+
+    async def async_create_feedback(self, feedback: dict) -> str:
         feedback_id = f"uxfb_{uuid.uuid4().hex}"
-        self.redis.hset(self.feedback_registry, feedback_id, json.dumps(feedback))
+        await self.resilience.call(lambda: self._write_feedback(feedback_id, feedback))
         return feedback_id
 
+    async def async_get_feedback(self, feedback_id: str, fields: Optional[List[str]] = None) -> dict:
+        return await self.resilience.call(lambda: self.store.get(self.redis, feedback_id, fields), idempotent=True)
+
+    async def async_list_feedbacks(self) -> list:
+        return [feedback async for feedback in self.async_iter_feedbacks()]
+
+    async def async_scan_feedbacks(self, cursor: int = 0, limit: int = 100, fields: Optional[List[str]] = None) -> Tuple[int, list]:
+        """
+        Fetch one HSCAN page of feedback. Returns (next_cursor, feedbacks); 0 means the scan is complete.
+        """
+        return await self.resilience.call(lambda: self.store.scan(self.redis, cursor, limit, fields), idempotent=True)
+
+    async def async_iter_feedbacks(self, batch_size: int = 500, fields: Optional[List[str]] = None) -> AsyncIterator[dict]:
+        """
+        Yield feedback records page by page without materialising the whole registry.
+        """
+        cursor = 0
+        while True:
+            cursor, feedbacks = await self.async_scan_feedbacks(cursor, batch_size, fields)
+            for feedback in feedbacks:
+                yield feedback
+            if cursor == 0:
+                break
+
+    async def async_update_feedback(self, feedback_id: str, updates: dict) -> dict:
+        """
+        Merge `updates` into stored feedback server-side in one round trip. A `version` in
+        `updates` makes the update conditional (VersionConflict when stale).
+        """
+        updates = dict(updates)
+        expected_version = updates.pop("version", None)
+        [(status, feedback)] = await self.resilience.call(lambda: self.merger.merge(self.redis, [(feedback_id, updates, expected_version)]))
+        if status == MERGE_MISSING:
+            raise ValueError("Feedback not found")
+        if status == MERGE_CONFLICT:
+            raise VersionConflict(feedback_id, feedback)
+        if status != MERGE_OK:
+            raise ValueError("Stored feedback is not a JSON object")
+        return feedback
+
+    # --- Synchronous compatibility wrappers (not for use inside async handlers) ---
+
+    def _bridged(self) -> "UXStateManager":
+        """
+        Twin of this manager for the sync wrappers, with a client and resilience policy used only on the
+        bridge loop (see sync_bridge.py).
+        """
+        if self._bridge is None:
+            client = get_bridge_redis(self._redis_url)
+            self._bridge = bridge_twin(
+                self,
+                redis=client,
+                resilience=resilience_policy("ux_redis_sync", env_prefix="UX_AGENT_REDIS", fail_max=3, reset_timeout=5, initial_limit=self._max_concurrent),
+            )
+        return self._bridge
+
+    def create_feedback(self, feedback: dict) -> str:
+        return run_sync(self._bridged().async_create_feedback(feedback))
+
     def get_feedback(self, feedback_id: str) -> dict:
-        raw = self.redis.hget(self.feedback_registry, feedback_id)
-        if not raw:
-            return None
-        return json.loads(raw)
+        return run_sync(self._bridged().async_get_feedback(feedback_id))
 
     def list_feedbacks(self) -> list:
-        keys = self.redis.hkeys(self.feedback_registry)
-        return [json.loads(self.redis.hget(self.feedback_registry, k)) for k in keys]
+        return run_sync(self._bridged().async_list_feedbacks())
+
+    def scan_feedbacks(self, cursor: int = 0, limit: int = 100) -> Tuple[int, list]:
+        return run_sync(self._bridged().async_scan_feedbacks(cursor, limit))
+
+    def iter_feedbacks(self, batch_size: int = 500) -> Iterator[dict]:
+        cursor = 0
+        while True:
+            cursor, feedbacks = self.scan_feedbacks(cursor, batch_size)
+            yield from feedbacks
+            if cursor == 0:
+                break
 
     def update_feedback(self, feedback_id: str, updates: dict) -> None:
-        feedback = self.get_feedback(feedback_id)
-        if not feedback:
-            raise ValueError("Feedback not found")
-        feedback.update(updates)
-        for k in ['created_at', 'updated_at']:
-            if k in feedback and hasattr(feedback[k], 'isoformat'):
-                feedback[k] = feedback[k].isoformat()
-        self.redis.hset(self.feedback_registry, feedback_id, json.dumps(feedback))
+        run_sync(self._bridged().async_update_feedback(feedback_id, updates))
 
     def resolve_conflict(self, feedback_a: dict, feedback_b: dict, alpha: float = 0.7, beta: float = 0.3) -> dict:
+        # Near-identical feedback (the same thing written twice): higher priority, then recency, wins
+        score = self.similarity.similarity(text_of(feedback_a, ["description"]), text_of(feedback_b, ["description"]))
+        winner = similar_winner(feedback_a, feedback_b, score)
+        if winner is not None:
+            return winner
         time_score = alpha * (feedback_a.get('timestamp', 0) - feedback_b.get('timestamp', 0))
         priority_score = beta * (feedback_a.get('priority', 1) - feedback_b.get('priority', 1))
         return feedback_a if (time_score + priority_score) >= 0 else feedback_b
+
+    def resolve_conflicts(self, pairs: List[Tuple[dict, dict]]) -> List[dict]:
+        """
+        Resolve many feedback pairs with the rules of resolve_conflict in one vectorized pass (one
+        batched similarity product). Returns per pair the winner ("a"/"b"), the resolved feedback and the decision path.
+        """
+        return resolve_pairs(pairs, CONFLICT_POLICY, self.similarity)
@@ -0,0 +1,311 @@
+"""
+Priority work queue with leases, one per agent type, stored in Redis
+- Pending work is a sorted set (`queue:<name>:pending`); dispatch is a ZPOPMAX, so claiming the
+  next item costs O(log n) instead of listing the registry and picking client-side
+- Age boosting: an item's score is `priority - enqueued_at / aging_seconds`, so every
+  `aging_seconds` spent waiting is worth one priority level. The boost is relative, so scores never
+  need to be rewritten as time passes; re-queued and re-prioritised items keep their original age
+- Claiming pops the items and takes a lease for the worker in the same script: a lease key
+  (`queue:<name>:lease:<id>`) holding the worker ID with a TTL, plus the lease deadline in
+  `queue:<name>:leases`. An item is therefore never handed to two workers at once
+- Workers heartbeat to extend their lease and ack when done; the reaper re-queues the items whose
+  lease expired (worker crashed or stalled), found with one range query on the deadline set
+
+Keys are derived inside the scripts, so they assume a standalone (non-cluster) Redis.
+
+Environment:
+- AGENT_QUEUE_LEASE_SECONDS: lease length for claimed items (default 60)
+- AGENT_QUEUE_AGING_SECONDS: waiting time worth one priority level (default 3600)
+- AGENT_QUEUE_REAP_INTERVAL_SECONDS: seconds between reaper runs (default 15, 0 disables)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter
+from redis.exceptions import NoScriptError
+
+logger = logging.getLogger("work_queue")
+
+claimed_items = Counter("work_queue_claimed_total", "Items handed out to workers", ["queue"])
+acked_items = Counter("work_queue_acked_total", "Items acknowledged as done", ["queue"])
+reaped_items = Counter("work_queue_reaped_total", "Items re-queued after their lease expired", ["queue"])
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name}, using default {default}")
+        return default
+
+
+# KEYS[1] = queue key prefix
+# ARGV    = mode ("add" or "rescore"), now, aging_seconds, (id, priority)*
+# "add" queues items that are not leased; "rescore" only re-scores items already pending.
+# Returns the number of items (re)scored.
+ENQUEUE_LUA = r"""
+local prefix = KEYS[1]
+local pending, enqueued = prefix .. 'pending', prefix .. 'enqueued'
+local mode, now, aging = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local changed = 0
+for i = 4, #ARGV, 2 do
+    local id, priority = ARGV[i], tonumber(ARGV[i + 1]) or 1
+    local queued = redis.call('ZSCORE', pending, id)
+    if (mode == 'add' and redis.call('EXISTS', prefix .. 'lease:' .. id) == 0) or (mode == 'rescore' and queued) then
+        local since = tonumber(redis.call('HGET', enqueued, id))
+        if not since then
+            since = now
+            redis.call('HSET', enqueued, id, since)
+        end
+        redis.call('ZADD', pending, priority - since / aging, id)
+        changed = changed + 1
+    end
+end
+return changed
+"""
+
+ENQUEUE_SHA = hashlib.sha1(ENQUEUE_LUA.encode("utf-8")).hexdigest()
+
+# KEYS[1] = queue key prefix
+# ARGV    = worker, count, lease_ms, now_ms
+# Returns a flat array of (id, score) pairs for the claimed items, best first.
+CLAIM_LUA = r"""
+local prefix = KEYS[1]
+local worker, lease_ms, now_ms = ARGV[1], tonumber(ARGV[3]), tonumber(ARGV[4])
+local popped = redis.call('ZPOPMAX', prefix .. 'pending', tonumber(ARGV[2]))
+for i = 1, #popped, 2 do
+    local id = popped[i]
+    redis.call('SET', prefix .. 'lease:' .. id, worker, 'PX', lease_ms)
+    redis.call('ZADD', prefix .. 'leases', now_ms + lease_ms, id)
+    redis.call('HSET', prefix .. 'held', id, popped[i + 1])
+end
+return popped
+"""
+
+CLAIM_SHA = hashlib.sha1(CLAIM_LUA.encode("utf-8")).hexdigest()
+
+# KEYS[1] = queue key prefix
+# ARGV    = action ("heartbeat", "ack", "release" or "drop"), worker ("" for any), lease_ms, now_ms, id*
+# heartbeat extends the worker's leases, ack ends them, release hands the items back to the queue
+# with their original score; drop forgets the items whether pending or leased (the worker is ignored).
+# Returns the number of items the action applied to.
+LEASE_LUA = r"""
+local prefix = KEYS[1]
+local action, worker, lease_ms, now_ms = ARGV[1], ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+local applied = 0
+for i = 5, #ARGV do
+    local id = ARGV[i]
+    local lease_key = prefix .. 'lease:' .. id
+    local holder = redis.call('GET', lease_key)
+    if action == 'drop' then
+        applied = applied + redis.call('ZREM', prefix .. 'pending', id) + redis.call('DEL', lease_key)
+        redis.call('ZREM', prefix .. 'leases', id)
+        redis.call('HDEL', prefix .. 'held', id)
+        redis.call('HDEL', prefix .. 'enqueued', id)
+    elseif holder and (worker == '' or holder == worker) then
+        if action == 'heartbeat' then
+            redis.call('PEXPIRE', lease_key, lease_ms)
+            redis.call('ZADD', prefix .. 'leases', now_ms + lease_ms, id)
+        else
+            local score = redis.call('HGET', prefix .. 'held', id)
+            redis.call('DEL', lease_key)
+            redis.call('ZREM', prefix .. 'leases', id)
+            redis.call('HDEL', prefix .. 'held', id)
+            if action == 'release' and score then
+                redis.call('ZADD', prefix .. 'pending', score, id)
+            else
+                redis.call('HDEL', prefix .. 'enqueued', id)
+            end
+        end
+        applied = applied + 1
+    end
+end
+return applied
+"""
+
+LEASE_SHA = hashlib.sha1(LEASE_LUA.encode("utf-8")).hexdigest()
+
+# KEYS[1] = queue key prefix
+# ARGV    = now_ms, batch
+# Re-queues up to `batch` items whose lease deadline passed and whose lease key is gone.
+# Returns the re-queued IDs.
+REAP_LUA = r"""
+local prefix = KEYS[1]
+local expired = redis.call('ZRANGEBYSCORE', prefix .. 'leases', '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local requeued = {}
+for _, id in ipairs(expired) do
+    if redis.call('EXISTS', prefix .. 'lease:' .. id) == 0 then
+        local score = redis.call('HGET', prefix .. 'held', id)
+        if score then
+            redis.call('ZADD', prefix .. 'pending', score, id)
+            requeued[#requeued + 1] = id
+        end
+        redis.call('ZREM', prefix .. 'leases', id)
+        redis.call('HDEL', prefix .. 'held', id)
+    end
+end
+return requeued
+"""
+
+REAP_SHA = hashlib.sha1(REAP_LUA.encode("utf-8")).hexdigest()
+
+# Record statuses handled by on_status(): queued, finished (ack) or paused (leave the queue)
+QUEUED_STATUSES = ("pending",)
+FINISHED_STATUSES = ("completed", "archived")
+PAUSED_STATUSES = ("blocked",)
+
+# Expired leases re-queued per reaper script call
+REAP_BATCH = 100
+
+
+class WorkQueue:
+    """
+    Leased priority queue of record IDs for one agent type (keys under `queue:<name>:`).
+    """
+    def __init__(self, name: str, lease_seconds: Optional[float] = None, aging_seconds: Optional[float] = None):
+        self.name = name
+        self.prefix = f"queue:{name}:"
+        self.pending_key = f"{self.prefix}pending"
+        self.lease_seconds = lease_seconds if lease_seconds is not None else _env_float("AGENT_QUEUE_LEASE_SECONDS", 60)
+        self.aging_seconds = aging_seconds if aging_seconds is not None else _env_float("AGENT_QUEUE_AGING_SECONDS", 3600)
+
+    @property
+    def _lease_ms(self) -> int:
+        return int(self.lease_seconds * 1000)
+
+    async def _evalsha(self, conn, source: str, sha: str, args: List[Any]):
+        try:
+            return await conn.evalsha(sha, 1, self.prefix, *args)
+        except NoScriptError:
+            await conn.script_load(source)
+            return await conn.evalsha(sha, 1, self.prefix, *args)
+
+    async def _enqueue(self, conn, mode: str, items: Sequence[Tuple[str, Optional[int]]]) -> int:
+        if not items:
+            return 0
+        args: List[Any] = [mode, time.time(), self.aging_seconds]
+        for record_id, priority in items:
+            args.extend([record_id, priority if priority is not None else 1])
+        return await self._evalsha(conn, ENQUEUE_LUA, ENQUEUE_SHA, args)
+
+    async def enqueue(self, conn, items: Sequence[Tuple[str, Optional[int]]]) -> int:
+        """
+        Queue (record_id, priority) pairs, or re-score them if already pending. Leased items are left
+        alone. Returns the number of items queued.
+        """
+        return await self._enqueue(conn, "add", items)
+
+    async def rescore(self, conn, record_id: str, priority: Optional[int]) -> bool:
+        """
+        Apply a new priority to an item that is waiting in the queue (keeping its age).
+        """
+        return bool(await self._enqueue(conn, "rescore", [(record_id, priority)]))
+
+    async def claim(self, conn, worker: str, count: int = 1) -> List[Tuple[str, float]]:
+        """
+        Atomically pop the `count` best items and lease them to `worker`. Returns (record_id, score) pairs.
+        """
+        raw = await self._evalsha(conn, CLAIM_LUA, CLAIM_SHA, [worker, count, self._lease_ms, int(time.time() * 1000)])
+        claimed = [(record_id, float(score)) for record_id, score in zip(raw[::2], raw[1::2])]
+        if claimed:
+            claimed_items.labels(self.name).inc(len(claimed))
+        return claimed
+
+    async def _lease(self, conn, action: str, record_ids: Sequence[str], worker: Optional[str]) -> int:
+        if not record_ids:
+            return 0
+        return await self._evalsha(conn, LEASE_LUA, LEASE_SHA, [action, worker or "", self._lease_ms, int(time.time() * 1000), *record_ids])
+
+    async def heartbeat(self, conn, record_id: str, worker: str) -> bool:
+        """
+        Extend the worker's lease. False when the worker no longer holds it (expired or reassigned).
+        """
+        return bool(await self._lease(conn, "heartbeat", [record_id], worker))
+
+    async def ack(self, conn, record_id: str, worker: Optional[str] = None) -> bool:
+        """
+        Finish a leased item (only if `worker` holds the lease, when given).
+        """
+        acked = bool(await self._lease(conn, "ack", [record_id], worker))
+        if acked:
+            acked_items.labels(self.name).inc()
+        return acked
+
+    async def release(self, conn, record_id: str, worker: str) -> bool:
+        """
+        Hand a leased item back to the queue with its original score.
+        """
+        return bool(await self._lease(conn, "release", [record_id], worker))
+
+    async def remove(self, conn, record_ids: Sequence[str]) -> int:
+        """
+        Take items out of the queue, leased or not (e.g. deleted records).
+        """
+        return await self._lease(conn, "drop", record_ids, None)
+
+    async def on_status(self, conn, record_id: str, status: Optional[str], priority: Optional[int] = None) -> None:
+        """
+        Follow a record's status transition: pending queues it, a finished status acks any lease,
+        blocked takes it out of the queue. Other statuses (work in progress) leave a lease in place
+        and only take the item out of the pending set.
+        """
+        if status in QUEUED_STATUSES:
+            await self.enqueue(conn, [(record_id, priority)])
+        elif status in FINISHED_STATUSES:
+            if await self.ack(conn, record_id):
+                return
+            await self.remove(conn, [record_id])
+        elif status in PAUSED_STATUSES:
+            await self.remove(conn, [record_id])
+        else:
+            await conn.zrem(self.pending_key, record_id)
+
+    async def follow(self, conn, record_id: str, fields, record: dict) -> None:
+        """
+        Move a record after a write of `fields`: a status change goes through on_status(), a new
+        priority alone re-scores the record while it waits.
+        """
+        if "status" in fields:
+            await self.on_status(conn, record_id, record.get("status"), record.get("priority"))
+        elif "priority" in fields:
+            await self.rescore(conn, record_id, record.get("priority"))
+
+    async def enqueue_pending(self, conn, items: Sequence[Tuple[str, dict]]) -> int:
+        """
+        Queue the new (record_id, record) pairs that are pending (records without a status count as pending).
+        """
+        return await self.enqueue(conn, [
+            (record_id, record.get("priority")) for record_id, record in items if record.get("status", "pending") in QUEUED_STATUSES
+        ])
+
+    async def reap(self, conn, batch_size: int = REAP_BATCH) -> List[str]:
+        """
+        Re-queue items whose lease expired. Returns their IDs.
+        """
+        requeued = await self._evalsha(conn, REAP_LUA, REAP_SHA, [int(time.time() * 1000), batch_size])
+        if requeued:
+            reaped_items.labels(self.name).inc(len(requeued))
+            logger.info(f"Re-queued {len(requeued)} expired leases on {self.name}")
+        return requeued
+
+    async def depth(self, conn) -> int:
+        return await conn.zcard(self.pending_key)
+
+    async def run_reaper(self, conn, interval: Optional[float] = None) -> None:
+        """
+        Reap expired leases every `interval` seconds (AGENT_QUEUE_REAP_INTERVAL_SECONDS) until cancelled.
+        """
+        interval = interval if interval is not None else _env_float("AGENT_QUEUE_REAP_INTERVAL_SECONDS", 15)
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                while len(await self.reap(conn)) >= REAP_BATCH:
+                    pass
+            except Exception as e:
+                logger.warning(f"Queue reaper run on {self.name} failed: {e}")
@@ -0,0 +1,131 @@
+"""
+Opt-in micro-batching of concurrent Redis writes
+- Writes submitted within WINDOW of each other (or until MAX_BATCH are waiting) are flushed together:
+  pipelined commands as one pipeline, record merges as one merge-script call
+- Each caller awaits its own future and gets back its own result, or the error for its own write;
+  a failure of the whole flush (e.g. Redis unreachable) is raised to every caller of that batch
+- The public state manager methods keep their signatures; they route through a coalescer only when one is configured
+
+Environment:
+- AGENT_WRITE_COALESCE: "true" to enable (default "false")
+- AGENT_WRITE_COALESCE_WINDOW_MS: how long the first write of a batch waits for company (default 2)
+- AGENT_WRITE_COALESCE_MAX_BATCH: flush as soon as this many writes are waiting (default 100)
+
+A caller that is cancelled after submitting does not withdraw its write.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger("write_coalescer")
+
+coalescer_batch_size = Histogram(
+    "write_coalescer_batch_size", "Writes flushed per batch", ["name"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+coalescer_flushes = Counter("write_coalescer_flushes_total", "Coalesced flushes", ["name", "trigger"])
+coalescer_errors = Counter("write_coalescer_errors_total", "Coalesced writes that failed", ["name", "scope"])
+
+
+class WriteCoalescer:
+    """
+    Gathers items submitted by concurrent callers and hands them to `flush` in batches.
+    `flush(items)` returns one result per item, in order; an Exception in the list fails only that item.
+    """
+    def __init__(self, name: str, flush: Callable[[List[Any]], Awaitable[List[Any]]], window: float = 0.002, max_batch: int = 100):
+        self.name = name
+        self.flush = flush
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now("size")
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now, "window")
+        return await future
+
+    def _flush_now(self, trigger: str) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        coalescer_flushes.labels(self.name, trigger).inc()
+        coalescer_batch_size.labels(self.name).observe(len(batch))
+        task = asyncio.ensure_future(self._run(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self.flush([item for item, _ in batch])
+        except Exception as e:
+            coalescer_errors.labels(self.name, "batch").inc()
+            logger.warning(f"[{self.name}] flush of {len(batch)} writes failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                coalescer_errors.labels(self.name, "item").inc()
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def drain(self) -> None:
+        """
+        Flush whatever is waiting and wait for in-flight flushes (shutdown, tests).
+        """
+        self._flush_now("drain")
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
+def pipeline_flush(conn, transaction: bool = True) -> Callable[[List[Callable[[Any], Any]]], Awaitable[List[Any]]]:
+    """
+    Flush function for items that are `queue(pipe) -> result` callables: everything is queued on one
+    pipeline, and an item whose own commands failed gets that error instead of its result.
+    """
+    async def flush(items: List[Callable[[Any], Any]]) -> List[Any]:
+        pipe = conn.pipeline(transaction=transaction)
+        spans = []
+        for queue in items:
+            start = len(pipe)
+            result = queue(pipe)
+            spans.append((result, start, len(pipe)))
+        replies = await pipe.execute(raise_on_error=False)
+        results = []
+        for result, start, end in spans:
+            error = next((reply for reply in replies[start:end] if isinstance(reply, Exception)), None)
+            results.append(error if error is not None else result)
+        return results
+    return flush
+
+
+def coalescer_from_env(name: str, flush: Callable[[List[Any]], Awaitable[List[Any]]]) -> Optional[WriteCoalescer]:
+    """
+    A coalescer configured from AGENT_WRITE_COALESCE_*, or None when coalescing is disabled.
+    """
+    if os.getenv("AGENT_WRITE_COALESCE", "false").lower() != "true":
+        return None
+    try:
+        window = max(float(os.getenv("AGENT_WRITE_COALESCE_WINDOW_MS", 2)), 0) / 1000
+        max_batch = int(os.getenv("AGENT_WRITE_COALESCE_MAX_BATCH", 100))
+    except ValueError:
+        logger.warning("Invalid AGENT_WRITE_COALESCE_WINDOW_MS/AGENT_WRITE_COALESCE_MAX_BATCH, using defaults")
+        window, max_batch = 0.002, 100
+    return WriteCoalescer(name, flush, window=window, max_batch=max_batch)